@@ -18,42 +18,209 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import argparse
 import base64
+import contextlib
+import ctypes
+import errno
 import hashlib
 import json
+import logging
 import os
 import shutil
 import sys
-from collections.abc import Iterator, Mapping
-from tempfile import mkstemp
-from typing import Any
+import threading
+from collections.abc import Iterable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import mkdtemp, mkstemp
+from typing import Any, TypeVar, cast
 from zipfile import ZipFile
 
+import requests
+
+from Collector.Spool import Spool
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Running.AutoRunner import AutoRunner
 from FTB.Signatures.CrashInfo import CrashInfo
 from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.OutputMatcher import OutputMatcher
+from FTB.Signatures.SignatureIndex import SignatureIndex
 from Reporter.Reporter import (
+    COMPRESSIONS,
     InvalidDataError,
+    MultipartStream,
     Reporter,
+    ServerError,
     remote_checks,
     sentry_init,
     signature_checks,
 )
 
+try:
+    import fcntl
+
+    HAVE_FCNTL = True
+except ImportError:
+    HAVE_FCNTL = False
+
 __all__: list[str] = []
 __version__ = 0.1
 __date__ = "2014-10-01"
-__updated__ = "2026-04-23"
+__updated__ = "2026-10-17"
+
+LOG = logging.getLogger(__name__)
+
+K = TypeVar("K")
+
+# A serialized crash submission: the crash information fields, the file name and
+# the path of the testcase, if any
+Submission = tuple[dict[str, Any], str | None, str | None]
+
+# Block size for reading testcases, which are never loaded into memory at once
+# when submitting them
+TESTCASE_BLOCK_SIZE = 64 * 1024
+
+# Bytes which are allowed in text testcases
+NOOP_BYTES = bytes(range(0x100))
+TEXT_BYTES = bytes([7, 8, 9, 10, 12, 13, 27]) + bytes(range(0x20, 0x100))
+
+
+# File in the signature cache directory holding the server export version of the
+# signatures, used to download only the changes on the next refresh
+SIGNATURE_VERSION_FILE = "signatures.version"
+
+# Prefix of the directories next to the signature cache directory which hold the
+# signatures once changes were applied, the cache directory is a symlink to one
+SIGNATURE_DIR_PREFIX = ".fuzzmanager-signatures-"
+
+# Crashes submitted per request by Collector.submit_many. Each testcase is a file
+# in the request and the server accepts 100 files per request by default.
+BULK_SUBMIT_BATCH_SIZE = 50
+
+# Size of the crash information and testcases after which a batch is submitted
+# early, regardless of the number of crashes in it
+BULK_SUBMIT_MAX_BYTES = 16 * 1024 * 1024
+
+# Seconds between checks of the spool for new submissions by the spool uploader
+SPOOL_UPLOAD_INTERVAL = 10.0
+
+# Number of batches of spooled submissions uploaded in parallel
+SPOOL_UPLOAD_CONCURRENCY = 4
+
+
+class SignatureCacheIndex:
+    """
+    In-memory index of the signatures in a signature cache directory, so each
+    search only fully matches the signatures that can possibly match the crash.
+    """
+
+    def __init__(self, sigCacheDir: str) -> None:
+        """
+        @type sigCacheDir: str
+        @param sigCacheDir: Directory to load the signatures from
+        """
+        # Taken before listing, so changes made while loading are detected later
+        self.mtime = os.stat(sigCacheDir).st_mtime_ns
+
+        self.sigFiles: list[str] = []
+        self.signatures: list[CrashSignature] = []
+        self.parseError: RuntimeError | None = None
+        for sigFile in os.listdir(sigCacheDir):
+            if not sigFile.endswith(".signature"):
+                continue
+
+            sigFile = os.path.join(sigCacheDir, sigFile)
+            if not os.path.isdir(sigFile):
+                with open(sigFile) as f:
+                    sigData = f.read()
+                try:
+                    signature = CrashSignature(sigData)
+                except RuntimeError as e:
+                    # Signatures before the broken one may still match, only
+                    # fail if none of them does.
+                    self.parseError = e
+                    break
+                self.sigFiles.append(sigFile)
+                self.signatures.append(signature)
+
+        self.index = SignatureIndex()
+        for key, signature in enumerate(self.signatures):
+            self.index.addSignature(key, signature)
+        self.outputMatcher = OutputMatcher(self.signatures)
+
+    def search(self, crashInfo: CrashInfo) -> tuple[str | None, dict[str, Any] | None]:
+        """
+        Search for the first signature matching the given crash.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash to search a signature for
+
+        @rtype: tuple
+        @return: Tuple containing filename of the signature and metadata matching, or
+                 None if no match.
+        """
+        # Scan the crash output once for all signatures instead of once per
+        # signature.
+        outputHits = self.outputMatcher.scan(crashInfo)
+
+        # Candidates are checked in directory order, like an unindexed search
+        for key in sorted(cast("set[int]", self.index.getCandidates(crashInfo))):
+            if self.signatures[key].matches(crashInfo, outputHits):
+                sigFile = self.sigFiles[key]
+                metadataFile = sigFile.replace(".signature", ".metadata")
+                metadata: dict[str, Any] | None = None
+                if os.path.exists(metadataFile):
+                    with open(metadataFile) as m:
+                        metadata = json.loads(m.read())
+
+                return (sigFile, metadata)
+
+        if self.parseError is not None:
+            raise self.parseError
+
+        return (None, None)
 
 
 class Collector(Reporter):
+    # Index of the signature cache directory, see getSignatureCacheIndex
+    _sigCacheIndex: SignatureCacheIndex | None = None
+
+    def __init__(
+        self,
+        *args: Any,
+        spoolDir: str | None = None,
+        streamTestcases: bool = False,
+        **kwds: Any,
+    ) -> None:
+        """
+        Initialize the Collector, see L{Reporter.__init__}.
+
+        @type spoolDir: string
+        @param spoolDir: Directory to spool submissions in instead of uploading
+                         them right away, see L{startSpoolUploader} and
+                         L{drainSpool}
+
+        @type streamTestcases: bool
+        @param streamTestcases: Upload the testcase of a single submission as file
+                                streamed from disk instead of as form field. The
+                                server must support this.
+        """
+        super().__init__(*args, **kwds)
+        self.spool = Spool(spoolDir) if spoolDir else None
+        self.streamTestcases = streamTestcases
+        self._spoolUploader: threading.Thread | None = None
+        self._spoolUploaderStop = threading.Event()
+
     @remote_checks
     @signature_checks
     def refresh(self) -> None:
         """
         Refresh signatures by contacting the server, downloading new signatures
-        and invalidating old ones.
+        and invalidating old ones. If the cache directory was refreshed before,
+        only the signatures changed since then are downloaded.
         """
+        version = self.getSignatureVersion()
+        if version is not None and self.refreshChanges(version):
+            return
+
         url = (
             f"{self.serverProtocol}://{self.serverHost}:{self.serverPort}"
             "/crashmanager/rest/signatures/download/"
@@ -69,6 +236,67 @@ class Collector(Reporter):
         self.refreshFromZip(zipFileName)
         os.remove(zipFileName)
 
+    @signature_checks
+    def getSignatureVersion(self) -> int | None:
+        """
+        Return the server export version of the signatures in the local cache
+        directory, if known.
+
+        @rtype: int
+        @return: Export version of the cached signatures, or None
+        """
+        assert self.sigCacheDir is not None
+        try:
+            with open(os.path.join(self.sigCacheDir, SIGNATURE_VERSION_FILE)) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    @remote_checks
+    @signature_checks
+    def refreshChanges(self, version: int) -> bool:
+        """
+        Refresh signatures by downloading only the signatures changed and deleted
+        on the server since the given export version.
+
+        @type version: int
+        @param version: Export version of the signatures in the cache directory
+
+        @rtype: bool
+        @return: False if the server can't provide the changes, so all signatures
+                 must be downloaded instead.
+        """
+        url = (
+            f"{self.serverProtocol}://{self.serverHost}:{self.serverPort}"
+            "/crashmanager/rest/signatures/changes/"
+        )
+
+        response = self.get(
+            url,
+            params={"since": version},
+            headers={"If-None-Match": f'"{version}"'},
+            expected=(
+                requests.codes["ok"],
+                requests.codes["not_modified"],
+                # unknown version, or server without support for changes
+                requests.codes["bad_request"],
+                requests.codes["not_found"],
+            ),
+        )
+        if response.status_code == requests.codes["not_modified"]:
+            return True
+        if response.status_code != requests.codes["ok"]:
+            return False
+
+        changes = response.json()
+        if not isinstance(changes, dict):
+            raise InvalidDataError(f"Server sent malformed JSON response: {changes!r}")
+
+        self.__apply_signature_changes(
+            changes["version"], changes["signatures"], changes["deleted"]
+        )
+        return True
+
     @signature_checks
     def refreshFromZip(self, zipFileName: str) -> None:
         """
@@ -77,13 +305,17 @@ class Collector(Reporter):
         you probably want to use refresh() instead.)
         """
         assert self.sigCacheDir is not None
-        with ZipFile(zipFileName, "r") as zipFile:
+        with self.__signature_lock(), ZipFile(zipFileName, "r") as zipFile:
             if zipFile.testzip():
                 raise InvalidDataError(f"Bad CRC for downloaded zipfile {zipFileName}")
 
             # Now clean the signature directory, only deleting signatures and metadata
             for sigFile in os.listdir(self.sigCacheDir):
-                if sigFile.endswith(".signature") or sigFile.endswith(".metadata"):
+                if (
+                    sigFile.endswith(".signature")
+                    or sigFile.endswith(".metadata")
+                    or sigFile == SIGNATURE_VERSION_FILE
+                ):
                     os.remove(os.path.join(self.sigCacheDir, sigFile))
                 else:
                     print(
@@ -94,6 +326,14 @@ class Collector(Reporter):
 
             zipFile.extractall(self.sigCacheDir)
 
+            # Exports of servers supporting signature changes carry their version
+            if zipFile.comment.isdigit():
+                versionFile = os.path.join(self.sigCacheDir, SIGNATURE_VERSION_FILE)
+                with open(versionFile, "wb") as f:
+                    f.write(zipFile.comment)
+
+        self._sigCacheIndex = None
+
     @remote_checks
     def submit(
         self,
@@ -126,12 +366,255 @@ class Collector(Reporter):
                          will be stored on the server in JSON format. This metadata is
                          combined with possible metadata stored in the
                          L{ProgramConfiguration} inside crashInfo.
+
+        @rtype: dict or None
+        @return: The created crash as returned by the server, or None if the
+                 submission was spooled
         """
         url = (
             f"{self.serverProtocol}://{self.serverHost}:{self.serverPort}"
             "/crashmanager/rest/crashes/"
         )
 
+        (data, testCaseName, testCasePath) = self.__crash_data(
+            crashInfo, testCase, testCaseQuality, testCaseSize, metaData
+        )
+        if self.spool is not None:
+            self.spool.add(data, testCaseName, testCasePath)
+            return None
+
+        if testCasePath is not None and self.streamTestcases:
+            # The testcase is uploaded as file, streamed from disk
+            assert testCaseName is not None
+            return self.__post_stream(
+                url, data.items(), [("testcase", testCaseName, testCasePath)]
+            ).json()
+
+        if testCasePath is not None:
+            with open(testCasePath, "rb") as f:
+                testCaseData = f.read()
+            if data["testcase_isbinary"]:
+                testCaseData = base64.b64encode(testCaseData)
+            data["testcase"] = testCaseData
+
+        return self.post(url, data).json()
+
+    @remote_checks
+    def submit_many(
+        self,
+        crashes: Iterable[Mapping[str, Any]],
+        batchSize: int = BULK_SUBMIT_BATCH_SIZE,
+        maxBatchBytes: int = BULK_SUBMIT_MAX_BYTES,
+    ) -> list[Any]:
+        """
+        Submit many crashes to the server, in batches of up to batchSize crashes
+        per request.
+
+        @type crashes: iterable(map)
+        @param crashes: The crashes to submit, each a map of the keyword arguments
+                        of L{submit}, e.g. {"crashInfo": ..., "testCase": ...}
+
+        @type batchSize: int
+        @param batchSize: Maximum number of crashes submitted per request
+
+        @type maxBatchBytes: int
+        @param maxBatchBytes: A batch is submitted early once the crash information
+                              and testcases in it reach this size
+
+        @rtype: list
+        @return: The created crashes as returned by the server, in order
+        """
+        results: list[Any] = []
+        submissions = ((None, self.__crash_data(**crash)) for crash in crashes)
+        for batch in self.__batches(submissions, batchSize, maxBatchBytes):
+            results.extend(self.__submit_batch([submission for _, submission in batch]))
+        return results
+
+    @remote_checks
+    def drainSpool(
+        self,
+        concurrency: int = SPOOL_UPLOAD_CONCURRENCY,
+        batchSize: int = BULK_SUBMIT_BATCH_SIZE,
+        maxBatchBytes: int = BULK_SUBMIT_MAX_BYTES,
+    ) -> int:
+        """
+        Upload the submissions waiting in the spool directory, with up to
+        concurrency batches in parallel. Submissions the server rejects are moved
+        to the "failed" subdirectory of the spool. If the server is unavailable,
+        the remaining submissions stay in the spool for the next attempt.
+
+        @type concurrency: int
+        @param concurrency: Number of batches uploaded in parallel
+
+        @rtype: int
+        @return: Number of uploaded submissions
+        """
+        assert self.spool is not None
+        spool = self.spool
+        spool.cleanup()
+
+        uploaded = 0
+        with ThreadPoolExecutor(concurrency) as pool:
+            while True:
+                loaded = []
+                for entry in spool.claim(batchSize * concurrency):
+                    try:
+                        loaded.append((entry, spool.load(entry)))
+                    except (OSError, ValueError) as exc:  # noqa: PERF203
+                        LOG.warning("Rejecting broken spool entry %s: %s", entry, exc)
+                        spool.reject(entry)
+                if not loaded:
+                    return uploaded
+
+                results = list(
+                    pool.map(
+                        self.__upload_spooled,
+                        self.__batches(loaded, batchSize, maxBatchBytes),
+                    )
+                )
+                uploaded += sum(count for count, _ in results)
+                if not all(available for _, available in results):
+                    return uploaded
+
+    def __upload_spooled(self, batch: list[tuple[str, Submission]]) -> tuple[int, bool]:
+        """
+        Upload a batch of spooled submissions and remove them from the spool.
+
+        @rtype: tuple(int, bool)
+        @return: Number of uploaded submissions and whether the server is available
+        """
+        assert self.spool is not None
+        try:
+            self.__submit_batch([submission for _, submission in batch])
+        except ServerError as exc:
+            if exc.status_code != requests.codes["bad_request"]:
+                LOG.warning("Keeping %d spooled crashes: %s", len(batch), exc)
+                for entry, _ in batch:
+                    self.spool.release(entry)
+                return 0, False
+            if len(batch) > 1:
+                # Find the invalid submissions by uploading them separately
+                results = [self.__upload_spooled([item]) for item in batch]
+                return (
+                    sum(count for count, _ in results),
+                    all(available for _, available in results),
+                )
+            LOG.warning("Server rejected spooled crash %s: %s", batch[0][0], exc)
+            self.spool.reject(batch[0][0])
+            return 0, True
+
+        for entry, _ in batch:
+            self.spool.remove(entry)
+        return len(batch), True
+
+    def runSpoolUploader(
+        self,
+        interval: float = SPOOL_UPLOAD_INTERVAL,
+        concurrency: int = SPOOL_UPLOAD_CONCURRENCY,
+    ) -> None:
+        """
+        Drain the spool every interval seconds, until L{stopSpoolUploader} is
+        called.
+        """
+        while not self._spoolUploaderStop.is_set():
+            try:
+                self.drainSpool(concurrency)
+            except Exception:
+                LOG.exception("Uploading spooled crashes failed")
+            self._spoolUploaderStop.wait(interval)
+
+    def startSpoolUploader(
+        self,
+        interval: float = SPOOL_UPLOAD_INTERVAL,
+        concurrency: int = SPOOL_UPLOAD_CONCURRENCY,
+    ) -> None:
+        """
+        Start uploading spooled submissions in a background thread, see
+        L{runSpoolUploader}. Submissions still spooled when the process exits
+        are uploaded by the next uploader using the same spool directory.
+        """
+        assert self.spool is not None
+        if self._spoolUploader is not None and self._spoolUploader.is_alive():
+            return
+        self._spoolUploaderStop.clear()
+        self._spoolUploader = threading.Thread(
+            target=self.runSpoolUploader,
+            args=(interval, concurrency),
+            name="SpoolUploader",
+            daemon=True,
+        )
+        self._spoolUploader.start()
+
+    def stopSpoolUploader(self, timeout: float | None = None) -> None:
+        """Stop the uploader started by L{startSpoolUploader}"""
+        self._spoolUploaderStop.set()
+        if self._spoolUploader is not None:
+            self._spoolUploader.join(timeout)
+            self._spoolUploader = None
+
+    @staticmethod
+    def __batches(
+        items: Iterable[tuple[K, Submission]], batchSize: int, maxBatchBytes: int
+    ) -> Iterator[list[tuple[K, Submission]]]:
+        """Split the submissions into batches for L{__submit_batch}"""
+        batch: list[tuple[K, Submission]] = []
+        batchBytes = 0
+        for item in items:
+            (data, _, testCasePath) = item[1]
+            batch.append(item)
+            batchBytes += sum(
+                len(value) for value in data.values() if isinstance(value, str)
+            )
+            if testCasePath is not None:
+                batchBytes += os.path.getsize(testCasePath)
+            if len(batch) >= batchSize or batchBytes >= maxBatchBytes:
+                yield batch
+                batch = []
+                batchBytes = 0
+        if batch:
+            yield batch
+
+    def __submit_batch(self, batch: list[Submission]) -> list[Any]:
+        """Submit the serialized crashes in a single request"""
+        url = (
+            f"{self.serverProtocol}://{self.serverHost}:{self.serverPort}"
+            "/crashmanager/rest/crashes/bulk/"
+        )
+        crashes = [data for data, _, _ in batch]
+        files: list[tuple[str, str, str]] = []
+        for index, (_, testCaseName, testCasePath) in enumerate(batch):
+            if testCasePath is not None:
+                assert testCaseName is not None
+                files.append((f"testcase_{index}", testCaseName, testCasePath))
+        result: list[Any] = self.__post_stream(
+            url, [("crashes", json.dumps(crashes))], files
+        ).json()
+        return result
+
+    def __post_stream(
+        self,
+        url: str,
+        fields: Iterable[tuple[str, Any]],
+        files: Iterable[tuple[str, str, str]],
+    ) -> requests.Response:
+        """POST a multipart request, streaming the files from disk"""
+        with MultipartStream(fields, files) as body:
+            return self.post(url, data=body, headers={"Content-Type": body.contentType})
+
+    def __crash_data(
+        self,
+        crashInfo: CrashInfo,
+        testCase: str | None = None,
+        testCaseQuality: int = 0,
+        testCaseSize: int | None = None,
+        metaData: Mapping[str, Any] | None = None,
+    ) -> Submission:
+        """
+        Serialize the crash information and metadata of a submission.
+
+        @rtype: tuple(dict, str, str)
+        @return: The fields to submit, the file name and path of the testcase
+        """
         # Serialize our crash information, testcase and metadata into a dictionary to
         # POST
         data: dict[str, Any] = {}
@@ -141,15 +624,11 @@ class Collector(Reporter):
         data["rawCrashData"] = os.linesep.join(crashInfo.rawCrashData)
 
         if testCase:
-            (testCaseData, isBinary) = Collector.read_testcase(testCase)
+            (fileSize, isBinary) = Collector.inspect_testcase(testCase)
 
             if testCaseSize is None:
-                testCaseSize = len(testCaseData)
-
-            if isBinary:
-                testCaseData = base64.b64encode(testCaseData)
+                testCaseSize = fileSize
 
-            data["testcase"] = testCaseData
             data["testcase_isbinary"] = isBinary
             data["testcase_quality"] = testCaseQuality
             data["testcase_size"] = testCaseSize
@@ -185,7 +664,24 @@ class Collector(Reporter):
         if crashInfo.configuration.args:
             data["args"] = json.dumps(crashInfo.configuration.args)
 
-        return self.post(url, data).json()
+        if not testCase:
+            return data, None, None
+        return data, os.path.basename(testCase), testCase
+
+    def getSignatureCacheIndex(self) -> SignatureCacheIndex:
+        """
+        Return the index of the local signature cache directory. It is kept in
+        memory and only rebuilt when the directory was modified since or after
+        signatures were refreshed.
+
+        @rtype: SignatureCacheIndex
+        @return: Index of the signatures currently in the cache directory
+        """
+        assert self.sigCacheDir is not None
+        index = self._sigCacheIndex
+        if index is None or index.mtime != os.stat(self.sigCacheDir).st_mtime_ns:
+            index = self._sigCacheIndex = SignatureCacheIndex(self.sigCacheDir)
+        return index
 
     @signature_checks
     def search(self, crashInfo: CrashInfo) -> tuple[str | None, dict[str, Any] | None]:
@@ -200,28 +696,25 @@ class Collector(Reporter):
         @return: Tuple containing filename of the signature and metadata matching, or
                  None if no match.
         """
-        assert self.sigCacheDir is not None
-        cachedSigFiles = os.listdir(self.sigCacheDir)
-
-        for sigFile in cachedSigFiles:
-            if not sigFile.endswith(".signature"):
-                continue
+        return self.getSignatureCacheIndex().search(crashInfo)
 
-            sigFile = os.path.join(self.sigCacheDir, sigFile)
-            if not os.path.isdir(sigFile):
-                with open(sigFile) as f:
-                    sigData = f.read()
-                    crashSig = CrashSignature(sigData)
-                    if crashSig.matches(crashInfo):
-                        metadataFile = sigFile.replace(".signature", ".metadata")
-                        metadata: dict[str, Any] | None = None
-                        if os.path.exists(metadataFile):
-                            with open(metadataFile) as m:
-                                metadata = json.loads(m.read())
+    @signature_checks
+    def search_many(
+        self, crashInfos: Iterable[CrashInfo]
+    ) -> list[tuple[str | None, dict[str, Any] | None]]:
+        """
+        Searches the local signature cache directory for signatures matching each of
+        the given crashes, using the same index for all of them.
 
-                        return (sigFile, metadata)
+        @type crashInfos: Iterable(CrashInfo)
+        @param crashInfos: CrashInfo instances obtained from
+                           L{CrashInfo.fromRawCrashData}
 
-        return (None, None)
+        @rtype: list(tuple)
+        @return: One result per crash, in order, as returned by L{search}
+        """
+        index = self.getSignatureCacheIndex()
+        return [index.search(crashInfo) for crashInfo in crashInfos]
 
     @signature_checks
     def generate(
@@ -356,6 +849,155 @@ class Collector(Reporter):
 
                 yield local_filename
 
+    def __apply_signature_changes(
+        self,
+        version: int,
+        signatures: Mapping[str, Mapping[str, str]],
+        deleted: list[int],
+    ) -> None:
+        """
+        Apply the signature changes in a copy of the signature cache directory and
+        swap it with the original, so concurrent searches either see all or none
+        of the changes.
+
+        @type version: int
+        @param version: Export version the changes lead to
+        @type signatures: dict
+        @param signatures: Signature and metadata by bucket id of all added and
+                           changed signatures
+        @type deleted: list(int)
+        @param deleted: Bucket ids of the deleted signatures
+        """
+        replaced = {SIGNATURE_VERSION_FILE}
+        for replacedId in [*map(int, signatures), *deleted]:
+            replaced.update((f"{replacedId:d}.signature", f"{replacedId:d}.metadata"))
+
+        with self.__signature_lock():
+            sigCacheDir = self.__signature_dir()
+            newDir = mkdtemp(
+                prefix=SIGNATURE_DIR_PREFIX, dir=os.path.dirname(sigCacheDir)
+            )
+            try:
+                shutil.copymode(sigCacheDir, newDir)
+                for name in os.listdir(sigCacheDir):
+                    (base, ext) = os.path.splitext(name)
+                    if name in replaced:
+                        continue
+                    if ext in (".signature", ".metadata") and not base.isdigit():
+                        # Locally generated signatures are dropped, like on a full
+                        # refresh
+                        continue
+
+                    # Unchanged files are linked into the new directory, not copied
+                    src = os.path.join(sigCacheDir, name)
+                    dst = os.path.join(newDir, name)
+                    if os.path.isdir(src):
+                        shutil.copytree(src, dst, symlinks=True)
+                        continue
+                    try:
+                        os.link(src, dst)
+                    except OSError:
+                        shutil.copy2(src, dst)
+
+                for bucketId, entry in signatures.items():
+                    sigBase = os.path.join(newDir, str(int(bucketId)))
+                    with open(f"{sigBase}.signature", "w") as f:
+                        f.write(entry["signature"])
+                    with open(f"{sigBase}.metadata", "w") as f:
+                        f.write(entry["metadata"])
+                with open(os.path.join(newDir, SIGNATURE_VERSION_FILE), "w") as f:
+                    f.write(str(int(version)))
+
+                oldDir = self.__swap_signature_dir(sigCacheDir, newDir)
+            except BaseException:
+                shutil.rmtree(newDir, ignore_errors=True)
+                raise
+
+        if oldDir is not None:
+            shutil.rmtree(oldDir, ignore_errors=True)
+        self._sigCacheIndex = None
+
+    def __signature_dir(self) -> str:
+        """
+        Return the path of the signature cache directory to swap when applying
+        changes. This is sigCacheDir itself, unless it is a symlink which was not
+        created by L{__swap_signature_dir}, then it is the symlink target.
+
+        @rtype: str
+        @return: Absolute path of the signature cache directory
+        """
+        assert self.sigCacheDir is not None
+        sigCacheDir = os.path.abspath(self.sigCacheDir)
+        if os.path.islink(sigCacheDir):
+            target = os.path.join(
+                os.path.dirname(sigCacheDir), os.readlink(sigCacheDir)
+            )
+            if os.path.dirname(target) != os.path.dirname(
+                sigCacheDir
+            ) or not os.path.basename(target).startswith(SIGNATURE_DIR_PREFIX):
+                return os.path.realpath(sigCacheDir)
+        return sigCacheDir
+
+    @staticmethod
+    def __swap_signature_dir(sigCacheDir: str, newDir: str) -> str | None:
+        """
+        Atomically make the signature cache directory refer to newDir, which is in
+        the same directory. The cache directory becomes a symlink to newDir, which
+        is replaced on the next swap, so the cache directory exists at all times.
+        Plain directories are exchanged with the symlink by renameat2 where it is
+        supported, otherwise they are replaced by two renames once.
+
+        @rtype: str
+        @return: The previous directory of the signatures, to be removed, if any
+        """
+        link = f"{newDir}.link"
+        try:
+            os.symlink(os.path.basename(newDir), link)
+        except (OSError, NotImplementedError):
+            # No symlinks (e.g. Windows without the privilege to create them),
+            # the directory is missing for a moment.
+            link = newDir
+
+        if link != newDir and os.path.islink(sigCacheDir):
+            oldDir = os.path.join(
+                os.path.dirname(sigCacheDir), os.readlink(sigCacheDir)
+            )
+            try:
+                os.replace(link, sigCacheDir)
+            except OSError:
+                os.remove(link)
+                raise
+            return oldDir
+
+        if link != newDir and _exchange_paths(link, sigCacheDir):
+            # the previous directory is now where the new symlink was
+            return link
+
+        oldDir = f"{newDir}.old"
+        os.rename(sigCacheDir, oldDir)
+        try:
+            os.rename(link, sigCacheDir)
+        except OSError:
+            os.rename(oldDir, sigCacheDir)
+            raise
+        return oldDir
+
+    @contextlib.contextmanager
+    def __signature_lock(self) -> Iterator[None]:
+        """
+        Serialize changes of the signature cache directory between processes (where
+        file locks are supported), using a lock file next to it.
+        """
+        assert self.sigCacheDir is not None
+        sigCacheDir = os.path.abspath(self.sigCacheDir)
+        lockFile = os.path.join(
+            os.path.dirname(sigCacheDir), f".{os.path.basename(sigCacheDir)}.lock"
+        )
+        with open(lockFile, "a") as f:
+            if HAVE_FCNTL:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
     def __store_signature_hashed(self, signature: CrashSignature) -> str:
         """
         Store a signature, using the sha1 hash hex representation as filename.
@@ -373,6 +1015,7 @@ class Collector(Reporter):
         sigfile = os.path.join(self.sigCacheDir, h.hexdigest() + ".signature")
         with open(sigfile, "w") as f:
             f.write(str(signature))
+        self._sigCacheIndex = None
 
         return sigfile
 
@@ -391,12 +1034,55 @@ class Collector(Reporter):
         with open(testCase, "rb") as f:
             testCaseData = f.read()
 
-        noopBytes = bytearray(range(0x100))
-        textBytes = bytearray([7, 8, 9, 10, 12, 13, 27]) + bytearray(range(0x20, 0x100))
-        isBinary = bool(testCaseData.translate(noopBytes, textBytes))
+        isBinary = bool(testCaseData.translate(NOOP_BYTES, TEXT_BYTES))
 
         return (testCaseData, isBinary)
 
+    @staticmethod
+    def inspect_testcase(testCase: str) -> tuple[int, bool]:
+        """
+        Determine the size of a testcase file and if it is binary or not, without
+        reading it into memory at once.
+
+        @type testCase: string
+        @param testCase: Filename of the file to inspect
+
+        @rtype: tuple(int, bool)
+        @return: Tuple containing the file size and a boolean indicating if the
+                 content is binary
+        """
+        isBinary = False
+        with open(testCase, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            while not isBinary and (chunk := f.read(TESTCASE_BLOCK_SIZE)):
+                isBinary = bool(chunk.translate(NOOP_BYTES, TEXT_BYTES))
+
+        return (size, isBinary)
+
+
+def _exchange_paths(first: str, second: str) -> bool:
+    """
+    Atomically exchange two paths of any type with renameat2(RENAME_EXCHANGE).
+
+    @rtype: bool
+    @return: False if this is not supported by the platform or file system
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    renameat2 = getattr(ctypes.CDLL(None, use_errno=True), "renameat2", None)
+    if renameat2 is None:
+        return False
+    atFdCwd = -100
+    renameExchange = 2
+    if renameat2(
+        atFdCwd, os.fsencode(first), atFdCwd, os.fsencode(second), renameExchange
+    ):
+        error = ctypes.get_errno()
+        if error in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            return False
+        raise OSError(error, os.strerror(error), second)
+    return True
+
 
 def main(args: list[str] | None = None) -> int:
     """Command line options."""
@@ -465,9 +1151,19 @@ def main(args: list[str] | None = None) -> int:
         action="store_true",
         help="Print the client ID used when submitting issues",
     )
+    actions.add_argument(
+        "--drain-spool",
+        action="store_true",
+        help="Keep uploading the crashes submitted to the spool directory",
+    )
 
     # Settings
     parser.add_argument("--sigdir", help="Signature cache directory", metavar="DIR")
+    parser.add_argument(
+        "--spooldir",
+        help="Spool directory to submit crashes to, to be uploaded in the background",
+        metavar="DIR",
+    )
     parser.add_argument(
         "--serverhost",
         help="Server hostname for remote signature management",
@@ -489,6 +1185,17 @@ def main(args: list[str] | None = None) -> int:
     parser.add_argument(
         "--clientid", help="Client ID to use when submitting issues", metavar="ID"
     )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        help="Compress submissions, the server must support this",
+    )
+    parser.add_argument(
+        "--stream-testcases",
+        action="store_true",
+        help="Upload testcases as files streamed from disk, the server must support "
+        "this",
+    )
     parser.add_argument(
         "--platform", help="Platform this crash appeared on", metavar="(x86|x86-64|arm)"
     )
@@ -684,8 +1391,9 @@ def main(args: list[str] | None = None) -> int:
                 with open(opts.crashdata) as f:
                     crashdata = f.read()
 
+            # only parsed if any of the actions needs more than the raw output
             crashInfo = CrashInfo.fromRawCrashData(
-                stdout, stderr, configuration, auxCrashData=crashdata
+                stdout, stderr, configuration, auxCrashData=crashdata, lazy=True
             )
             if opts.testcase:
                 (testCaseData, isBinary) = Collector.read_testcase(opts.testcase)
@@ -705,8 +1413,18 @@ def main(args: list[str] | None = None) -> int:
         serverauthtoken,
         opts.clientid,
         opts.tool,
+        compression=opts.compression,
+        spoolDir=opts.spooldir,
+        streamTestcases=opts.stream_testcases,
     )
 
+    if opts.drain_spool:
+        if not opts.spooldir:
+            parser.error("Action --drain-spool requires --spooldir to be specified")
+        with contextlib.suppress(KeyboardInterrupt):
+            collector.runSpoolUploader()
+        return 0
+
     if opts.refresh:
         collector.refresh()
         return 0
@@ -0,0 +1,181 @@
+"""
+Spool -- On-disk queue of crash submissions
+
+Crashes spooled by the Collector are uploaded later in the background or by
+a separate `collector --drain-spool` process, so submitting never blocks on
+the server.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import time
+import uuid
+from tempfile import mkdtemp
+from typing import Any
+
+# Entries claimed by an uploader for longer than this (in seconds) are assumed
+# to belong to an uploader that died and are released again. Temporary entries
+# that were never completed are removed after the same time.
+STALE_TIMEOUT = 3600
+
+# Name of the file holding the serialized submission in every entry
+SUBMISSION_FILE = "crash.json"
+
+# Name of the file holding the testcase in every entry, if any
+TESTCASE_FILE = "testcase"
+
+# Subdirectory holding entries that were rejected by the server
+FAILED_DIR = "failed"
+
+CLAIM_SEPARATOR = ".claimed-"
+TEMP_PREFIX = ".tmp-"
+
+
+class Spool:
+    """
+    Queue directory of crash submissions. Every entry is a directory holding
+    the serialized submission and its testcase. Entries are prepared under a
+    temporary name and renamed into place, so uploaders never see partial
+    entries. Uploaders claim entries by renaming them, so several processes
+    can share a spool.
+    """
+
+    def __init__(self, spoolDir: str) -> None:
+        self.spoolDir = spoolDir
+        os.makedirs(spoolDir, exist_ok=True)
+
+    def add(
+        self,
+        data: dict[str, Any],
+        testCaseName: str | None = None,
+        testCasePath: str | None = None,
+    ) -> str:
+        """
+        Add a submission to the spool. The testcase is copied into the spool.
+
+        @type data: dict
+        @param data: The serialized crash information
+
+        @type testCaseName: str
+        @param testCaseName: File name of the testcase
+
+        @type testCasePath: str
+        @param testCasePath: Path of the testcase file
+
+        @rtype: str
+        @return: Path of the new entry
+        """
+        tmpDir = mkdtemp(prefix=TEMP_PREFIX, dir=self.spoolDir)
+        try:
+            with open(os.path.join(tmpDir, SUBMISSION_FILE), "w") as f:
+                json.dump({"data": data, "testcase": testCaseName}, f)
+            if testCasePath is not None:
+                shutil.copyfile(testCasePath, os.path.join(tmpDir, TESTCASE_FILE))
+
+            # Entry names sort in the order of submission
+            entry = os.path.join(
+                self.spoolDir,
+                f"{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}",
+            )
+            os.rename(tmpDir, entry)
+        except BaseException:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+            raise
+        return entry
+
+    def pending(self) -> list[str]:
+        """
+        @rtype: list(str)
+        @return: Names of the entries waiting for upload, oldest first
+        """
+        return sorted(
+            name
+            for name in os.listdir(self.spoolDir)
+            if not name.startswith(".")
+            and CLAIM_SEPARATOR not in name
+            and name != FAILED_DIR
+        )
+
+    def claim(self, limit: int) -> list[str]:
+        """
+        Claim up to limit of the oldest pending entries for upload. Entries
+        claimed concurrently by another uploader are skipped.
+
+        @rtype: list(str)
+        @return: Paths of the claimed entries
+        """
+        claimed: list[str] = []
+        for name in self.pending():
+            if len(claimed) >= limit:
+                break
+            path = os.path.join(
+                self.spoolDir, f"{name}{CLAIM_SEPARATOR}{time.time_ns():d}"
+            )
+            try:
+                os.rename(os.path.join(self.spoolDir, name), path)
+            except FileNotFoundError:
+                continue
+            claimed.append(path)
+        return claimed
+
+    @staticmethod
+    def load(entry: str) -> tuple[dict[str, Any], str | None, str | None]:
+        """
+        Load a claimed entry. The testcase remains in the entry until it is
+        removed.
+
+        @rtype: tuple(dict, str, str)
+        @return: The serialized crash information, the testcase file name and the
+                 path of the testcase file
+        """
+        with open(os.path.join(entry, SUBMISSION_FILE)) as f:
+            submission = json.load(f)
+        testCasePath = None
+        if submission["testcase"] is not None:
+            testCasePath = os.path.join(entry, TESTCASE_FILE)
+            if not os.path.isfile(testCasePath):
+                raise FileNotFoundError(f"Missing testcase in {entry}")
+        return submission["data"], submission["testcase"], testCasePath
+
+    @staticmethod
+    def remove(entry: str) -> None:
+        """Remove a claimed entry after it was uploaded"""
+        shutil.rmtree(entry)
+
+    def release(self, entry: str) -> None:
+        """Return a claimed entry to the spool, to be uploaded again later"""
+        name = os.path.basename(entry).split(CLAIM_SEPARATOR, 1)[0]
+        os.rename(entry, os.path.join(self.spoolDir, name))
+
+    def reject(self, entry: str) -> None:
+        """Move a claimed entry the server refused out of the spool"""
+        failedDir = os.path.join(self.spoolDir, FAILED_DIR)
+        os.makedirs(failedDir, exist_ok=True)
+        name = os.path.basename(entry).split(CLAIM_SEPARATOR, 1)[0]
+        os.rename(entry, os.path.join(failedDir, name))
+
+    def cleanup(self, timeout: float = STALE_TIMEOUT) -> None:
+        """Release stale claims and remove stale temporary entries"""
+        now = time.time_ns()
+        for name in os.listdir(self.spoolDir):
+            path = os.path.join(self.spoolDir, name)
+            if CLAIM_SEPARATOR in name:
+                claimedAt = int(name.split(CLAIM_SEPARATOR, 1)[1])
+                if now - claimedAt > timeout * 1e9:
+                    with contextlib.suppress(FileNotFoundError):
+                        self.release(path)
+            elif name.startswith(TEMP_PREFIX):
+                try:
+                    modified = os.stat(path).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                if now - modified > timeout * 1e9:
+                    shutil.rmtree(path, ignore_errors=True)
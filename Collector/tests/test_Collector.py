@@ -12,9 +12,12 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 @contact:    choller@mozilla.com
 """
 
+import email
+import io
 import json
 import os
 import platform
+import threading
 import zipfile
 from pathlib import Path
 from unittest.mock import Mock, patch
@@ -24,10 +27,11 @@ import pytest
 import requests
 
 from Collector.Collector import Collector, main
+from Collector.Spool import Spool
 from crashmanager.models import CrashEntry
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
-from Reporter.Reporter import InvalidDataError, ServerError
+from Reporter.Reporter import ConfigurationError, InvalidDataError, ServerError
 
 FIXTURE_PATH = Path(__file__).parent / "fixtures"
 
@@ -95,12 +99,23 @@ def test_collector_submit(mock_expanduser, live_server, tmp_path, fm_user):
     assert entry.testcase.quality == 0
     assert not entry.testcase.isBinary
     assert entry.testcase.size == len(exampleTestCase)
-    with open(entry.testcase.test.path, "rb") as testcase_fp:
-        assert testcase_fp.read() == exampleTestCase
+    entry.testcase.loadTest()
+    assert entry.testcase.content == exampleTestCase
     assert entry.metadata == ""
     assert entry.env == ""
     assert entry.args == ""
 
+    # testcases streamed from disk which are not valid UTF-8 are stored as binary
+    collector.streamTestcases = True
+    latin1_path = tmp_path / "testcase" / "latin1.js"
+    latin1_path.write_bytes(b"caf\xe9")
+    result = collector.submit(crashInfo, str(latin1_path))
+    entry = CrashEntry.objects.get(pk=result["id"])
+    assert entry.testcase.isBinary
+    assert entry.testcase.size == 4
+    entry.testcase.loadTest()
+    assert entry.testcase.content == b"caf\xe9"
+
     # create a test config
     with (tmp_path / ".fuzzmanagerconf").open("w") as fp:
         fp.write("[Main]\n")
@@ -171,8 +186,8 @@ def test_collector_submit(mock_expanduser, live_server, tmp_path, fm_user):
     assert entry.testcase.quality == 5
     assert entry.testcase.isBinary
     assert entry.testcase.size == 1
-    with open(entry.testcase.test.path, "rb") as testcase_fp:
-        assert testcase_fp.read() == b"\0"
+    entry.testcase.loadTest()
+    assert entry.testcase.content == b"\0"
     assert json.loads(entry.metadata) == {"var1": "val1", "var2": "val2"}
     assert json.loads(entry.env) == {"PATH": "/home/ken", "LD_PRELOAD": "hack.so"}
     assert json.loads(entry.args) == ["./myprog"]
@@ -187,6 +202,290 @@ def test_collector_submit(mock_expanduser, live_server, tmp_path, fm_user):
         collector.submit(crashInfo, str(testcase_path))
 
 
+def _read_multipart(kwds):
+    """Parse the fields of a streamed multipart request body"""
+    message = email.message_from_bytes(
+        f"Content-Type: {kwds['headers']['Content-Type']}\r\n\r\n".encode()
+        + kwds["data"].read()
+    )
+    return {
+        part.get_param("name", header="content-disposition"): part.get_payload(
+            decode=True
+        )
+        for part in message.get_payload()
+    }
+
+
+@patch("os.path.expanduser")
+@patch("time.sleep", new=Mock())
+def test_collector_submit_many(mock_expanduser, live_server, tmp_path, fm_user):
+    """Test bulk crash submission"""
+    mock_expanduser.side_effect = lambda path: str(
+        tmp_path
+    )  # ensure fuzzmanager config is not used
+
+    url = urlsplit(live_server.url)
+    collector = Collector(
+        serverHost=url.hostname,
+        serverPort=url.port,
+        serverProtocol=url.scheme,
+        serverAuthToken=fm_user.token,
+        clientId="test-fuzzer1",
+        tool="test-tool",
+    )
+    text_path = tmp_path / "testcase.js"
+    text_path.write_bytes(exampleTestCase)
+    binary_path = tmp_path / "testcase.bin"
+    binary_path.write_bytes(b"\0")
+    config = ProgramConfiguration(
+        "mozilla-central", "x86-64", "linux", version="ba0bc4f26681"
+    )
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+
+    # 5 crashes are submitted in 3 batches
+    results = collector.submit_many(
+        [
+            {"crashInfo": crashInfo, "testCase": str(text_path)},
+            {"crashInfo": crashInfo, "metaData": {"var1": "val1"}},
+            {
+                "crashInfo": crashInfo,
+                "testCase": str(binary_path),
+                "testCaseQuality": 5,
+            },
+            {"crashInfo": crashInfo, "testCase": str(text_path)},
+            {"crashInfo": crashInfo},
+        ],
+        batchSize=2,
+    )
+
+    entries = [CrashEntry.objects.get(pk=result["id"]) for result in results]
+    assert len(entries) == 5
+    for entry in entries:
+        assert entry.rawStderr == asan_trace_crash.rstrip()
+        assert entry.tool.name == "test-tool"
+        assert entry.client.name == "test-fuzzer1"
+        assert entry.product.version == config.version
+    assert [entry.testcase is not None for entry in entries] == [
+        True,
+        False,
+        True,
+        True,
+        False,
+    ]
+    assert json.loads(entries[1].metadata) == {"var1": "val1"}
+    entries[0].testcase.loadTest()
+    assert entries[0].testcase.content == exampleTestCase
+    assert not entries[0].testcase.isBinary
+    assert os.path.splitext(entries[0].testcase.test.name)[1] == ".js"
+    entries[2].testcase.loadTest()
+    assert entries[2].testcase.content == b"\0"
+    assert entries[2].testcase.isBinary
+    assert entries[2].testcase.quality == 5
+
+    # large batches are submitted early
+    posts = []
+    response = Mock(status_code=requests.codes["created"])
+    response.json.side_effect = lambda: [{}]
+
+    def post(*args, **kwds):
+        posts.append(_read_multipart(kwds))
+        return response
+
+    collector._session.post = post
+    collector.submit_many(
+        [{"crashInfo": crashInfo, "testCase": str(text_path)}] * 3,
+        maxBatchBytes=len(exampleTestCase),
+    )
+    assert len(posts) == 3
+    assert list(posts[0]) == ["crashes", "testcase_0"]
+    assert posts[0]["testcase_0"] == exampleTestCase
+
+
+@patch("os.path.expanduser")
+@patch("time.sleep", new=Mock())
+def test_collector_submit_compressed(mock_expanduser, live_server, tmp_path, fm_user):
+    """Test crash submission with compressed request bodies"""
+    mock_expanduser.side_effect = lambda path: str(
+        tmp_path
+    )  # ensure fuzzmanager config is not used
+
+    url = urlsplit(live_server.url)
+    collector = Collector(
+        serverHost=url.hostname,
+        serverPort=url.port,
+        serverProtocol=url.scheme,
+        serverAuthToken=fm_user.token,
+        clientId="test-fuzzer1",
+        tool="test-tool",
+        compression="gzip",
+    )
+    testcase_path = tmp_path / "testcase.js"
+    testcase_path.write_bytes(exampleTestCase * 100)
+    config = ProgramConfiguration(
+        "mozilla-central", "x86-64", "linux", version="ba0bc4f26681"
+    )
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+
+    result = collector.submit(crashInfo, str(testcase_path))
+    entry = CrashEntry.objects.get(pk=result["id"])
+    assert entry.rawStderr == asan_trace_crash.rstrip()
+    entry.testcase.loadTest()
+    assert entry.testcase.content == exampleTestCase * 100
+
+    results = collector.submit_many(
+        [{"crashInfo": crashInfo, "testCase": str(testcase_path)}] * 2
+    )
+    assert CrashEntry.objects.filter(pk__in=[r["id"] for r in results]).count() == 2
+
+    # small requests are sent uncompressed
+    posts = []
+    response = Mock(status_code=requests.codes["created"])
+    response.json.side_effect = lambda: {}
+
+    def post(*args, **kwds):
+        posts.append((args, kwds))
+        return response
+
+    collector._session.post = post
+    collector.submit(CrashInfo.fromRawCrashData([], [], config))
+    collector.submit(crashInfo, str(testcase_path))
+    assert "Content-Encoding" not in posts[0][1]["headers"]
+    assert posts[1][1]["headers"]["Content-Encoding"] == "gzip"
+
+    # so are testcases streamed from disk
+    collector.streamTestcases = True
+    collector.submit(crashInfo, str(testcase_path))
+    assert posts[2][1]["headers"]["Content-Encoding"] == "gzip"
+
+    with pytest.raises(ConfigurationError, match=r"Unsupported compression"):
+        Collector(serverHost="localhost", compression="bzip2")
+
+
+def test_spool(tmp_path):
+    """Test spool entries are claimed, released and rejected"""
+    spool = Spool(str(tmp_path / "spool"))
+    testcase_path = tmp_path / "test.bin"
+    testcase_path.write_bytes(b"\0")
+    first = spool.add({"rawStderr": "a"})
+    second = spool.add({"rawStderr": "b"}, "test.bin", str(testcase_path))
+    testcase_path.unlink()
+    assert spool.pending() == [os.path.basename(first), os.path.basename(second)]
+
+    claimed = spool.claim(1)
+    assert len(claimed) == 1
+    assert spool.load(claimed[0]) == ({"rawStderr": "a"}, None, None)
+    assert spool.pending() == [os.path.basename(second)]
+    spool.release(claimed[0])
+    assert len(spool.pending()) == 2
+
+    (_, claimed_b) = spool.claim(5)
+    (data, name, path) = spool.load(claimed_b)
+    assert (data, name) == ({"rawStderr": "b"}, "test.bin")
+    assert Path(path).read_bytes() == b"\0"
+    spool.reject(claimed_b)
+    assert os.listdir(tmp_path / "spool" / "failed") == [os.path.basename(second)]
+
+    # claims of uploaders that died are released, unfinished entries removed
+    (tmp_path / "spool" / ".tmp-foo").mkdir()
+    spool.cleanup(timeout=60)
+    assert spool.pending() == []
+    spool.cleanup(timeout=0)
+    assert spool.pending() == [os.path.basename(first)]
+    assert not (tmp_path / "spool" / ".tmp-foo").exists()
+
+
+@patch("os.path.expanduser")
+@patch("time.sleep", new=Mock())
+def test_collector_spool(mock_expanduser, live_server, tmp_path, fm_user):
+    """Test spooled submissions are uploaded later"""
+    mock_expanduser.side_effect = lambda path: str(
+        tmp_path
+    )  # ensure fuzzmanager config is not used
+
+    url = urlsplit(live_server.url)
+    collector = Collector(
+        serverHost=url.hostname,
+        serverPort=url.port,
+        serverProtocol=url.scheme,
+        serverAuthToken=fm_user.token,
+        clientId="test-fuzzer1",
+        tool="test-tool",
+        spoolDir=str(tmp_path / "spool"),
+    )
+    testcase_path = tmp_path / "testcase.js"
+    testcase_path.write_bytes(exampleTestCase)
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData([], ["foo"], config)
+
+    for _ in range(3):
+        assert collector.submit(crashInfo, str(testcase_path)) is None
+    assert not CrashEntry.objects.exists()
+    assert len(collector.spool.pending()) == 3
+
+    # uploads are not concurrent, sqlite doesn't support concurrent writes
+    assert collector.drainSpool(concurrency=1, batchSize=2) == 3
+    assert collector.spool.pending() == []
+    assert CrashEntry.objects.count() == 3
+    for entry in CrashEntry.objects.all():
+        assert entry.rawStderr == "foo"
+        assert entry.client.name == "test-fuzzer1"
+        entry.testcase.loadTest()
+        assert entry.testcase.content == exampleTestCase
+
+    # the background uploader picks up new submissions
+    collector.startSpoolUploader(interval=0.1, concurrency=1)
+    try:
+        collector.submit(crashInfo)
+        # time.sleep is mocked
+        waiter = threading.Event()
+        for _ in range(100):
+            if CrashEntry.objects.count() == 4:
+                break
+            waiter.wait(0.1)
+    finally:
+        collector.stopSpoolUploader()
+    assert CrashEntry.objects.count() == 4
+    assert collector.spool.pending() == []
+
+
+@patch("time.sleep", new=Mock())
+def test_collector_spool_errors(tmp_path):
+    """Test spooled submissions are kept while the server is unavailable"""
+    collector = Collector(
+        serverHost="localhost",
+        serverAuthToken="token",
+        clientId="test-fuzzer1",
+        tool="test-tool",
+        spoolDir=str(tmp_path / "spool"),
+    )
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    for stderr in ("good", "bad", "good"):
+        collector.submit(CrashInfo.fromRawCrashData([], [stderr], config))
+
+    def unavailable(*_, **__):
+        return Mock(status_code=requests.codes["service_unavailable"])
+
+    collector._session.post = unavailable
+    assert collector.drainSpool(batchSize=1) == 0
+    assert len(collector.spool.pending()) == 3
+
+    # the invalid submission is found and moved aside
+    def post(*_, **kwds):
+        crashes = json.loads(_read_multipart(kwds)["crashes"])
+        if any(crash["rawStderr"] == "bad" for crash in crashes):
+            return Mock(status_code=requests.codes["bad_request"])
+        response = Mock(status_code=requests.codes["created"])
+        response.json.return_value = [{}] * len(crashes)
+        return response
+
+    collector._session.post = post
+    assert collector.drainSpool(concurrency=2, batchSize=2) == 2
+    assert collector.spool.pending() == []
+    assert len(os.listdir(tmp_path / "spool" / "failed")) == 1
+
+
 def test_collector_refresh(capsys, tmp_path):
     """Test signature downloads"""
     # create a test signature zip
@@ -282,6 +581,132 @@ def test_collector_refresh(capsys, tmp_path):
             collector.refresh()
 
 
+@pytest.mark.parametrize("exchange", [True, False])
+def test_collector_refresh_changes(monkeypatch, tmp_path, exchange):
+    """Test downloading only the signatures changed since the last refresh"""
+    if not exchange:
+        # the directory is replaced by renaming it without renameat2
+        monkeypatch.setattr("Collector.Collector._exchange_paths", lambda *_: False)
+    sigs_path = tmp_path / "sigs"
+    sigs_path.mkdir()
+    for name in ("1.signature", "1.metadata", "2.signature", "2.metadata"):
+        (sigs_path / name).write_text(f"old {name}")
+    (sigs_path / "0123abcd.signature").touch()
+    (sigs_path / "other.txt").touch()
+    (sigs_path / "signatures.version").write_text("1")
+
+    outzip_path = tmp_path / "out.zip"
+    with zipfile.ZipFile(str(outzip_path), "w") as zf:
+        zf.comment = b"7"
+        zf.writestr("7.signature", "sig7")
+
+    responses = []
+
+    class response_t:
+        def __init__(self, status_code, body=None, raw=None):
+            self.status_code = status_code
+            self.text = ""
+            self.body = body
+            self.raw = raw
+
+        def json(self):
+            return self.body
+
+    def myget(url, params=None, stream=None, headers=None):
+        if url.endswith("/download/"):
+            return response_t(
+                requests.codes["ok"], raw=io.BytesIO(outzip_path.read_bytes())
+            )
+        assert url == "gopher://aol.com:70/crashmanager/rest/signatures/changes/"
+        version = collector.getSignatureVersion()
+        assert params == {"since": version}
+        assert headers == {
+            "If-None-Match": f'"{version}"',
+            "Authorization": "Token token",
+        }
+        return responses.pop(0)
+
+    collector = Collector(
+        sigCacheDir=str(sigs_path),
+        serverHost="aol.com",
+        serverPort=70,
+        serverProtocol="gopher",
+        serverAuthToken="token",
+        clientId="test-fuzzer1",
+        tool="test-tool",
+    )
+    collector._session.get = myget
+
+    responses.append(
+        response_t(
+            requests.codes["ok"],
+            {
+                "version": 3,
+                "signatures": {
+                    "1": {"signature": "new sig1", "metadata": "{}"},
+                    "3": {"signature": "sig3", "metadata": '{"size": 1}'},
+                },
+                "deleted": [2],
+            },
+        )
+    )
+    collector.refresh()
+    assert {f.name for f in sigs_path.iterdir()} == {
+        "1.signature",
+        "1.metadata",
+        "3.signature",
+        "3.metadata",
+        "other.txt",
+        "signatures.version",
+    }
+    assert (sigs_path / "1.signature").read_text() == "new sig1"
+    assert (sigs_path / "3.metadata").read_text() == '{"size": 1}'
+    assert collector.getSignatureVersion() == 3
+    # the cache directory is now a symlink to the updated copy next to it, so it
+    # can be swapped atomically, no other directories are left behind
+    assert sigs_path.is_symlink()
+    (sigs_copy,) = tmp_path.glob(".fuzzmanager-signatures-*")
+    assert {f.name for f in tmp_path.iterdir()} == {
+        "sigs",
+        "out.zip",
+        ".sigs.lock",
+        sigs_copy.name,
+    }
+
+    # the symlink is replaced on the next change
+    responses.append(
+        response_t(
+            requests.codes["ok"], {"version": 4, "signatures": {}, "deleted": [3]}
+        )
+    )
+    collector.refresh()
+    assert not sigs_copy.exists()
+    assert {f.name for f in sigs_path.iterdir()} == {
+        "1.signature",
+        "1.metadata",
+        "other.txt",
+        "signatures.version",
+    }
+    assert len(list(tmp_path.glob(".fuzzmanager-signatures-*"))) == 1
+
+    # nothing changed
+    responses.append(response_t(requests.codes["not_modified"]))
+    collector.refresh()
+    assert collector.getSignatureVersion() == 4
+    assert (sigs_path / "1.signature").read_text() == "new sig1"
+
+    # unknown version, all signatures are downloaded again
+    responses.append(response_t(requests.codes["bad_request"]))
+    collector.refresh()
+    assert {f.name for f in sigs_path.iterdir()} == {
+        "7.signature",
+        "other.txt",
+        "signatures.version",
+    }
+    assert collector.getSignatureVersion() == 7
+    assert not responses
+
+
 def test_collector_generate_search(tmp_path):
     """Test sigcache generation and search"""
     # create a cache dir
@@ -324,6 +749,36 @@ def test_collector_generate_search(tmp_path):
     assert result is None
 
 
+def test_collector_search_index(tmp_path):
+    """Test that the sigcache index is kept until the directory changes"""
+    cache_dir = tmp_path / "sigcache"
+    cache_dir.mkdir()
+    collector = Collector(sigCacheDir=str(cache_dir))
+
+    config = ProgramConfiguration("mozilla-central", "x86-64", "linux")
+    asan_trace_crash = (FIXTURE_PATH / "asan_trace_crash.txt").read_text()
+    crashInfo = CrashInfo.fromRawCrashData([], asan_trace_crash.splitlines(), config)
+    noCrashInfo = CrashInfo.fromRawCrashData([], [], config)
+    sig = collector.generate(crashInfo, False, False, 8)
+
+    assert collector.search_many([crashInfo, noCrashInfo, crashInfo]) == [
+        (sig, None),
+        (None, None),
+        (sig, None),
+    ]
+    index = collector.getSignatureCacheIndex()
+    collector.search(crashInfo)
+    assert collector.getSignatureCacheIndex() is index
+
+    # signatures added by other processes are picked up
+    other = cache_dir / "other.signature"
+    other.write_text(json.dumps({"symptoms": [{"type": "output", "value": "foo"}]}))
+    os.utime(cache_dir, ns=(0, index.mtime + 1))
+    fooCrashInfo = CrashInfo.fromRawCrashData(["foo"], [], config)
+    assert collector.search(fooCrashInfo) == (str(other), None)
+    assert collector.getSignatureCacheIndex() is not index
+
+
 def test_collector_download(tmp_path, monkeypatch):
     """Test testcase downloads"""
     # create Collector
@@ -22,7 +22,13 @@ import os
 import sys
 
 from FTB import CoverageHelper
-from Reporter.Reporter import InvalidDataError, Reporter, remote_checks, sentry_init
+from Reporter.Reporter import (
+    COMPRESSIONS,
+    InvalidDataError,
+    Reporter,
+    remote_checks,
+    sentry_init,
+)
 
 __all__ = []
 __version__ = 0.1
@@ -40,6 +46,7 @@ class CovReporter(Reporter):
         clientId=None,
         tool=None,
         repository=None,
+        compression=None,
     ):
         """
         Initialize the Reporter. This constructor will also attempt to read
@@ -58,6 +65,9 @@ class CovReporter(Reporter):
         @param tool: Name of the tool that created this coverage
         @type repository: string
         @param repository: Name of the repository that this coverage was measured on
+        @type compression: string
+        @param compression: Content encoding to compress the uploads with,
+                            "gzip" or "zstd"
         """
 
         # Call abstract base class to handle configuration file
@@ -70,6 +80,7 @@ class CovReporter(Reporter):
             serverAuthToken=serverAuthToken,
             clientId=clientId,
             tool=tool,
+            compression=compression,
         )
 
         self.repository = repository
@@ -320,6 +331,11 @@ def main(argv=None):
     parser.add_argument(
         "--tool", help="Name of the tool that generated this coverage", metavar="NAME"
     )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        help="Compress uploads, the server must support this",
+    )
 
     # Coverage specific settings
     parser.add_argument(
@@ -378,6 +394,7 @@ def main(argv=None):
         opts.clientid,
         opts.tool,
         opts.repository,
+        opts.compression,
     )
 
     if opts.submit or opts.multi_submit:
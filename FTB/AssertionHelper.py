@@ -14,7 +14,10 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 @contact:    choller@mozilla.com
 """
 
+from __future__ import annotations
+
 import re
+from functools import lru_cache
 
 RE_ASSERTION = re.compile(r"^ASSERTION \d+: \(.+\)")
 RE_MOZ_CRASH = re.compile(r"Hit MOZ_CRASH\([^\)]")
@@ -23,6 +26,85 @@ RE_PID = re.compile(r"^\[\d+\]\s+")
 RE_RUST_ASSERT = re.compile(r"^thread .*? panicked at '.+$")
 RE_RUST_END = re.compile(r".+?\.rs(:\d+)+$")
 RE_V8_END = re.compile(r"^")
+RE_RSS_LIMIT = re.compile(r" \(\d+Mb vs \d+Mb\)")
+RE_RSS_PID = re.compile(r"=+\d+=+")
+
+RE_ASAN_UNKNOWN_ADDRESS = re.compile(r"(SEGV|access-violation) on unknown address")
+RE_ASAN_ADDRESS = re.compile(r"on address 0x[0-9a-f]+")
+RE_ASAN_PC = re.compile(r"(at |\()pc 0x[0-9a-f]+")
+RE_ASAN_BP = re.compile(r"bp 0x[0-9a-f]+")
+RE_ASAN_SP = re.compile(r"sp 0x[0-9a-f]+")
+RE_ASAN_THREAD = re.compile(r"(\(thread\s)?T[0-9]+\)")
+RE_ASAN_PREFIX = re.compile(r"^[0-9=]+")
+RE_TSAN_PID = re.compile(r"\s*\(pid=\d+\)")
+RE_TSAN_RW = re.compile(r"\s*(?:Previous )?(?:[Aa]tomic )?(?:[Rr]ead|[Ww]rite) of size")
+RE_UBSAN = re.compile(r":\d+:\d+: runtime error: ")
+
+# Every line getAssertion reacts to (unless it is collecting the lines of a
+# multi-line assertion) contains one of these substrings. All other lines are
+# skipped after testing just these, instead of every assertion format.
+ASSERTION_ANCHORS = (
+    "ssert",
+    "ASSERT",
+    "panicked at",
+    "# Fatal error in",
+    "MOZ_CRASH",
+    "terminate called",
+    "[Non-crash bug] ",
+    "hard rss limit",
+)
+
+# Same for getAuxiliaryAbortMessage, unless it is looking for the read/write line
+# following a sanitizer report.
+AUXILIARY_ANCHORS = ("Sanitizer", "glibc detected", "runtime error")
+
+# Number of sanitized assertion messages cached by getSanitizedAssertionPattern
+SANITIZED_PATTERN_CACHE_SIZE = 4096
+
+
+# Strip full paths. Match using a boundary-restricted class so we don't
+# greedily consume text preceding the path, but emit `.+/` as the
+# replacement so the resulting signature stays readable.
+PATH_MATCH = "[^ '\",(]+/"
+PATH_REPLACE = ".+/"
+
+# Patterns replaced by getSanitizedAssertionPattern, in order. Each entry is
+# (match_regex, replacement_text). A replacement_text of None means "use the
+# match_regex as the replacement"
+REPLACEMENT_PATTERNS: list[tuple[str, str | None]] = [
+    # Specific TSan patterns
+    ("(Previous )?[Aa]tomic [Rr]ead of size", None),
+    ("(Previous )?[Aa]tomic [Ww]rite of size", None),
+    ("(Previous )?[Rr]ead of size", None),
+    ("(Previous )?[Ww]rite of size", None),
+    # We avoid the use of parentheses here because they would be double-escaped
+    ("thread T[0-9]+( .+mutexes: .+)?:", None),
+    ("by main thread( .+mutexes: .+)?:", None),
+    # Replace everything that looks like a memory address
+    ("0x[0-9a-fA-F]+", None),
+    # Strip line numbers as they can easily change across versions
+    ("(:[0-9]+)+", None),
+    (", line [0-9]+", None),
+    # Replace rust thread #s
+    ("Thread#[0-9]+' panicked", None),
+    # In order to reliably identify paths, we require them to be prefixed
+    # by some character that doesn't belong to the path. It turns out that
+    # spaces, quotes and comma are the only things used in the assertions
+    # we support so far. However, we don't want to group these characters
+    # into a regex so avoid cluttering the signature too much.
+    *((prefix + PATH_MATCH, prefix + PATH_REPLACE) for prefix in (" ", "'", '"', ",")),
+    # Replace larger numbers, assuming that 1-digit numbers are likely
+    # some constant that doesn't need sanitizing.
+    ("[0-9]{2,}", None),
+]
+SANITIZE_PATTERNS = [
+    (re.compile(match), match if replacement is None else replacement)
+    for match, replacement in REPLACEMENT_PATTERNS
+]
+
+# Some implementations wrap the path into parentheses. This cannot be part of
+# SANITIZE_PATTERNS because it would double-escape the leading parenthesis.
+RE_PARENTHESIZED_PATH = re.compile("\\(" + PATH_MATCH)
 
 
 def getAssertion(output: list[str]) -> str | list[str] | None:
@@ -50,14 +132,23 @@ def getAssertion(output: list[str]) -> str | list[str] | None:
 
     for line in output:
         # Remove any PID output at the beginning of the line
-        line = re.sub(RE_PID, "", line, count=1)
+        if line.startswith("["):
+            line = RE_PID.sub("", line, count=1)
 
         if endRegex is not None:
             assert isinstance(lastLine, list)
             lastLine.append(line)
             if endRegex.search(line) is not None:
                 endRegex = None
-        elif line.startswith("Assertion failure"):
+            continue
+
+        for anchor in ASSERTION_ANCHORS:
+            if anchor in line:
+                break
+        else:
+            continue
+
+        if line.startswith("Assertion failure"):
             # Firefox fatal assertion (MOZ_ASSERT, JS_ASSERT)
 
             # If we've seen a self-hosted JS assertion, then we ignore
@@ -122,8 +213,8 @@ def getAssertion(output: list[str]) -> str | list[str] | None:
             # Magic string "added" to stderr by some fuzzers.
             lastLine = line
         elif "Sanitizer: hard rss limit exhausted" in line:
-            line = re.sub(r" \(\d+Mb vs \d+Mb\)", "", line)
-            line = re.sub(r"=+\d+=+", "", line)
+            line = RE_RSS_LIMIT.sub("", line)
+            line = RE_RSS_PID.sub("", line)
             lastLine = line
             haveFatalAssertion = True
 
@@ -146,19 +237,27 @@ def getAuxiliaryAbortMessage(output: list[str]) -> str | list[str] | None:
 
     for line in output:
         # Remove any PID output at the beginning of the line
-        line = re.sub("^\\[\\d+\\]\\s+", "", line, count=1)
+        if line.startswith("["):
+            line = RE_PID.sub("", line, count=1)
+
+        if not (needASanRW or needTSanRW):
+            for anchor in AUXILIARY_ANCHORS:
+                if anchor in line:
+                    break
+            else:
+                continue
 
         if "ERROR: AddressSanitizer" in line:
             if "failed to allocate" in line:
                 lastLine = line.split(": ", 1)[-1].strip()
-            elif re.search(r"(SEGV|access-violation) on unknown address", line) is None:
+            elif RE_ASAN_UNKNOWN_ADDRESS.search(line) is None:
                 # Strip address, registers and PID prefix
-                line = re.sub(r"on address 0x[0-9a-f]+", "", line)
-                line = re.sub(r"(at |\()pc 0x[0-9a-f]+", "", line)
-                line = re.sub(r"bp 0x[0-9a-f]+", "", line)
-                line = re.sub(r"sp 0x[0-9a-f]+", "", line)
-                line = re.sub(r"(\(thread\s)?T[0-9]+\)", "", line)
-                line = re.sub(r"^[0-9=]+", "", line)
+                line = RE_ASAN_ADDRESS.sub("", line)
+                line = RE_ASAN_PC.sub("", line)
+                line = RE_ASAN_BP.sub("", line)
+                line = RE_ASAN_SP.sub("", line)
+                line = RE_ASAN_THREAD.sub("", line)
+                line = RE_ASAN_PREFIX.sub("", line)
                 lastLine = line.strip()
                 needASanRW = True
         elif needASanRW and ("READ of size" in line or "WRITE of size" in line):
@@ -167,7 +266,7 @@ def getAuxiliaryAbortMessage(output: list[str]) -> str | list[str] | None:
             lastLine.append(line)
             needASanRW = False
         elif "WARNING: ThreadSanitizer:" in line:
-            line = re.sub(r"\s*\(pid=\d+\)", "", line)
+            line = RE_TSAN_PID.sub("", line)
             lastLine = line.strip()
 
             # If we have a data race, then we would like the read/write lines mentioning
@@ -176,15 +275,13 @@ def getAuxiliaryAbortMessage(output: list[str]) -> str | list[str] | None:
 
             if needTSanRW:
                 lastLine = [lastLine]
-        elif needTSanRW and re.match(
-            r"\s*(?:Previous )?(?:[Aa]tomic )?(?:[Rr]ead|[Ww]rite) of size", line
-        ):
+        elif needTSanRW and RE_TSAN_RW.match(line):
             assert isinstance(lastLine, list)
             lastLine.append(line.strip())
         elif "glibc detected" in line:
             # Aborts caused by glibc runtime error detection
             lastLine = line
-        elif "runtime error" in line and re.search(":\\d+:\\d+: runtime error: ", line):
+        elif "runtime error" in line and RE_UBSAN.search(line):
             # UBSan error
             lastLine = line
 
@@ -210,118 +307,7 @@ def getSanitizedAssertionPattern(msgs: str | list[str]) -> str | list[str]:
         msgs = [msgs]
         returnList = False
 
-    sanitizedMsgs = []
-
-    for msg in msgs:
-        # remember the position of all backslashes in the input
-        bsPositions: list[int] = []
-        for chunk in msg.split("\\"):
-            if not bsPositions:
-                bsPositions.append(len(chunk))
-            else:
-                bsPositions.append(len(chunk) + bsPositions[-1] + 1)
-        # msg.split(x) will return `# of matches(x) + 1` values: the last one is invalid
-        bsPositions.pop()
-
-        # replace backslashes with forward slashes for now so we can process paths
-        # consistently any backslashes not matched in a path pattern will be restored
-        # later
-        sanitizedMsg = escapePattern(msg.replace("\\", "/"))
-
-        # correct bsPositions for escaped characters
-        idx = 0
-        for chunk in sanitizedMsg.split("\\"):
-            idx += len(chunk) + 1
-            bsPositions = [bs + 1 if bs > idx else bs for bs in bsPositions]
-
-        # Each entry is (match_regex, replacement_text). A replacement_text of
-        # None means "use the match_regex as the replacement"
-        replacementPatterns: list[tuple[str, str | None]] = []
-
-        # Specific TSan patterns
-        replacementPatterns.append(("(Previous )?[Aa]tomic [Rr]ead of size", None))
-        replacementPatterns.append(("(Previous )?[Aa]tomic [Ww]rite of size", None))
-        replacementPatterns.append(("(Previous )?[Rr]ead of size", None))
-        replacementPatterns.append(("(Previous )?[Ww]rite of size", None))
-        # We avoid the use of parentheses here because they would be double-escaped
-        replacementPatterns.append(("thread T[0-9]+( .+mutexes: .+)?:", None))
-        replacementPatterns.append(("by main thread( .+mutexes: .+)?:", None))
-
-        # Replace everything that looks like a memory address
-        replacementPatterns.append(("0x[0-9a-fA-F]+", None))
-
-        # Strip line numbers as they can easily change across versions
-        replacementPatterns.append(("(:[0-9]+)+", None))
-        replacementPatterns.append((", line [0-9]+", None))
-
-        # Replace rust thread #s
-        replacementPatterns.append(("Thread#[0-9]+' panicked", None))
-
-        # Strip full paths. Match using a boundary-restricted class so we don't
-        # greedily consume text preceding the path, but emit `.+/` as the
-        # replacement so the resulting signature stays readable.
-        pathMatch = "[^ '\",(]+/"
-        pathReplace = ".+/"
-
-        # In order to reliably identify paths, we require them to be prefixed
-        # by some character that doesn't belong to the path. It turns out that
-        # spaces, quotes and comma are the only things used in the assertions
-        # we support so far. However, we don't want to group these characters
-        # into a regex so avoid cluttering the signature too much.
-        replacementPatterns.extend(
-            (prefix + pathMatch, prefix + pathReplace)
-            for prefix in (" ", "'", '"', ",")
-        )
-
-        # Replace larger numbers, assuming that 1-digit numbers are likely
-        # some constant that doesn't need sanitizing.
-        replacementPatterns.append(("[0-9]{2,}", None))
-
-        for matchPattern, replacementText in replacementPatterns:
-            replacementPattern = (
-                matchPattern if replacementText is None else replacementText
-            )
-
-            def _handleMatch(match: re.Match[str]) -> str:
-                start = match.start(0)
-                end = match.end(0)
-                lengthDiff = len(replacementPattern) - len(match.group(0))
-
-                # we can't replace bsPositions with list comprehensions because we're in
-                # a nested scope. iterate by index and modify it instead
-                idx = 0
-                while idx < len(bsPositions):
-                    if bsPositions[idx] < start:
-                        # no change for backslashes before the start of this match
-                        idx += 1
-                    elif bsPositions[idx] < end:
-                        # the backslash is covered by this match, remove it
-                        bsPositions.pop(idx)
-                    else:
-                        # the backslash is after the match, shift it by the length
-                        # difference
-                        bsPositions[idx] += lengthDiff
-                        idx += 1
-
-                return replacementPattern
-
-            sanitizedMsg = re.sub(matchPattern, _handleMatch, sanitizedMsg)
-
-        # backslashes were replaced with / for unified path handling (and because
-        # backslash is the escape character, which makes pattern matching otherwise
-        # impossible)
-        # if they were not used in a path pattern, restore them now
-        # in other words, add back the windows bs
-        while bsPositions:
-            bsPos = bsPositions.pop()
-            # escape it now too, since it would have gone through escapePattern above
-            sanitizedMsg = sanitizedMsg[:bsPos] + "\\\\" + sanitizedMsg[bsPos + 1 :]
-
-        # Some implementations wrap the path into parentheses. We cannot add this to
-        # replacementPatterns because it would double-escape the leading parenthesis.
-        sanitizedMsg = re.sub("\\(" + pathMatch, "(" + pathReplace, sanitizedMsg)
-
-        sanitizedMsgs.append(sanitizedMsg)
+    sanitizedMsgs = [_sanitizeAssertionMessage(msg) for msg in msgs]
 
     if not returnList:
         return sanitizedMsgs[0]
@@ -329,6 +315,73 @@ def getSanitizedAssertionPattern(msgs: str | list[str]) -> str | list[str]:
     return sanitizedMsgs
 
 
+@lru_cache(maxsize=SANITIZED_PATTERN_CACHE_SIZE)
+def _sanitizeAssertionMessage(msg: str) -> str:
+    """Sanitize a single assertion message, see getSanitizedAssertionPattern"""
+    # remember the position of all backslashes in the input
+    bsPositions: list[int] = []
+    for chunk in msg.split("\\"):
+        if not bsPositions:
+            bsPositions.append(len(chunk))
+        else:
+            bsPositions.append(len(chunk) + bsPositions[-1] + 1)
+    # msg.split(x) will return `# of matches(x) + 1` values: the last one is invalid
+    bsPositions.pop()
+
+    # replace backslashes with forward slashes for now so we can process paths
+    # consistently any backslashes not matched in a path pattern will be restored
+    # later
+    sanitizedMsg = escapePattern(msg.replace("\\", "/"))
+
+    # correct bsPositions for escaped characters
+    idx = 0
+    for chunk in sanitizedMsg.split("\\"):
+        idx += len(chunk) + 1
+        bsPositions = [bs + 1 if bs > idx else bs for bs in bsPositions]
+
+    for matchRegex, replacementPattern in SANITIZE_PATTERNS:
+
+        def _handleMatch(
+            match: re.Match[str], replacementPattern: str = replacementPattern
+        ) -> str:
+            start = match.start(0)
+            end = match.end(0)
+            lengthDiff = len(replacementPattern) - len(match.group(0))
+
+            # we can't replace bsPositions with list comprehensions because we're in
+            # a nested scope. iterate by index and modify it instead
+            idx = 0
+            while idx < len(bsPositions):
+                if bsPositions[idx] < start:
+                    # no change for backslashes before the start of this match
+                    idx += 1
+                elif bsPositions[idx] < end:
+                    # the backslash is covered by this match, remove it
+                    bsPositions.pop(idx)
+                else:
+                    # the backslash is after the match, shift it by the length
+                    # difference
+                    bsPositions[idx] += lengthDiff
+                    idx += 1
+
+            return replacementPattern
+
+        sanitizedMsg = matchRegex.sub(_handleMatch, sanitizedMsg)
+
+    # backslashes were replaced with / for unified path handling (and because
+    # backslash is the escape character, which makes pattern matching otherwise
+    # impossible)
+    # if they were not used in a path pattern, restore them now
+    # in other words, add back the windows bs
+    while bsPositions:
+        bsPos = bsPositions.pop()
+        # escape it now too, since it would have gone through escapePattern above
+        sanitizedMsg = sanitizedMsg[:bsPos] + "\\\\" + sanitizedMsg[bsPos + 1 :]
+
+    # Some implementations wrap the path into parentheses
+    return RE_PARENTHESIZED_PATH.sub("(" + PATH_REPLACE, sanitizedMsg)
+
+
 def escapePattern(msg: str) -> str:
     """
     This method escapes regular expression characters in the string.
@@ -20,12 +20,14 @@ from __future__ import annotations
 import json
 import os
 import re
+import struct
 import sys
 import unicodedata
 from abc import ABCMeta
 from contextlib import suppress
 from functools import wraps
-from typing import TYPE_CHECKING, Any
+from itertools import chain
+from typing import TYPE_CHECKING, Any, cast
 
 from FTB import AssertionHelper
 from FTB.ProgramConfiguration import ProgramConfiguration
@@ -35,6 +37,50 @@ from FTB.Signatures.CrashSignature import CrashSignature
 if TYPE_CHECKING:
     from collections.abc import Callable, Mapping
 
+    # signature shared by the constructors of all CrashInfo subclasses
+    CrashInfoFactory = Callable[
+        [
+            list[str] | None,
+            list[str] | None,
+            ProgramConfiguration,
+            list[str] | None,
+        ],
+        "CrashInfo",
+    ]
+
+# Binary cache object layout (see CrashInfo.encodeCacheObject): a header with a
+# marker byte that can never start a JSON document, the format version, flags, the
+# number of strings in the string table, of backtrace frames and of registers, the
+# crash address and the string indices of the crash instruction and failure reason.
+# It is followed by the frame and register name string indices, the register values
+# and finally the NUL separated string table.
+CACHE_MARKER = 0
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct("<BBBIIIQII")
+CACHE_HAS_ADDRESS = 1
+# set if no frame repeats, the backtrace is then the start of the string table and
+# the frame string indices are omitted
+CACHE_SEQUENTIAL_FRAMES = 2
+CACHE_NO_STRING = 0xFFFFFFFF
+
+# Crash format detection (see CrashInfo.detectCrashInfoClass) only looks at lines
+# containing one of these substrings, each trigger string contains at least one of
+# them. Ordinary output lines are rejected with these few substring searches instead
+# of testing every trigger string. Valgrind messages are detected separately.
+DETECTION_ANCHORS = (
+    "Sanitizer",
+    "runtime error",
+    "signal ",
+    "Mac OS X",
+    "Windows Debugger",
+    "panicked at",
+    "stack backtrace:",
+    "|",
+)
+UBSAN_DETECTION_REGEX = re.compile(r".+?:\d+:\d+: runtime error:\s+.+")
+# Rust symbols have a source hash appended to them
+RUST_HASH_REGEX = re.compile(r"::h[0-9a-f]{16}$")
+
 
 def unicode_escape_result(func: Callable[..., str]) -> Callable[..., str]:
     r"""Decorator to escape control and special block unicode
@@ -161,6 +207,15 @@ class CrashInfo(metaclass=ABCMeta):
     It also supports generating a CrashSignature based on the stored information.
     """
 
+    # Fields computed from the raw data by the subclass constructors
+    PARSED_FIELDS = (
+        "backtrace",
+        "registers",
+        "crashAddress",
+        "crashInstruction",
+        "failureReason",
+    )
+
     def __init__(self) -> None:
         # Store the raw data
         self.rawStdout: list[str] = []
@@ -229,13 +284,149 @@ class CrashInfo(metaclass=ABCMeta):
 
         return cacheObject
 
+    @staticmethod
+    def encodeCacheObject(cacheObject: Mapping[str, Any]) -> bytes:
+        """
+        Encode a cache object created by toCacheObject into a compact binary form.
+
+        All strings (frames, register names, crash instruction and failure reason)
+        are interned into a single NUL separated string table that is referenced by
+        index, register values and the crash address are stored as unsigned 64-bit
+        integers. Cache objects that cannot be represented that way are encoded as
+        JSON instead, which decodeCacheObject accepts as well.
+
+        @type cacheObject: Dictionary
+        @param cacheObject: The cache object as returned by toCacheObject
+
+        @rtype: bytes
+        @return: Encoded cache object
+        """
+        strings: dict[str, int] = {}
+
+        def intern(value: str | None) -> int:
+            if value is None:
+                return CACHE_NO_STRING
+            return strings.setdefault(value, len(strings))
+
+        frames = [intern(frame) for frame in cacheObject["backtrace"]]
+        frameCount = len(frames)
+        flags = 0
+        if len(strings) == frameCount:
+            flags |= CACHE_SEQUENTIAL_FRAMES
+            frames = []
+
+        registers = cacheObject["registers"]
+        indices = frames + [intern(name) for name in registers]
+
+        crashAddress = cacheObject["crashAddress"]
+        if crashAddress is not None:
+            flags |= CACHE_HAS_ADDRESS
+        crashInstruction = intern(cacheObject["crashInstruction"])
+        failureReason = intern(cacheObject["failureReason"])
+
+        if any("\0" in value for value in strings):
+            return json.dumps(cacheObject).encode("utf-8")
+
+        try:
+            return b"".join(
+                (
+                    CACHE_HEADER.pack(
+                        CACHE_MARKER,
+                        CACHE_VERSION,
+                        flags,
+                        len(strings),
+                        frameCount,
+                        len(registers),
+                        crashAddress or 0,
+                        crashInstruction,
+                        failureReason,
+                    ),
+                    struct.pack(
+                        f"<{len(indices)}I{len(registers)}Q",
+                        *indices,
+                        *registers.values(),
+                    ),
+                    "\0".join(strings).encode("utf-8", "surrogatepass"),
+                )
+            )
+        except struct.error:
+            # e.g. register values or addresses that do not fit into 64 bits
+            return json.dumps(cacheObject).encode("utf-8")
+
+    @staticmethod
+    def decodeCacheObject(data: bytes) -> dict[str, Any]:
+        """
+        Decode a cache object encoded by encodeCacheObject. JSON encoded cache
+        objects are accepted as well.
+
+        @type data: bytes
+        @param data: Encoded cache object
+
+        @rtype: dict
+        @return: The cache object, as returned by toCacheObject
+        """
+        if not data or data[0] != CACHE_MARKER:
+            result: dict[str, Any] = json.loads(bytes(data))
+            return result
+
+        (
+            _,
+            version,
+            flags,
+            _,
+            frameCount,
+            registerCount,
+            crashAddress,
+            crashInstruction,
+            failureReason,
+        ) = CACHE_HEADER.unpack_from(data)
+        if version != CACHE_VERSION:
+            raise ValueError(f"Unsupported cache object version {version}")
+
+        indexCount = registerCount
+        if not flags & CACHE_SEQUENTIAL_FRAMES:
+            indexCount += frameCount
+        bodyFormat = f"<{indexCount}I{registerCount}Q"
+        values = struct.unpack_from(bodyFormat, data, CACHE_HEADER.size)
+        strings = str(
+            data[CACHE_HEADER.size + struct.calcsize(bodyFormat) :],
+            "utf-8",
+            "surrogatepass",
+        ).split("\0")
+
+        registerStart = indexCount - registerCount
+        if flags & CACHE_SEQUENTIAL_FRAMES:
+            backtrace = strings[:frameCount]
+        else:
+            backtrace = list(map(strings.__getitem__, values[:registerStart]))
+        return {
+            "backtrace": backtrace,
+            "registers": dict(
+                zip(
+                    map(strings.__getitem__, values[registerStart:indexCount]),
+                    values[indexCount:],
+                )
+            ),
+            "crashAddress": crashAddress if flags & CACHE_HAS_ADDRESS else None,
+            "crashInstruction": (
+                None
+                if crashInstruction == CACHE_NO_STRING
+                else strings[crashInstruction]
+            ),
+            "failureReason": (
+                None if failureReason == CACHE_NO_STRING else strings[failureReason]
+            ),
+        }
+
     @staticmethod
     def fromRawCrashData(
         stdout: str | list[str] | None,
         stderr: str | list[str] | None,
         configuration: ProgramConfiguration,
         auxCrashData: str | list[str] | None = None,
-        cacheObject: Mapping[str, Any] | None = None,
+        cacheObject: Mapping[str, Any] | bytes | None = None,
+        maxDetectionLines: int | None = None,
+        lazy: bool = False,
     ) -> CrashInfo:
         """
         Create appropriate CrashInfo instance from raw crash data
@@ -250,10 +441,19 @@ class CrashInfo(metaclass=ABCMeta):
         @type auxCrashData: List of strings
         @param auxCrashData: Optional additional crash output (e.g. GDB). If not
                              specified, stderr is used.
-        @type cacheObject: Dictionary
+        @type cacheObject: Dictionary or bytes
         @param cacheObject: The cache object that should be used to restore the class
                             fields instead of parsing the crash data. The appropriate
-                            object can be created by calling the toCacheObject method.
+                            object can be created by calling the toCacheObject method,
+                            optionally encoded using encodeCacheObject.
+        @type maxDetectionLines: int
+        @param maxDetectionLines: If specified, only the last maxDetectionLines lines
+                                  of auxCrashData and stderr are inspected to detect
+                                  the crash output format.
+        @type lazy: bool
+        @param lazy: If True, the crash data is only parsed on first access to any
+                     of the parsed fields (see PARSED_FIELDS). Matching signatures
+                     that only contain output symptoms then never parses it.
 
         @rtype: CrashInfo
         @return: Crash information object
@@ -275,6 +475,9 @@ class CrashInfo(metaclass=ABCMeta):
             auxCrashData = auxCrashData.splitlines()
 
         if cacheObject is not None:
+            if isinstance(cacheObject, (bytes, bytearray, memoryview)):
+                cacheObject = CrashInfo.decodeCacheObject(cacheObject)
+
             c = CrashInfo()
 
             if stdout is not None:
@@ -295,9 +498,108 @@ class CrashInfo(metaclass=ABCMeta):
 
             return c
 
+        crashInfoClass = CrashInfo.detectCrashInfoClass(
+            stderr, auxCrashData, maxLines=maxDetectionLines
+        )
+        if not lazy:
+            return CrashInfo._parse(
+                crashInfoClass, stdout, stderr, configuration, auxCrashData
+            )
+
+        lazyClass = cast("type[CrashInfo]", crashInfoClass)
+        result = lazyClass.__new__(lazyClass)
+        CrashInfo.__init__(result)
+
+        if stdout is not None:
+            result.rawStdout.extend(stdout)
+
+        if stderr is not None:
+            result.rawStderr.extend(stderr)
+
+        if auxCrashData is not None:
+            result.rawCrashData.extend(auxCrashData)
+
+        result.configuration = configuration
+
+        # Remove the parsed fields, so the first access to any of them goes through
+        # __getattr__ and parses the crash data.
+        for field in CrashInfo.PARSED_FIELDS:
+            delattr(result, field)
+        result.__dict__["_deferredArgs"] = (
+            crashInfoClass,
+            stdout,
+            stderr,
+            configuration,
+            auxCrashData,
+        )
+
+        return result
+
+    @staticmethod
+    def _parse(
+        crashInfoClass: CrashInfoFactory,
+        stdout: list[str] | None,
+        stderr: list[str] | None,
+        configuration: ProgramConfiguration,
+        auxCrashData: list[str] | None,
+    ) -> CrashInfo:
+        result = crashInfoClass(stdout, stderr, configuration, auxCrashData)
+
+        # Rust symbols have a source hash appended to them. Strip this off regardless of
+        # the CrashInfo type
+        result.backtrace = [
+            RUST_HASH_REGEX.sub("", frame) if "::h" in frame else frame
+            for frame in result.backtrace
+        ]
+
+        return result
+
+    if not TYPE_CHECKING:
+
+        def __getattr__(self, name):
+            # Only called for attributes that are not set, i.e. the parsed fields of
+            # lazily created instances before their first access.
+            deferredArgs = self.__dict__.get("_deferredArgs")
+            if deferredArgs is None or name.startswith("__"):
+                raise AttributeError(
+                    f"{type(self).__name__!r} object has no attribute {name!r}"
+                )
+
+            parsed = CrashInfo._parse(*deferredArgs)
+            # Fields assigned before parsing (e.g. an attached testcase) are kept.
+            # The arguments are only dropped afterwards, so concurrent first
+            # accesses parse twice instead of failing.
+            for field, value in parsed.__dict__.items():
+                self.__dict__.setdefault(field, value)
+            self.__dict__.pop("_deferredArgs", None)
+
+            return getattr(self, name)
+
+    @staticmethod
+    def detectCrashInfoClass(
+        stderr: list[str] | None,
+        auxCrashData: list[str] | None = None,
+        maxLines: int | None = None,
+    ) -> CrashInfoFactory:
+        """
+        Determine the CrashInfo subclass matching the given crash output in a single
+        pass over the lines of auxCrashData followed by stderr.
+
+        @type stderr: List of strings
+        @param stderr: List of lines as they appeared on stderr
+        @type auxCrashData: List of strings
+        @param auxCrashData: Optional additional crash output, preferred over stderr
+        @type maxLines: int
+        @param maxLines: If specified, only the last maxLines lines of auxCrashData
+                         and of stderr are inspected, bounding the time spent on
+                         pathologically long output.
+
+        @rtype: class
+        @return: CrashInfo subclass to be instantiated for the crash output
+        """
         # some results are weak, meaning any other CrashInfo detected after it will take
         # precedence
-        weakResult = None
+        weakResult: CrashInfoFactory = NoCrashInfo
 
         asanString = "ERROR: AddressSanitizer"
         asanString2 = "Sanitizer: hard rss limit exhausted"
@@ -308,7 +610,6 @@ class CrashInfo(metaclass=ABCMeta):
         tsanString2 = "ERROR: ThreadSanitizer:"
         ubsanString = ": runtime error: "
         ubsanString2 = "ERROR: UndefinedBehaviorSanitizer"
-        ubsanRegex = r".+?:\d+:\d+: runtime error:\s+.+"
         appleString = "Mac OS X"
         cdbString = "Microsoft (R) Windows Debugger"
 
@@ -323,45 +624,45 @@ class CrashInfo(metaclass=ABCMeta):
         minidumpFirstDetected = False
 
         # Search both crashData and stderr, but prefer crashData
-        lines: list[str] = []
-        if auxCrashData is not None:
-            lines.extend(auxCrashData)
-        if stderr is not None:
-            lines.extend(stderr)
+        sources = [lines for lines in (auxCrashData, stderr) if lines]
+        if maxLines is not None:
+            sources = [lines[-maxLines:] if maxLines else [] for lines in sources]
 
-        result: CrashInfo | None = None
-        for line in lines:
-            if ubsanString in line and re.match(ubsanRegex, line) is not None:
-                result = UBSanCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
+        for line in chain.from_iterable(sources):
+            for anchor in DETECTION_ANCHORS:
+                if anchor in line:
+                    break
+            else:
+                # none of the strings below can be contained in this line
+                if line.startswith("==") and ValgrindCrashInfo.MSG_REGEX.match(line):
+                    return ValgrindCrashInfo
+                minidumpFirstDetected = False
+                continue
+
+            if ubsanString in line and UBSAN_DETECTION_REGEX.match(line) is not None:
+                return UBSanCrashInfo
             if (
                 asanString in line
                 or asanString2 in line
                 or ubsanString2 in line
                 or tsanString2 in line
             ):
-                result = ASanCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
+                return ASanCrashInfo
             if lsanString in line:
-                result = LSanCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
+                return LSanCrashInfo
             if tsanString in line:
-                result = TSanCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
+                return TSanCrashInfo
             if appleString in line and not line.startswith(minidumpFirstString):
-                result = AppleCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
+                return AppleCrashInfo
             if cdbString in line:
-                result = CDBCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
+                return CDBCrashInfo
             if gdbString in line or gdbCoreString in line:
-                result = GDBCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
+                return GDBCrashInfo
             if not rustFirstDetected and rustFirstString in line:
                 rustFirstDetected = True
                 minidumpFirstDetected = False
             elif rustFirstDetected and rustSecondString in line:
-                weakResult = RustCrashInfo(stdout, stderr, configuration, auxCrashData)
+                weakResult = RustCrashInfo
                 rustFirstDetected = False
             elif not minidumpFirstDetected and minidumpFirstString in line:
                 # Only match Minidump output if the *next* line also contains
@@ -369,29 +670,16 @@ class CrashInfo(metaclass=ABCMeta):
                 rustFirstDetected = False
                 minidumpFirstDetected = True
             elif minidumpFirstDetected and minidumpSecondString in line:
-                result = MinidumpCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
-            elif line.startswith("==") and re.match(ValgrindCrashInfo.MSG_REGEX, line):
-                result = ValgrindCrashInfo(stdout, stderr, configuration, auxCrashData)
-                break
+                return MinidumpCrashInfo
+            elif line.startswith("==") and ValgrindCrashInfo.MSG_REGEX.match(line):
+                return ValgrindCrashInfo
             else:
                 minidumpFirstDetected = False
 
         # Default fallback to be used if there is neither ASan nor GDB output.
         # This is still useful in case there is no crash but we want to match
         # e.g. stdout/stderr output with signatures.
-        if result is None:
-            result = weakResult or NoCrashInfo(
-                stdout, stderr, configuration, auxCrashData
-            )
-
-        # Rust symbols have a source hash appended to them. Strip this off regardless of
-        # the CrashInfo type
-        result.backtrace = [
-            re.sub(r"::h[0-9a-f]{16}$", "", frame) for frame in result.backtrace
-        ]
-
-        return result
+        return weakResult
 
     @unicode_escape_result
     def createShortSignature(self) -> str:
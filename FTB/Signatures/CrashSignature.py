@@ -23,6 +23,7 @@ from typing import TYPE_CHECKING, Any
 
 from FTB.Signatures import JSONHelper
 from FTB.Signatures.Symptom import (
+    DEFAULT_MAX_DIFF_DISTANCE,
     OutputSymptom,
     StackFramesSymptom,
     Symptom,
@@ -31,6 +32,8 @@ from FTB.Signatures.Symptom import (
 
 if TYPE_CHECKING:
     from FTB.Signatures.CrashInfo import CrashInfo
+    from FTB.Signatures.OutputMatcher import OutputMatchResult
+    from FTB.Signatures.Symptom import FrameMatcher
 
 
 class CrashSignature:
@@ -79,13 +82,26 @@ class CrashSignature:
     def __str__(self) -> str:
         return self.rawSignature
 
-    def matches(self, crashInfo: CrashInfo) -> bool:
+    def matches(
+        self,
+        crashInfo: CrashInfo,
+        outputHits: OutputMatchResult | None = None,
+        matchFrame: FrameMatcher | None = None,
+    ) -> bool:
         """
         Match this signature against the given crash information
 
         @type crashInfo: CrashInfo
         @param crashInfo: The crash info to match the signature against
 
+        @type outputHits: OutputMatchResult
+        @param outputHits: Optional precomputed output symptom results for this
+                           crash, obtained from L{OutputMatcher.scan}
+
+        @type matchFrame: callable
+        @param matchFrame: Optional function matching PCRE function names of
+                           stackFrames symptoms, see L{StackFramesSymptom.matches}
+
         @rtype: bool
         @return: True if the signature matches, False otherwise
         """
@@ -111,10 +127,24 @@ class CrashSignature:
                 deferredSymptoms.append(symptom)
                 continue
 
+            if isinstance(symptom, StackFramesSymptom):
+                if not symptom.matches(crashInfo, matchFrame):
+                    return False
+            elif not symptom.matches(crashInfo):
+                return False
+
+        for symptom in deferredSymptoms:
+            if outputHits is not None and isinstance(symptom, OutputSymptom):
+                hit = outputHits.get(symptom)
+                if hit is not None:
+                    if not hit:
+                        return False
+                    continue
+
             if not symptom.matches(crashInfo):
                 return False
 
-        return all(symptom.matches(crashInfo) for symptom in deferredSymptoms)
+        return True
 
     def matchRequiresTest(self) -> bool:
         """
@@ -151,21 +181,50 @@ class CrashSignature:
 
         return ret
 
-    def getDistance(self, crashInfo: CrashInfo) -> int:
+    def getDistance(
+        self,
+        crashInfo: CrashInfo,
+        maxFrameDistance: int = DEFAULT_MAX_DIFF_DISTANCE,
+        maxDistance: int | None = None,
+    ) -> int:
+        """
+        Determine how far this signature is off from matching the given crash.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash information to check against
+        @type maxFrameDistance: int
+        @param maxFrameDistance: Maximum number of wildcard edits to consider for
+                                 each stackFrames symptom
+        @type maxDistance: int
+        @param maxDistance: If given, stop as soon as the distance exceeds this
+                            value. Any distance above maxDistance is then only
+                            guaranteed to be above maxDistance, not exact.
+
+        @rtype: int
+        @return: The distance, 0 if the signature matches
+        """
         distance = 0
 
         for symptom in self.symptoms:
             if isinstance(symptom, StackFramesSymptom):
-                symptomDistance = symptom.diff(crashInfo)[0]
+                frameDistance = maxFrameDistance
+                if maxDistance is not None:
+                    frameDistance = min(frameDistance, maxDistance - distance)
+                symptomDistance = symptom.diff(crashInfo, frameDistance)[0]
                 if symptomDistance is not None:
                     distance += symptomDistance
                 else:
-                    # If we can't find the distance, assume worst-case
+                    # If we can't find the distance, assume worst-case. This is
+                    # never less than the actual number of edits, so it still
+                    # exceeds maxDistance if frameDistance was too small.
                     distance += len(symptom.functionNames)
             else:
                 if not symptom.matches(crashInfo):
                     distance += 1
 
+            if maxDistance is not None and distance > maxDistance:
+                return distance
+
         if self.platforms is not None:
             assert crashInfo.configuration is not None
             if crashInfo.configuration.platform not in self.platforms:
@@ -181,7 +240,9 @@ class CrashSignature:
 
         return distance
 
-    def fit(self, crashInfo: CrashInfo) -> CrashSignature | None:
+    def fit(
+        self, crashInfo: CrashInfo, maxFrameDistance: int = DEFAULT_MAX_DIFF_DISTANCE
+    ) -> CrashSignature | None:
         sigObj: dict[str, Any] = {}
         sigSymptoms: list[Any] = []
 
@@ -196,7 +257,7 @@ class CrashSignature:
         if self.products:
             sigObj["products"] = self.products
 
-        symptomsDiff = self.getSymptomsDiff(crashInfo)
+        symptomsDiff = self.getSymptomsDiff(crashInfo, maxFrameDistance)
 
         for symptomDiff in symptomsDiff:
             if symptomDiff["offending"]:
@@ -210,7 +271,9 @@ class CrashSignature:
 
         return CrashSignature(json.dumps(sigObj, indent=2, sort_keys=True))
 
-    def getSymptomsDiff(self, crashInfo: CrashInfo) -> list[dict[str, Any]]:
+    def getSymptomsDiff(
+        self, crashInfo: CrashInfo, maxFrameDistance: int = DEFAULT_MAX_DIFF_DISTANCE
+    ) -> list[dict[str, Any]]:
         symptomsDiff: list[dict[str, Any]] = []
         for symptom in self.symptoms:
             if symptom.matches(crashInfo):
@@ -221,7 +284,7 @@ class CrashSignature:
                 # calling matchWithDiff, we annotate internals of the symptom with
                 # distance information to display.
                 if isinstance(symptom, StackFramesSymptom):
-                    proposedSymptom = symptom.diff(crashInfo)[1]
+                    proposedSymptom = symptom.diff(crashInfo, maxFrameDistance)[1]
                     if proposedSymptom:
                         symptomsDiff.append(
                             {
@@ -236,7 +299,7 @@ class CrashSignature:
         return symptomsDiff
 
     def getSignatureUnifiedDiffTuples(
-        self, crashInfo: CrashInfo
+        self, crashInfo: CrashInfo, maxFrameDistance: int = DEFAULT_MAX_DIFF_DISTANCE
     ) -> list[tuple[str, str]]:
         diffTuples: list[tuple[str, str]] = []
 
@@ -246,7 +309,7 @@ class CrashSignature:
             json.loads(self.rawSignature), indent=2, sort_keys=True
         ).splitlines()
         newLines = []
-        newRawCrashSignature = self.fit(crashInfo)
+        newRawCrashSignature = self.fit(crashInfo, maxFrameDistance)
         if newRawCrashSignature:
             newLines = newRawCrashSignature.rawSignature.splitlines()
         context = max(len(oldLines), len(newLines))
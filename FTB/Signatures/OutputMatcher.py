@@ -0,0 +1,329 @@
+"""
+Output Matcher
+
+Matches the output symptoms of a whole set of crash signatures against a crash
+by scanning each output source only once.
+
+@author:     Christian Holler (:decoder)
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+@contact:    choller@mozilla.com
+"""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import TYPE_CHECKING
+
+from FTB.Signatures.Symptom import OutputSymptom
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from FTB.Signatures.CrashInfo import CrashInfo
+    from FTB.Signatures.CrashSignature import CrashSignature
+    from FTB.Signatures.Matchers import StringMatch
+
+OUTPUT_SOURCES = ("stdout", "stderr", "crashdata")
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton finding all of a set of literals in a text in a single
+    pass over that text.
+    """
+
+    def __init__(self, literals: list[str]) -> None:
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[tuple[int, ...]] = [()]
+
+        for literalIdx, literal in enumerate(literals):
+            state = 0
+            for char in literal:
+                nextState = self.goto[state].get(char)
+                if nextState is None:
+                    nextState = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                    self.goto[state][char] = nextState
+                state = nextState
+            self.out[state] += (literalIdx,)
+
+        # Breadth-first construction of the failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nextState in self.goto[state].items():
+                queue.append(nextState)
+                failState = self.fail[state]
+                while failState and char not in self.goto[failState]:
+                    failState = self.fail[failState]
+                failState = self.goto[failState].get(char, 0)
+                self.fail[nextState] = failState if failState != nextState else 0
+                self.out[nextState] += self.out[self.fail[nextState]]
+
+    def search(self, text: str) -> set[int]:
+        """
+        Find all literals occurring in the given text.
+
+        @type text: str
+        @param text: Text to search
+
+        @rtype: set(int)
+        @return: Indices of all literals contained in the text
+        """
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+
+        found: set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class OutputMatcher:
+    """
+    Compiled matcher for all output symptoms of a set of signatures.
+
+    "Contains" values are found with one Aho-Corasick pass over each output
+    source, PCRE values are prefiltered per line with one combined alternation.
+    The results are handed to L{CrashSignature.matches}, which then no longer
+    scans the output for every single symptom.
+    """
+
+    def __init__(self, signatures: Iterable[CrashSignature]) -> None:
+        """
+        @type signatures: Iterable(CrashSignature)
+        @param signatures: The signatures whose output symptoms should be matched
+        """
+        # Keep the symptoms referenced, results are keyed by their identity
+        self.symptoms: dict[int, OutputSymptom] = {}
+        self.sources: dict[int, tuple[str, ...]] = {}
+
+        self.literals: list[str] = []
+        self.literalSymptoms: list[list[int]] = []
+        literalIndices: dict[str, int] = {}
+
+        self.patterns: list[StringMatch] = []
+        self.patternSymptoms: list[list[int]] = []
+        patternIndices: dict[str, int] = {}
+
+        for signature in signatures:
+            for symptom in signature.symptoms:
+                if not isinstance(symptom, OutputSymptom):
+                    continue
+                match = symptom.output
+                if not match.isPCRE and (not match.value or "\n" in match.value):
+                    # The empty literal matches any line and a literal with a
+                    # newline none, leave these to the symptom itself.
+                    continue
+
+                key = id(symptom)
+                self.symptoms[key] = symptom
+                self.sources[key] = (
+                    OUTPUT_SOURCES if symptom.src is None else (symptom.src,)
+                )
+
+                if match.isPCRE:
+                    if match.value not in patternIndices:
+                        patternIndices[match.value] = len(self.patterns)
+                        self.patterns.append(match)
+                        self.patternSymptoms.append([])
+                    self.patternSymptoms[patternIndices[match.value]].append(key)
+                else:
+                    if match.value not in literalIndices:
+                        literalIndices[match.value] = len(self.literals)
+                        self.literals.append(match.value)
+                        self.literalSymptoms.append([])
+                    self.literalSymptoms[literalIndices[match.value]].append(key)
+
+        self.automaton = AhoCorasick(self.literals) if self.literals else None
+
+        # Patterns are looked up per output source, as they only need to be
+        # matched against the sources their symptoms refer to.
+        self.sourcePatterns: dict[str, list[int]] = {src: [] for src in OUTPUT_SOURCES}
+        for patternIdx, keys in enumerate(self.patternSymptoms):
+            patternSources = {src for key in keys for src in self.sources[key]}
+            for src in OUTPUT_SOURCES:
+                if src in patternSources:
+                    self.sourcePatterns[src].append(patternIdx)
+
+        self.combined: dict[str, re.Pattern[str] | None] = {}
+        self.uncombined: dict[str, list[int]] = {}
+        for src in OUTPUT_SOURCES:
+            self.combined[src], self.uncombined[src] = self._combinePatterns(
+                self.sourcePatterns[src]
+            )
+
+    def _combinePatterns(
+        self, patternIndices: list[int]
+    ) -> tuple[re.Pattern[str] | None, list[int]]:
+        combinable: list[str] = []
+        uncombined: list[int] = []
+
+        for patternIdx in patternIndices:
+            value = self.patterns[patternIdx].value
+            try:
+                # Fails e.g. for global inline flags, which must come first
+                compiled = re.compile(f"(?:{value})")
+            except re.error:
+                uncombined.append(patternIdx)
+                continue
+            if compiled.groups:
+                # Group numbers shift and group names clash in a single
+                # alternation, which changes the meaning of backreferences and
+                # conditional groups, so such patterns are matched on their own.
+                uncombined.append(patternIdx)
+                continue
+            combinable.append(value)
+
+        if not combinable:
+            return (None, patternIndices)
+
+        try:
+            combined = re.compile("|".join(f"(?:{value})" for value in combinable))
+        except re.error:
+            return (None, patternIndices)
+
+        return (combined, uncombined)
+
+    def __len__(self) -> int:
+        return len(self.symptoms)
+
+    def scan(self, crashInfo: CrashInfo) -> OutputMatchResult:
+        """
+        Prepare the results of all output symptoms for the given crash. The
+        output is only scanned when the first result is requested.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash information to match against
+
+        @rtype: OutputMatchResult
+        @return: Result object to pass to L{CrashSignature.matches}
+        """
+        return OutputMatchResult(self, crashInfo)
+
+    def _match(self, crashInfo: CrashInfo) -> set[int]:
+        assert crashInfo.configuration is not None
+        windowsSlashWorkaround = crashInfo.configuration.os == "windows"
+
+        lines = {
+            "stdout": crashInfo.rawStdout,
+            "stderr": crashInfo.rawStderr,
+            "crashdata": crashInfo.rawCrashData,
+        }
+        for src, srcLines in lines.items():
+            if any(isinstance(line, bytes) for line in srcLines):
+                lines[src] = [
+                    line.decode("utf-8", errors="replace")
+                    if isinstance(line, bytes)
+                    else line
+                    for line in srcLines
+                ]
+
+        hits: set[int] = set()
+
+        for src in OUTPUT_SOURCES:
+            if not lines[src]:
+                continue
+
+            if self.automaton is not None:
+                # Literals never contain newlines, so searching the joined
+                # output finds exactly the literals contained in a single line.
+                for literalIdx in self.automaton.search("\n".join(lines[src])):
+                    for key in self.literalSymptoms[literalIdx]:
+                        if src in self.sources[key]:
+                            hits.add(key)
+
+            if self.sourcePatterns[src]:
+                self._matchPatterns(src, lines[src], windowsSlashWorkaround, hits)
+
+        return hits
+
+    def _matchPatterns(
+        self,
+        src: str,
+        lines: list[str],
+        windowsSlashWorkaround: bool,
+        hits: set[int],
+    ) -> None:
+        # Only patterns that still have a symptom without a hit in this source
+        # need to be matched at all.
+        remaining = {
+            patternIdx
+            for patternIdx in self.sourcePatterns[src]
+            if any(
+                key not in hits and src in self.sources[key]
+                for key in self.patternSymptoms[patternIdx]
+            )
+        }
+        combined = self.combined[src]
+        uncombined = [idx for idx in self.uncombined[src] if idx in remaining]
+
+        for line in lines:
+            if not remaining:
+                break
+
+            candidates = uncombined
+            if combined is not None and (
+                combined.search(line) is not None
+                or (
+                    windowsSlashWorkaround
+                    and "\\" in line
+                    and combined.search(line.replace("\\", "/")) is not None
+                )
+            ):
+                candidates = list(remaining)
+
+            for patternIdx in candidates:
+                if patternIdx not in remaining:
+                    continue
+                if self.patterns[patternIdx].matches(
+                    line, windowsSlashWorkaround=windowsSlashWorkaround
+                ):
+                    remaining.discard(patternIdx)
+                    for key in self.patternSymptoms[patternIdx]:
+                        if src in self.sources[key]:
+                            hits.add(key)
+
+            uncombined = [idx for idx in uncombined if idx in remaining]
+
+
+class OutputMatchResult:
+    """Precomputed output symptom results of an L{OutputMatcher} for one crash."""
+
+    def __init__(self, matcher: OutputMatcher, crashInfo: CrashInfo) -> None:
+        self.matcher = matcher
+        self.crashInfo = crashInfo
+        self.hits: set[int] | None = None
+
+    def get(self, symptom: OutputSymptom) -> bool | None:
+        """
+        Look up the result for the given symptom.
+
+        @type symptom: OutputSymptom
+        @param symptom: The symptom to look up
+
+        @rtype: bool
+        @return: Whether the symptom matches, or None if the symptom is not
+                 covered by the matcher and must be matched directly.
+        """
+        if id(symptom) not in self.matcher.symptoms:
+            return None
+        if self.hits is None:
+            self.hits = self.matcher._match(self.crashInfo)
+        return id(symptom) in self.hits
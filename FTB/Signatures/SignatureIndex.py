@@ -0,0 +1,246 @@
+"""
+Signature Index
+
+Inverted index over a set of crash signatures, used to preselect the
+signatures that can possibly match a given crash before doing a full match.
+
+@author:     Christian Holler (:decoder)
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+@contact:    choller@mozilla.com
+"""
+
+from __future__ import annotations
+
+from itertools import chain
+from typing import TYPE_CHECKING
+
+from FTB.Signatures.OutputMatcher import AhoCorasick
+from FTB.Signatures.Symptom import StackFramesSymptom, StackFrameSymptom
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable, Iterable
+
+    from FTB.Signatures.CrashInfo import CrashInfo
+    from FTB.Signatures.CrashSignature import CrashSignature
+
+
+def getRequiredFrameLiterals(signature: CrashSignature) -> list[str]:
+    """
+    Return all literal (non-PCRE, non-wildcard) function names that must be
+    contained in at least one frame of the backtrace for the signature to match.
+
+    @type signature: CrashSignature
+    @param signature: The signature to extract the literals from
+
+    @rtype: list(str)
+    @return: List of unique frame literals required by the signature
+    """
+    literals: list[str] = []
+
+    for symptom in signature.symptoms:
+        if isinstance(symptom, StackFrameSymptom):
+            matches = [symptom.functionName]
+        elif isinstance(symptom, StackFramesSymptom):
+            matches = symptom.functionNames
+        else:
+            continue
+
+        for match in matches:
+            value = str(match)
+            # Empty literals match everything and newlines can never be part of
+            # a frame, so neither is useful for lookups.
+            if match.isPCRE or value in {"", "?", "???"} or "\n" in value:
+                continue
+            if value not in literals:
+                literals.append(value)
+
+    return literals
+
+
+class SignatureIndex:
+    """
+    Inverted index mapping literal frames to the signatures requiring them.
+
+    Every indexed signature is identified by an arbitrary hashable key (e.g. a
+    bucket id or a signature filename). Signatures without any literal frame
+    requirement (e.g. output-only signatures) are always returned as candidates,
+    subject only to their platform/product/OS facets.
+
+    Frames equal to a literal are looked up directly, all other frames are
+    searched for literals with one Aho-Corasick pass. Only the signatures
+    reached through the literals found are counted, so a lookup doesn't depend
+    on the total number of signatures or literals.
+    """
+
+    def __init__(self) -> None:
+        self.literals: dict[str, set[Hashable]] = {}
+        self.requiredCounts: dict[Hashable, int] = {}
+        self.facets: dict[
+            Hashable, tuple[list[str] | None, list[str] | None, list[str] | None]
+        ] = {}
+        # Signatures without any literal requirement
+        self.unconstrained: set[Hashable] = set()
+
+        # Built on the first lookup after the set of literals changed
+        self.automaton: AhoCorasick | None = None
+        self.automatonLiterals: list[str] = []
+        # Literals contained in each literal, for frames equal to a literal
+        self.containedLiterals: dict[str, list[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.requiredCounts)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.requiredCounts
+
+    def add(
+        self,
+        key: Hashable,
+        literals: Iterable[str],
+        platforms: list[str] | None = None,
+        operatingSystems: list[str] | None = None,
+        products: list[str] | None = None,
+    ) -> None:
+        """
+        Add a signature to the index by its precomputed requirements.
+
+        @type key: Hashable
+        @param key: Key identifying the signature
+        @type literals: list(str)
+        @param literals: Frame literals required by the signature
+        @type platforms: list(str)
+        @param platforms: Platforms the signature is restricted to, if any
+        @type operatingSystems: list(str)
+        @param operatingSystems: Operating systems the signature is restricted to
+        @type products: list(str)
+        @param products: Products the signature is restricted to, if any
+        """
+        if key in self:
+            self.remove(key)
+
+        uniqueLiterals = set(literals)
+        for literal in uniqueLiterals:
+            if literal not in self.literals:
+                self.literals[literal] = set()
+                self._literalsChanged()
+            self.literals[literal].add(key)
+
+        if not uniqueLiterals:
+            self.unconstrained.add(key)
+        self.requiredCounts[key] = len(uniqueLiterals)
+        self.facets[key] = (platforms, operatingSystems, products)
+
+    def addSignature(self, key: Hashable, signature: CrashSignature) -> None:
+        """
+        Add a signature to the index.
+
+        @type key: Hashable
+        @param key: Key identifying the signature
+        @type signature: CrashSignature
+        @param signature: The signature to add
+        """
+        self.add(
+            key,
+            getRequiredFrameLiterals(signature),
+            signature.platforms,
+            signature.operatingSystems,
+            signature.products,
+        )
+
+    def remove(self, key: Hashable) -> None:
+        """
+        Remove a signature from the index. Unknown keys are ignored.
+
+        @type key: Hashable
+        @param key: Key identifying the signature
+        """
+        if key not in self:
+            return
+
+        for literal in [lit for lit, keys in self.literals.items() if key in keys]:
+            self.literals[literal].discard(key)
+            if not self.literals[literal]:
+                del self.literals[literal]
+                self._literalsChanged()
+
+        self.unconstrained.discard(key)
+        del self.requiredCounts[key]
+        del self.facets[key]
+
+    def _literalsChanged(self) -> None:
+        self.automaton = None
+        self.containedLiterals = {}
+
+    def _findLiterals(self, text: str) -> list[str]:
+        if self.automaton is None:
+            self.automatonLiterals = list(self.literals)
+            self.automaton = AhoCorasick(self.automatonLiterals)
+        return [self.automatonLiterals[idx] for idx in self.automaton.search(text)]
+
+    def getCandidates(self, crashInfo: CrashInfo) -> set[Hashable]:
+        """
+        Determine all signatures that could possibly match the given crash.
+
+        This is a necessary but not sufficient condition: every signature that
+        matches the crash is guaranteed to be returned, but the caller still has
+        to fully match the returned candidates.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash information to look up
+
+        @rtype: set
+        @return: Keys of all candidate signatures
+        """
+        hitLiterals: set[str] = set()
+        # Without any frame literals, the backtrace of lazily created crash
+        # information doesn't need to be parsed at all.
+        if self.literals:
+            unmatchedFrames = []
+            for frame in dict.fromkeys(crashInfo.backtrace):
+                if frame in self.literals:
+                    contained = self.containedLiterals.get(frame)
+                    if contained is None:
+                        contained = self._findLiterals(frame)
+                        self.containedLiterals[frame] = contained
+                    hitLiterals.update(contained)
+                else:
+                    unmatchedFrames.append(frame)
+
+            if unmatchedFrames:
+                # Frames never contain newlines, so searching the joined frames
+                # finds exactly the literals contained in at least one frame.
+                hitLiterals.update(self._findLiterals("\n".join(unmatchedFrames)))
+
+        hitCounts: dict[Hashable, int] = {}
+        for literal in hitLiterals:
+            for key in self.literals[literal]:
+                hitCounts[key] = hitCounts.get(key, 0) + 1
+
+        config = crashInfo.configuration
+        candidates: set[Hashable] = set()
+        for key in chain(
+            self.unconstrained,
+            (
+                key
+                for key, hitCount in hitCounts.items()
+                if hitCount == self.requiredCounts[key]
+            ),
+        ):
+            (platforms, operatingSystems, products) = self.facets[key]
+            if config is not None:
+                if platforms is not None and config.platform not in platforms:
+                    continue
+                if operatingSystems is not None and config.os not in operatingSystems:
+                    continue
+                if products is not None and config.product not in products:
+                    continue
+
+            candidates.add(key)
+
+        return candidates
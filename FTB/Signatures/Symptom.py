@@ -24,8 +24,22 @@ from FTB.Signatures import JSONHelper
 from FTB.Signatures.Matchers import NumberMatch, StringMatch
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from FTB.Signatures.CrashInfo import CrashInfo
 
+    # Matches a PCRE function name against the frame at the given index of the
+    # backtrace, see StackFramesSymptom.matches
+    FrameMatcher = Callable[[StringMatch, int], bool]
+
+# Kinds of entries in the function names of a StackFramesSymptom
+WILDCARD_NONE = 0
+WILDCARD_SINGLE = 1  # "?", matches zero or one frame
+WILDCARD_MULTI = 2  # "???", matches any number of frames
+
+# Maximum number of wildcard edits considered by StackFramesSymptom.diff
+DEFAULT_MAX_DIFF_DISTANCE = 3
+
 
 class Symptom(metaclass=ABCMeta):
     """
@@ -308,195 +322,318 @@ class StackFramesSymptom(Symptom):
             for fn in rawFunctionNames:
                 self.functionNames.append(StringMatch(fn))
 
-    def matches(self, crashInfo: CrashInfo) -> bool:
+        self.wildcards = StackFramesSymptom._compile(self.functionNames)
+
+    def matches(
+        self, crashInfo: CrashInfo, matchFrame: FrameMatcher | None = None
+    ) -> bool:
         """
         Check if the symptom matches the given crash information
 
         @type crashInfo: CrashInfo
         @param crashInfo: The crash information to check against
+        @type matchFrame: callable
+        @param matchFrame: Optional function matching a PCRE function name against
+                           the frame at the given index of the backtrace, e.g. to
+                           reuse earlier results for the same frames
 
         @rtype: bool
         @return: True if the symptom matches, False otherwise
         """
 
-        return StackFramesSymptom._match(crashInfo.backtrace, self.functionNames)
+        return StackFramesSymptom._matchCompiled(
+            crashInfo.backtrace, self.functionNames, self.wildcards, matchFrame
+        )
 
     def diff(
-        self, crashInfo: CrashInfo
+        self, crashInfo: CrashInfo, maxDistance: int = DEFAULT_MAX_DIFF_DISTANCE
     ) -> tuple[int | None, StackFramesSymptom | None]:
+        """
+        Determine the minimum number of wildcard edits needed for this symptom to
+        match the given crash, and the resulting symptom.
+
+        @type crashInfo: CrashInfo
+        @param crashInfo: The crash information to check against
+        @type maxDistance: int
+        @param maxDistance: Maximum number of edits to consider
+
+        @rtype: tuple
+        @return: Tuple of the number of edits and the proposed symptom, or
+                 (None, None) if there is no such symptom within maxDistance edits.
+        """
         if self.matches(crashInfo):
             return (0, None)
 
-        for depth in range(1, 4):
-            (bestDepth, bestGuess) = StackFramesSymptom._diff(
-                crashInfo.backtrace, self.functionNames, 0, 1, depth
-            )
-            if bestDepth is not None:
-                assert bestGuess is not None
-                guessedFunctionNames = [repr(x) for x in bestGuess]
-
-                # Remove trailing wildcards as they are of no use
-                while guessedFunctionNames and (
-                    guessedFunctionNames[-1] == "?" or guessedFunctionNames[-1] == "???"
-                ):
-                    guessedFunctionNames.pop()
-
-                if not guessedFunctionNames:
-                    # Do not return empty matches. This happens if there's nothing left
-                    # except wildcards.
-                    return (None, None)
-
-                return (
-                    bestDepth,
-                    StackFramesSymptom(
-                        {"type": "stackFrames", "functionNames": guessedFunctionNames}
-                    ),
-                )
-
-        return (None, None)
+        (bestDepth, bestGuess) = StackFramesSymptom._diff(
+            crashInfo.backtrace, self.functionNames, maxDistance
+        )
+        if bestDepth is None:
+            return (None, None)
+
+        assert bestGuess is not None
+        guessedFunctionNames = [repr(x) for x in bestGuess]
+
+        # Remove trailing wildcards as they are of no use
+        while guessedFunctionNames and (
+            guessedFunctionNames[-1] == "?" or guessedFunctionNames[-1] == "???"
+        ):
+            guessedFunctionNames.pop()
+
+        if not guessedFunctionNames:
+            # Do not return empty matches. This happens if there's nothing left
+            # except wildcards.
+            return (None, None)
+
+        return (
+            bestDepth,
+            StackFramesSymptom(
+                {"type": "stackFrames", "functionNames": guessedFunctionNames}
+            ),
+        )
 
     @staticmethod
     def _diff(
         stack: list[str],
-        signatureGuess: list[StringMatch],
-        startIdx: int,
-        depth: int,
-        maxDepth: int,
+        functionNames: list[StringMatch],
+        maxDistance: int = DEFAULT_MAX_DIFF_DISTANCE,
     ) -> tuple[int | None, list[StringMatch] | None]:
-        singleWildcardMatch = StringMatch("?")
-
-        newSignatureGuess = []
-        newSignatureGuess.extend(signatureGuess)
-
-        bestDepth = None
-        bestGuess = None
-
-        hasVariableStackLengthQuantifier = "???" in [str(x) for x in newSignatureGuess]
-
-        for idx in range(startIdx, len(newSignatureGuess)):
-            if idx == startIdx or (
-                str(newSignatureGuess[idx - 1]) != "?"
-                and str(newSignatureGuess[idx - 1]) != "???"
-            ):
-                # Inserting '?' after another '?' or '???' does not make a difference
-                # because it is equivalent to inserting it before that last wildcard
-                # itself.
+        """
+        Align the function names with the stack, allowing two kinds of edits:
+        inserting a "?" wildcard and replacing a function name by a "?" wildcard.
 
-                newSignatureGuess.insert(idx, singleWildcardMatch)
+        This is a shortest path search over the grid of (frame, function name)
+        positions, the same NFA as in L{_matchCompiled} with the edits as
+        additional, weighted transitions. All transitions lead to larger
+        positions, so a single pass over the grid finds the minimum number of
+        edits in O(frames x function names). Positions costing more than
+        maxDistance edits, or more than the cheapest complete alignment found
+        so far, are never entered, and the pass stops at the first frame that
+        no position reaches.
 
-                # Check if we have a match with our modification
-                if StackFramesSymptom._match(stack, newSignatureGuess):
-                    return (depth, newSignatureGuess)
+        @rtype: tuple
+        @return: Tuple of the number of edits and the edited function names, or
+                 (None, None) if more than maxDistance edits would be needed.
+        """
+        singleWildcardMatch = StringMatch("?")
+        wildcards = StackFramesSymptom._compile(functionNames)
+        frameCount = len(stack)
+        count = len(functionNames)
+
+        # cost[frameIdx][idx] is the minimum number of edits needed for the
+        # first idx function names to consume the first frameIdx frames, prev
+        # holds the predecessor position and the emitted function name (if any)
+        # of the best edge into that position. Rows are added as the pass
+        # reaches them.
+        cost: list[list[int | None]] = [[None] * (count + 1)]
+        prev: list[list[tuple[int, int, StringMatch | None] | None]] = [
+            [None] * (count + 1)
+        ]
+        cost[0][0] = 0
+        # maxDistance, then the cost of the cheapest alignment consuming all
+        # function names so far
+        bound = maxDistance
+
+        def relax(
+            frameIdx: int,
+            idx: int,
+            newCost: int,
+            origin: tuple[int, int, StringMatch | None],
+        ) -> None:
+            nonlocal bound
+            if newCost > bound:
+                return
+            oldCost = cost[frameIdx][idx]
+            if oldCost is None or newCost < oldCost:
+                cost[frameIdx][idx] = newCost
+                prev[frameIdx][idx] = origin
+                if idx == count:
+                    bound = newCost
+
+        for frameIdx in range(frameCount + 1):
+            hasFrame = frameIdx < frameCount
+            if hasFrame:
+                cost.append([None] * (count + 1))
+                prev.append([None] * (count + 1))
+            for idx in range(count):
+                current = cost[frameIdx][idx]
+                if current is None:
+                    continue
+                functionName = functionNames[idx]
+                wildcard = wildcards[idx]
+
+                if wildcard != WILDCARD_NONE:
+                    # Wildcards may consume no frame at all
+                    relax(frameIdx, idx + 1, current, (frameIdx, idx, functionName))
+                    if hasFrame:
+                        if wildcard == WILDCARD_MULTI:
+                            relax(frameIdx + 1, idx, current, (frameIdx, idx, None))
+                        else:
+                            relax(
+                                frameIdx + 1,
+                                idx + 1,
+                                current,
+                                (frameIdx, idx, functionName),
+                            )
+                    continue
 
-                # If we don't have a match but we're not at our current depth limit,
-                # add one more level of depth for our search.
-                if depth < maxDepth:
-                    (newBestDepth, newBestGuess) = StackFramesSymptom._diff(
-                        stack, newSignatureGuess, idx, depth + 1, maxDepth
+                if hasFrame:
+                    frame = stack[frameIdx]
+                    if functionName.matches(frame):
+                        relax(
+                            frameIdx + 1,
+                            idx + 1,
+                            current,
+                            (frameIdx, idx, functionName),
+                        )
+                    else:
+                        # Replace the function name. If the frame is a substring
+                        # of a literal function name, the frame itself still
+                        # matches without resorting to a wildcard.
+                        newMatch = singleWildcardMatch
+                        if (
+                            not functionName.isPCRE
+                            and frame
+                            and frame in str(functionName)
+                        ):
+                            newMatch = StringMatch(frame)
+                        relax(
+                            frameIdx + 1,
+                            idx + 1,
+                            current + 1,
+                            (frameIdx, idx, newMatch),
+                        )
+
+                    # Insert a wildcard consuming this frame
+                    relax(
+                        frameIdx + 1,
+                        idx,
+                        current + 1,
+                        (frameIdx, idx, singleWildcardMatch),
                     )
 
-                    if newBestDepth is not None and (
-                        bestDepth is None or newBestDepth < bestDepth
-                    ):
-                        bestDepth = newBestDepth
-                        bestGuess = newBestGuess
-
-                newSignatureGuess.pop(idx)
-
-            # Now repeat the same with replacing instead of adding
-            # unless the match at idx is a wildcard itself
+                # Replace the function name by a wildcard consuming no frame
+                relax(
+                    frameIdx,
+                    idx + 1,
+                    current + 1,
+                    (frameIdx, idx, singleWildcardMatch),
+                )
 
-            if (
-                str(newSignatureGuess[idx]) == "?"
-                or str(newSignatureGuess[idx]) == "???"
-            ):
-                continue
+            if not hasFrame or all(nextCost is None for nextCost in cost[frameIdx + 1]):
+                break
+
+        # All function names must be consumed, remaining frames are not relevant
+        bestFrameIdx = None
+        bestCost = None
+        for frameIdx, row in enumerate(cost):
+            finalCost = row[count]
+            if finalCost is not None and (bestCost is None or finalCost < bestCost):
+                bestFrameIdx = frameIdx
+                bestCost = finalCost
+
+        if bestFrameIdx is None:
+            return (None, None)
+
+        guess: list[StringMatch] = []
+        frameIdx, idx = bestFrameIdx, count
+        while (frameIdx, idx) != (0, 0):
+            origin = prev[frameIdx][idx]
+            assert origin is not None
+            (frameIdx, idx, emitted) = origin
+            if emitted is not None:
+                guess.append(emitted)
+        guess.reverse()
+
+        return (bestCost, guess)
 
-            newMatch = singleWildcardMatch
-            if not hasVariableStackLengthQuantifier and len(stack) > idx:
-                # We can perform some optimizations here if we have a signature that
-                # does not contain any quantifiers that can match multiple stack frames.
+    @staticmethod
+    def _compile(functionNames: list[StringMatch]) -> list[int]:
+        """
+        Compile a list of function names into the wildcard kinds used by
+        L{_matchCompiled}.
+        """
+        wildcards = []
+        for functionName in functionNames:
+            value = str(functionName)
+            if value == "?":
+                wildcards.append(WILDCARD_SINGLE)
+            elif value == "???":
+                wildcards.append(WILDCARD_MULTI)
+            else:
+                wildcards.append(WILDCARD_NONE)
+        return wildcards
 
-                if newSignatureGuess[idx].matches(stack[idx]):
-                    # Our frame matches, so it doesn't make sense to try and mess with
-                    # it
-                    continue
+    @staticmethod
+    def _match(stack: list[str], functionNames: list[StringMatch]) -> bool:
+        return StackFramesSymptom._matchCompiled(
+            stack, functionNames, StackFramesSymptom._compile(functionNames)
+        )
 
-                # If our match is not PCRE, try some heuristics to generalize the
-                # match. The stack frame is a substring of what we try to match,
-                # use the stack frame as new matcher to ensure a match without
-                # using a wildcard.
-                if not newSignatureGuess[idx].isPCRE and stack[idx] in str(
-                    newSignatureGuess[idx]
-                ):
-                    newMatch = StringMatch(stack[idx])
-
-            origMatch = newSignatureGuess[idx]
-            newSignatureGuess[idx] = newMatch
-
-            # Check if we have a match with our modification
-            if StackFramesSymptom._match(stack, newSignatureGuess):
-                return (depth, newSignatureGuess)
-
-            # If we don't have a match but we're not at our current depth limit,
-            # add one more level of depth for our search.
-            if depth < maxDepth:
-                (newBestDepth, newBestGuess) = StackFramesSymptom._diff(
-                    stack, newSignatureGuess, idx, depth + 1, maxDepth
-                )
+    @staticmethod
+    def _matchCompiled(
+        stack: list[str],
+        functionNames: list[StringMatch],
+        wildcards: list[int],
+        matchFrame: FrameMatcher | None = None,
+    ) -> bool:
+        """
+        Match the function names against the top of the stack.
 
-                if newBestDepth is not None and (
-                    bestDepth is None or newBestDepth < bestDepth
-                ):
-                    bestDepth = newBestDepth
-                    bestGuess = newBestGuess
+        This simulates the NFA formed by the function names, where "?" consumes
+        zero or one frame and "???" any number of frames. The set of reachable
+        positions in the function names is advanced one frame at a time, so every
+        function name is compared to every frame at most once.
 
-            newSignatureGuess[idx] = origMatch
+        If given, matchFrame is used to match PCRE function names against frames.
+        """
+        count = len(functionNames)
 
-        return (bestDepth, bestGuess)
+        # active[idx] is True if the first idx function names can consume the
+        # frames processed so far.
+        active = [False] * (count + 1)
+        active[0] = True
 
-    @staticmethod
-    def _match(
-        partialStack: list[str], partialFunctionNames: list[StringMatch]
-    ) -> bool:
+        frameIdx = 0
         while True:
-            # Process as many non-wildcard chars as we can find iteratively for
-            # performance reasons
-            while (
-                partialFunctionNames
-                and partialStack
-                and str(partialFunctionNames[0]) not in {"?", "???"}
-            ):
-                if not partialFunctionNames[0].matches(partialStack[0]):
-                    return False
+            # Wildcards may also match no frame at all
+            for idx in range(count):
+                if active[idx] and wildcards[idx] != WILDCARD_NONE:
+                    active[idx + 1] = True
 
-                # Change the view on partialStack and partialFunctionNames without
-                # actually modifying the underlying arrays. They have to be preserved
-                # for the caller.
-                partialStack = partialStack[1:]
-                partialFunctionNames = partialFunctionNames[1:]
-
-            if not partialFunctionNames:
+            if active[count]:
                 # End of function names to match, accept
                 return True
 
-            if str(partialFunctionNames[0]) in {"?", "???"}:
-                if StackFramesSymptom._match(partialStack, partialFunctionNames[1:]):
-                    # We recursively consumed 0 to N stack frames and can now
-                    # get a match for the remaining stack without the current
-                    # wildcard element, so we're done and accept the stack.
-                    return True
-                if not partialStack:
-                    # Out of stack to match, reject
-                    return False
-
-                # Consume one stack frame and continue
-                partialStack = partialStack[1:]
+            if frameIdx == len(stack):
+                # Out of stack to match, reject
+                return False
 
-                if str(partialFunctionNames[0]) == "?":
-                    # Consume the question mark too
-                    partialFunctionNames = partialFunctionNames[1:]
+            frame = stack[frameIdx]
+            frameIdx += 1
 
-            elif not partialStack:
-                # Out of stack to match, reject
+            nextActive = [False] * (count + 1)
+            anyActive = False
+            for idx in range(count):
+                if not active[idx]:
+                    continue
+                wildcard = wildcards[idx]
+                if wildcard == WILDCARD_MULTI:
+                    nextActive[idx] = True
+                    anyActive = True
+                elif wildcard == WILDCARD_SINGLE:
+                    nextActive[idx + 1] = True
+                    anyActive = True
+                else:
+                    functionName = functionNames[idx]
+                    if matchFrame is not None and functionName.isPCRE:
+                        match = matchFrame(functionName, frameIdx - 1)
+                    else:
+                        match = functionName.matches(frame)
+                    if match:
+                        nextActive[idx + 1] = True
+                        anyActive = True
+
+            if not anyActive:
+                # No position can consume this frame, reject
                 return False
+            active = nextActive
@@ -13,6 +13,7 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
 import json
+import re
 from pathlib import Path
 
 import pytest
@@ -20,14 +21,19 @@ import pytest
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures import RegisterHelper
 from FTB.Signatures.CrashInfo import (
+    CACHE_HEADER,
     AppleCrashInfo,
     ASanCrashInfo,
     CDBCrashInfo,
     CrashInfo,
     GDBCrashInfo,
+    LSanCrashInfo,
     MinidumpCrashInfo,
     NoCrashInfo,
     RustCrashInfo,
+    TSanCrashInfo,
+    UBSanCrashInfo,
+    ValgrindCrashInfo,
     int32,
     unicode_escape_result,
 )
@@ -3043,3 +3049,203 @@ def test_unicode_escape():
         return """ü\ufffdシ\u008dAن"""
 
     assert testfunc() == r"""ü\u{fffd}シ\u{8d}Aن"""
+
+
+@pytest.mark.parametrize(
+    "fixture, os",
+    [
+        ("trace_asan_segv.txt", "linux"),
+        ("trace_gdb_sample_1.txt", "linux"),
+        ("trace_rust_sample_2.txt", "linux"),
+        ("tsan-report.txt", "linux"),
+    ],
+)
+def test_CacheObjectEncoding(fixture, os):
+    config = ProgramConfiguration("test", "x86-64", os)
+    lines = (FIXTURE_PATH / fixture).read_text().splitlines()
+    crashInfo = CrashInfo.fromRawCrashData([], [], config, lines)
+    cacheObject = crashInfo.toCacheObject()
+
+    encoded = CrashInfo.encodeCacheObject(cacheObject)
+    assert len(encoded) < len(json.dumps(cacheObject))
+    assert CrashInfo.decodeCacheObject(encoded) == cacheObject
+
+    # both the binary and the JSON encoding restore the same crash info
+    shortSignatures = set()
+    for cached in (encoded, json.loads(json.dumps(cacheObject))):
+        restored = CrashInfo.fromRawCrashData([], [], config, lines, cacheObject=cached)
+        assert restored.backtrace == crashInfo.backtrace
+        assert restored.registers == crashInfo.registers
+        assert restored.crashAddress == crashInfo.crashAddress
+        assert restored.crashInstruction == crashInfo.crashInstruction
+        assert restored.failureReason == crashInfo.failureReason
+        shortSignatures.add(restored.createShortSignature())
+    assert len(shortSignatures) == 1
+
+
+def test_CacheObjectEncodingEdgeCases():
+    cacheObject = {
+        "backtrace": ["a", "b", "a", ""],
+        "registers": {"rip": 0xFFFFFFFFFFFFFFFF, "a": 1},
+        "crashAddress": 0,
+        "crashInstruction": "b",
+        "failureReason": "ü�",
+    }
+    encoded = CrashInfo.encodeCacheObject(cacheObject)
+    assert encoded[0] == 0
+    assert CrashInfo.decodeCacheObject(encoded) == cacheObject
+    assert CrashInfo.decodeCacheObject(memoryview(encoded)) == cacheObject
+
+    empty = {
+        "backtrace": [],
+        "registers": {},
+        "crashAddress": None,
+        "crashInstruction": None,
+        "failureReason": None,
+    }
+    assert CrashInfo.decodeCacheObject(CrashInfo.encodeCacheObject(empty)) == empty
+
+    # values that do not fit the binary layout fall back to JSON
+    for cacheObject in (
+        dict(empty, registers={"xmm0": 2**64}),
+        dict(empty, crashAddress=-1),
+        dict(empty, backtrace=["a\0b"]),
+    ):
+        encoded = CrashInfo.encodeCacheObject(cacheObject)
+        assert json.loads(encoded) == cacheObject
+        assert CrashInfo.decodeCacheObject(encoded) == cacheObject
+
+    with pytest.raises(ValueError, match="Unsupported cache object version"):
+        CrashInfo.decodeCacheObject(b"\0\x09" + bytes(CACHE_HEADER.size))
+
+
+def _detectCrashInfoClassUnoptimized(lines):
+    """Crash format detection testing every trigger string on every line"""
+    weakResult = NoCrashInfo
+    rustFirstDetected = minidumpFirstDetected = False
+    for line in lines:
+        if ": runtime error: " in line and re.match(
+            r".+?:\d+:\d+: runtime error:\s+.+", line
+        ):
+            return UBSanCrashInfo
+        if any(
+            trigger in line
+            for trigger in (
+                "ERROR: AddressSanitizer",
+                "Sanitizer: hard rss limit exhausted",
+                "ERROR: UndefinedBehaviorSanitizer",
+                "ERROR: ThreadSanitizer:",
+            )
+        ):
+            return ASanCrashInfo
+        if "ERROR: LeakSanitizer:" in line:
+            return LSanCrashInfo
+        if "WARNING: ThreadSanitizer:" in line:
+            return TSanCrashInfo
+        if "Mac OS X" in line and not line.startswith("OS|"):
+            return AppleCrashInfo
+        if "Microsoft (R) Windows Debugger" in line:
+            return CDBCrashInfo
+        if "received signal SIG" in line or "Program terminated with signal " in line:
+            return GDBCrashInfo
+        if not rustFirstDetected and "panicked at" in line:
+            rustFirstDetected = True
+            minidumpFirstDetected = False
+        elif rustFirstDetected and "stack backtrace:" in line:
+            weakResult = RustCrashInfo
+            rustFirstDetected = False
+        elif not minidumpFirstDetected and "OS|" in line:
+            rustFirstDetected = False
+            minidumpFirstDetected = True
+        elif minidumpFirstDetected and "CPU|" in line:
+            return MinidumpCrashInfo
+        elif line.startswith("==") and ValgrindCrashInfo.MSG_REGEX.match(line):
+            return ValgrindCrashInfo
+        else:
+            minidumpFirstDetected = False
+    return weakResult
+
+
+def test_DetectCrashInfoClass():
+    fixtures = [
+        (FIXTURE_PATH / fixture).read_text(errors="replace").splitlines()
+        for fixture in sorted(FIXTURE_PATH.glob("*.txt"))
+    ]
+    detected = set()
+    for lines in fixtures:
+        detected.add(_detectCrashInfoClassUnoptimized(lines))
+        # crash data is scanned before stderr
+        for stderr, crashData in ((lines, None), (None, lines), (lines, fixtures[0])):
+            expected = _detectCrashInfoClassUnoptimized(
+                (crashData or []) + (stderr or [])
+            )
+            assert CrashInfo.detectCrashInfoClass(stderr, crashData) is expected
+    assert len(detected) >= 10
+
+
+def test_DetectCrashInfoClassMaxLines():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    lines = (FIXTURE_PATH / "trace_asan_segv.txt").read_text().splitlines()
+    padding = [f"line {idx}" for idx in range(100)]
+
+    crashInfo = CrashInfo.fromRawCrashData(
+        [], lines + padding, config, maxDetectionLines=100
+    )
+    assert isinstance(crashInfo, NoCrashInfo)
+    crashInfo = CrashInfo.fromRawCrashData(
+        [], lines + padding, config, maxDetectionLines=len(lines) + 100
+    )
+    assert isinstance(crashInfo, ASanCrashInfo)
+
+    # the bound applies to crash data and stderr separately
+    assert (
+        CrashInfo.detectCrashInfoClass(lines + padding, padding, maxLines=100)
+        is NoCrashInfo
+    )
+    assert CrashInfo.detectCrashInfoClass(padding, lines, maxLines=100) is ASanCrashInfo
+    assert CrashInfo.detectCrashInfoClass(lines, None, maxLines=0) is NoCrashInfo
+
+
+def test_LazyCrashInfo(mocker):
+    config = ProgramConfiguration("test", "x86", "linux")
+    crashData = (FIXTURE_PATH / "trace_gdb_regression_2.txt").read_text().splitlines()
+    eager = CrashInfo.fromRawCrashData([], [], config, crashData)
+    calculateCrashAddress = mocker.spy(GDBCrashInfo, "calculateCrashAddress")
+
+    crashInfo = CrashInfo.fromRawCrashData([], [], config, crashData, lazy=True)
+    assert isinstance(crashInfo, GDBCrashInfo)
+    crashInfo.testcase = "testcase"
+
+    # output-only signatures are matched without parsing the crash data
+    outputSig = CrashSignature(
+        json.dumps(
+            {"symptoms": [{"type": "output", "src": "crashdata", "value": "SIG"}]}
+        )
+    )
+    assert outputSig.matches(crashInfo)
+    assert not calculateCrashAddress.called
+    assert "backtrace" not in vars(crashInfo)
+
+    assert crashInfo.crashAddress == eager.crashAddress
+    assert calculateCrashAddress.call_count == 1
+    assert crashInfo.toCacheObject() == eager.toCacheObject()
+    assert crashInfo.createShortSignature() == eager.createShortSignature()
+    assert crashInfo.testcase == "testcase"
+    assert crashInfo.rawCrashData == eager.rawCrashData
+    assert calculateCrashAddress.call_count == 1
+
+    with pytest.raises(AttributeError):
+        crashInfo.missing
+
+
+def test_LazyCrashInfoRust():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    stderr = (FIXTURE_PATH / "trace_rust_sample_2.txt").read_text().splitlines()
+    eager = CrashInfo.fromRawCrashData([], stderr, config)
+    crashInfo = CrashInfo.fromRawCrashData([], stderr, config, lazy=True)
+    assert isinstance(crashInfo, RustCrashInfo)
+    # assigned fields take precedence over the parsed ones
+    crashInfo.failureReason = "failure"
+    assert crashInfo.backtrace == eager.backtrace
+    assert not any("::h" in frame for frame in crashInfo.backtrace)
+    assert crashInfo.failureReason == "failure"
@@ -150,13 +150,61 @@ def test_SignatureStackFramesAlgorithmsTest():
     ]
 
     for stack, rawSig, expectedDepth, expectedSig in testArray:
-        for maxDepth in (expectedDepth, 3):
+        for maxDepth in (expectedDepth, 3, 10):
             (actualDepth, actualSig) = StackFramesSymptom._diff(
-                stack, [StringMatch(x) for x in rawSig], 0, 1, maxDepth
+                stack, [StringMatch(x) for x in rawSig], maxDepth
             )
             assert expectedDepth == actualDepth
             assert expectedSig == [str(x) for x in actualSig]
 
+        # Not reachable with fewer edits
+        assert StackFramesSymptom._diff(
+            stack, [StringMatch(x) for x in rawSig], expectedDepth - 1
+        ) == (None, None)
+
+
+def test_SignatureStackFramesDistanceTest():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData(
+        [], (FIXTURE_PATH / "tsan-report.txt").read_text().splitlines(), config
+    )
+    frames = crashInfo.backtrace[:12]
+    for idx in (1, 3, 5, 7, 9):
+        frames[idx] = "missing"
+    sig = CrashSignature(
+        json.dumps({"symptoms": [{"type": "stackFrames", "functionNames": frames}]})
+    )
+
+    # Beyond the default maximum distance, the worst case is assumed
+    assert sig.getDistance(crashInfo) == len(frames)
+    assert sig.fit(crashInfo) is None
+
+    assert sig.getDistance(crashInfo, maxFrameDistance=5) == 5
+    assert sig.getDistance(crashInfo, maxFrameDistance=5, maxDistance=5) == 5
+    # Only known to be above maxDistance
+    assert sig.getDistance(crashInfo, maxFrameDistance=5, maxDistance=4) > 4
+
+    # Other symptoms count against the same maximum
+    outputSig = CrashSignature(
+        json.dumps(
+            {
+                "symptoms": [
+                    {"type": "output", "value": "missing"},
+                    {"type": "stackFrames", "functionNames": frames},
+                ]
+            }
+        )
+    )
+    assert outputSig.getDistance(crashInfo, maxFrameDistance=5) == 6
+    assert outputSig.getDistance(crashInfo, maxFrameDistance=5, maxDistance=6) == 6
+    assert outputSig.getDistance(crashInfo, maxFrameDistance=5, maxDistance=5) > 5
+    assert outputSig.getDistance(crashInfo, maxFrameDistance=5, maxDistance=0) == 1
+
+    fitted = sig.fit(crashInfo, maxFrameDistance=10)
+    assert fitted is not None
+    assert fitted.matches(crashInfo)
+    assert [str(x) for x in fitted.symptoms[0].functionNames].count("?") == 5
+
 
 def test_SignaturePCREShortTest():
     config = ProgramConfiguration("test", "x86", "linux")
@@ -0,0 +1,155 @@
+"""
+Tests for the multi-signature output matcher
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.OutputMatcher import AhoCorasick, OutputMatcher
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+OUTPUT_VALUES = [
+    "AddressSanitizer",
+    "SEGV on unknown address",
+    "js::AbstractFramePtr",
+    "not in any trace",
+    "==",
+    "",
+    "two\nlines",
+    "/SEGV on unknown address 0x[0-9a-f]+/",
+    "/^==\\d+==ERROR/",
+    "/(?i)addresssanitizer/",
+    "/(a)\\1/",
+    "/(?P<frame>#\\d+) 0x/",
+    "/(q)nomatch/",
+    "/(S)(?(1)EGV|nomatch)/",
+    "/src/[a-z]+\\.cpp/",
+    "/nomatch[0-9]{4}/",
+    {"value": "Sanitizer: SEGV", "matchType": "contains"},
+    {"value": "READ|WRITE", "matchType": "pcre"},
+]
+
+
+def test_AhoCorasickSearch():
+    random.seed(0)
+    literals = ["he", "she", "his", "hers", "e", "rs", "x"]
+    automaton = AhoCorasick(literals)
+    assert automaton.search("ushers") == {0, 1, 3, 4, 5}
+    assert automaton.search("") == set()
+
+    alphabet = "abc"
+    literals = list(
+        {"".join(random.choices(alphabet, k=random.randint(1, 4))) for _ in range(30)}
+    )
+    automaton = AhoCorasick(literals)
+    for _ in range(100):
+        text = "".join(random.choices(alphabet, k=random.randint(0, 20)))
+        expected = {idx for idx, lit in enumerate(literals) if lit in text}
+        assert automaton.search(text) == expected
+
+
+@pytest.mark.parametrize("os_name", ["linux", "windows"])
+@pytest.mark.parametrize(
+    "trace",
+    ["trace_asan_segv.txt", "trace_asan_uaf.txt", "trace_assertion_path_bwd_slash.txt"],
+)
+def test_OutputMatcherEquivalence(trace, os_name):
+    config = ProgramConfiguration("test", "x86-64", os_name)
+    lines = (FIXTURE_PATH / trace).read_text().splitlines()
+    crashInfo = CrashInfo.fromRawCrashData(lines[:3], lines, config, lines[-3:])
+
+    signatures = []
+    for value in OUTPUT_VALUES:
+        for src in (None, "stdout", "stderr", "crashdata"):
+            symptom = {"type": "output", "value": value}
+            if src is not None:
+                symptom["src"] = src
+            signatures.append(CrashSignature(json.dumps({"symptoms": [symptom]})))
+    signatures.append(
+        CrashSignature(
+            json.dumps(
+                {
+                    "symptoms": [
+                        {"type": "output", "value": "AddressSanitizer"},
+                        {"type": "output", "value": "/ERROR/", "src": "stderr"},
+                    ]
+                }
+            )
+        )
+    )
+
+    matcher = OutputMatcher(signatures)
+    hits = matcher.scan(crashInfo)
+    for signature in signatures:
+        assert signature.matches(crashInfo, hits) == signature.matches(crashInfo), str(
+            signature
+        )
+
+
+def test_OutputMatcherGroups():
+    # Group numbers shift when patterns are combined, so patterns with groups
+    # are matched on their own.
+    signatures = [
+        CrashSignature(json.dumps({"symptoms": [{"type": "output", "value": value}]}))
+        for value in ("/(q)nomatch/", "/(S)(?(1)EGV|nomatch)/", "/SEGV|READ/")
+    ]
+    matcher = OutputMatcher(signatures)
+    combined = matcher.combined["stderr"]
+    assert combined is not None
+    assert combined.pattern == "(?:SEGV|READ)"
+    assert matcher.uncombined["stderr"] == [0, 1]
+
+    crashInfo = CrashInfo.fromRawCrashData(
+        [], ["SEGV on unknown address"], ProgramConfiguration("test", "x86-64", "linux")
+    )
+    hits = matcher.scan(crashInfo)
+    assert [signature.matches(crashInfo, hits) for signature in signatures] == [
+        False,
+        True,
+        True,
+    ]
+
+
+def test_OutputMatcherWindowsSlash():
+    sig = CrashSignature(
+        json.dumps({"symptoms": [{"type": "output", "value": "/js/src/jit/[A-Z]/"}]})
+    )
+    matcher = OutputMatcher([sig])
+    for os_name, expected in (("windows", True), ("linux", False)):
+        crashInfo = CrashInfo.fromRawCrashData(
+            [],
+            ["Assertion failure: at c:\\js\\src\\jit\\Ion.cpp:10"],
+            ProgramConfiguration("test", "x86-64", os_name),
+        )
+        assert sig.matches(crashInfo, matcher.scan(crashInfo)) is expected
+        assert sig.matches(crashInfo) is expected
+
+
+def test_OutputMatcherUncovered():
+    covered = CrashSignature(
+        json.dumps({"symptoms": [{"type": "output", "value": "foo"}]})
+    )
+    other = CrashSignature(
+        json.dumps({"symptoms": [{"type": "output", "value": "bar"}]})
+    )
+    crashInfo = CrashInfo.fromRawCrashData(
+        ["bar"], [], ProgramConfiguration("test", "x86-64", "linux")
+    )
+    hits = OutputMatcher([covered]).scan(crashInfo)
+    assert hits.get(other.symptoms[0]) is None
+    assert hits.get(covered.symptoms[0]) is False
+    # symptoms unknown to the matcher are matched directly
+    assert other.matches(crashInfo, hits)
@@ -0,0 +1,101 @@
+"""
+Tests for the signature index
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+from pathlib import Path
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureIndex import SignatureIndex, getRequiredFrameLiterals
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+
+def _sig(symptoms, **kwds):
+    kwds["symptoms"] = symptoms
+    return CrashSignature(json.dumps(kwds))
+
+
+def test_SignatureIndexRequiredLiterals():
+    sig = _sig(
+        [
+            {"type": "stackFrame", "functionName": "js::foo", "frameNumber": "> 2"},
+            {"type": "stackFrames", "functionNames": ["bar", "?", "/ba[z]/", "???"]},
+            {"type": "stackFrames", "functionNames": ["", "bar", "qux"]},
+            {"type": "output", "value": "/notAFrame/"},
+        ]
+    )
+    assert getRequiredFrameLiterals(sig) == ["js::foo", "bar", "qux"]
+
+
+def test_SignatureIndexCandidates():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crashInfo = CrashInfo.fromRawCrashData(
+        [], (FIXTURE_PATH / "trace_asan_segv.txt").read_text().splitlines(), config
+    )
+    assert crashInfo.backtrace[2] == "EvalInFrame"
+
+    sigs = {
+        # exact top frame
+        "exact": _sig([{"type": "stackFrame", "functionName": crashInfo.backtrace[0]}]),
+        # substring of a frame
+        "substring": _sig(
+            [
+                {
+                    "type": "stackFrames",
+                    "functionNames": ["?", "AbstractFramePtr::scr", "Eval"],
+                }
+            ]
+        ),
+        # whole frame, containing the "Eval" literal of the previous signature
+        "contained": _sig([{"type": "stackFrame", "functionName": "EvalInFrame"}]),
+        # literal not present anywhere
+        "missing": _sig(
+            [{"type": "stackFrames", "functionNames": ["js::AbstractFramePtr", "x::"]}]
+        ),
+        # no literals, only a facet that does not fit
+        "wrong_os": _sig(
+            [{"type": "output", "value": "foo"}], operatingSystems=["windows"]
+        ),
+        # no literals at all
+        "unindexed": _sig([{"type": "output", "value": "/foo/"}]),
+        # facet fits
+        "platform": _sig(
+            [{"type": "stackFrame", "functionName": "js::"}], platforms=["x86-64"]
+        ),
+        # facet does not fit
+        "wrong_product": _sig(
+            [{"type": "stackFrame", "functionName": "js::"}], products=["other"]
+        ),
+    }
+
+    index = SignatureIndex()
+    for key, sig in sigs.items():
+        index.addSignature(key, sig)
+    assert len(index) == len(sigs)
+
+    candidates = index.getCandidates(crashInfo)
+    assert candidates == {"exact", "substring", "contained", "unindexed", "platform"}
+
+    # The index must never filter out a signature that actually matches
+    for key, sig in sigs.items():
+        if sig.matches(crashInfo):
+            assert key in candidates
+
+    index.remove("exact")
+    index.remove("exact")
+    assert "exact" not in index
+    assert "exact" not in index.getCandidates(crashInfo)
+    assert crashInfo.backtrace[0] not in index.literals
+
+    # Re-adding a key replaces its previous requirements
+    index.addSignature("missing", sigs["exact"])
+    assert "missing" in index.getCandidates(crashInfo)
@@ -0,0 +1,159 @@
+"""
+Tests for the compiled StackFramesSymptom matcher
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import random
+from pathlib import Path
+
+import pytest
+
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
+from FTB.Signatures.Matchers import StringMatch
+from FTB.Signatures.Symptom import StackFramesSymptom
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+
+DEEP_TRACES = [
+    "trace_rust_sample_1.txt",
+    "trace_rust_sample_2.txt",
+    "trace_tsan_clang14.txt",
+    "tsan-report.txt",
+    "tsan-report-atomic.txt",
+]
+
+
+def _matchRecursive(partialStack, partialFunctionNames):
+    """The previous, recursive implementation of StackFramesSymptom._match"""
+    while True:
+        while (
+            partialFunctionNames
+            and partialStack
+            and str(partialFunctionNames[0]) not in {"?", "???"}
+        ):
+            if not partialFunctionNames[0].matches(partialStack[0]):
+                return False
+            partialStack = partialStack[1:]
+            partialFunctionNames = partialFunctionNames[1:]
+
+        if not partialFunctionNames:
+            return True
+
+        if str(partialFunctionNames[0]) in {"?", "???"}:
+            if _matchRecursive(partialStack, partialFunctionNames[1:]):
+                return True
+            if not partialStack:
+                return False
+            partialStack = partialStack[1:]
+            if str(partialFunctionNames[0]) == "?":
+                partialFunctionNames = partialFunctionNames[1:]
+
+        elif not partialStack:
+            return False
+
+
+def _crashInfo(trace):
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    lines = (FIXTURE_PATH / trace).read_text().splitlines()
+    return CrashInfo.fromRawCrashData([], lines, config)
+
+
+def _randomSignature(rng, stack, alphabet):
+    names = []
+    for _ in range(rng.randint(0, 6)):
+        kind = rng.random()
+        if kind < 0.2:
+            names.append("?")
+        elif kind < 0.4:
+            names.append("???")
+        elif kind < 0.5:
+            names.append("/^[a-c]$/")
+        elif kind < 0.8 and stack:
+            names.append(rng.choice(stack))
+        else:
+            names.append(rng.choice(alphabet))
+    return [StringMatch(name) for name in names]
+
+
+def test_StackFramesMatcherRandom():
+    rng = random.Random(0)
+    alphabet = ["a", "b", "c", "d"]
+    for _ in range(5000):
+        stack = rng.choices(alphabet, k=rng.randint(0, 8))
+        names = _randomSignature(rng, stack, alphabet)
+        assert StackFramesSymptom._match(stack, names) == _matchRecursive(
+            stack, names
+        ), (stack, [str(name) for name in names])
+
+
+@pytest.mark.parametrize("trace", DEEP_TRACES)
+def test_StackFramesMatcherFixtures(trace):
+    rng = random.Random(trace)
+    crashInfo = _crashInfo(trace)
+    stack = crashInfo.backtrace
+    assert len(stack) >= 20
+
+    for _ in range(500):
+        # Signatures derived from frames of the stack, in order, with wildcards
+        # in between, so that a good share of them matches.
+        names = []
+        for frame in sorted(rng.sample(range(len(stack)), rng.randint(1, 5))):
+            names.append(rng.choice(["?", "???", "???"]))
+            names.append(stack[frame] if rng.random() < 0.9 else "missing")
+        names = [StringMatch(name) for name in names]
+
+        symptom = StackFramesSymptom(
+            {"type": "stackFrames", "functionNames": [str(name) for name in names]}
+        )
+        expected = _matchRecursive(stack, names)
+        assert StackFramesSymptom._match(stack, names) == expected
+        assert symptom.matches(crashInfo) == expected
+
+
+@pytest.mark.parametrize("trace", ["trace_rust_sample_2.txt", "tsan-report.txt"])
+def test_StackFramesMatcherWildcards(trace):
+    # Several "???" followed by a frame that never occurs make the recursive
+    # matcher try every way of splitting the stack between the wildcards, so it is
+    # only compared on the top of the stack. Full stacks are timed by the
+    # signature.match_wildcards benchmark.
+    stack = _crashInfo(trace).backtrace[:12]
+    for names in (["???", "???", "???", "missing"], ["???", "?", "???", stack[-1]]):
+        names = [StringMatch(name) for name in names]
+        assert StackFramesSymptom._match(stack, names) == _matchRecursive(stack, names)
+
+
+def test_StackFramesMatcherMatchFrame():
+    symptom = StackFramesSymptom(
+        {"type": "stackFrames", "functionNames": ["?", "/^b/", "???", "c"]}
+    )
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    calls = []
+
+    def _matchFrame(functionName, frameIdx):
+        calls.append((str(functionName), crashInfo.backtrace[frameIdx]))
+        return functionName.matches(crashInfo.backtrace[frameIdx])
+
+    results = []
+    for stack in (["a", "b", "d", "c"], ["x", "b", "c"], ["a", "d", "c"]):
+        crashInfo = CrashInfo.fromRawCrashData([], [], config)
+        crashInfo.backtrace = stack
+        results.append(symptom.matches(crashInfo, _matchFrame))
+        # the result is the same without the hook
+        assert results[-1] == symptom.matches(crashInfo)
+    assert results == [True, True, False]
+
+    # only PCRE function names are matched through the hook
+    assert calls == [
+        ("^b", "a"),
+        ("^b", "b"),
+        ("^b", "x"),
+        ("^b", "b"),
+        ("^b", "a"),
+        ("^b", "d"),
+    ]
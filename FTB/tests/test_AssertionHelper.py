@@ -308,3 +308,36 @@ def test_AssertionHelperTestRustPanic03():
     )
     assert sanitizedMsg[-1] == r" right: `Block`', .+/style_adjuster\.rs(:[0-9]+)+"
     _check_regex_matches(err, sanitizedMsg)
+
+
+def test_AssertionHelperTestSurroundingOutput():
+    noise = [
+        "[1234] WARNING: NS_ENSURE_TRUE(mDocShell) failed: file Document.cpp:12",
+        "[Parent 1234, Main Thread] ###!!! ASSERTION: Invalid state: 'mState'",
+        "console.log: loading",
+    ]
+    for fixture in sorted(FIXTURE_PATH.glob("*.txt")):
+        err = fixture.read_text().splitlines()
+        # unrelated output and PID prefixes don't change the results (the prefix
+        # also removes the indentation of a line, so those are kept as is)
+        padded = [
+            *noise,
+            *(line if line[:1].isspace() else f"[42] {line}" for line in err),
+            *noise,
+        ]
+        assert AssertionHelper.getAssertion(padded) == AssertionHelper.getAssertion(err)
+        assert AssertionHelper.getAuxiliaryAbortMessage(
+            padded
+        ) == AssertionHelper.getAuxiliaryAbortMessage(err)
+
+
+def test_AssertionHelperTestSanitizedPatternCache():
+    msg = "Assertion failure: cached(), at /srv/repos/mozilla-central/a.cpp:12"
+    AssertionHelper._sanitizeAssertionMessage.cache_clear()
+    sanitizedMsg = AssertionHelper.getSanitizedAssertionPattern(msg)
+    assert sanitizedMsg == r"Assertion failure: cached\(\), at .+/a\.cpp(:[0-9]+)+"
+    assert AssertionHelper.getSanitizedAssertionPattern([msg, msg]) == [
+        sanitizedMsg,
+        sanitizedMsg,
+    ]
+    assert AssertionHelper._sanitizeAssertionMessage.cache_info().hits == 2
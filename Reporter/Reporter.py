@@ -12,14 +12,21 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 @contact:    choller@mozilla.com
 """
 
+import contextlib
 import functools
+import gzip
+import io
 import logging
 import os
 import platform
+import tempfile
 import time
+import uuid
 from abc import ABC
-from collections.abc import Callable
-from typing import Any, Concatenate, ParamSpec, TypeVar
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Any, Concatenate, ParamSpec, TypeVar
 
 import requests
 import requests.exceptions
@@ -33,12 +40,28 @@ try:
 except ImportError:
     HAVE_SENTRY = False
 
+try:
+    import zstandard
+
+    HAVE_ZSTD = True
+except ImportError:
+    HAVE_ZSTD = False
+
 LOG = logging.getLogger(__name__)
 
 P = ParamSpec("P")
 R = TypeVar("R")
 T = TypeVar("T", bound="Reporter")
 
+# Content encodings supported for compressing request bodies
+COMPRESSIONS = ("gzip", "zstd")
+
+# Request bodies smaller than this (in bytes) are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+# Streamed request bodies are compressed in blocks of this size (in bytes)
+COMPRESS_BLOCK_SIZE = 1024 * 1024
+
 
 # Inheriting from RuntimeError because of legacy code.
 # All of these exceptions used to be RuntimeError.
@@ -53,6 +76,9 @@ class ConfigurationError(ReporterException):
 class ServerError(ReporterException):
     """Communication errors encountered by Reporter during operation."""
 
+    # HTTP status code of the failed request, if the server responded at all
+    status_code: int | None = None
+
 
 class InvalidDataError(ReporterException):
     """Reporter data validation failures."""
@@ -111,11 +137,16 @@ def requests_retry(
     @functools.wraps(wrapped)
     def wrapper(*args: Any, **kwds: Any) -> requests.Response:
         success = kwds.pop("expected")
+        if isinstance(success, int):
+            success = (success,)
         # max_sleep is the upper limit for exponential backoff,
         # which begins at 2s and doubles each retry
         max_sleep = kwds.pop("max_sleep", 64)
         current_timeout = 2
         while True:
+            # streamed request bodies are sent again from the start
+            if hasattr(kwds.get("data"), "seek"):
+                kwds["data"].seek(0)
             try:
                 response = wrapped(*args, **kwds)
             except requests.exceptions.ConnectionError as exc:
@@ -126,7 +157,7 @@ def requests_retry(
                     continue
                 raise ServerError(f"maximum timeout exceeded: {exc}") from None
 
-            if response.status_code != success:
+            if response.status_code not in success:
                 # Allow for a total sleep time of up to 2 minutes if it's
                 # likely that the response codes indicate a temporary error
                 retry_codes = (429, 500, 502, 503, 504)
@@ -139,15 +170,123 @@ def requests_retry(
                     time.sleep(current_timeout)
                     current_timeout *= 2
                     continue
-                raise ServerError(
+                error = ServerError(
                     "Server unexpectedly responded with status code "
                     f"{response.status_code}: {response.text}"
                 )
+                error.status_code = response.status_code
+                raise error
             return response
 
     return wrapper
 
 
+class MultipartStream:
+    """
+    File-like multipart/form-data request body, which reads the uploaded files
+    while the request is sent instead of loading them into memory. Its length is
+    known in advance, so the request is not sent chunked. Pass it as data to
+    L{Reporter.post} together with its contentType as Content-Type header.
+    """
+
+    def __init__(
+        self,
+        fields: Iterable[tuple[str, Any]],
+        files: Iterable[tuple[str, str, str]] = (),
+    ) -> None:
+        """
+        @type fields: iterable(tuple(str, object))
+        @param fields: Names and values of the form fields
+
+        @type files: iterable(tuple(str, str, str))
+        @param files: Field names, file names and paths of the files to upload
+        """
+        boundary = uuid.uuid4().hex
+        self.contentType = f"multipart/form-data; boundary={boundary}"
+        self._parts: list[bytes | Path] = []
+        for name, value in fields:
+            if not isinstance(value, bytes):
+                value = str(value).encode("utf-8")
+            self._parts.append(
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{self.quote(name)}"\r\n'
+                "\r\n".encode()
+                + value
+                + b"\r\n"
+            )
+        for name, fileName, path in files:
+            self._parts.append(
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{self.quote(name)}"; '
+                f'filename="{self.quote(fileName)}"\r\n'
+                "Content-Type: application/octet-stream\r\n"
+                "\r\n".encode()
+            )
+            self._parts.append(Path(path))
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{boundary}--\r\n".encode())
+        self._length = sum(
+            len(part) if isinstance(part, bytes) else part.stat().st_size
+            for part in self._parts
+        )
+        self._index = 0
+        self._current: IO[bytes] | None = None
+        self._position = 0
+
+    @staticmethod
+    def quote(value: str) -> str:
+        return value.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+    def __len__(self) -> int:
+        return self._length
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        result = bytearray()
+        while self._index < len(self._parts) and (size < 0 or len(result) < size):
+            if self._current is None:
+                part = self._parts[self._index]
+                self._current = (
+                    io.BytesIO(part) if isinstance(part, bytes) else part.open("rb")
+                )
+            chunk = self._current.read(-1 if size < 0 else size - len(result))
+            if chunk:
+                result += chunk
+            else:
+                self._current.close()
+                self._current = None
+                self._index += 1
+        self._position += len(result)
+        return bytes(result)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Only rewinding to the start is supported"""
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("can only seek to the start")
+        self.close()
+        self._index = 0
+        self._position = 0
+        return 0
+
+    def close(self) -> None:
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+    def __enter__(self) -> "MultipartStream":
+        return self
+
+    def __exit__(
+        self,
+        excType: type[BaseException] | None,
+        excValue: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
 def sentry_init() -> None:
     if HAVE_SENTRY:
         sentry_fuzzing_config.init()
@@ -163,6 +302,7 @@ class Reporter(ABC):
         serverAuthToken: str | None = None,
         clientId: str | None = None,
         tool: str | None = None,
+        compression: str | None = None,
     ) -> None:
         """
         Initialize the Reporter. This constructor will also attempt to read
@@ -181,6 +321,9 @@ class Reporter(ABC):
         @param clientId: Client ID stored in the server when submitting issues
         @type tool: string
         @param tool: Name of the tool that found this issue
+        @type compression: string
+        @param compression: Content encoding to compress request bodies with,
+                            "gzip" or "zstd". The server must support this.
         """
         self.sigCacheDir = sigCacheDir
         self.serverHost = serverHost
@@ -189,6 +332,7 @@ class Reporter(ABC):
         self.serverAuthToken = serverAuthToken
         self.clientId = clientId
         self.tool = tool
+        self.compression = compression
         self._session = requests.Session()
 
         # Now search for the global configuration file. If it exists, read its contents
@@ -226,6 +370,9 @@ class Reporter(ABC):
             if self.tool is None and "tool" in globalConfig:
                 self.tool = globalConfig["tool"]
 
+            if self.compression is None and "compression" in globalConfig:
+                self.compression = globalConfig["compression"]
+
         # Set some defaults that we can't set through default arguments, otherwise
         # they would overwrite configuration file settings
         if self.serverProtocol is None:
@@ -241,12 +388,23 @@ class Reporter(ABC):
         if self.serverHost is not None and self.clientId is None:
             self.clientId = platform.node()
 
+        if self.compression is not None:
+            if self.compression not in COMPRESSIONS:
+                raise ConfigurationError(
+                    f"Unsupported compression {self.compression!r}, "
+                    f"use one of: {', '.join(COMPRESSIONS)}"
+                )
+            if self.compression == "zstd" and not HAVE_ZSTD:
+                raise ConfigurationError(
+                    "Compression zstd requires the zstandard package"
+                )
+
     def get(self, *args: Any, **kwds: Any) -> requests.Response:
         """requests.get, with added support for FuzzManager authentication and retry on
         5xx errors.
 
-        @type expected: int
-        @param expected: HTTP status code for successful response
+        @type expected: int or tuple(int)
+        @param expected: HTTP status code(s) for successful response
                          (default: requests.codes["ok"])
         """
         kwds.setdefault("expected", requests.codes["ok"])
@@ -256,25 +414,89 @@ class Reporter(ABC):
         return requests_retry(self._session.get)(*args, **kwds)
 
     def post(self, *args: Any, **kwds: Any) -> requests.Response:
-        """requests.post, with added support for FuzzManager authentication and retry on
-        5xx errors.
+        """requests.post, with added support for FuzzManager authentication, retry on
+        5xx errors and compression of the request body (see compression).
 
-        @type expected: int
-        @param expected: HTTP status code for successful response
+        @type expected: int or tuple(int)
+        @param expected: HTTP status code(s) for successful response
                          (default: requests.codes["created"])
         """
         kwds.setdefault("expected", requests.codes["created"])
         kwds.setdefault("headers", {}).update(
             {"Authorization": f"Token {self.serverAuthToken}"}
         )
-        return requests_retry(self._session.post)(*args, **kwds)
+        with contextlib.ExitStack() as stack:
+            if self.compression is not None:
+                args = self._compress_request(args, kwds, stack)
+            return requests_retry(self._session.post)(*args, **kwds)
+
+    def _compress_request(
+        self, args: tuple[Any, ...], kwds: dict[str, Any], stack: contextlib.ExitStack
+    ) -> tuple[Any, ...]:
+        """Encode the body of a POST request like requests would and compress it.
+
+        The data, json and files arguments are replaced by the compressed body and
+        the Content-Type and Content-Encoding headers are set accordingly. Streamed
+        bodies (see L{MultipartStream}) are compressed into a temporary file
+        instead, which is passed as data and closed by the given exit stack.
+
+        @rtype: tuple
+        @return: The positional arguments for requests.post
+        """
+        (url, *rest) = args
+        data = rest[0] if rest else kwds.pop("data", None)
+        json = rest[1] if len(rest) > 1 else kwds.pop("json", None)
+        files = kwds.pop("files", None)
+        if hasattr(data, "read"):
+            kwds["data"] = data
+            if len(data) >= COMPRESS_MIN_SIZE:
+                compressed = tempfile.TemporaryFile()  # noqa: SIM115
+                kwds["data"] = stack.enter_context(compressed)
+                self._compress_stream(data, compressed)
+                kwds["headers"]["Content-Encoding"] = self.compression
+            return (url,)
+
+        prepared = requests.Request(
+            "POST", url, data=data, json=json, files=files
+        ).prepare()
+        body = prepared.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if "Content-Type" in prepared.headers:
+            kwds["headers"]["Content-Type"] = prepared.headers["Content-Type"]
+        if body is not None and len(body) >= COMPRESS_MIN_SIZE:
+            if self.compression == "zstd":
+                body = zstandard.ZstdCompressor().compress(body)
+            else:
+                body = gzip.compress(body)
+            kwds["headers"]["Content-Encoding"] = self.compression
+        return (url, body)
+
+    def _compress_stream(self, stream: IO[bytes], target: IO[bytes]) -> None:
+        """Compress a streamed request body into a file and rewind it.
+
+        The body is compressed in blocks, so it is never held in memory as a whole.
+        Unlike a chunked request, the compressed body has a known length, which
+        WSGI servers need to pass it on.
+        """
+        if self.compression == "zstd":
+            writer = zstandard.ZstdCompressor().stream_writer(target, closefd=False)
+        else:
+            writer = gzip.GzipFile(fileobj=target, mode="wb")
+        with writer:
+            while True:
+                block = stream.read(COMPRESS_BLOCK_SIZE)
+                if not block:
+                    break
+                writer.write(block)
+        target.seek(0)
 
     def patch(self, *args: Any, **kwds: Any) -> requests.Response:
         """requests.patch, with added support for FuzzManager authentication and retry
         on 5xx errors.
 
-        @type expected: int
-        @param expected: HTTP status code for successful response
+        @type expected: int or tuple(int)
+        @param expected: HTTP status code(s) for successful response
                          (default: requests.codes["created"])
         """
         kwds.setdefault("expected", requests.codes["ok"])
@@ -0,0 +1,151 @@
+"""
+Benchmarks
+
+Throughput benchmarks for the performance critical parts of FTB. Run them with
+`python -m benchmarks`, see `python -m benchmarks --help` for comparing the
+results against the stored baselines.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from __future__ import annotations
+
+import importlib
+import json
+import platform
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    # does all the setup and returns the operation to time, together with the
+    # number of items the operation processes per call
+    Benchmark = Callable[[], tuple[Callable[[], object], int]]
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# Fixed pure Python workload timed along with the benchmarks. Results are
+# normalized by its duration, so baselines recorded on one machine remain
+# comparable on a faster or slower one.
+CALIBRATION_ROUNDS = 200000
+
+# modules registering benchmarks
+BENCHMARK_MODULES = ["benchmarks.assertions", "benchmarks.signatures"]
+
+# registered benchmarks by name
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> Callable[[Benchmark], Benchmark]:
+    """Register a benchmark. The decorated function does all the setup, its result
+    is the operation to time and the number of items processed per call."""
+
+    def decorator(func: Benchmark) -> Benchmark:
+        assert name not in BENCHMARKS, f"duplicate benchmark {name}"
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+def load() -> None:
+    """Import all modules registering benchmarks"""
+    for module in BENCHMARK_MODULES:
+        importlib.import_module(module)
+
+
+def calibrate() -> float:
+    """Duration of the calibration workload in seconds (best of 5)"""
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        total = 0
+        values: dict[int, str] = {}
+        for idx in range(CALIBRATION_ROUNDS):
+            total += idx % 7
+            values[idx & 1023] = str(idx)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(
+    names: list[str] | None = None, repeat: int = 5, min_time: float = 0.2
+) -> dict[str, Any]:
+    """
+    Run the given (or all) registered benchmarks.
+
+    Every benchmark is called often enough to take at least min_time seconds and
+    this is repeated `repeat` times, the fastest repetition counts.
+
+    @rtype: dict
+    @return: Machine readable results, suitable for storing as baseline
+    """
+    results: dict[str, dict[str, float]] = {}
+    calibration = calibrate()
+
+    for name in names or sorted(BENCHMARKS):
+        func, items = BENCHMARKS[name]()
+        # warm up caches and determine the number of calls per repetition
+        calls = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(calls):
+                func()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+            calls *= 2
+
+        best = elapsed / calls
+        for _ in range(repeat - 1):
+            start = time.perf_counter()
+            for _ in range(calls):
+                func()
+            best = min(best, (time.perf_counter() - start) / calls)
+
+        results[name] = {
+            "seconds": best,
+            "items_per_second": items / best,
+            "normalized": best / calibration,
+        }
+
+    return {
+        "python": platform.python_version(),
+        "calibration": calibration,
+        "results": results,
+    }
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    """
+    Compare benchmark results against a baseline.
+
+    @type tolerance: float
+    @param tolerance: Allowed relative slowdown of the normalized time, e.g. 0.25
+
+    @rtype: list(str)
+    @return: Descriptions of all benchmarks that regressed
+    """
+    regressions = []
+    for name, result in sorted(results["results"].items()):
+        expected = baseline["results"].get(name)
+        if expected is None:
+            continue
+        ratio = result["normalized"] / expected["normalized"]
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {ratio:.2f}x slower than baseline")
+    return regressions
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict[str, Any]:
+    with path.open() as fp:
+        baseline: dict[str, Any] = json.load(fp)
+    return baseline
@@ -0,0 +1,109 @@
+"""
+Run the benchmarks and compare them against the stored baselines.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import json
+import sys
+from pathlib import Path
+
+from benchmarks import BASELINE_PATH, BENCHMARKS, compare, load, load_baseline, run
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "patterns",
+        nargs="*",
+        metavar="PATTERN",
+        help="Only run benchmarks matching these shell-style patterns",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Repetitions per benchmark (best counts)"
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="Minimum duration of each repetition in seconds",
+    )
+    parser.add_argument(
+        "--output", type=Path, help="Write the JSON results to this file"
+    )
+    parser.add_argument(
+        "--compare",
+        nargs="?",
+        const=BASELINE_PATH,
+        type=Path,
+        metavar="BASELINE",
+        help="Fail if any benchmark is slower than in the given baseline "
+        "(default: the stored baseline)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative slowdown when comparing (default: 0.25)",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as new baseline",
+    )
+    args = parser.parse_args(argv)
+
+    load()
+    names = sorted(BENCHMARKS)
+    if args.patterns:
+        names = [
+            name
+            for name in names
+            if any(fnmatch.fnmatch(name, pattern) for pattern in args.patterns)
+        ]
+        if not names:
+            parser.error("no benchmark matches the given patterns")
+
+    results = run(names, repeat=args.repeat, min_time=args.min_time)
+
+    for name, result in results["results"].items():
+        print(
+            f"{name:40} {result['seconds'] * 1000:10.3f} ms "
+            f"{result['items_per_second']:14.1f} items/s",
+            file=sys.stderr,
+        )
+
+    output = json.dumps(results, indent=2, sort_keys=True) + "\n"
+    if args.output is not None:
+        args.output.write_text(output)
+    if args.update_baseline:
+        if BASELINE_PATH.exists():
+            # keep the baselines of benchmarks that were not run
+            baseline = load_baseline()
+            baseline.update({k: v for k, v in results.items() if k != "results"})
+            baseline["results"].update(results["results"])
+            output = json.dumps(baseline, indent=2, sort_keys=True) + "\n"
+        BASELINE_PATH.write_text(output)
+    if args.output is None and not args.update_baseline:
+        print(output, end="")
+
+    if args.compare is not None:
+        regressions = compare(results, load_baseline(args.compare), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Benchmarks for extracting and sanitizing abort messages from large logs.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from __future__ import annotations
+
+import random
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from benchmarks import benchmark
+from FTB import AssertionHelper
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+FIXTURE_PATH = Path(__file__).parent.parent / "FTB" / "tests" / "fixtures"
+
+# number of log lines preceding the abort message
+LOG_LINES = 50000
+
+# number of distinct abort messages sanitized per call
+SANITIZE_MESSAGES = 200
+
+
+def _firefoxNoise(rng: random.Random, idx: int) -> str:
+    pid = rng.randrange(1000, 99999)
+    return rng.choice(
+        (
+            f"[Parent {pid}, Main Thread] WARNING: NS_ENSURE_TRUE(mDocShell) failed: "
+            f"file /builds/worker/checkouts/gecko/dom/base/Document.cpp:{idx}",
+            f"[Child {pid}, Main Thread] WARNING: '!mWindow', file "
+            f"/builds/worker/checkouts/gecko/dom/base/nsGlobalWindowOuter.cpp:{idx}",
+            f"[{pid}] ###!!! ASSERTION: Invalid frame state: 'mState', file "
+            f"/builds/worker/checkouts/gecko/layout/generic/nsIFrame.cpp:{idx}",
+            f"console.log: loading resource {idx}",
+            f"JavaScript error: resource://gre/modules/Foo.sys.mjs, line {idx}: "
+            "TypeError: x is undefined",
+        )
+    )
+
+
+def _v8Noise(rng: random.Random, idx: int) -> str:
+    return rng.choice(
+        (
+            f"[marking {idx}] Mark-Compact 12.3 (15.1) -> 11.9 (16.1) MB, 4.2 ms",
+            f"[optimizing 0x{idx:08x} <JSFunction f{idx}> - took 0.1, 0.4 ms]",
+            f"Scavenge {idx}.1 (22.3) -> 20.9 (23.3) MB, 1.1 / 0.0 ms",
+        )
+    )
+
+
+def _rustNoise(rng: random.Random, idx: int) -> str:
+    return rng.choice(
+        (
+            f"[2024-01-01T00:00:{idx % 60:02d}Z DEBUG style::traversal] visiting {idx}",
+            f"[2024-01-01T00:00:{idx % 60:02d}Z INFO  webrender::renderer] frame {idx}",
+            f"    at /builds/worker/checkouts/gecko/servo/components/style/x.rs:{idx}",
+        )
+    )
+
+
+def _log(
+    noise: Callable[[random.Random, int], str], fixture: str
+) -> tuple[Callable[[], object], int]:
+    rng = random.Random(0)
+    lines = [noise(rng, idx) for idx in range(LOG_LINES)]
+    lines.extend((FIXTURE_PATH / fixture).read_text().splitlines())
+    assert AssertionHelper.getAssertion(lines) is not None
+    return lambda: AssertionHelper.getAssertion(lines), len(lines)
+
+
+@benchmark("assertion.firefox")
+def firefoxAssertion() -> tuple[Callable[[], object], int]:
+    return _log(_firefoxNoise, "assert_windows_forward_slash_path.txt")
+
+
+@benchmark("assertion.v8")
+def v8Assertion() -> tuple[Callable[[], object], int]:
+    return _log(_v8Noise, "assert_v8_abort.txt")
+
+
+@benchmark("assertion.rust")
+def rustAssertion() -> tuple[Callable[[], object], int]:
+    return _log(_rustNoise, "assert_rust_panic1.txt")
+
+
+@benchmark("assertion.auxiliary")
+def auxiliaryAbortMessage() -> tuple[Callable[[], object], int]:
+    rng = random.Random(0)
+    lines = [_firefoxNoise(rng, idx) for idx in range(LOG_LINES)]
+    lines.extend(
+        (FIXTURE_PATH / "assert_asan_heap_buffer_overflow.txt").read_text().splitlines()
+    )
+    assert AssertionHelper.getAuxiliaryAbortMessage(lines) is not None
+    return lambda: AssertionHelper.getAuxiliaryAbortMessage(lines), len(lines)
+
+
+@benchmark("assertion.sanitize")
+def sanitizeAssertion() -> tuple[Callable[[], object], int]:
+    messages = [
+        f"Assertion failure: mFrame{idx}->IsValid(), at "
+        f"/builds/worker/checkouts/gecko/layout/generic/nsFrame{idx}.cpp:{idx * 7}"
+        for idx in range(SANITIZE_MESSAGES)
+    ]
+
+    def sanitize() -> None:
+        # measure the sanitizing itself, not the cache
+        AssertionHelper._sanitizeAssertionMessage.cache_clear()
+        for message in messages:
+            AssertionHelper.getSanitizedAssertionPattern(message)
+
+    return sanitize, len(messages)
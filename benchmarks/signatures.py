@@ -0,0 +1,270 @@
+"""
+Benchmarks for parsing crash output and matching crash signatures, using the
+trace fixtures of the FTB.Signatures tests.
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+from contextlib import redirect_stderr, redirect_stdout
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from benchmarks import benchmark
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import (
+    AppleCrashInfo,
+    ASanCrashInfo,
+    CDBCrashInfo,
+    CrashInfo,
+    GDBCrashInfo,
+    LSanCrashInfo,
+    MinidumpCrashInfo,
+    RustCrashInfo,
+    TSanCrashInfo,
+    UBSanCrashInfo,
+    ValgrindCrashInfo,
+)
+from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.OutputMatcher import OutputMatcher
+from FTB.Signatures.SignatureIndex import SignatureIndex
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+FIXTURE_PATH = (
+    Path(__file__).parent.parent / "FTB" / "Signatures" / "tests" / "fixtures"
+)
+
+# number of synthetic signatures matched against the fixtures
+SIGNATURE_COUNT = 5000
+
+# number of fixtures every signature is matched against without any index
+MATCH_SAMPLE = 10
+
+# number of signatures compared to the crash they were derived from, to measure
+# getDistance and fit
+PAIR_SAMPLE = 500
+
+PARSERS = {
+    "apple": AppleCrashInfo,
+    "asan": ASanCrashInfo,
+    "cdb": CDBCrashInfo,
+    "gdb": GDBCrashInfo,
+    "lsan": LSanCrashInfo,
+    "minidump": MinidumpCrashInfo,
+    "rust": RustCrashInfo,
+    "tsan": TSanCrashInfo,
+    "ubsan": UBSanCrashInfo,
+    "valgrind": ValgrindCrashInfo,
+}
+
+
+def _configuration(crashInfoClass: type[CrashInfo]) -> ProgramConfiguration:
+    if crashInfoClass is CDBCrashInfo:
+        return ProgramConfiguration("test", "x86-64", "windows")
+    if crashInfoClass is AppleCrashInfo:
+        return ProgramConfiguration("test", "x86-64", "macosx")
+    return ProgramConfiguration("test", "x86-64", "linux")
+
+
+def _quiet(func: Callable[[], object]) -> Callable[[], object]:
+    """Silence the diagnostics some parsers print for unsupported input"""
+
+    def wrapper() -> object:
+        with (
+            open(os.devnull, "w") as devnull,
+            redirect_stdout(devnull),
+            redirect_stderr(devnull),
+        ):
+            return func()
+
+    return wrapper
+
+
+@cache
+def fixtures() -> list[tuple[type[CrashInfo], ProgramConfiguration, list[str]]]:
+    """All trace fixtures with their detected CrashInfo class"""
+    result = []
+    for path in sorted(FIXTURE_PATH.glob("*.txt")):
+        lines = path.read_text(errors="replace").splitlines()
+        crashInfoClass = CrashInfo.detectCrashInfoClass(None, lines)
+        result.append((crashInfoClass, _configuration(crashInfoClass), lines))
+    return result
+
+
+@cache
+def crashInfos() -> list[CrashInfo]:
+    def parse() -> list[CrashInfo]:
+        return [
+            CrashInfo.fromRawCrashData([], [], config, lines)
+            for _, config, lines in fixtures()
+        ]
+
+    return _quiet(parse)()
+
+
+@cache
+def signatures() -> list[tuple[CrashSignature, CrashInfo]]:
+    """Synthetic signature set: variations of the signatures generated for the
+    fixtures, most of them not matching their fixture anymore. Every signature is
+    returned together with the crash it was derived from."""
+    rng = random.Random(0)
+    generated = []
+    for crashInfo in crashInfos():
+        sig = crashInfo.createCrashSignature()
+        if sig is not None:
+            generated.append((str(sig), crashInfo))
+
+    result = []
+    for idx in range(SIGNATURE_COUNT):
+        rawSignature, crashInfo = generated[idx % len(generated)]
+        sigObj: dict[str, Any] = json.loads(rawSignature)
+        for symptom in sigObj["symptoms"]:
+            if rng.random() < 0.2:
+                continue
+            if symptom["type"] == "stackFrames":
+                frames = symptom["functionNames"]
+                frames[rng.randrange(len(frames))] = f"synthetic::frame{idx}"
+            elif symptom["type"] == "output":
+                symptom["value"] = f"synthetic output {idx}"
+        result.append((CrashSignature(json.dumps(sigObj)), crashInfo))
+    return result
+
+
+def _parse(crashInfoClass: type[CrashInfo]) -> tuple[Callable[[], object], int]:
+    traces = [
+        (config, lines) for cls, config, lines in fixtures() if cls is crashInfoClass
+    ]
+
+    def parse() -> None:
+        for config, lines in traces:
+            CrashInfo.fromRawCrashData([], [], config, lines)
+
+    return _quiet(parse), len(traces)
+
+
+for _name, _crashInfoClass in PARSERS.items():
+    benchmark(f"parse.{_name}")(
+        lambda crashInfoClass=_crashInfoClass: _parse(crashInfoClass)
+    )
+
+
+@benchmark("signature.create")
+def createSignatures() -> tuple[Callable[[], object], int]:
+    infos = crashInfos()
+
+    def create() -> None:
+        for crashInfo in infos:
+            crashInfo.createCrashSignature()
+
+    return _quiet(create), len(infos)
+
+
+@benchmark("signature.match")
+def matchSignatures() -> tuple[Callable[[], object], int]:
+    infos = crashInfos()[:: len(crashInfos()) // MATCH_SAMPLE][:MATCH_SAMPLE]
+    sigs = [sig for sig, _ in signatures()]
+
+    def match() -> None:
+        for crashInfo in infos:
+            for sig in sigs:
+                sig.matches(crashInfo)
+
+    return match, len(infos) * len(sigs)
+
+
+@benchmark("signature.match_indexed")
+def matchSignaturesIndexed() -> tuple[Callable[[], object], int]:
+    infos = crashInfos()
+    sigs = [sig for sig, _ in signatures()]
+    index = SignatureIndex()
+    for key, sig in enumerate(sigs):
+        index.addSignature(key, sig)
+    matcher = OutputMatcher(sigs)
+
+    def match() -> None:
+        for crashInfo in infos:
+            outputHits = matcher.scan(crashInfo)
+            for key in index.getCandidates(crashInfo):
+                sigs[key].matches(crashInfo, outputHits)
+
+    return match, len(infos)
+
+
+@benchmark("signature.match_wildcards")
+def matchWildcards() -> tuple[Callable[[], object], int]:
+    # Several "???" followed by a frame that never occurs force the stackFrames
+    # matcher to consider every way of splitting the stack between the wildcards.
+    # This was exponential in the number of wildcards before the matcher was
+    # compiled, now it is linear in the size of the stack.
+    infos = [crashInfo for crashInfo in crashInfos() if len(crashInfo.backtrace) >= 20]
+    sigs = [
+        CrashSignature(
+            json.dumps(
+                {
+                    "symptoms": [
+                        {"type": "stackFrames", "functionNames": [*names, "missing"]}
+                    ]
+                }
+            )
+        )
+        for names in (["???"] * 3, ["???"] * 20)
+    ]
+
+    def match() -> None:
+        for crashInfo in infos:
+            for sig in sigs:
+                sig.matches(crashInfo)
+
+    return match, len(infos) * len(sigs)
+
+
+@benchmark("signature.distance")
+def signatureDistance() -> tuple[Callable[[], object], int]:
+    pairs = signatures()[:PAIR_SAMPLE]
+
+    def distance() -> None:
+        for sig, crashInfo in pairs:
+            sig.getDistance(crashInfo)
+
+    return distance, len(pairs)
+
+
+@benchmark("signature.fit")
+def fitSignature() -> tuple[Callable[[], object], int]:
+    pairs = signatures()[:PAIR_SAMPLE]
+
+    def fit() -> None:
+        for sig, crashInfo in pairs:
+            sig.fit(crashInfo)
+
+    return fit, len(pairs)
+
+
+@benchmark("signature.match_output_lazy")
+def matchOutputLazy() -> tuple[Callable[[], object], int]:
+    traces = fixtures()
+    sigs = [
+        CrashSignature(
+            json.dumps({"symptoms": [{"type": "output", "value": f"/output {idx}/"}]})
+        )
+        for idx in range(20)
+    ]
+
+    def match() -> None:
+        for _, config, lines in traces:
+            crashInfo = CrashInfo.fromRawCrashData([], [], config, lines, lazy=True)
+            for sig in sigs:
+                sig.matches(crashInfo)
+
+    return _quiet(match), len(traces)
@@ -0,0 +1,57 @@
+"""
+Tests for the benchmark harness
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+
+from benchmarks import BENCHMARKS, compare, load, load_baseline, run
+from benchmarks.__main__ import main
+
+
+def test_baseline_complete():
+    load()
+    assert set(load_baseline()["results"]) == set(BENCHMARKS)
+
+
+def test_run():
+    load()
+    results = run(["parse.asan", "parse.gdb"], repeat=1, min_time=0)
+    assert set(results["results"]) == {"parse.asan", "parse.gdb"}
+    for result in results["results"].values():
+        assert result["seconds"] > 0
+        assert result["items_per_second"] > 0
+        assert result["normalized"] == result["seconds"] / results["calibration"]
+
+
+def test_compare():
+    baseline = {"results": {"a": {"normalized": 1.0}, "b": {"normalized": 1.0}}}
+    results = {
+        "results": {
+            "a": {"normalized": 1.2},
+            "b": {"normalized": 1.3},
+            "new": {"normalized": 5.0},
+        }
+    }
+    assert compare(results, baseline, 0.25) == ["b: 1.30x slower than baseline"]
+    assert compare(results, baseline, 0.5) == []
+
+
+def test_main_compare(capsys, tmp_path):
+    baseline = tmp_path / "baseline.json"
+    output = tmp_path / "results.json"
+    args = ["parse.ubsan", "--repeat", "1", "--min-time", "0", "--output", str(output)]
+    assert main(args) == 0
+    results = json.loads(output.read_text())
+    assert list(results["results"]) == ["parse.ubsan"]
+
+    # anything is a regression compared to an infinitely fast baseline
+    results["results"]["parse.ubsan"]["normalized"] = 1e-12
+    baseline.write_text(json.dumps(results))
+    assert main([*args, "--compare", str(baseline)]) == 1
+    assert "Regression: parse.ubsan" in capsys.readouterr().err
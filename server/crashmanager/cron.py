@@ -94,3 +94,18 @@ def export_signatures():
 @app.task(ignore_result=True)
 def notify_by_email():
     call_command("notify_by_email")
+
+
+@app.task(ignore_result=True)
+def resume_reassign_jobs():
+    from .models import BucketReassignJob
+
+    # Jobs without progress for a while lost their tasks, e.g. to a worker
+    # restart. Ranges that are already done are not processed again.
+    stalled = timezone.now() - timedelta(
+        seconds=getattr(settings, "REASSIGN_JOB_RESUME_AFTER", 15 * 60)
+    )
+    for job in BucketReassignJob.objects.filter(finished=None, updated__lt=stalled):
+        job.updated = timezone.now()
+        job.save(update_fields=["updated"])
+        job.dispatch()
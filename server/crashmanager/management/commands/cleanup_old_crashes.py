@@ -6,7 +6,7 @@ from django.core.management import BaseCommand, CommandError  # noqa
 from django.db.models.aggregates import Count
 from django.utils import timezone
 
-from crashmanager.models import Bucket, Bug, CrashEntry
+from crashmanager.models import Bucket, BucketStatsDelta, Bug, CrashEntry
 
 LOG = logging.getLogger("fm.crashmanager.cleanup_old_crashes")
 
@@ -27,7 +27,9 @@ LOG = logging.getLogger("fm.crashmanager.cleanup_old_crashes")
 def _bulk_delete_crashes(qs):
     while qs.count():
         pks = list(qs.values_list("pk", flat=True)[:500])
-        CrashEntry.objects.filter(pk__in=pks).delete()
+        # statistics of the affected buckets are updated once per batch
+        with BucketStatsDelta.collect():
+            CrashEntry.objects.filter(pk__in=pks).delete()
 
 
 class Command(BaseCommand):
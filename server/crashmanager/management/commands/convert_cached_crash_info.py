@@ -0,0 +1,92 @@
+import json
+import logging
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from crashmanager.models import CrashEntry, Frame
+from FTB.Signatures.CrashInfo import CrashInfo
+
+LOG = logging.getLogger("fm.crashmanager.convert_cached_crash_info")
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the cached crash information of all crash entries to the compact "
+        "binary encoding, with the backtrace frames stored in the Frame table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of crash entries converted per transaction",
+        )
+
+    @staticmethod
+    def drop(entry, exc):
+        # the crash info is parsed again the next time it is used
+        LOG.warning("Dropping invalid cached crash info of crash %d: %s", entry.pk, exc)
+        entry.cachedCrashInfoBinary = None
+        entry.frameIds = None
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        entries = (
+            CrashEntry.objects.filter(
+                (Q(cachedCrashInfo__isnull=False) & ~Q(cachedCrashInfo=""))
+                | Q(cachedCrashInfoBinary__isnull=False, frameIds__isnull=True)
+            )
+            .only("id", "cachedCrashInfo", "cachedCrashInfoBinary", "frameIds")
+            .order_by("id")
+        )
+
+        converted = 0
+        last_seen = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    entries.select_for_update().filter(id__gt=last_seen)[:batch_size]
+                )
+                if not batch:
+                    break
+                last_seen = batch[-1].pk
+
+                cache_objects = {}
+                frames = []
+                for entry in batch:
+                    try:
+                        if entry.cachedCrashInfo:
+                            cache_object = json.loads(entry.cachedCrashInfo)
+                        else:
+                            cache_object = CrashInfo.decodeCacheObject(
+                                entry.cachedCrashInfoBinary
+                            )
+                        frames.extend(cache_object["backtrace"])
+                        cache_objects[entry.pk] = cache_object
+                    except (ValueError, KeyError, TypeError) as exc:  # noqa: PERF203
+                        self.drop(entry, exc)
+
+                # create the frames of the whole batch at once
+                Frame.intern(frames)
+                for entry in batch:
+                    if entry.pk in cache_objects:
+                        try:
+                            entry.setCacheObject(cache_objects[entry.pk])
+                        except (KeyError, TypeError) as exc:
+                            self.drop(entry, exc)
+                    entry.cachedCrashInfo = None
+
+                CrashEntry.objects.bulk_update(
+                    batch, ["cachedCrashInfo", "cachedCrashInfoBinary", "frameIds"]
+                )
+            converted += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Successfully converted {converted} crash entries")
+        )
@@ -35,6 +35,7 @@ from crashmanager.models import (
     Platform,
     Product,
     TestCase,
+    TestCaseBlob,
     Tool,
     User,
 )
@@ -324,7 +325,9 @@ def create_crash(tools, oss, platforms, client, symptoms=None, bucket=None):
     testdata = "hello world\n" * randint(1, 20)
     binary = choice((True, False))
     testcase = TestCase(quality=randint(0, 10), isBinary=binary, size=len(testdata))
-    testcase.test.save("test.bin" if binary else "test.txt", ContentFile(testdata))
+    testcase.test = TestCaseBlob.store(
+        ContentFile(testdata), "bin" if binary else "txt"
+    )
     testcase.save()
     random_time = timedelta(seconds=randint(0, 24 * 3600))
 
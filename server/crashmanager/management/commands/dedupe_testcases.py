@@ -0,0 +1,54 @@
+import logging
+import os
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crashmanager.models import TestCase, TestCaseBlob
+
+LOG = logging.getLogger("fm.crashmanager.dedupe_testcases")
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the testcase files which are not in the content-addressed testcase "
+        "store yet into it. Afterwards, identical testcases share a single "
+        "compressed file. Interrupted runs can be resumed by running it again."
+    )
+
+    def handle(self, *args, **options):
+        storage = TestCaseBlob.storage()
+        testcases = (
+            TestCase.objects.exclude(test="")
+            .exclude(test__startswith=f"{TestCaseBlob.PREFIX}/")
+            .order_by("id")
+        )
+        moved = 0
+        missing = 0
+        for testcase in testcases.iterator():
+            old_name = testcase.test.name
+            if not storage.exists(old_name):
+                LOG.warning("Testcase %d file is missing: %s", testcase.pk, old_name)
+                missing += 1
+                continue
+
+            ext = os.path.splitext(old_name)[1].lstrip(".")
+            with transaction.atomic():
+                with storage.open(old_name, "rb") as fp:
+                    name = TestCaseBlob.store(fp, ext)
+                # update() bypasses the post_save receivers, the testcase itself
+                # is unchanged
+                TestCase.objects.filter(pk=testcase.pk).update(test=name)
+                # The old file is only removed once the new name is committed, a
+                # rollback must not lose the testcase.
+                transaction.on_commit(partial(storage.delete, old_name))
+            moved += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully moved {moved} testcases into "
+                f"{TestCaseBlob.objects.count()} stored files, "
+                f"{missing} testcases with missing files skipped"
+            )
+        )
@@ -2,51 +2,131 @@ import json
 from zipfile import ZipFile
 
 from django.core.management.base import BaseCommand
-from django.db.models.aggregates import Count, Min
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.aggregates import Count
+from django.db.models.functions import RowNumber
 
-from crashmanager.models import Bucket, CrashEntry
+from crashmanager.models import (
+    Bucket,
+    CrashEntry,
+    ExportedSignature,
+    PendingSignatureExport,
+)
+
+# Number of buckets whose metadata is queried at once
+BATCH_SIZE = 500
+
+
+def export_buckets(buckets):
+    """
+    Return the exported (signature, metadata) by bucket id of the given buckets,
+    using one query for the sizes and one for the best entries of all of them.
+    """
+    bucket_ids = [bucket.pk for bucket in buckets]
+    sizes = dict(
+        CrashEntry.objects.filter(bucket_id__in=bucket_ids)
+        .order_by()
+        .values("bucket_id")
+        .annotate(size=Count("id"))
+        .values_list("bucket_id", "size")
+    )
+
+    # The best entry of a bucket has a testcase of the best (lowest) quality,
+    # and the smallest of those, preferring newer entries.
+    best_testcases = {
+        bucket_id: (quality, size)
+        for bucket_id, quality, size in CrashEntry.objects.filter(
+            bucket_id__in=bucket_ids, testcase__isnull=False
+        )
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=F("bucket_id"),
+                order_by=[
+                    F("testcase__quality").asc(),
+                    F("testcase__size").asc(),
+                    F("id").desc(),
+                ],
+            )
+        )
+        .filter(rank=1)
+        .values_list("bucket_id", "testcase__quality", "testcase__size")
+    }
+
+    exported = {}
+    for bucket in buckets:
+        metadata = {}
+        metadata["size"] = sizes.get(bucket.pk, 0)
+        metadata["shortDescription"] = bucket.shortDescription
+        metadata["frequent"] = bucket.frequent
+        if bucket.bug is not None:
+            metadata["bug__id"] = bucket.bug.externalId
+
+        if bucket.pk in best_testcases:
+            (
+                metadata["testcase__quality"],
+                metadata["testcase__size"],
+            ) = best_testcases[bucket.pk]
+
+        exported[bucket.pk] = (bucket.signature, json.dumps(metadata, indent=4))
+    return exported
 
 
 class Command(BaseCommand):
-    help = "Export signatures and their metadata."
+    help = (
+        "Export signatures and their metadata. Only buckets changed since the "
+        "last export are exported again, the zip file is assembled from the "
+        "stored results of previous exports."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
             "filename", help="output filename to write signatures zip to"
         )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Export all buckets again, not only the changed ones",
+        )
 
     def handle(self, filename, **options):
+        with transaction.atomic():
+            # Buckets changed while exporting remain pending for the next run
+            pending = PendingSignatureExport.take()
+            buckets = Bucket.objects.select_related("bug").order_by("id")
+            if options["full"] or not ExportedSignature.objects.exists():
+                changes = dict.fromkeys(
+                    ExportedSignature.objects.filter(deleted=False).values_list(
+                        "bucket_id", flat=True
+                    )
+                )
+                bucket_ids = list(buckets.values_list("id", flat=True))
+            else:
+                changes = dict.fromkeys(pending)
+                bucket_ids = sorted(pending)
+
+            for offset in range(0, len(bucket_ids), BATCH_SIZE):
+                changes.update(
+                    export_buckets(
+                        list(
+                            buckets.filter(
+                                pk__in=bucket_ids[offset : offset + BATCH_SIZE]
+                            )
+                        )
+                    )
+                )
+
+            # The version allows clients to fetch only the changes to this export
+            version = ExportedSignature.record(changes)
+
         with ZipFile(filename, "w") as zipFile:
-            for bucket in Bucket.objects.annotate(
-                size=Count("crashentry"), quality=Min("crashentry__testcase__quality")
+            zipFile.comment = str(version).encode("ascii")
+            for bucket_id, signature, metadata in (
+                ExportedSignature.objects.filter(deleted=False)
+                .order_by("bucket_id")
+                .values_list("bucket_id", "signature", "metadata")
+                .iterator()
             ):
-                bestEntryQuery = (
-                    CrashEntry.objects.filter(bucket_id=bucket.pk)
-                    .filter(testcase__quality=bucket.quality)
-                    .defer("rawCrashData", "rawStderr", "rawStdout")
-                    .order_by("testcase__size", "-id")
-                )
-                if bestEntryQuery.count():
-                    bucket.bestEntry = bestEntryQuery[0]
-                else:
-                    bucket.bestEntry = None
-
-                metadata = {}
-                metadata["size"] = bucket.size
-                metadata["shortDescription"] = bucket.shortDescription
-                metadata["frequent"] = bucket.frequent
-                if bucket.bug is not None:
-                    metadata["bug__id"] = bucket.bug.externalId
-
-                if (
-                    bucket.bestEntry is not None
-                    and bucket.bestEntry.testcase is not None
-                ):
-                    metadata["testcase__quality"] = bucket.bestEntry.testcase.quality
-                    metadata["testcase__size"] = bucket.bestEntry.testcase.size
-
-                sigFileName = f"{bucket.pk}.signature"
-                metaFileName = f"{bucket.pk}.metadata"
-
-                zipFile.writestr(sigFileName, bucket.signature)
-                zipFile.writestr(metaFileName, json.dumps(metadata, indent=4))
+                zipFile.writestr(f"{bucket_id}.signature", signature)
+                zipFile.writestr(f"{bucket_id}.metadata", metadata)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from crashmanager.models import Bucket, BucketIndex
+
+
+class Command(BaseCommand):
+    help = "Populate or rebuild the bucket index used for triage"
+
+    def handle(self, *args, **options):
+        self.stdout.write("Processing buckets...")
+        count = 0
+
+        for bucket in Bucket.objects.iterator():
+            BucketIndex.update_for_bucket(bucket)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully indexed {count} buckets"))
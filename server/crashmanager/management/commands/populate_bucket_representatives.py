@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from crashmanager.models import Bucket, BucketRepresentative
+
+
+class Command(BaseCommand):
+    help = "Populate or refresh the sample crash entries kept for each bucket"
+
+    def handle(self, *args, **options):
+        self.stdout.write("Processing buckets...")
+        bucket_ids = list(Bucket.objects.values_list("id", flat=True))
+
+        for offset in range(0, len(bucket_ids), 500):
+            BucketRepresentative.refresh(bucket_ids[offset : offset + 500])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Successfully processed {len(bucket_ids)} buckets")
+        )
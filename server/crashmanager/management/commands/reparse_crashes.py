@@ -0,0 +1,229 @@
+import logging
+import multiprocessing
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max, Min, Sum
+
+from crashmanager.models import BucketStatsDelta, CrashEntry, CrashReparseRange
+
+from .triage_new_crashes import BatchTriage
+
+LOG = logging.getLogger("fm.crashmanager.reparse_crashes")
+
+
+class BatchReparse:
+    """Reparse the crash entries of checkpointed id ranges in-process"""
+
+    def __init__(self):
+        self.signatures = {}
+        self.triage = None
+
+    def get_signature(self, bucket):
+        if bucket.pk not in self.signatures:
+            try:
+                self.signatures[bucket.pk] = bucket.getSignature()
+            except RuntimeError as exc:
+                LOG.warning(
+                    "Keeping entries of bucket %d with invalid signature: %s",
+                    bucket.pk,
+                    exc,
+                )
+                self.signatures[bucket.pk] = None
+        return self.signatures[bucket.pk]
+
+    def still_matches(self, entry, crash_info):
+        signature = self.get_signature(entry.bucket)
+        if signature is None:
+            return True
+        if (
+            signature.matchRequiresTest()
+            and entry.testcase is not None
+            and not entry.testcase.isBinary
+        ):
+            entry.testcase.loadTest()
+            crash_info.testcase = entry.testcase.content
+        return signature.matches(crash_info)
+
+    def reparse_range(self, range_pk, chunk_size):
+        job_range = CrashReparseRange.objects.get(pk=range_pk)
+        entries = CrashEntry.objects.select_related(
+            "product", "platform", "os", "testcase", "bucket"
+        ).order_by("id")
+
+        while not job_range.done:
+            chunk = list(
+                entries.filter(id__gte=job_range.next_id, id__lte=job_range.last_id)[
+                    :chunk_size
+                ]
+            )
+            next_id = chunk[-1].pk + 1 if chunk else job_range.last_id + 1
+            dropped = self.reparse_chunk(job_range, chunk, next_id)
+            if dropped:
+                if self.triage is None:
+                    self.triage = BatchTriage()
+                rebucketed = self.triage.triage_chunk(dropped)
+                CrashReparseRange.objects.filter(pk=range_pk).update(
+                    rebucketed=job_range.rebucketed + rebucketed
+                )
+                job_range.rebucketed += rebucketed
+
+        return job_range.reparsed, job_range.unbucketed, job_range.rebucketed
+
+    def reparse_chunk(self, job_range, chunk, next_id):
+        """
+        Reparse the chunk and commit it together with the checkpoint. Returns the
+        entries that dropped out of their bucket and must be triaged again.
+        """
+        dropped = []
+        for entry in chunk:
+            entry.cachedCrashInfo = None
+            entry.cachedCrashInfoBinary = None
+            entry.frameIds = None
+            crash_info = entry.getCrashInfo()
+            entry.updateParsedFields(crash_info)
+            if entry.bucket is not None and not self.still_matches(entry, crash_info):
+                dropped.append(entry)
+
+        with transaction.atomic():
+            # Entries deleted since we loaded the chunk are skipped, entries
+            # moved or triaged concurrently keep their new state.
+            locked = (
+                CrashEntry.objects.select_for_update()
+                .filter(pk__in=[entry.pk for entry in chunk])
+                .values_list("pk", "bucket_id", "triagedOnce")
+            )
+            current = {pk: (bucket_id, triaged) for pk, bucket_id, triaged in locked}
+            chunk = [entry for entry in chunk if entry.pk in current]
+            dropped = [
+                entry for entry in dropped if current[entry.pk][0] == entry.bucket_id
+            ]
+
+            with BucketStatsDelta.collect() as delta:
+                for entry in dropped:
+                    delta.remove(
+                        entry.bucket_id,
+                        entry.tool_id,
+                        entry.created,
+                        entry.testcase.quality if entry.testcase else None,
+                    )
+                for entry in chunk:
+                    (entry.bucket_id, entry.triagedOnce) = current[entry.pk]
+                for entry in dropped:
+                    entry.bucket = None
+                    entry.triagedOnce = False
+
+                # bulk_update bypasses the post_save receivers, the statistics
+                # are maintained by the delta above
+                CrashEntry.objects.bulk_update(
+                    chunk, [*CrashEntry.PARSED_FIELDS, "bucket", "triagedOnce"]
+                )
+
+            job_range.next_id = next_id
+            job_range.reparsed += len(chunk)
+            job_range.unbucketed += len(dropped)
+            job_range.save(update_fields=["next_id", "reparsed", "unbucketed"])
+
+        return dropped
+
+
+def _reparse_worker(args):
+    (range_pk, chunk_size) = args
+    return BatchReparse().reparse_range(range_pk, chunk_size)
+
+
+class Command(BaseCommand):
+    help = (
+        "Reparses the raw crash information of all crash entries, e.g. after the "
+        "parsers were updated. The depending fields are repopulated and entries "
+        "that no longer match their bucket signature are triaged again. "
+        "Progress is checkpointed, so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes reparsing id ranges in parallel",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of crash entries loaded and updated at once",
+        )
+        parser.add_argument(
+            "--range-size",
+            type=int,
+            default=10000,
+            help="Number of crash entry ids per range handed to a worker",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Discard the checkpoint of an interrupted run and start over",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        chunk_size = options["chunk_size"]
+        range_size = options["range_size"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        if range_size < 1:
+            raise CommandError("--range-size must be at least 1")
+
+        if options["restart"]:
+            CrashReparseRange.objects.all().delete()
+
+        if CrashReparseRange.objects.exists():
+            LOG.info("Resuming interrupted reparse")
+        else:
+            id_range = CrashEntry.objects.aggregate(first=Min("id"), last=Max("id"))
+            if id_range["first"] is not None:
+                CrashReparseRange.objects.bulk_create(
+                    CrashReparseRange(
+                        first_id=first_id,
+                        last_id=min(first_id + range_size - 1, id_range["last"]),
+                        next_id=first_id,
+                    )
+                    for first_id in range(
+                        id_range["first"], id_range["last"] + 1, range_size
+                    )
+                )
+
+        jobs = [
+            (job_range.pk, chunk_size)
+            for job_range in CrashReparseRange.objects.order_by("first_id")
+            if not job_range.done
+        ]
+        if workers == 1 or len(jobs) <= 1:
+            for job in jobs:
+                _reparse_worker(job)
+        else:
+            # Connections must not be shared with the forked workers, each of
+            # them opens its own.
+            connections.close_all()
+            with multiprocessing.get_context("fork").Pool(
+                min(workers, len(jobs))
+            ) as pool:
+                for _ in pool.imap_unordered(_reparse_worker, jobs):
+                    pass
+
+        # Totals include the ranges reparsed before an interruption
+        totals = CrashReparseRange.objects.aggregate(
+            reparsed=Sum("reparsed"),
+            unbucketed=Sum("unbucketed"),
+            rebucketed=Sum("rebucketed"),
+        )
+        CrashReparseRange.objects.all().delete()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully reparsed {totals['reparsed'] or 0} crash entries, "
+                f"{totals['unbucketed'] or 0} removed from their bucket, "
+                f"{totals['rebucketed'] or 0} of them assigned to a bucket again"
+            )
+        )
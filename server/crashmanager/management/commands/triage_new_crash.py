@@ -1,9 +1,12 @@
+import logging
 from collections import OrderedDict
 
 from django.conf import settings
 from django.core.management import BaseCommand
 
-from crashmanager.models import Bucket, CrashEntry
+from crashmanager.models import Bucket, BucketIndex, CrashEntry
+
+LOG = logging.getLogger("fm.crashmanager.triage_new_crash")
 
 # This is a per-worker global cache mapping short descriptions of
 # crashes to a list of bucket candidates to try first.
@@ -28,24 +31,36 @@ class Command(BaseCommand):
         entry = CrashEntry.objects.get(pk=options["id"])
         crashInfo = entry.getCrashInfo(attachTestcase=True)
 
-        cacheHit = False
+        # Most crashes are duplicates of an entry that is already bucketed, in
+        # which case only the signature of that bucket needs to be checked.
+        duplicateBucket = entry.findDuplicateBucket(crashInfo)
+        cacheHit = duplicateBucket is not None
+        if cacheHit:
+            entry.bucket = duplicateBucket
+            LOG.debug("Duplicate hit for crash %d", entry.pk)
 
         triage_cache_hint = TRIAGE_CACHE.get(entry.shortSignature, [])
 
-        if triage_cache_hint:
+        if triage_cache_hint and not cacheHit:
             buckets = Bucket.objects.filter(pk__in=triage_cache_hint).order_by("-id")
             for bucket in buckets:
                 signature = bucket.getSignature()
                 if signature.matches(crashInfo):
                     entry.bucket = bucket
-                    print("Cache hit")
+                    LOG.debug("Cache hit for crash %d", entry.pk)
                     cacheHit = True
                     break
 
         if not cacheHit:
-            buckets = Bucket.objects.exclude(pk__in=triage_cache_hint).order_by("-id")
-
-            for bucket in buckets:
+            # Only buckets that can possibly match according to the index
+            # need to be matched, in the same order as a full scan would.
+            candidate_ids = [
+                pk
+                for pk in BucketIndex.get_candidate_ids(crashInfo)
+                if pk not in triage_cache_hint
+            ]
+
+            for bucket in self.iter_buckets(candidate_ids):
                 signature = bucket.getSignature()
                 if signature.matches(crashInfo):
                     entry.bucket = bucket
@@ -72,3 +87,10 @@ class Command(BaseCommand):
 
         entry.triagedOnce = True
         entry.save()
+
+    @staticmethod
+    def iter_buckets(bucket_ids, chunk_size=500):
+        for offset in range(0, len(bucket_ids), chunk_size):
+            yield from Bucket.objects.filter(
+                pk__in=bucket_ids[offset : offset + chunk_size]
+            ).order_by("-id")
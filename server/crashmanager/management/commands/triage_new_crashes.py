@@ -1,6 +1,230 @@
-from django.core.management import BaseCommand, call_command
+import logging
+import multiprocessing
+from collections import defaultdict
 
-from crashmanager.models import CrashEntry
+from django.core.management import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max, Min
+
+from crashmanager.models import (
+    Bucket,
+    BucketIndex,
+    BucketStatsDelta,
+    CrashEntry,
+    Frame,
+    SignatureCache,
+)
+from FTB.Signatures.OutputMatcher import OutputMatcher
+
+LOG = logging.getLogger("fm.crashmanager.triage_new_crashes")
+
+
+def _pending_entries():
+    return CrashEntry.objects.filter(triagedOnce=False, bucket=None)
+
+
+def split_id_range(first_id, last_id, parts):
+    """Split the inclusive id range into at most `parts` contiguous ranges"""
+    size = max(1, (last_id - first_id + parts) // parts)
+    return [
+        (start, min(start + size - 1, last_id))
+        for start in range(first_id, last_id + 1, size)
+    ]
+
+
+class BatchTriage:
+    """Triage many crash entries in-process using one snapshot of the buckets"""
+
+    # Snapshot shared by all batches triaged in one process (see current())
+    _current = None
+    _current_version = None
+
+    def __init__(self):
+        self.buckets = {}
+        self.signatures = {}
+        for bucket in Bucket.objects.all():
+            try:
+                self.signatures[bucket.pk] = bucket.getSignature()
+            except RuntimeError as exc:
+                LOG.warning(
+                    "Skipping bucket %d with invalid signature: %s", bucket.pk, exc
+                )
+                continue
+            self.buckets[bucket.pk] = bucket
+
+        self.need_test = any(
+            sig.matchRequiresTest() for sig in self.signatures.values()
+        )
+        self.required_outputs = set()
+        for sig in self.signatures.values():
+            self.required_outputs.update(sig.getRequiredOutputSources())
+        self.unindexed_ids = BucketIndex.get_unindexed_ids()
+        self.output_matcher = OutputMatcher(self.signatures.values())
+        self.watchers = {}
+
+    @classmethod
+    def current(cls):
+        """
+        Return the snapshot of this process, rebuilt only when a bucket was
+        created, changed or deleted since it was taken. Loading all buckets
+        costs more than triaging a small batch, e.g. one bulk submission.
+        """
+        # Signature edits publish a new signature version, while creating or
+        # deleting buckets (and any edit) publishes a new index version.
+        version = (SignatureCache.get_version(), BucketIndex.get_version())
+        if cls._current is None or version != cls._current_version:
+            cls._current = cls()
+            cls._current_version = version
+        # Watchers can change without any signature change
+        cls._current.watchers = {}
+        return cls._current
+
+    @staticmethod
+    def find_duplicates(chunk):
+        """
+        Map (field, fingerprint) of the entries in the chunk to the bucket of the
+        most recent bucketed entry with that fingerprint
+        """
+        duplicates = {}
+        for field in ("crashFingerprint", "framesFingerprint"):
+            fingerprints = {getattr(entry, field) for entry in chunk} - {""}
+            if not fingerprints:
+                continue
+            last_ids = (
+                CrashEntry.objects.filter(
+                    **{f"{field}__in": fingerprints}, bucket__isnull=False
+                )
+                .order_by()
+                .values(field)
+                .annotate(last_id=Max("id"))
+                .values_list("last_id", flat=True)
+            )
+            for fingerprint, bucket_id in CrashEntry.objects.filter(
+                pk__in=list(last_ids)
+            ).values_list(field, "bucket_id"):
+                duplicates[(field, fingerprint)] = bucket_id
+        return duplicates
+
+    def find_bucket(self, crash_info, duplicate_ids=()):
+        # The output of the crash is scanned once for all candidate signatures
+        output_hits = self.output_matcher.scan(crash_info)
+        # Buckets of already bucketed duplicates are tried first
+        for bucket_id in duplicate_ids:
+            signature = self.signatures.get(bucket_id)
+            if signature is not None and signature.matches(crash_info, output_hits):
+                return bucket_id
+        for bucket_id in BucketIndex.get_candidate_ids(crash_info, self.unindexed_ids):
+            signature = self.signatures.get(bucket_id)
+            if signature is not None and signature.matches(crash_info, output_hits):
+                return bucket_id
+        return None
+
+    def pending_entries(self):
+        # testcase is needed for the statistics, even if no signature requires it
+        entries = _pending_entries().select_related(
+            "product", "platform", "os", "testcase"
+        )
+        return CrashEntry.deferRawFields(entries, self.required_outputs).order_by("id")
+
+    def triage_range(self, first_id, last_id, chunk_size):
+        entries = self.pending_entries().filter(id__gte=first_id, id__lte=last_id)
+
+        triaged = 0
+        bucketed = 0
+        last_seen = first_id - 1
+        while True:
+            chunk = list(entries.filter(id__gt=last_seen)[:chunk_size])
+            if not chunk:
+                break
+            last_seen = chunk[-1].pk
+            triaged += len(chunk)
+            bucketed += self.triage_chunk(chunk)
+
+        return triaged, bucketed
+
+    def triage_ids(self, ids, chunk_size=500):
+        """Triage the given crash entries, e.g. the ones submitted together"""
+        ids = sorted(ids)
+        triaged = 0
+        bucketed = 0
+        for offset in range(0, len(ids), chunk_size):
+            chunk = list(
+                self.pending_entries().filter(pk__in=ids[offset : offset + chunk_size])
+            )
+            if chunk:
+                triaged += len(chunk)
+                bucketed += self.triage_chunk(chunk)
+
+        return triaged, bucketed
+
+    def triage_chunk(self, chunk):
+        assignments = defaultdict(list)
+        duplicates = self.find_duplicates(chunk)
+        Frame.prefetch(chunk)
+        for entry in chunk:
+            duplicate_ids = [
+                duplicates[(field, getattr(entry, field))]
+                for field in ("crashFingerprint", "framesFingerprint")
+                if (field, getattr(entry, field)) in duplicates
+            ]
+            bucket_id = self.find_bucket(
+                entry.getCrashInfo(
+                    attachTestcase=self.need_test,
+                    requiredOutputSources=self.required_outputs,
+                ),
+                duplicate_ids,
+            )
+            if bucket_id is not None:
+                assignments[bucket_id].append(entry)
+
+        with transaction.atomic():
+            # Entries triaged concurrently (e.g. by the celery task) since we
+            # loaded the chunk are left alone.
+            pending = set(
+                _pending_entries()
+                .select_for_update()
+                .filter(pk__in=[entry.pk for entry in chunk])
+                .values_list("pk", flat=True)
+            )
+            for bucket_id in list(assignments):
+                assignments[bucket_id] = [
+                    entry for entry in assignments[bucket_id] if entry.pk in pending
+                ]
+                if not assignments[bucket_id]:
+                    del assignments[bucket_id]
+
+            with BucketStatsDelta.collect() as delta:
+                for bucket_id, bucket_entries in assignments.items():
+                    CrashEntry.objects.filter(
+                        pk__in=[entry.pk for entry in bucket_entries]
+                    ).update(bucket_id=bucket_id, triagedOnce=True)
+
+                    for entry in bucket_entries:
+                        delta.add(
+                            bucket_id,
+                            entry.tool_id,
+                            entry.created,
+                            entry.testcase.quality if entry.testcase else None,
+                        )
+
+            CrashEntry.objects.filter(pk__in=pending).update(triagedOnce=True)
+
+        for bucket_id, bucket_entries in assignments.items():
+            bucket = self.buckets[bucket_id]
+            if bucket_id not in self.watchers:
+                self.watchers[bucket_id] = list(bucket.watchers)
+            for entry in bucket_entries:
+                entry.bucket = bucket
+                entry.triagedOnce = True
+                if self.watchers[bucket_id]:
+                    entry.notify_bucket_hit(self.watchers[bucket_id])
+
+        return sum(len(bucket_entries) for bucket_entries in assignments.values())
+
+
+def _triage_worker(args):
+    (first_id, last_id, chunk_size) = args
+    return BatchTriage().triage_range(first_id, last_id, chunk_size)
 
 
 class Command(BaseCommand):
@@ -9,10 +233,44 @@ class Command(BaseCommand):
         "before to assign them into the existing buckets."
     )
 
-    def handle(self, *args, **options):
-        entries = CrashEntry.objects.filter(triagedOnce=False, bucket=None).values_list(
-            "id", flat=True
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes to split the pending id range across",
         )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of crash entries loaded and updated at once",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        chunk_size = options["chunk_size"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        id_range = _pending_entries().aggregate(first=Min("id"), last=Max("id"))
+        if id_range["first"] is None:
+            return
+
+        ranges = split_id_range(id_range["first"], id_range["last"], workers)
+        jobs = [(first_id, last_id, chunk_size) for (first_id, last_id) in ranges]
+
+        if len(jobs) == 1:
+            results = [_triage_worker(jobs[0])]
+        else:
+            # Connections must not be shared with the forked workers, each of
+            # them opens its own.
+            connections.close_all()
+            with multiprocessing.get_context("fork").Pool(len(jobs)) as pool:
+                results = pool.map(_triage_worker, jobs)
 
-        for entry in entries:
-            call_command("triage_new_crash", entry)
+        triaged = sum(result[0] for result in results)
+        bucketed = sum(result[1] for result in results)
+        LOG.info("Triaged %d crashes, %d assigned to buckets", triaged, bucketed)
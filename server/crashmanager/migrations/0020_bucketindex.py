@@ -0,0 +1,41 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:09
+
+import django.db.models.deletion
+from django.core.management import call_command
+from django.db import migrations, models
+
+
+def populate_index(apps, schema_editor):
+    call_command("populate_bucket_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0019_alter_user_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BucketIndex",
+            fields=[
+                (
+                    "bucket",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="crashmanager.bucket",
+                    ),
+                ),
+                ("frames", models.TextField(blank=True)),
+                ("platforms", models.TextField(blank=True, null=True)),
+                ("operatingSystems", models.TextField(blank=True, null=True)),
+                ("products", models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(
+            populate_index,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
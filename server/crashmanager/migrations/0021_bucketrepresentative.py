@@ -0,0 +1,44 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:40
+
+import django.db.models.deletion
+from django.core.management import call_command
+from django.db import migrations, models
+
+
+def populate_representatives(apps, schema_editor):
+    call_command("populate_bucket_representatives")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0020_bucketindex"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BucketRepresentative",
+            fields=[
+                (
+                    "entry",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="crashmanager.crashentry",
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crashmanager.bucket",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(
+            populate_representatives,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
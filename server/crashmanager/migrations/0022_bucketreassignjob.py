@@ -0,0 +1,67 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0021_bucketrepresentative"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BucketReassignJob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                ("updated", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished", models.DateTimeField(blank=True, null=True)),
+                (
+                    "bucket",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="crashmanager.bucket",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BucketReassignRange",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("first_id", models.IntegerField()),
+                ("last_id", models.IntegerField()),
+                ("done", models.BooleanField(default=False)),
+                ("scanned", models.IntegerField(default=0)),
+                ("moved_in", models.IntegerField(default=0)),
+                ("moved_out", models.IntegerField(default=0)),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ranges",
+                        to="crashmanager.bucketreassignjob",
+                    ),
+                ),
+            ],
+        ),
+    ]
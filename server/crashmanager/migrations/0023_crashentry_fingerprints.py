@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0022_bucketreassignjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crashentry",
+            name="crashFingerprint",
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name="crashentry",
+            name="framesFingerprint",
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0023_crashentry_fingerprints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crashentry",
+            name="cachedCrashInfoBinary",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
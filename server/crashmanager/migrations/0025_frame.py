@@ -0,0 +1,34 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0024_crashentry_cachedcrashinfobinary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Frame",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hash", models.CharField(max_length=40, unique=True)),
+                ("name", models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="crashentry",
+            name="frameIds",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
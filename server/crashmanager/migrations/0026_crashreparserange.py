@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0025_frame"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CrashReparseRange",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("first_id", models.IntegerField()),
+                ("last_id", models.IntegerField()),
+                ("next_id", models.IntegerField()),
+                ("reparsed", models.IntegerField(default=0)),
+                ("unbucketed", models.IntegerField(default=0)),
+                ("rebucketed", models.IntegerField(default=0)),
+            ],
+        ),
+    ]
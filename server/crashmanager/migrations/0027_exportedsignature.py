@@ -0,0 +1,32 @@
+# Generated by Django 4.2.27 on 2026-10-17 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0026_crashreparserange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportedSignature",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket_id", models.IntegerField(unique=True)),
+                ("signature", models.TextField(blank=True)),
+                ("metadata", models.TextField(blank=True)),
+                ("deleted", models.BooleanField(default=False)),
+                ("version", models.IntegerField(db_index=True)),
+            ],
+        ),
+    ]
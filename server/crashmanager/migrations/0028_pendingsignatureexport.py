@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-17 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crashmanager", "0027_exportedsignature"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingSignatureExport",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket_id", models.IntegerField(unique=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.27 on 2026-10-17 10:05
+
+from django.core.management import call_command
+from django.db import migrations, models
+
+
+def dedupe_testcases(apps, schema_editor):
+    call_command("dedupe_testcases")
+
+
+class Migration(migrations.Migration):
+    # Every testcase is moved in its own transaction, so an interrupted migration
+    # keeps the testcases moved so far and resumes with the others.
+    atomic = False
+
+    dependencies = [
+        ("crashmanager", "0028_pendingsignatureexport"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestCaseBlob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("compression", models.CharField(blank=True, max_length=8)),
+                ("refcount", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        # Irreversible, the testcases refer to shared and compressed files
+        migrations.RunPython(dedupe_testcases),
+    ]
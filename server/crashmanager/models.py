@@ -1,6 +1,18 @@
+import gzip
+import hashlib
 import json
+import os
 import re
+import struct
+import tempfile
+import threading
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager, nullcontext
 from datetime import timedelta
+from datetime import timezone as dt_timezone
+from functools import partial
+from itertools import islice
 from logging import getLogger
 from time import perf_counter
 
@@ -8,9 +20,12 @@ from django.conf import settings
 from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User as DjangoUser
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.base import ContentFile, File
 from django.core.files.storage import FileSystemStorage
-from django.db import models
-from django.db.models import Min
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Min
+from django.db.models.functions import Greatest, TruncHour
 from django.db.models.signals import post_delete, post_save
 from django.dispatch.dispatcher import receiver
 from django.utils import timezone
@@ -20,6 +35,14 @@ from notifications.signals import notify
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
 from FTB.Signatures.CrashSignature import CrashSignature
+from FTB.Signatures.SignatureIndex import SignatureIndex, getRequiredFrameLiterals
+
+try:
+    import zstandard
+
+    HAVE_ZSTD = True
+except ImportError:
+    HAVE_ZSTD = False
 
 if getattr(settings, "USE_CELERY", None):
     from .tasks import triage_new_crash
@@ -27,6 +50,19 @@ if getattr(settings, "USE_CELERY", None):
 LOG = getLogger("crashmanager")
 
 
+def _triage_new_crashes(crash_ids):
+    for crash_id in crash_ids:
+        triage_new_crash.delay(crash_id)
+
+
+def _grouper(iterable, n):
+    """Collect data into fixed-length chunks or blocks"""
+    # grouper('ABCDEFG', 3) --> ABC DEF G
+    while iterable:
+        result, iterable = iterable[:n], iterable[n:]
+        yield result
+
+
 class Tool(models.Model):
     name = models.CharField(max_length=63, unique=True)
 
@@ -64,6 +100,137 @@ class OS(models.Model):
         ]
 
 
+class TestCaseBlob(models.Model):
+    """
+    Content-addressed testcase file in TEST_STORAGE, shared by all testcases with
+    the same content and extension. Blobs are compressed at rest (zstd if the
+    zstandard package is installed, gzip otherwise, or as configured by
+    TEST_STORAGE_COMPRESSION) and counted by reference. The file is removed when
+    the last testcase using it is deleted.
+    """
+
+    # storage name of the file, {PREFIX}/<first 2 hash digits>/<sha1>[.<ext>]
+    name = models.CharField(max_length=255, unique=True)
+    # "zstd", "gzip" or "" if stored uncompressed
+    compression = models.CharField(max_length=8, blank=True)
+    refcount = models.PositiveIntegerField(default=0)
+
+    PREFIX = "testcases"
+    CHUNK_SIZE = 64 * 1024
+
+    @staticmethod
+    def storage():
+        return TestCase._meta.get_field("test").storage
+
+    @staticmethod
+    def default_compression():
+        compression = getattr(settings, "TEST_STORAGE_COMPRESSION", None)
+        if compression is None:
+            compression = "zstd" if HAVE_ZSTD else "gzip"
+        return compression
+
+    @staticmethod
+    def compressor(compression, fileobj):
+        """Wrap the writable fileobj, so everything written to it is compressed"""
+        if compression == "zstd":
+            return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+        if compression == "gzip":
+            return gzip.GzipFile(fileobj=fileobj, mode="wb")
+        return nullcontext(fileobj)
+
+    @staticmethod
+    def decompressor(compression, fileobj):
+        """Wrap the readable fileobj, so everything read from it is decompressed"""
+        if compression == "zstd":
+            if not HAVE_ZSTD:
+                raise RuntimeError("zstd compressed testcase requires zstandard")
+            return zstandard.ZstdDecompressor().stream_reader(fileobj)
+        if compression == "gzip":
+            return gzip.GzipFile(fileobj=fileobj, mode="rb")
+        return nullcontext(fileobj)
+
+    @classmethod
+    def store(cls, content, ext=None):
+        """
+        Store the content (a File) of a testcase and return the storage name of
+        its blob. The content is hashed and compressed in chunks. If a blob with
+        the same content exists already, only its reference count is increased.
+        """
+        return cls.store_many([(content, ext)])[0]
+
+    @classmethod
+    def store_many(cls, files):
+        """
+        Store many testcases given as (content, ext) at once, see store. The
+        blobs of all of them are looked up and updated with a few queries.
+        Returns the storage names in order.
+        """
+        compression = cls.default_compression()
+        storage = cls.storage()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            names = []
+            paths = {}
+            for index, (content, ext) in enumerate(files):
+                path = os.path.join(tmp_dir, str(index))
+                h = hashlib.sha1()
+                with (
+                    open(path, "wb") as tmp,
+                    cls.compressor(compression, tmp) as writer,
+                ):
+                    for chunk in content.chunks(cls.CHUNK_SIZE):
+                        if isinstance(chunk, str):
+                            chunk = chunk.encode("utf-8")
+                        h.update(chunk)
+                        writer.write(chunk)
+
+                digest = h.hexdigest()
+                name = f"{cls.PREFIX}/{digest[:2]}/{digest}"
+                if ext:
+                    name += f".{ext}"
+                names.append(name)
+                paths.setdefault(name, path)
+
+            counts = Counter(names)
+            with transaction.atomic():
+                cls.objects.bulk_create(
+                    [cls(name=name, compression=compression) for name in counts],
+                    ignore_conflicts=True,
+                )
+                blobs = list(
+                    cls.objects.select_for_update()
+                    .filter(name__in=counts)
+                    .order_by("name")
+                )
+                for blob in blobs:
+                    # New blobs are not referenced yet. The file of an existing
+                    # blob can be missing if it was removed while the blob was
+                    # released concurrently.
+                    if blob.refcount == 0 or not storage.exists(blob.name):
+                        storage.delete(blob.name)
+                        with open(paths[blob.name], "rb") as tmp:
+                            storage.save(blob.name, File(tmp))
+                        blob.compression = compression
+                    blob.refcount += counts[blob.name]
+                cls.objects.bulk_update(blobs, ["compression", "refcount"])
+        return names
+
+    @classmethod
+    def release(cls, name):
+        """
+        Drop a reference to the blob of the given storage name and remove its file
+        if it was the last one. Files not in the blob store are removed right away.
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.refcount > 1:
+                blob.refcount = F("refcount") - 1
+                blob.save(update_fields=["refcount"])
+                return
+            if blob is not None:
+                blob.delete()
+            cls.storage().delete(name)
+
+
 class TestCase(models.Model):
     test = models.FileField(
         storage=FileSystemStorage(location=getattr(settings, "TEST_STORAGE", None)),
@@ -91,23 +258,39 @@ class TestCase(models.Model):
         instance._original_quality = instance.quality
         return instance
 
+    def iterTest(self):
+        """Iterate over the (decompressed) test content in chunks"""
+        compression = (
+            TestCaseBlob.objects.filter(name=self.test.name)
+            .values_list("compression", flat=True)
+            .first()
+        )
+        with (
+            self.test.storage.open(self.test.name, "rb") as fileobj,
+            TestCaseBlob.decompressor(compression, fileobj) as reader,
+        ):
+            while chunk := reader.read(TestCaseBlob.CHUNK_SIZE):
+                yield chunk
+
     def loadTest(self):
-        self.test.open(mode="rb")
-        self.content = self.test.read()
-        self.test.close()
+        self.content = b"".join(self.iterTest())
 
     def storeTestAndSave(self):
         self.size = len(self.content)
-        self.test.open(mode="w")
-        self.test.write(self.content)
-        self.test.close()
+        # The blob of the old content may be shared, so the new content is
+        # stored as a new blob.
+        old_name = self.test.name
+        ext = os.path.splitext(old_name)[1].lstrip(".") if old_name else None
+        self.test = TestCaseBlob.store(ContentFile(self.content), ext)
         self.save()
+        if old_name:
+            TestCaseBlob.release(old_name)
 
 
 @receiver(post_delete, sender=TestCase)
 def TestCase_delete(sender, instance, **kwargs):
     if instance.test:
-        instance.test.delete(False)
+        TestCaseBlob.release(instance.test.name)
 
 
 @receiver(post_save, sender=TestCase)
@@ -117,6 +300,8 @@ def TestCase_save(sender, instance, created, **kwargs):
         BucketStatistics.update_quality(
             crash.bucket_id, crash.tool_id, instance._original_quality, instance.quality
         )
+    if crash and crash.bucket_id is not None:
+        PendingSignatureExport.add([crash.bucket_id])
 
 
 class Client(models.Model):
@@ -156,6 +341,129 @@ class Bug(models.Model):
         return DjangoUser.objects.filter(id__in=ids).distinct()
 
 
+class SignatureCache:
+    """
+    Process-level LRU cache of parsed bucket signatures.
+
+    Entries are keyed by bucket id and a hash of the signature text, so an edited
+    signature is never served from the cache. In addition, every signature edit
+    publishes a new signature version for the bucket in the shared cache (Redis).
+    Workers periodically compare those versions with what they have cached and
+    drop stale entries right away instead of waiting for them to be evicted.
+
+    By default, all buckets are kept: triage, reassign previews and the signature
+    search scan every bucket in order, which would evict every entry of an LRU
+    smaller than the number of buckets before it is used again. Deleted buckets
+    also publish a version, so their entries are dropped as well.
+
+    The same CrashSignature instance is handed out to all callers. Signatures
+    are never modified after parsing (fit() and the diff methods build new
+    objects), and callers must not modify them either.
+    """
+
+    VERSION_CACHE_KEY = "crashmanager:signature_version"
+    BUCKET_VERSION_CACHE_KEY = "crashmanager:signature_version:%d"
+
+    def __init__(self, max_entries=None, sync_interval=None):
+        self.max_entries = max_entries
+        self.sync_interval = sync_interval
+        self.entries = OrderedDict()
+        self.version = None
+        self.last_sync = None
+        self.lock = threading.Lock()
+
+    def get(self, bucket):
+        if bucket.pk is None:
+            return CrashSignature(bucket.signature)
+
+        self.sync()
+
+        digest = hashlib.sha1(bucket.signature.encode("utf-8")).hexdigest()
+        with self.lock:
+            cached = self.entries.get(bucket.pk)
+            if cached is not None and cached[0] == digest:
+                self.entries.move_to_end(bucket.pk)
+                return cached[1]
+
+        # Parsing happens outside the lock, invalid signatures raise here
+        # and are never cached.
+        signature = CrashSignature(bucket.signature)
+
+        with self.lock:
+            self.entries[bucket.pk] = (digest, signature)
+            self.entries.move_to_end(bucket.pk)
+            max_entries = self.max_entries
+            if max_entries is None:
+                max_entries = getattr(settings, "SIGNATURE_CACHE_ENTRIES", None)
+            while max_entries is not None and len(self.entries) > max_entries:
+                self.entries.popitem(last=False)
+
+        return signature
+
+    def sync(self, force=False):
+        """Drop all entries of buckets whose signature was edited elsewhere"""
+        now = perf_counter()
+        sync_interval = self.sync_interval
+        if sync_interval is None:
+            sync_interval = getattr(settings, "SIGNATURE_CACHE_SYNC_INTERVAL", 1.0)
+        if (
+            not force
+            and self.last_sync is not None
+            and now - self.last_sync < sync_interval
+        ):
+            return
+        self.last_sync = now
+
+        version = self.get_version()
+        if version == self.version:
+            return
+
+        if self.version is not None:
+            with self.lock:
+                bucket_ids = list(self.entries)
+            bucket_versions = cache.get_many(
+                [self.BUCKET_VERSION_CACHE_KEY % pk for pk in bucket_ids]
+            )
+            with self.lock:
+                for pk in bucket_ids:
+                    bucket_version = bucket_versions.get(
+                        self.BUCKET_VERSION_CACHE_KEY % pk
+                    )
+                    if bucket_version is not None and bucket_version > self.version:
+                        self.entries.pop(pk, None)
+
+        self.version = version
+
+    @classmethod
+    def get_version(cls):
+        """Return the version published by the last signature change"""
+        version = cache.get(cls.VERSION_CACHE_KEY)
+        if version is None:
+            # No edits published yet (or Redis was flushed): start counting
+            cache.add(cls.VERSION_CACHE_KEY, 0, None)
+            version = cache.get(cls.VERSION_CACHE_KEY)
+        return version
+
+    @classmethod
+    def bump(cls, bucket_id):
+        """Publish a new signature version for the given bucket"""
+        try:
+            version = cache.incr(cls.VERSION_CACHE_KEY)
+        except ValueError:
+            cache.add(cls.VERSION_CACHE_KEY, 0, None)
+            version = cache.incr(cls.VERSION_CACHE_KEY)
+        cache.set(cls.BUCKET_VERSION_CACHE_KEY % bucket_id, version, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        self.version = None
+        self.last_sync = None
+
+
+SIGNATURE_CACHE = SignatureCache()
+
+
 class Bucket(models.Model):
     bug = models.ForeignKey(
         Bug, blank=True, null=True, on_delete=models.deletion.CASCADE
@@ -168,6 +476,17 @@ class Bucket(models.Model):
     doNotReduce = models.BooleanField(blank=False, default=False)
     reassign_in_progress = models.BooleanField(default=False)
 
+    def __init__(self, *args, **kwargs):
+        self._original_signature = None
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "signature" in field_names:
+            instance._original_signature = instance.signature
+        return instance
+
     @property
     def watchers(self):
         ids = User.objects.filter(
@@ -176,7 +495,7 @@ class Bucket(models.Model):
         return DjangoUser.objects.filter(id__in=ids).distinct()
 
     def getSignature(self):
-        return CrashSignature(self.signature)
+        return SIGNATURE_CACHE.get(self)
 
     def getOptimizedSignature(self):
         return CrashSignature(self.optimizedSignature)
@@ -224,17 +543,8 @@ class Bucket(models.Model):
 
         signature = self.getSignature()
         need_test = signature.matchRequiresTest()
-        entries = CrashEntry.objects.filter(
-            models.Q(bucket=None) | models.Q(bucket=self)
-        )
-        entries = entries.select_related(
-            "product", "platform", "os"
-        )  # these are used by getCrashInfo
-        if need_test:
-            entries = entries.select_related("testcase")
-
         required_outputs = signature.getRequiredOutputSources()
-        entries = CrashEntry.deferRawFields(entries, required_outputs)
+        entries = self._reassign_entries(signature)
 
         # ensure a consistent sort otherwise not all crashes will be visited
         # - sort descending for preview for aesthetics
@@ -264,24 +574,19 @@ class Bucket(models.Model):
                 next_offset = (offset or 0) + limit
             entry_ids = entry_ids[:limit]
 
-        def grouper(iterable, n):
-            """Collect data into fixed-length chunks or blocks"""
-            # grouper('ABCDEFG', 3) --> ABC DEF G
-            while iterable:
-                result, iterable = iterable[:n], iterable[n:]
-                yield result
-
         # If we are saving, we only care about the id of each entry
         # Otherwise, we save the entire object. Limit to the first 100 entries to avoid
         # OOM.
-        for entry_ids_chunk in grouper(entry_ids, 100):
-            entries_chunk = entries.filter(id__in=entry_ids_chunk)
+        for entry_ids_chunk in _grouper(entry_ids, 100):
+            entries_chunk = list(entries.filter(id__in=entry_ids_chunk))
+            Frame.prefetch(entries_chunk)
 
             for entry in entries_chunk:
-                match = signature.matches(
+                match = entry.matchesSignature(
+                    signature,
                     entry.getCrashInfo(
                         attachTestcase=need_test, requiredOutputSources=required_outputs
-                    )
+                    ),
                 )
                 if match and entry.bucket_id is None:
                     if submit_save:
@@ -297,48 +602,7 @@ class Bucket(models.Model):
                     out_list_count += 1
 
         if submit_save:
-            for upd_list in grouper(in_list, 500):
-                for crash in CrashEntry.objects.filter(pk__in=upd_list).values(
-                    "bucket_id", "created", "tool_id", "testcase__quality"
-                ):
-                    if crash["bucket_id"] != self.id:
-                        if crash["bucket_id"] is not None:
-                            BucketHit.decrement_count(
-                                crash["bucket_id"], crash["tool_id"], crash["created"]
-                            )
-                            BucketStatistics.decrement_count(
-                                crash["bucket_id"],
-                                crash["tool_id"],
-                                crash["testcase__quality"],
-                            )
-                        BucketHit.increment_count(
-                            self.id, crash["tool_id"], crash["created"]
-                        )
-                        BucketStatistics.increment_count(
-                            self.id, crash["tool_id"], crash["testcase__quality"]
-                        )
-                CrashEntry.objects.filter(pk__in=upd_list).update(
-                    bucket=self, triagedOnce=True
-                )
-            for upd_list in grouper(out_list, 500):
-                for crash in CrashEntry.objects.filter(pk__in=upd_list).values(
-                    "bucket_id", "created", "tool_id", "testcase__quality"
-                ):
-                    if crash["bucket_id"] is not None:
-                        BucketHit.decrement_count(
-                            crash["bucket_id"], crash["tool_id"], crash["created"]
-                        )
-                        BucketStatistics.decrement_count(
-                            crash["bucket_id"],
-                            crash["tool_id"],
-                            crash["testcase__quality"],
-                        )
-                CrashEntry.objects.filter(pk__in=upd_list).update(
-                    bucket=None, triagedOnce=False
-                )
-                if getattr(settings, "USE_CELERY", None):
-                    for crash_id in upd_list:
-                        triage_new_crash.delay(crash_id)
+            self._apply_reassign(in_list, out_list)
 
             LOG.debug(
                 "done reassign(bucket_id=%d), took %.2lfs",
@@ -348,6 +612,74 @@ class Bucket(models.Model):
 
         return in_list, out_list, in_list_count, out_list_count, next_offset
 
+    def _reassign_entries(self, signature):
+        """Entries that reassigning with the given signature has to look at"""
+        entries = CrashEntry.objects.filter(
+            models.Q(bucket=None) | models.Q(bucket=self)
+        )
+        entries = entries.select_related(
+            "product", "platform", "os"
+        )  # these are used by getCrashInfo
+        if signature.matchRequiresTest():
+            entries = entries.select_related("testcase")
+
+        return CrashEntry.deferRawFields(entries, signature.getRequiredOutputSources())
+
+    def _apply_reassign(self, in_list, out_list):
+        """Move the given entries into and out of this bucket"""
+        with BucketStatsDelta.collect() as delta:
+            for upd_list in _grouper(in_list, 500):
+                entries = CrashEntry.objects.filter(pk__in=upd_list)
+                delta.move_entries(entries, self.id)
+                entries.update(bucket=self, triagedOnce=True)
+            for upd_list in _grouper(out_list, 500):
+                entries = CrashEntry.objects.filter(pk__in=upd_list)
+                delta.move_entries(entries, None)
+                entries.update(bucket=None, triagedOnce=False)
+                if getattr(settings, "USE_CELERY", None):
+                    # Only triage once the entries are actually out of this bucket
+                    transaction.on_commit(
+                        partial(_triage_new_crashes, upd_list), robust=True
+                    )
+
+    def reassign_range(self, first_id, last_id):
+        """
+        Reassign all entries with ids in the given (inclusive) range, as done by
+        reassign(submit_save=True) for all entries.
+
+        Returns the number of entries scanned, moved in and moved out.
+        """
+        signature = self.getSignature()
+        need_test = signature.matchRequiresTest()
+        required_outputs = signature.getRequiredOutputSources()
+        entries = self._reassign_entries(signature).filter(
+            id__gte=first_id, id__lte=last_id
+        )
+
+        scanned = 0
+        in_list, out_list = [], []
+        entries = entries.order_by("id").iterator(chunk_size=2000)
+        while True:
+            entries_chunk = list(islice(entries, 2000))
+            if not entries_chunk:
+                break
+            Frame.prefetch(entries_chunk)
+            for entry in entries_chunk:
+                scanned += 1
+                match = entry.matchesSignature(
+                    signature,
+                    entry.getCrashInfo(
+                        attachTestcase=need_test, requiredOutputSources=required_outputs
+                    ),
+                )
+                if match and entry.bucket_id is None:
+                    in_list.append(entry.pk)
+                elif not match and entry.bucket_id is not None:
+                    out_list.append(entry.pk)
+
+        self._apply_reassign(in_list, out_list)
+        return scanned, len(in_list), len(out_list)
+
     def optimizeSignature(self, unbucketed_entries):
         buckets = Bucket.objects.all()
 
@@ -361,9 +693,8 @@ class Bucket(models.Model):
         optimized_signature = None
         matching_entries = []
 
-        # Avoid hitting the database multiple times when looking for the first
-        # entry of a bucket. Keeping these in memory is less expensive.
-        first_entry_per_bucket_cache = {}
+        # Sample crashes of all other buckets, loaded at once
+        representatives = BucketRepresentative.get_crash_infos(required_outputs)
 
         for entry in entries:
             entry.crashinfo = entry.getCrashInfo(
@@ -390,37 +721,15 @@ class Bucket(models.Model):
                     if other_bucket.pk == self.pk:
                         continue
 
-                    if (
-                        self.bug
-                        and other_bucket.bug
-                        and self.bug.pk == other_bucket.bug.pk
-                    ):
+                    if self.bug_id is not None and other_bucket.bug_id == self.bug_id:
                         # Allow matches in other buckets if they are both linked to the
                         # same bug
                         continue
 
-                    if other_bucket.pk not in first_entry_per_bucket_cache:
-                        c = CrashEntry.objects.filter(
-                            bucket=other_bucket
-                        ).select_related("product", "platform", "os")
-                        c = CrashEntry.deferRawFields(c, required_outputs)
-                        c = c.first()
-                        first_entry_per_bucket_cache[other_bucket.pk] = c
-                        if c:
-                            # Omit testcase for performance reasons for now
-                            first_entry_per_bucket_cache[other_bucket.pk] = (
-                                c.getCrashInfo(
-                                    attachTestcase=False,
-                                    requiredOutputSources=required_outputs,
-                                )
-                            )
-
-                    first_entry_crash_info = first_entry_per_bucket_cache[
-                        other_bucket.pk
-                    ]
                     # Omit testcase for performance reasons for now
-                    if first_entry_crash_info and optimized_signature.matches(
-                        first_entry_crash_info
+                    if any(
+                        optimized_signature.matches(crash_info)
+                        for crash_info in representatives.get(other_bucket.pk, ())
                     ):
                         matches_in_other_buckets = True
                         break
@@ -450,6 +759,9 @@ class Bucket(models.Model):
 @receiver(post_delete, sender=Bucket)
 def Bucket_delete(sender, instance, **kwargs):
     LOG.info("rm bucket:%d", instance.id)
+    BucketIndex.invalidate()
+    SignatureCache.bump(instance.id)
+    PendingSignatureExport.add([instance.id])
 
 
 @receiver(post_save, sender=Bucket)
@@ -457,6 +769,572 @@ def Bucket_save(sender, instance, created, **kwargs):
     if created:
         LOG.info("created bucket:%d", instance.id)
 
+    if created or instance.signature != instance._original_signature:
+        BucketIndex.update_for_bucket(instance)
+        if not created:
+            SignatureCache.bump(instance.id)
+        instance._original_signature = instance.signature
+
+    PendingSignatureExport.add([instance.id])
+
+
+@receiver(post_save, sender=Bug)
+def Bug_save(sender, instance, created, **kwargs):
+    # the bug id is part of the exported metadata of its buckets
+    if not created:
+        PendingSignatureExport.add(instance.bucket_set.values_list("pk", flat=True))
+
+
+class ExportedSignature(models.Model):
+    """
+    Signature and metadata of a bucket as written by the last export_signatures
+    run, together with the export version that last changed them. Deleted
+    buckets are kept as tombstones, so clients can fetch only the changes since
+    the version they have (see changes_since).
+    """
+
+    # Not a foreign key, the tombstones outlive their bucket
+    bucket_id = models.IntegerField(unique=True)
+    signature = models.TextField(blank=True)
+    metadata = models.TextField(blank=True)
+    deleted = models.BooleanField(default=False)
+    version = models.IntegerField(db_index=True)
+
+    @classmethod
+    def current_version(cls):
+        """Version of the latest export that changed anything, 0 if none did"""
+        return cls.objects.aggregate(version=models.Max("version"))["version"] or 0
+
+    @classmethod
+    def record(cls, changes):
+        """
+        Record the signatures of an export and return the resulting version.
+
+        @type changes: dict
+        @param changes: (signature, metadata) by bucket id of the exported buckets,
+                        None for the ids of deleted buckets. Buckets not included
+                        are left unchanged.
+        """
+        with transaction.atomic():
+            version = cls.current_version()
+            new_version = version + 1
+
+            previous = {}
+            for bucket_ids in _grouper(list(changes), 500):
+                previous.update(
+                    (row.bucket_id, row)
+                    for row in cls.objects.select_for_update().filter(
+                        bucket_id__in=bucket_ids
+                    )
+                )
+
+            changed = []
+            for bucket_id, exported in changes.items():
+                row = previous.get(bucket_id)
+                if exported is None:
+                    if row is None or row.deleted:
+                        continue
+                    (row.signature, row.metadata, row.deleted) = ("", "", True)
+                else:
+                    (signature, metadata) = exported
+                    if row is None:
+                        row = cls(bucket_id=bucket_id)
+                    elif (row.signature, row.metadata, row.deleted) == (
+                        signature,
+                        metadata,
+                        False,
+                    ):
+                        continue
+                    (row.signature, row.metadata, row.deleted) = (
+                        signature,
+                        metadata,
+                        False,
+                    )
+                row.version = new_version
+                changed.append(row)
+
+            if not changed:
+                return version
+            cls.objects.bulk_update(
+                [row for row in changed if row.pk is not None],
+                ["signature", "metadata", "deleted", "version"],
+                batch_size=500,
+            )
+            cls.objects.bulk_create([row for row in changed if row.pk is None])
+            return new_version
+
+    @classmethod
+    def changes_since(cls, version):
+        """
+        Return the current version together with the (signature, metadata) by
+        bucket id of all buckets changed since the given version, and the ids of
+        the buckets deleted since then.
+        """
+        changed = {}
+        deleted = []
+        current = version
+        for row in cls.objects.filter(version__gt=version).order_by("bucket_id"):
+            current = max(current, row.version)
+            if row.deleted:
+                deleted.append(row.bucket_id)
+            else:
+                changed[row.bucket_id] = (row.signature, row.metadata)
+        return current, changed, deleted
+
+
+class PendingSignatureExport(models.Model):
+    """
+    Buckets whose signature or metadata might have changed since the last
+    export_signatures run, so only these have to be exported again.
+    """
+
+    bucket_id = models.IntegerField(unique=True)
+
+    @classmethod
+    def add(cls, bucket_ids):
+        rows = [
+            cls(bucket_id=bucket_id)
+            for bucket_id in set(bucket_ids)
+            if bucket_id is not None
+        ]
+        if rows:
+            cls.objects.bulk_create(rows, ignore_conflicts=True)
+
+    @classmethod
+    def take(cls):
+        """Remove and return the ids of all pending buckets"""
+        bucket_ids = list(cls.objects.values_list("bucket_id", flat=True))
+        for group in _grouper(bucket_ids, 500):
+            cls.objects.filter(bucket_id__in=group).delete()
+        return bucket_ids
+
+
+class BucketIndex(models.Model):
+    """
+    Triage lookup data extracted from the bucket signature: the literal frames
+    that must be present in a crash backtrace and the platform/product/OS facets.
+
+    These rows are loaded into an in-memory SignatureIndex, which maps each
+    literal to the buckets requiring it, so triage only has to fully match the
+    candidate buckets instead of every bucket. Buckets without an index row
+    (e.g. because their signature is invalid) are always matched.
+    """
+
+    bucket = models.OneToOneField(
+        Bucket, on_delete=models.deletion.CASCADE, primary_key=True
+    )
+    frames = models.TextField(blank=True)
+    platforms = models.TextField(blank=True, null=True)
+    operatingSystems = models.TextField(blank=True, null=True)
+    products = models.TextField(blank=True, null=True)
+
+    # The in-memory index is shared by all triage runs in one process. It is
+    # rebuilt whenever the version stored in the (shared) cache changes.
+    VERSION_CACHE_KEY = "crashmanager:bucket_index_version"
+    _cached_index = None
+    _cached_unindexed_ids = None
+    _cached_version = None
+
+    @classmethod
+    def update_for_bucket(cls, bucket):
+        try:
+            signature = bucket.getSignature()
+        except RuntimeError:
+            LOG.warning("bucket:%d has an invalid signature, not indexed", bucket.id)
+            cls.objects.filter(bucket=bucket).delete()
+        else:
+            cls.objects.update_or_create(
+                bucket=bucket,
+                defaults={
+                    "frames": json.dumps(getRequiredFrameLiterals(signature)),
+                    "platforms": cls._dump_facet(signature.platforms),
+                    "operatingSystems": cls._dump_facet(signature.operatingSystems),
+                    "products": cls._dump_facet(signature.products),
+                },
+            )
+        cls.invalidate()
+
+    @staticmethod
+    def _dump_facet(values):
+        if values is None:
+            return None
+        return json.dumps(values)
+
+    @staticmethod
+    def _load_facet(value):
+        if value is None:
+            return None
+        return json.loads(value)
+
+    @classmethod
+    def invalidate(cls):
+        cache.set(cls.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+    @classmethod
+    def get_version(cls):
+        """Return the version published by the last change of any bucket index"""
+        version = cache.get(cls.VERSION_CACHE_KEY)
+        if version is None:
+            # Nothing published a version yet (or the cache was flushed).
+            # Publish one before loading so that any concurrent change
+            # replaces it and is picked up by the next lookup.
+            cache.add(cls.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+            version = cache.get(cls.VERSION_CACHE_KEY)
+        return version
+
+    @classmethod
+    def get_index(cls):
+        """Return the (possibly cached) SignatureIndex over all indexed buckets"""
+        version = cls.get_version()
+
+        if cls._cached_index is None or version != cls._cached_version:
+            index = SignatureIndex()
+            for (
+                bucket_id,
+                frames,
+                platforms,
+                operating_systems,
+                products,
+            ) in cls.objects.values_list(
+                "bucket_id", "frames", "platforms", "operatingSystems", "products"
+            ).iterator():
+                index.add(
+                    bucket_id,
+                    json.loads(frames) if frames else [],
+                    cls._load_facet(platforms),
+                    cls._load_facet(operating_systems),
+                    cls._load_facet(products),
+                )
+            cls._cached_index = index
+            # Buckets only lose or gain their index row along with a new version
+            cls._cached_unindexed_ids = frozenset(
+                Bucket.objects.filter(bucketindex__isnull=True).values_list(
+                    "id", flat=True
+                )
+            )
+            cls._cached_version = version
+
+        return cls._cached_index
+
+    @classmethod
+    def get_unindexed_ids(cls):
+        """Return the (possibly cached) ids of all buckets without an index row"""
+        cls.get_index()
+        return cls._cached_unindexed_ids
+
+    @classmethod
+    def get_candidate_ids(cls, crashInfo, unindexed_ids=None):
+        """
+        Return the ids of all buckets that could match the given crash,
+        sorted by descending id (the order in which triage tries buckets).
+
+        Callers triaging many crashes with one snapshot of the buckets can pass
+        the result of get_unindexed_ids() taken along with it.
+        """
+        candidates = cls.get_index().getCandidates(crashInfo)
+        if unindexed_ids is None:
+            unindexed_ids = cls._cached_unindexed_ids
+        candidates.update(unindexed_ids)
+        return sorted(candidates, reverse=True)
+
+
+class BucketRepresentative(models.Model):
+    """
+    Sample crash entries of a bucket, used to check whether a proposed
+    signature also matches crashes in other buckets.
+
+    Each bucket keeps up to BUCKET_REPRESENTATIVES of its oldest entries here,
+    so the samples of all buckets can be loaded in one query. The rows are
+    refreshed whenever entries join or leave a bucket.
+    """
+
+    entry = models.OneToOneField(
+        "CrashEntry", on_delete=models.deletion.CASCADE, primary_key=True
+    )
+    bucket = models.ForeignKey(Bucket, on_delete=models.deletion.CASCADE)
+
+    # The parsed crash information is shared by all requests in one process. It
+    # is reloaded whenever the version stored in the (shared) cache changes.
+    # Raw outputs are not part of it, they are loaded per call as required.
+    VERSION_CACHE_KEY = "crashmanager:bucket_representatives_version"
+    RAW_OUTPUT_FIELDS = (
+        ("stdout", "rawStdout"),
+        ("stderr", "rawStderr"),
+        ("crashdata", "rawCrashData"),
+    )
+    _cached_entries = None
+    _cached_crash_infos = None
+    _cached_version = None
+
+    @staticmethod
+    def get_count():
+        return getattr(settings, "BUCKET_REPRESENTATIVES", 1)
+
+    @classmethod
+    def refresh(cls, bucket_ids):
+        """Update the representatives of the given buckets after entries moved"""
+        bucket_ids = {bucket_id for bucket_id in bucket_ids if bucket_id is not None}
+        if not bucket_ids:
+            return
+
+        count = cls.get_count()
+        changed = False
+        for bucket_id in bucket_ids:
+            # Drop entries that left the bucket
+            deleted, _ = (
+                cls.objects.filter(bucket_id=bucket_id)
+                .exclude(entry__bucket_id=bucket_id)
+                .delete()
+            )
+            changed = changed or bool(deleted)
+
+            current = cls.objects.filter(bucket_id=bucket_id).count()
+            if current >= count:
+                continue
+
+            new_ids = (
+                CrashEntry.objects.filter(bucket_id=bucket_id)
+                .exclude(bucketrepresentative__isnull=False)
+                .order_by("id")
+                .values_list("id", flat=True)[: count - current]
+            )
+            new_rows = [cls(entry_id=pk, bucket_id=bucket_id) for pk in new_ids]
+            if new_rows:
+                cls.objects.bulk_create(new_rows)
+                changed = True
+
+        if changed:
+            cls.invalidate()
+
+    @classmethod
+    def invalidate(cls):
+        cache.set(cls.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+    @classmethod
+    def get_crash_infos(cls, required_outputs=("stdout", "stderr", "crashdata")):
+        """
+        Return the (possibly cached) crash information of all representatives,
+        as a dict mapping each bucket id to a list of CrashInfo objects.
+
+        Testcases are not attached for performance reasons. Raw outputs are only
+        loaded for required_outputs, without parsing the crash data again.
+        """
+        version = cache.get(cls.VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(cls.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+            version = cache.get(cls.VERSION_CACHE_KEY)
+
+        if cls._cached_crash_infos is None or version != cls._cached_version:
+            entries = CrashEntry.objects.filter(
+                bucketrepresentative__isnull=False
+            ).select_related("product", "platform", "os")
+            entries = CrashEntry.deferRawFields(entries)
+
+            cached_entries = []
+            crash_infos = {}
+            entries = list(entries.order_by("id"))
+            Frame.prefetch(entries)
+            for entry in entries:
+                crash_info = entry.getCrashInfo(
+                    attachTestcase=False, requiredOutputSources=()
+                )
+                cache_object = crash_info.toCacheObject()
+                cached_entries.append(
+                    (entry.bucket_id, entry.pk, crash_info.configuration, cache_object)
+                )
+                crash_infos.setdefault(entry.bucket_id, []).append(
+                    CrashInfo.fromRawCrashData(
+                        None,
+                        None,
+                        crash_info.configuration,
+                        cacheObject=cache_object,
+                    )
+                )
+            cls._cached_entries = cached_entries
+            cls._cached_crash_infos = crash_infos
+            cls._cached_version = version
+
+        fields = [
+            field
+            for source, field in cls.RAW_OUTPUT_FIELDS
+            if source in required_outputs
+        ]
+        if not fields:
+            return cls._cached_crash_infos
+
+        # Only the outputs are loaded again, the parsed fields are reused
+        outputs = {
+            row[0]: dict(zip(fields, row[1:]))
+            for row in CrashEntry.objects.filter(
+                bucketrepresentative__isnull=False
+            ).values_list("id", *fields)
+        }
+        crash_infos = {}
+        for bucket_id, entry_id, configuration, cache_object in cls._cached_entries:
+            raw = outputs.get(entry_id, {})
+            crash_infos.setdefault(bucket_id, []).append(
+                CrashInfo.fromRawCrashData(
+                    raw.get("rawStdout"),
+                    raw.get("rawStderr"),
+                    configuration,
+                    raw.get("rawCrashData"),
+                    cacheObject=cache_object,
+                )
+            )
+        return crash_infos
+
+
+@receiver(post_delete, sender=BucketRepresentative)
+def BucketRepresentative_delete(sender, instance, **kwargs):
+    # Also covers representatives removed along with their crash entry
+    BucketRepresentative.invalidate()
+
+
+class BucketReassignJob(models.Model):
+    """
+    Background reassignment of a bucket, split into ranges of crash entry ids
+    which are reassigned in parallel by celery workers.
+
+    Each range is committed together with its progress, so a job interrupted
+    e.g. by a worker restart is resumed from the ranges that are not done yet.
+    """
+
+    bucket = models.OneToOneField(Bucket, on_delete=models.deletion.CASCADE)
+    created = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    @classmethod
+    def start(cls, bucket):
+        """Create a new reassign job for the bucket and dispatch it on commit"""
+        range_size = getattr(settings, "REASSIGN_JOB_RANGE_SIZE", 10000)
+
+        # Any previous job is replaced, its remaining ranges are skipped.
+        cls.objects.filter(bucket=bucket).delete()
+        job = cls.objects.create(bucket=bucket)
+
+        id_range = CrashEntry.objects.filter(
+            models.Q(bucket=None) | models.Q(bucket=bucket)
+        ).aggregate(first=Min("id"), last=models.Max("id"))
+        if id_range["first"] is not None:
+            BucketReassignRange.objects.bulk_create(
+                BucketReassignRange(
+                    job=job,
+                    first_id=first_id,
+                    last_id=min(first_id + range_size - 1, id_range["last"]),
+                )
+                for first_id in range(
+                    id_range["first"], id_range["last"] + 1, range_size
+                )
+            )
+
+        Bucket.objects.filter(pk=bucket.pk).update(reassign_in_progress=True)
+        transaction.on_commit(job.dispatch)
+        return job
+
+    def dispatch(self):
+        """Queue all ranges that are not done yet, followed by finish()"""
+        import celery
+
+        from .tasks import reassign_finish, reassign_range
+
+        pending = list(
+            self.ranges.filter(done=False)
+            .order_by("first_id")
+            .values_list("pk", flat=True)
+        )
+        if not pending:
+            reassign_finish.delay(self.pk)
+            return
+        celery.chord(
+            [reassign_range.si(range_pk) for range_pk in pending],
+            reassign_finish.si(self.pk),
+        )()
+
+    def finish(self):
+        """Mark the job as finished, unless some range is still not done"""
+        if self.ranges.filter(done=False).exists():
+            return False
+        self.finished = timezone.now()
+        self.save(update_fields=["finished"])
+        Bucket.objects.filter(pk=self.bucket_id).update(reassign_in_progress=False)
+        return True
+
+    def get_progress(self):
+        progress = self.ranges.aggregate(
+            ranges=models.Count("pk"),
+            ranges_done=models.Count("pk", filter=models.Q(done=True)),
+            scanned=models.Sum("scanned"),
+            moved_in=models.Sum("moved_in"),
+            moved_out=models.Sum("moved_out"),
+        )
+        for key in ("scanned", "moved_in", "moved_out"):
+            progress[key] = progress[key] or 0
+        progress["finished"] = self.finished is not None
+        return progress
+
+
+class BucketReassignRange(models.Model):
+    job = models.ForeignKey(
+        BucketReassignJob, on_delete=models.deletion.CASCADE, related_name="ranges"
+    )
+    first_id = models.IntegerField()
+    last_id = models.IntegerField()
+    done = models.BooleanField(default=False)
+    scanned = models.IntegerField(default=0)
+    moved_in = models.IntegerField(default=0)
+    moved_out = models.IntegerField(default=0)
+
+    @classmethod
+    def process(cls, range_pk):
+        """Reassign the entries of one range and commit it as done"""
+        with transaction.atomic():
+            # The row lock keeps a redelivered task from processing the range
+            # again while it is still in progress.
+            job_range = (
+                cls.objects.select_for_update()
+                .select_related("job__bucket")
+                .filter(pk=range_pk, done=False)
+                .first()
+            )
+            if job_range is None:
+                return False
+
+            (
+                job_range.scanned,
+                job_range.moved_in,
+                job_range.moved_out,
+            ) = job_range.job.bucket.reassign_range(
+                job_range.first_id, job_range.last_id
+            )
+            job_range.done = True
+            job_range.save()
+            BucketReassignJob.objects.filter(pk=job_range.job_id).update(
+                updated=timezone.now()
+            )
+        return True
+
+
+class CrashReparseRange(models.Model):
+    """
+    Checkpoint of the reparse_crashes command: a range of crash entry ids
+    reparsed by one worker, with the first id that was not reparsed yet.
+
+    Progress is committed together with every chunk of reparsed entries, so an
+    interrupted run resumes where it stopped.
+    """
+
+    first_id = models.IntegerField()
+    last_id = models.IntegerField()
+    next_id = models.IntegerField()
+    reparsed = models.IntegerField(default=0)
+    unbucketed = models.IntegerField(default=0)
+    rebucketed = models.IntegerField(default=0)
+
+    @property
+    def done(self):
+        return self.next_id > self.last_id
+
 
 class BucketStatistics(models.Model):
     bucket = models.ForeignKey(Bucket, on_delete=models.CASCADE)
@@ -465,9 +1343,9 @@ class BucketStatistics(models.Model):
     quality = models.IntegerField(null=True)
 
     @classmethod
-    def increment_count(cls, bucket_id, tool_id, quality=None):
+    def increment_count(cls, bucket_id, tool_id, quality=None, count=1):
         stats, _ = cls.objects.get_or_create(bucket_id=bucket_id, tool_id=tool_id)
-        stats.size += 1
+        stats.size += count
         if quality is not None and (stats.quality is None or quality < stats.quality):
             stats.quality = quality
         stats.save()
@@ -491,6 +1369,52 @@ class BucketStatistics(models.Model):
                 stats.quality = None
             stats.save()
 
+    @classmethod
+    def add_count(
+        cls,
+        bucket_id,
+        tool_id,
+        count,
+        added_quality=None,
+        removed_quality=None,
+    ):
+        """
+        Apply the statistics delta of many entries that were added to/removed
+        from the bucket. The entries must already be updated in the database.
+        """
+        stats = cls.objects.filter(bucket_id=bucket_id, tool_id=tool_id)
+        if (
+            count
+            and not stats.update(size=Greatest(F("size") + count, 0))
+            and count > 0
+        ):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(bucket_id=bucket_id, tool_id=tool_id)
+            except IntegrityError:
+                pass  # created concurrently
+            stats.update(size=F("size") + count)
+
+        current = stats.first()
+        if current is None:
+            return
+
+        quality = current.quality
+        if current.size == 0:
+            quality = None
+        elif removed_quality is not None and (
+            quality is None or removed_quality <= quality
+        ):
+            # The minimum might have left the bucket, recompute it
+            quality = CrashEntry.objects.filter(
+                bucket_id=bucket_id, tool_id=tool_id, testcase__isnull=False
+            ).aggregate(min_quality=Min("testcase__quality"))["min_quality"]
+        elif added_quality is not None and (quality is None or added_quality < quality):
+            quality = added_quality
+
+        if quality != current.quality:
+            stats.update(quality=quality)
+
     @classmethod
     def update_quality(cls, bucket_id, tool_id, old_quality, new_quality):
         """called when a crash.testcase quality is changed"""
@@ -538,14 +1462,29 @@ class BucketHit(models.Model):
             counter.save()
 
     @classmethod
-    def increment_count(cls, bucket_id, tool_id, begin):
+    def increment_count(cls, bucket_id, tool_id, begin, count=1):
         begin = begin.replace(microsecond=0, second=0, minute=0)
         counter, _ = cls.objects.get_or_create(
             bucket_id=bucket_id, begin=begin, tool_id=tool_id
         )
-        counter.count += 1
+        counter.count += count
         counter.save()
 
+    @classmethod
+    def add_count(cls, bucket_id, tool_id, begin, count):
+        """Apply a (possibly negative) count delta with a single F() update"""
+        counters = cls.objects.filter(bucket_id=bucket_id, tool_id=tool_id, begin=begin)
+        if counters.update(count=Greatest(F("count") + count, 0)) or count <= 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    bucket_id=bucket_id, tool_id=tool_id, begin=begin, count=count
+                )
+        except IntegrityError:
+            # created concurrently
+            counters.update(count=F("count") + count)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -555,6 +1494,124 @@ class BucketHit(models.Model):
         ]
 
 
+class BucketStatsDelta:
+    """
+    Accumulates the BucketHit/BucketStatistics changes caused by moving crash
+    entries between buckets, so they can be applied with one query per
+    (bucket, tool, hour) group instead of several queries per entry.
+
+    Within a collect() block, the CrashEntry save/delete receivers of the
+    current thread record their changes here instead of applying them.
+    """
+
+    _local = threading.local()
+
+    def __init__(self):
+        # (bucket_id, tool_id, begin) -> count delta
+        self.hits = defaultdict(int)
+        # (bucket_id, tool_id) -> size delta
+        self.sizes = defaultdict(int)
+        # (bucket_id, tool_id) -> minimum quality added/removed
+        self.added_quality = {}
+        self.removed_quality = {}
+        # buckets that gained or lost entries
+        self.buckets = set()
+
+    @classmethod
+    def current(cls):
+        """Return the delta collected by the enclosing collect() block, if any"""
+        return getattr(cls._local, "delta", None)
+
+    @classmethod
+    @contextmanager
+    def collect(cls):
+        """Collect all statistics changes in this block and apply them at the end"""
+        outer = cls.current()
+        if outer is not None:
+            yield outer
+            return
+        delta = cls()
+        cls._local.delta = delta
+        try:
+            yield delta
+        finally:
+            cls._local.delta = None
+        delta.apply()
+
+    @staticmethod
+    def _begin(created):
+        return created.replace(microsecond=0, second=0, minute=0)
+
+    @staticmethod
+    def _min(a, b):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return min(a, b)
+
+    def add(self, bucket_id, tool_id, created, quality=None, count=1):
+        self.hits[(bucket_id, tool_id, self._begin(created))] += count
+        self.sizes[(bucket_id, tool_id)] += count
+        self.added_quality[(bucket_id, tool_id)] = self._min(
+            self.added_quality.get((bucket_id, tool_id)), quality
+        )
+        self.buckets.add(bucket_id)
+
+    def remove(self, bucket_id, tool_id, created, quality=None, count=1):
+        self.hits[(bucket_id, tool_id, self._begin(created))] -= count
+        self.sizes[(bucket_id, tool_id)] -= count
+        self.removed_quality[(bucket_id, tool_id)] = self._min(
+            self.removed_quality.get((bucket_id, tool_id)), quality
+        )
+        self.buckets.add(bucket_id)
+
+    def move_entries(self, queryset, new_bucket_id):
+        """
+        Record moving all entries of the queryset into the given bucket (or out
+        of any bucket if new_bucket_id is None), using a single GROUP BY query.
+        This must be called before the entries are actually updated.
+        """
+        groups = (
+            queryset.exclude(bucket_id=new_bucket_id)
+            .order_by()
+            .values("bucket_id", "tool_id", "testcase__quality")
+            .annotate(
+                begin=TruncHour("created", tzinfo=dt_timezone.utc), count=Count("id")
+            )
+            .values_list("bucket_id", "tool_id", "testcase__quality", "begin", "count")
+        )
+        for old_bucket_id, tool_id, quality, begin, count in groups:
+            if old_bucket_id is not None:
+                self.remove(old_bucket_id, tool_id, begin, quality, count)
+            if new_bucket_id is not None:
+                self.add(new_bucket_id, tool_id, begin, quality, count)
+
+    def apply(self):
+        """Write all accumulated changes to the database"""
+        for (bucket_id, tool_id, begin), count in self.hits.items():
+            if count:
+                BucketHit.add_count(bucket_id, tool_id, begin, count)
+
+        for (bucket_id, tool_id), size in self.sizes.items():
+            BucketStatistics.add_count(
+                bucket_id,
+                tool_id,
+                size,
+                self.added_quality.get((bucket_id, tool_id)),
+                self.removed_quality.get((bucket_id, tool_id)),
+            )
+
+        BucketRepresentative.refresh(self.buckets)
+        PendingSignatureExport.add(self.buckets)
+
+        self.hits.clear()
+        self.sizes.clear()
+        self.added_quality.clear()
+        self.removed_quality.clear()
+        self.buckets.clear()
+
+
 class CrashHit(models.Model):
     lastUpdate = models.DateTimeField(default=timezone.now)
     tool = models.ForeignKey(Tool, on_delete=models.deletion.CASCADE)
@@ -582,6 +1639,198 @@ class CrashHit(models.Model):
         ]
 
 
+class Frame(models.Model):
+    """
+    Function names of backtrace frames, shared by all crash entries. Crash entries
+    store their backtrace as a list of frame ids, see CrashEntry.frameIds.
+    """
+
+    hash = models.CharField(max_length=40, unique=True)
+    name = models.TextField()
+
+    # Per-process caches of frame names by id and of frame ids by name. Frames
+    # are never changed or deleted, so these do not need to be invalidated. Only
+    # committed frames are cached, see intern.
+    _names = {}
+    _ids = {}
+    _lock = threading.Lock()
+    # Ids of the frames interned by the open transaction of each thread
+    _pending = threading.local()
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._lock:
+            cls._names = {}
+            cls._ids = {}
+
+    @staticmethod
+    def get_hash(name):
+        return hashlib.sha1(name.encode("utf-8", "surrogatepass")).hexdigest()
+
+    @staticmethod
+    def pack(frame_ids):
+        return struct.pack(f"<{len(frame_ids)}I", *frame_ids)
+
+    @staticmethod
+    def unpack(data):
+        return struct.unpack(f"<{len(data) // 4}I", data)
+
+    @classmethod
+    def _remember(cls, frames):
+        """Add (id, name) pairs to the caches, returns the cached names by id"""
+        result = {}
+        with cls._lock:
+            if len(cls._names) + len(frames) > getattr(
+                settings, "FRAME_CACHE_ENTRIES", 500000
+            ):
+                cls._names = {}
+                cls._ids = {}
+            for frame_id, name in frames:
+                # All entries share the same string object
+                name = cls._ids.setdefault(name, (frame_id, name))[1]
+                cls._names[frame_id] = name
+                result[frame_id] = name
+        return result
+
+    @classmethod
+    def _uncommitted(cls):
+        """Return the ids of the frames interned by the open transaction"""
+        if not transaction.get_connection().in_atomic_block:
+            # committed or rolled back since
+            cls._pending.ids = set()
+        elif not hasattr(cls._pending, "ids"):
+            cls._pending.ids = set()
+        return cls._pending.ids
+
+    @classmethod
+    def _commit(cls, frames):
+        cls._uncommitted().difference_update(frame_id for frame_id, _ in frames)
+        cls._remember(frames)
+
+    @classmethod
+    def intern(cls, names):
+        """Return the ids of the given frame names, creating missing frames"""
+        ids = {}
+        missing = {}
+        for name in names:
+            cached = cls._ids.get(name)
+            if cached is not None:
+                ids[name] = cached[0]
+            else:
+                missing[cls.get_hash(name)] = name
+        if missing:
+            cls.objects.bulk_create(
+                [
+                    cls(hash=frame_hash, name=name)
+                    for frame_hash, name in missing.items()
+                ],
+                ignore_conflicts=True,
+            )
+            pending = cls._uncommitted()
+            for chunk in _grouper(list(missing), 1000):
+                frames = list(
+                    cls.objects.filter(hash__in=chunk).values_list("id", "name")
+                )
+                if transaction.get_connection().in_atomic_block:
+                    # the frames created here vanish if the transaction is
+                    # rolled back, so they are only cached once it is committed
+                    pending.update(frame_id for frame_id, _ in frames)
+                    transaction.on_commit(partial(cls._commit, frames))
+                    ids.update((name, frame_id) for frame_id, name in frames)
+                else:
+                    ids.update(
+                        (name, frame_id)
+                        for frame_id, name in cls._remember(frames).items()
+                    )
+        return [ids[name] for name in names]
+
+    @classmethod
+    def get_names(cls, frame_ids):
+        """Return the frame names of the given ids"""
+        names = {}
+        missing = []
+        for frame_id in frame_ids:
+            name = cls._names.get(frame_id)
+            if name is not None:
+                names[frame_id] = name
+            else:
+                missing.append(frame_id)
+        pending = cls._uncommitted() if missing else ()
+        for chunk in _grouper(list(set(missing)), 1000):
+            frames = list(cls.objects.filter(id__in=chunk).values_list("id", "name"))
+            names.update(
+                cls._remember([frame for frame in frames if frame[0] not in pending])
+            )
+            names.update(frame for frame in frames if frame[0] in pending)
+        return [names[frame_id] for frame_id in frame_ids]
+
+    @classmethod
+    def prefetch(cls, entries):
+        """Load the frames of many crash entries into the cache at once"""
+        frame_ids = set()
+        for entry in entries:
+            if entry.frameIds:
+                frame_ids.update(cls.unpack(entry.frameIds))
+        cls.get_names(frame_ids)
+
+
+class FrameMatchCache:
+    """
+    Process-level results of matching PCRE function names of stackFrames
+    symptoms against frames, keyed by the pattern and the Frame id.
+
+    Reassigning matches one signature against many crash entries, which mostly
+    share the same frames. Results are kept in two generations: once the current
+    one is full, it replaces the previous one. Results used again in between are
+    moved to the current generation, so frequently used results are kept.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self.current = {}
+        self.previous = {}
+
+    def get_matcher(self, frame_ids, backtrace):
+        """
+        Return a matchFrame function for CrashSignature.matches, for the backtrace
+        made up of the given frames, or None if the results can't be cached.
+        """
+        # Ids of frames that are not committed yet could be used again for other
+        # frames after a rollback.
+        if len(frame_ids) != len(backtrace) or not Frame._uncommitted().isdisjoint(
+            frame_ids
+        ):
+            return None
+
+        def match_frame(function_name, frame_idx):
+            key = (function_name.value, frame_ids[frame_idx])
+            match = self.current.get(key)
+            if match is None:
+                match = self.previous.get(key)
+                if match is None:
+                    match = function_name.matches(backtrace[frame_idx])
+                self.add(key, match)
+            return match
+
+        return match_frame
+
+    def add(self, key, match):
+        max_entries = self.max_entries
+        if max_entries is None:
+            max_entries = getattr(settings, "FRAME_MATCH_CACHE_ENTRIES", 262144)
+        if len(self.current) >= max(1, max_entries // 2):
+            self.previous = self.current
+            self.current = {}
+        self.current[key] = match
+
+    def clear(self):
+        self.current = {}
+        self.previous = {}
+
+
+FRAME_MATCH_CACHE = FrameMatchCache()
+
+
 class CrashEntry(models.Model):
     created = models.DateTimeField(default=timezone.now)
     tool = models.ForeignKey(Tool, on_delete=models.deletion.CASCADE)
@@ -605,7 +1854,18 @@ class CrashEntry(models.Model):
     crashAddressNumeric = models.BigIntegerField(blank=True, null=True)
     shortSignature = models.CharField(max_length=255, blank=True)
     cachedCrashInfo = models.TextField(blank=True, null=True)
+    # Compact encoding of the cached crash info, see CrashInfo.encodeCacheObject.
+    # Older entries keep their JSON encoded cachedCrashInfo until they are converted
+    # using the convert_cached_crash_info command.
+    cachedCrashInfoBinary = models.BinaryField(blank=True, null=True)
+    # Ids of the backtrace frames (see Frame) as unsigned 32-bit integers. If set,
+    # the backtrace is not part of the cached crash info.
+    frameIds = models.BinaryField(blank=True, null=True)
     triagedOnce = models.BooleanField(blank=False, default=False)
+    # Hashes of the top frames and of the full crash, used to find bucketed
+    # duplicates of new entries, see getFingerprints
+    framesFingerprint = models.CharField(max_length=40, blank=True, db_index=True)
+    crashFingerprint = models.CharField(max_length=40, blank=True, db_index=True)
 
     def __init__(self, *args, **kwargs):
         # These variables can hold temporarily deserialized data
@@ -627,6 +1887,20 @@ class CrashEntry(models.Model):
         return instance
 
     def save(self, *args, **kwargs):
+        modified = self.prepareSave()
+
+        # required in Django 4.2+
+        if "update_fields" in kwargs and kwargs["update_fields"] is not None:
+            kwargs["update_fields"] = modified.union(kwargs["update_fields"])
+
+        super().save(*args, **kwargs)
+
+    def prepareSave(self):
+        """
+        Bring the derived and serialized fields up to date before the entry is
+        written. This is done by save, entries created in bulk must call it
+        themselves. Returns the names of the modified fields.
+        """
         modified = set()
 
         if self.pk is None and not getattr(settings, "DB_ISUTF8MB4", False):
@@ -653,11 +1927,10 @@ class CrashEntry(models.Model):
                 self.rawCrashData = new_rawCrashData
                 modified.add("rawCrashData")
 
-        if not self.cachedCrashInfo:
-            # Serialize the important fields of the CrashInfo class into a JSON blob
-            crashInfo = self.getCrashInfo()
-            self.cachedCrashInfo = json.dumps(crashInfo.toCacheObject())
-            modified.add("cachedCrashInfo")
+        if not self.cachedCrashInfo and not self.cachedCrashInfoBinary:
+            # Serialize the important fields of the CrashInfo class into a blob
+            self.setCacheObject(self.getCrashInfo().toCacheObject())
+            modified.update(("cachedCrashInfoBinary", "frameIds"))
 
         # Reserialize data, then call regular save method
         if self.argsList:
@@ -684,13 +1957,7 @@ class CrashEntry(models.Model):
         # sync so we can search easily by crash address including ranges
         if self.crashAddress:
             orig_crashAddressNumeric = self.crashAddressNumeric
-            self.crashAddressNumeric = int(self.crashAddress, 16)
-
-            # We need to possibly convert the numeric crash address from unsigned
-            # to signed in order to store it in the database.
-            if self.crashAddressNumeric > (2**63 - 1):
-                self.crashAddressNumeric -= 2**64
-
+            self.crashAddressNumeric = self.getNumericCrashAddress(self.crashAddress)
             if orig_crashAddressNumeric != self.crashAddressNumeric:
                 modified.add("crashAddressNumeric")
 
@@ -698,11 +1965,7 @@ class CrashEntry(models.Model):
             self.shortSignature = self.shortSignature[:255]
             modified.add("shortSignature")
 
-        # required in Django 4.2+
-        if "update_fields" in kwargs and kwargs["update_fields"] is not None:
-            kwargs["update_fields"] = modified.union(kwargs["update_fields"])
-
-        super().save(*args, **kwargs)
+        return modified
 
     def deserializeFields(self):
         if self.args:
@@ -716,6 +1979,18 @@ class CrashEntry(models.Model):
             metadataDict = json.loads(self.metadata)
             self.metadataList = [f"{s}={metadataDict[s]}" for s in metadataDict]
 
+    def matchesSignature(self, signature, crashInfo):
+        """
+        Match the signature against the crash information of this entry. Results
+        of PCRE function names are reused for the same frames, see FrameMatchCache.
+        """
+        matchFrame = None
+        if self.frameIds is not None:
+            matchFrame = FRAME_MATCH_CACHE.get_matcher(
+                Frame.unpack(self.frameIds), crashInfo.backtrace
+            )
+        return signature.matches(crashInfo, matchFrame=matchFrame)
+
     def getCrashInfo(
         self,
         attachTestcase=False,
@@ -728,7 +2003,14 @@ class CrashEntry(models.Model):
         )
 
         cachedCrashInfo = None
-        if self.cachedCrashInfo:
+        if self.cachedCrashInfoBinary:
+            cachedCrashInfo = self.cachedCrashInfoBinary
+            if self.frameIds is not None:
+                cachedCrashInfo = CrashInfo.decodeCacheObject(cachedCrashInfo)
+                cachedCrashInfo["backtrace"] = Frame.get_names(
+                    Frame.unpack(self.frameIds)
+                )
+        elif self.cachedCrashInfo:
             cachedCrashInfo = json.loads(self.cachedCrashInfo)
 
         # We can skip loading raw output fields from the database iff
@@ -748,6 +2030,7 @@ class CrashEntry(models.Model):
             configuration,
             rawCrashData,
             cacheObject=cachedCrashInfo,
+            maxDetectionLines=getattr(settings, "CRASH_DETECTION_MAX_LINES", None),
         )
 
         if attachTestcase and self.testcase is not None and not self.testcase.isBinary:
@@ -756,6 +2039,16 @@ class CrashEntry(models.Model):
 
         return crashInfo
 
+    def setCacheObject(self, cacheObject):
+        """
+        Store the given cache object (see CrashInfo.toCacheObject), with the
+        backtrace frames interned into the Frame table.
+        """
+        self.frameIds = Frame.pack(Frame.intern(cacheObject["backtrace"]))
+        self.cachedCrashInfoBinary = CrashInfo.encodeCacheObject(
+            dict(cacheObject, backtrace=[])
+        )
+
     def reparseCrashInfo(self):
         # Purges cached crash information and then forces a reparsing
         # of the raw crash information. Based on the new crash information,
@@ -764,10 +2057,9 @@ class CrashEntry(models.Model):
         # This method should only be called if either the raw crash information
         # has changed or the implementation parsing it was updated.
         self.cachedCrashInfo = None
-        crashInfo = self.getCrashInfo()
-        if crashInfo.crashAddress is not None:
-            self.crashAddress = f"0x{crashInfo.crashAddress:x}"
-        self.shortSignature = crashInfo.createShortSignature()
+        self.cachedCrashInfoBinary = None
+        self.frameIds = None
+        self.updateParsedFields(self.getCrashInfo())
 
         # If the entry has a bucket, check if it still fits into
         # this bucket, otherwise remove it.
@@ -784,6 +2076,103 @@ class CrashEntry(models.Model):
 
         return self.save()
 
+    # Fields set by updateParsedFields
+    PARSED_FIELDS = (
+        "cachedCrashInfo",
+        "cachedCrashInfoBinary",
+        "frameIds",
+        "crashAddress",
+        "crashAddressNumeric",
+        "shortSignature",
+        "framesFingerprint",
+        "crashFingerprint",
+    )
+
+    def updateParsedFields(self, crashInfo):
+        """
+        Cache the given (freshly parsed) crash information and repopulate all
+        fields depending on it, without saving the entry.
+        """
+        self.cachedCrashInfo = None
+        self.setCacheObject(crashInfo.toCacheObject())
+        if crashInfo.crashAddress is not None:
+            self.crashAddress = f"0x{crashInfo.crashAddress:x}"
+        if self.crashAddress:
+            self.crashAddressNumeric = self.getNumericCrashAddress(self.crashAddress)
+        self.shortSignature = crashInfo.createShortSignature()[:255]
+        (self.framesFingerprint, self.crashFingerprint) = self.getFingerprints(
+            crashInfo
+        )
+
+    @staticmethod
+    def getNumericCrashAddress(crashAddress):
+        # We need to possibly convert the numeric crash address from unsigned
+        # to signed in order to store it in the database.
+        crashAddressNumeric = int(crashAddress, 16)
+        if crashAddressNumeric > (2**63 - 1):
+            crashAddressNumeric -= 2**64
+        return crashAddressNumeric
+
+    @staticmethod
+    def getFingerprints(crashInfo):
+        """
+        Return the (framesFingerprint, crashFingerprint) of the given crash:
+        a hash of the normalized top frames, and a hash of the full backtrace
+        together with the crash type (described by the short signature).
+        Crashes without a backtrace have no frames fingerprint.
+        """
+        frames = [" ".join(frame.split()) for frame in crashInfo.backtrace]
+        top_frames = frames[: getattr(settings, "CRASH_FINGERPRINT_FRAMES", 8)]
+
+        framesFingerprint = ""
+        if top_frames:
+            framesFingerprint = hashlib.sha1(
+                "\n".join(top_frames).encode("utf-8")
+            ).hexdigest()
+        crashFingerprint = hashlib.sha1(
+            "\n".join([crashInfo.createShortSignature(), *frames]).encode("utf-8")
+        ).hexdigest()
+        return (framesFingerprint, crashFingerprint)
+
+    def findDuplicateBucket(self, crashInfo):
+        """
+        Return the bucket of the most recent bucketed entry with the same
+        fingerprint as this one, if its signature also matches this crash.
+        Exact duplicates are checked first, then entries with the same top frames.
+        """
+        for field in ("crashFingerprint", "framesFingerprint"):
+            fingerprint = getattr(self, field)
+            if not fingerprint:
+                continue
+            duplicate = (
+                CrashEntry.objects.filter(**{field: fingerprint}, bucket__isnull=False)
+                .exclude(pk=self.pk)
+                .select_related("bucket")
+                .only("bucket")
+                .order_by("-id")
+                .first()
+            )
+            if duplicate is not None and duplicate.bucket.getSignature().matches(
+                crashInfo
+            ):
+                return duplicate.bucket
+        return None
+
+    def notify_bucket_hit(self, watchers=None):
+        if watchers is None:
+            watchers = self.bucket.watchers
+        notify.send(
+            self.bucket,
+            recipient=watchers,
+            actor=self.bucket,
+            verb="bucket_hit",
+            target=self,
+            level="info",
+            description=(
+                f"The bucket {self.bucket_id} received a new crash entry {self.pk}"
+            ),
+        )
+
     @staticmethod
     def deferRawFields(queryset, requiredOutputSources=()):
         # This method calls defer() on the given query set for every raw field
@@ -805,7 +2194,15 @@ def CrashEntry_delete(sender, instance, **kwargs):
     LOG.info("rm crash:%d from bucket:%r", instance.id, instance.bucket_id)
     if instance.testcase:
         instance.testcase.delete(False)
-    if instance.bucket_id is not None:
+    delta = BucketStatsDelta.current()
+    if instance.bucket_id is not None and delta is not None:
+        delta.remove(
+            instance.bucket_id,
+            instance.tool_id,
+            instance.created,
+            instance.testcase.quality if instance.testcase else None,
+        )
+    elif instance.bucket_id is not None:
         BucketHit.decrement_count(
             instance.bucket_id, instance.tool_id, instance.created
         )
@@ -814,6 +2211,8 @@ def CrashEntry_delete(sender, instance, **kwargs):
             instance.tool_id,
             instance.testcase.quality if instance.testcase else None,
         )
+        BucketRepresentative.refresh([instance.bucket_id])
+        PendingSignatureExport.add([instance.bucket_id])
 
 
 @receiver(post_save, sender=CrashEntry)
@@ -833,42 +2232,49 @@ def CrashEntry_save(sender, instance, created, **kwargs):
             instance.bucket_id,
         )
 
-        if instance._original_bucket is not None:
-            # remove BucketHit for old bucket/tool
-            BucketHit.decrement_count(
-                instance._original_bucket, instance.tool_id, instance.created
-            )
-            # remove BucketStatistics for old bucket
-            BucketStatistics.decrement_count(
-                instance._original_bucket,
-                instance.tool_id,
-                instance.testcase.quality if instance.testcase else None,
-            )
+        quality = instance.testcase.quality if instance.testcase else None
+        delta = BucketStatsDelta.current()
+        if delta is not None:
+            # applied in bulk when the enclosing collect() block ends
+            if instance._original_bucket is not None:
+                delta.remove(
+                    instance._original_bucket,
+                    instance.tool_id,
+                    instance.created,
+                    quality,
+                )
+            if instance.bucket_id is not None:
+                delta.add(
+                    instance.bucket_id, instance.tool_id, instance.created, quality
+                )
+        else:
+            if instance._original_bucket is not None:
+                # remove BucketHit for old bucket/tool
+                BucketHit.decrement_count(
+                    instance._original_bucket, instance.tool_id, instance.created
+                )
+                # remove BucketStatistics for old bucket
+                BucketStatistics.decrement_count(
+                    instance._original_bucket, instance.tool_id, quality
+                )
 
-        if instance.bucket is not None:
-            # add BucketHit for new bucket
-            BucketHit.increment_count(
-                instance.bucket_id, instance.tool_id, instance.created
-            )
-            # add BucketStatistics for new bucket
-            quality = instance.testcase.quality if instance.testcase else None
-            BucketStatistics.increment_count(
-                instance.bucket_id, instance.tool_id, quality
+            if instance.bucket is not None:
+                # add BucketHit for new bucket
+                BucketHit.increment_count(
+                    instance.bucket_id, instance.tool_id, instance.created
+                )
+                # add BucketStatistics for new bucket
+                BucketStatistics.increment_count(
+                    instance.bucket_id, instance.tool_id, quality
+                )
+
+            BucketRepresentative.refresh(
+                [instance._original_bucket, instance.bucket_id]
             )
+            PendingSignatureExport.add([instance._original_bucket, instance.bucket_id])
 
         if instance.bucket is not None:
-            notify.send(
-                instance.bucket,
-                recipient=instance.bucket.watchers,
-                actor=instance.bucket,
-                verb="bucket_hit",
-                target=instance,
-                level="info",
-                description=(
-                    f"The bucket {instance.bucket_id} received a new crash entry "
-                    f"{instance.pk}"
-                ),
-            )
+            instance.notify_bucket_hit()
 
 
 class BugzillaTemplateMode(Enum):
@@ -1,9 +1,13 @@
 import base64
-import hashlib
+import codecs
+from functools import partial
+from logging import getLogger
 
 from django.conf import settings
 from django.core.exceptions import MultipleObjectsReturned  # noqa
 from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Max
 from django.forms import widgets  # noqa
 from django.urls import reverse
 from notifications.models import Notification
@@ -14,25 +18,155 @@ from covmanager.models import Collection
 from crashmanager.models import (
     OS,
     Bucket,
+    BucketReassignJob,
     Bug,
     BugProvider,
     BugzillaTemplate,
     Client,
     CrashEntry,
+    Frame,
     Platform,
     Product,
     TestCase,
+    TestCaseBlob,
     Tool,
 )
 from FTB.ProgramConfiguration import ProgramConfiguration
 from FTB.Signatures.CrashInfo import CrashInfo
 from taskmanager.models import Pool, Task
 
+LOG = getLogger("crashmanager")
+
 
 class InvalidArgumentException(APIException):
     status_code = 400
 
 
+def bulk_create_with_ids(model, objs, match_fields):
+    """
+    bulk_create() the given objects and set their primary keys, also on databases
+    that can't return the inserted rows (e.g. MySQL). There, the rows inserted
+    after the highest id seen before are matched to the objects in order by
+    comparing match_fields, which must tell them apart from concurrent inserts.
+    """
+    if not objs or connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs)
+
+    last_id = model.objects.aggregate(last_id=Max("pk"))["last_id"]
+    model.objects.bulk_create(objs)
+
+    # Ids are assigned in insertion order, but rows committed concurrently by
+    # other transactions can be interleaved.
+    pending = iter(objs)
+    obj = next(pending)
+    rows = model.objects.order_by("pk").values_list("pk", *match_fields)
+    if last_id is not None:
+        rows = rows.filter(pk__gt=last_id)
+    for pk, *values in rows.iterator():
+        if values == [getattr(obj, field) for field in match_fields]:
+            obj.pk = pk
+            obj = next(pending, None)
+            if obj is None:
+                return objs
+
+    raise RuntimeError(f"Could not find the inserted {model.__name__} rows")
+
+
+class CrashEntryListSerializer(serializers.ListSerializer):
+    """
+    Creates many CrashEntry instances at once. The foreign objects are resolved
+    once per batch and the testcases and entries are written in bulk. Testcases
+    can be given as uploaded files in the `testcase_files` context, keyed by
+    `testcase_<index>`.
+    """
+
+    # foreign objects flattened into CrashEntrySerializer fields
+    FOREIGN_MODELS = (
+        ("product", Product),
+        ("platform", Platform),
+        ("os", OS),
+        ("client", Client),
+        ("tool", Tool),
+    )
+
+    def create(self, validated_data):
+        for attrs in validated_data:
+            CrashEntrySerializer.check_raw_fields(attrs)
+
+        for field, model in self.FOREIGN_MODELS:
+            resolved = {}
+            for attrs in validated_data:
+                key = tuple(sorted(attrs[field].items()))
+                if key not in resolved:
+                    resolved[key] = model.objects.get_or_create(**attrs[field])[0]
+                attrs[field] = resolved[key]
+
+        testcase_files = self.context.get("testcase_files", {})
+        crash_infos = []
+        testcases = []
+        for index, attrs in enumerate(validated_data):
+            crash_infos.append(CrashEntrySerializer.parse_crash(attrs))
+            testcase = CrashEntrySerializer.build_testcase(
+                attrs, testcase_files.get(f"testcase_{index}")
+            )
+            attrs["testcase"] = None
+            if testcase is not None:
+                attrs["testcase"] = testcase[0]
+                testcases.append(testcase)
+
+        # Intern the frames of the whole batch at once, so setting the cache
+        # objects below doesn't query for each entry.
+        cache_objects = [crash_info.toCacheObject() for crash_info in crash_infos]
+        Frame.intern(
+            list({frame for obj in cache_objects for frame in obj["backtrace"]})
+        )
+        entries = []
+        for attrs, cache_object in zip(validated_data, cache_objects):
+            entry = CrashEntry(**attrs)
+            entry.setCacheObject(cache_object)
+            entry.prepareSave()
+            entries.append(entry)
+
+        try:
+            names = TestCaseBlob.store_many(
+                [(content, ext) for _, ext, content in testcases]
+            )
+            for (dbobj, _, _), name in zip(testcases, names):
+                dbobj.test = name
+
+            with transaction.atomic():
+                # bulk_create bypasses the post_save receivers, new entries
+                # are not bucketed yet and are triaged together below.
+                bulk_create_with_ids(
+                    TestCase,
+                    [dbobj for dbobj, _, _ in testcases],
+                    ("test", "size", "quality", "isBinary"),
+                )
+                bulk_create_with_ids(
+                    CrashEntry,
+                    entries,
+                    ("created", "client_id", "tool_id", "testcase_id"),
+                )
+                if getattr(settings, "USE_CELERY", None):
+                    from .tasks import triage_crashes
+
+                    transaction.on_commit(
+                        partial(
+                            triage_crashes.delay,
+                            [entry.pk for entry in entries],
+                        )
+                    )
+        except:
+            # testcases not stored yet have no name
+            for dbobj, _, _ in testcases:
+                if dbobj.test:
+                    TestCaseBlob.release(dbobj.test.name)
+            raise
+
+        LOG.info("created %d crashes in bulk", len(entries))
+        return entries
+
+
 class CrashEntrySerializer(serializers.ModelSerializer):
     # We need to redefine several fields explicitly because we flatten our
     # foreign keys into these fields instead of using primary keys, hyperlinks
@@ -93,9 +227,19 @@ class CrashEntrySerializer(serializers.ModelSerializer):
             "id",
             "shortSignature",
             "crashAddress",
+            "framesFingerprint",
+            "crashFingerprint",
         )
         ordering = ["-id"]
-        read_only_fields = ("bucket", "id", "shortSignature", "crashAddress")
+        list_serializer_class = CrashEntryListSerializer
+        read_only_fields = (
+            "bucket",
+            "id",
+            "shortSignature",
+            "crashAddress",
+            "framesFingerprint",
+            "crashFingerprint",
+        )
 
     def create(self, attrs):
         """
@@ -104,11 +248,7 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         platform, os and client and create the foreign objects on the fly
         if they don't exist in our database yet.
         """
-        missing_keys = {"rawStdout", "rawStderr", "rawCrashData"} - set(attrs.keys())
-        if missing_keys:
-            raise InvalidArgumentException(
-                {key: ["This field is required."] for key in missing_keys}
-            )
+        self.check_raw_fields(attrs)
 
         attrs["product"] = Product.objects.get_or_create(**attrs["product"])[0]
         attrs["platform"] = Platform.objects.get_or_create(**attrs["platform"])[0]
@@ -116,6 +256,38 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         attrs["client"] = Client.objects.get_or_create(**attrs["client"])[0]
         attrs["tool"] = Tool.objects.get_or_create(**attrs["tool"])[0]
 
+        self.parse_crash(attrs)
+
+        # If a testcase is supplied, create a testcase object and store it
+        testcase = self.build_testcase(attrs, self.context.get("testcase_file"))
+        attrs["testcase"] = None
+        if testcase is not None:
+            (attrs["testcase"], ext, content) = testcase
+            attrs["testcase"].test = TestCaseBlob.store(content, ext)
+            attrs["testcase"].save()
+
+        try:
+            # Create our CrashEntry instance
+            return super().create(attrs)
+        except:
+            if attrs["testcase"] is not None:
+                attrs["testcase"].delete()
+            raise
+
+    @staticmethod
+    def check_raw_fields(attrs):
+        missing_keys = {"rawStdout", "rawStderr", "rawCrashData"} - set(attrs.keys())
+        if missing_keys:
+            raise InvalidArgumentException(
+                {key: ["This field is required."] for key in missing_keys}
+            )
+
+    @staticmethod
+    def parse_crash(attrs):
+        """
+        Parse the raw crash data and populate the fields depending on it. The
+        foreign objects must already be resolved. Returns the CrashInfo.
+        """
         # Parse the incoming data using the crash signature package from FTB
         configuration = ProgramConfiguration(
             attrs["product"].name,
@@ -124,7 +296,11 @@ class CrashEntrySerializer(serializers.ModelSerializer):
             attrs["product"].version,
         )
         crashInfo = CrashInfo.fromRawCrashData(
-            attrs["rawStdout"], attrs["rawStderr"], configuration, attrs["rawCrashData"]
+            attrs["rawStdout"],
+            attrs["rawStderr"],
+            configuration,
+            attrs["rawCrashData"],
+            maxDetectionLines=getattr(settings, "CRASH_DETECTION_MAX_LINES", None),
         )
 
         # Populate certain fields here from the CrashInfo object we just got
@@ -134,48 +310,57 @@ class CrashEntrySerializer(serializers.ModelSerializer):
         attrs["shortSignature"] = attrs["shortSignature"][
             : CrashEntry._meta.get_field("shortSignature").max_length
         ]
-
-        # If a testcase is supplied, create a testcase object and store it
-        if "test" in attrs["testcase"]:
-            testcase = attrs["testcase"]
-            testcase_ext = attrs.pop("testcase_ext", None)
-            testcase_size = testcase.get("size", 0)
-            testcase_quality = testcase.get("quality", 0)
-            testcase_isbinary = testcase.get("isBinary", False)
-            testcase = testcase["test"]
-
-            h = hashlib.new("sha1")
+        (
+            attrs["framesFingerprint"],
+            attrs["crashFingerprint"],
+        ) = CrashEntry.getFingerprints(crashInfo)
+        return crashInfo
+
+    @staticmethod
+    def build_testcase(attrs, upload=None):
+        """
+        Build the (unsaved) TestCase of the given values, together with the file
+        extension and the File to store (see TestCaseBlob.store). The content is
+        either given inline or as an uploaded file. Uploaded files are checked in
+        chunks, so they are never read into memory at once. Uploaded text which is
+        not valid UTF-8 is stored as binary. Returns None if there is no testcase.
+        """
+        testcase_ext = attrs.pop("testcase_ext", None)
+        testcase = attrs["testcase"]
+        if upload is None and "test" not in testcase:
+            return None
+
+        testcase_size = testcase.get("size", 0)
+        testcase_quality = testcase.get("quality", 0)
+        testcase_isbinary = testcase.get("isBinary", False)
+        if upload is not None:
+            size = upload.size
+            if not testcase_isbinary:
+                # the size of text testcases is counted in characters
+                decoder = codecs.getincrementaldecoder("utf-8")()
+                try:
+                    size = sum(len(decoder.decode(chunk)) for chunk in upload.chunks())
+                    decoder.decode(b"", final=True)
+                except UnicodeDecodeError:
+                    # kept as is instead of replacing the invalid bytes
+                    size = upload.size
+                    testcase_isbinary = True
+            content = upload
+        else:
             if testcase_isbinary:
-                testcase = base64.b64decode(testcase)
-                h.update(testcase)
+                data = base64.b64decode(testcase["test"])
             else:
-                h.update(repr(testcase).encode("utf-8"))
+                data = testcase["test"]
+            size = len(data)
+            content = ContentFile(data)
 
-            if not testcase_size:
-                testcase_size = len(testcase)
-
-            dbobj = TestCase(
-                quality=testcase_quality, isBinary=testcase_isbinary, size=testcase_size
-            )
-            filename = (
-                f"{h.hexdigest()}.{testcase_ext}"
-                if testcase_ext is not None
-                else h.hexdigest()
-            )
-            dbobj.test.save(filename, ContentFile(testcase))
-            dbobj.save()
-            attrs["testcase"] = dbobj
-        else:
-            attrs["testcase"] = None
-            attrs.pop("testcase_ext", None)
+        if not testcase_size:
+            testcase_size = size
 
-        try:
-            # Create our CrashEntry instance
-            return super().create(attrs)
-        except:
-            if attrs["testcase"] is not None:
-                attrs["testcase"].delete()
-            raise
+        dbobj = TestCase(
+            quality=testcase_quality, isBinary=testcase_isbinary, size=testcase_size
+        )
+        return dbobj, testcase_ext, content
 
 
 class BucketSerializer(serializers.ModelSerializer):
@@ -229,6 +414,11 @@ class BucketSerializer(serializers.ModelSerializer):
         serialized["best_entry"] = getattr(obj, "best_entry", None)
         serialized["best_quality"] = obj.quality
         serialized["has_optimization"] = bool(obj.optimizedSignature)
+        serialized["reassign_progress"] = None
+        if obj.reassign_in_progress:
+            job = BucketReassignJob.objects.filter(bucket=obj).first()
+            if job is not None:
+                serialized["reassign_progress"] = job.get_progress()
         return serialized
 
 
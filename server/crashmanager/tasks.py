@@ -7,3 +7,26 @@ from . import cron  # noqa ensure cron tasks get registered
 @app.task(ignore_result=True)
 def triage_new_crash(pk):
     call_command("triage_new_crash", pk)
+
+
+@app.task(ignore_result=True)
+def triage_crashes(pks):
+    from .management.commands.triage_new_crashes import BatchTriage
+
+    BatchTriage.current().triage_ids(pks)
+
+
+@app.task(acks_late=True)
+def reassign_range(range_pk):
+    from .models import BucketReassignRange
+
+    BucketReassignRange.process(range_pk)
+
+
+@app.task(ignore_result=True)
+def reassign_finish(job_pk):
+    from .models import BucketReassignJob
+
+    job = BucketReassignJob.objects.filter(pk=job_pk).first()
+    if job is not None:
+        job.finish()
@@ -0,0 +1,87 @@
+"""Tests for the per-bucket representative crash entries
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+
+import pytest
+from django.core.management import call_command
+
+from crashmanager.models import BucketRepresentative, CrashEntry
+
+pytestmark = pytest.mark.usefixtures("crashmanager_test")  # pylint: disable=invalid-name
+
+
+def _signature(value):
+    return json.dumps({"symptoms": [{"type": "output", "value": value}]})
+
+
+def _representatives():
+    return sorted(BucketRepresentative.objects.values_list("bucket_id", "entry_id"))
+
+
+def test_representatives_follow_entries(cm):
+    bucket1 = cm.create_bucket(signature=_signature("foo"))
+    bucket2 = cm.create_bucket(signature=_signature("bar"))
+    crash1 = cm.create_crash(stderr="foo", bucket=bucket1)
+    crash2 = cm.create_crash(stderr="foo", bucket=bucket1)
+    assert _representatives() == [(bucket1.pk, crash1.pk)]
+
+    # moving the representative picks the next entry of the old bucket
+    crash1 = CrashEntry.objects.get(pk=crash1.pk)
+    crash1.bucket = bucket2
+    crash1.save()
+    assert _representatives() == [(bucket1.pk, crash2.pk), (bucket2.pk, crash1.pk)]
+
+    crash2.delete()
+    assert _representatives() == [(bucket2.pk, crash1.pk)]
+
+
+def test_representatives_settings(cm, settings):
+    settings.BUCKET_REPRESENTATIVES = 2
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    crashes = [cm.create_crash(stderr="foo", bucket=bucket) for _ in range(3)]
+    assert _representatives() == [(bucket.pk, crash.pk) for crash in crashes[:2]]
+
+
+def test_representatives_bulk_changes(cm):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    crashes = [cm.create_crash(stderr="foo") for _ in range(2)]
+    assert not _representatives()
+
+    bucket.reassign(True)
+    assert _representatives() == [(bucket.pk, crashes[0].pk)]
+
+    # populate from scratch, e.g. after the migration
+    BucketRepresentative.objects.all().delete()
+    call_command("populate_bucket_representatives")
+    assert _representatives() == [(bucket.pk, crashes[0].pk)]
+
+
+def test_representatives_crash_infos(cm, django_assert_num_queries):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    crash = cm.create_crash(stderr="foo", bucket=bucket)
+
+    crash_infos = BucketRepresentative.get_crash_infos()
+    assert list(crash_infos) == [bucket.pk]
+    assert crash_infos[bucket.pk][0].rawStderr == ["foo"]
+    # served from memory until the representatives change
+    crash_infos = BucketRepresentative.get_crash_infos(())
+    assert crash_infos[bucket.pk][0].rawStderr == []
+    assert BucketRepresentative.get_crash_infos(()) is crash_infos
+
+    # outputs are loaded per call, even if a narrower set was cached first
+    with django_assert_num_queries(1):
+        crash_infos = BucketRepresentative.get_crash_infos(("stderr",))
+    assert crash_infos[bucket.pk][0].rawStderr == ["foo"]
+    assert crash_infos[bucket.pk][0].rawStdout == []
+    crash_infos = BucketRepresentative.get_crash_infos()
+    assert crash_infos[bucket.pk][0].rawStderr == ["foo"]
+
+    crash.delete()
+    assert BucketRepresentative.get_crash_infos() == {}
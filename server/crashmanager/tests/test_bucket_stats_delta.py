@@ -0,0 +1,166 @@
+"""Tests for the set-based bucket statistics maintenance
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from crashmanager.management.commands.cleanup_old_crashes import _bulk_delete_crashes
+from crashmanager.models import (
+    BucketHit,
+    BucketStatistics,
+    BucketStatsDelta,
+    CrashEntry,
+)
+
+pytestmark = pytest.mark.usefixtures("crashmanager_test")  # pylint: disable=invalid-name
+
+
+def _signature(value):
+    return json.dumps({"symptoms": [{"type": "output", "value": value}]})
+
+
+def _stats():
+    return sorted(
+        BucketStatistics.objects.filter(size__gt=0).values_list(
+            "bucket_id", "tool__name", "size", "quality"
+        )
+    )
+
+
+def _hits():
+    return sorted(
+        BucketHit.objects.filter(count__gt=0).values_list(
+            "bucket_id", "tool__name", "begin", "count"
+        )
+    )
+
+
+def _create_crashes(cm, bucket, stderr):
+    """Crash entries spread over two tools, two hours and several qualities"""
+    now = timezone.now().replace(minute=30)
+    crashes = []
+    for idx in range(6):
+        crash = cm.create_crash(
+            tool=f"tool{idx % 2}",
+            testcase=cm.create_testcase("test.js", quality=idx + 1),
+            stderr=stderr,
+        )
+        CrashEntry.objects.filter(pk=crash.pk).update(
+            created=now - timedelta(hours=idx % 3 // 2)
+        )
+        crash = CrashEntry.objects.get(pk=crash.pk)
+        crash.bucket = bucket
+        crash.save()
+        crashes.append(crash)
+    return crashes
+
+
+def _recompute_stats(buckets):
+    """Statistics as maintained by the per-entry receivers"""
+    stats = []
+    for bucket in buckets:
+        for tool in {"tool0", "tool1"}:
+            entries = CrashEntry.objects.filter(bucket=bucket, tool__name=tool)
+            if entries:
+                stats.append(
+                    (
+                        bucket.pk,
+                        tool,
+                        entries.count(),
+                        min(entry.testcase.quality for entry in entries),
+                    )
+                )
+    return sorted(stats)
+
+
+def _expected_hits(buckets):
+    hits = {}
+    for bucket in buckets:
+        for entry in CrashEntry.objects.filter(bucket=bucket):
+            key = (
+                bucket.pk,
+                entry.tool.name,
+                entry.created.replace(microsecond=0, second=0, minute=0),
+            )
+            hits[key] = hits.get(key, 0) + 1
+    return sorted((*key, count) for key, count in hits.items())
+
+
+def test_reassign_stats(cm):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    matching = _create_crashes(cm, None, stderr="foo")
+    leaving = _create_crashes(cm, bucket, stderr="bar")
+    kept = _create_crashes(cm, bucket, stderr="foo")
+
+    bucket.reassign(True)
+    assert set(CrashEntry.objects.filter(bucket=bucket)) == set(matching + kept)
+    assert not CrashEntry.objects.filter(
+        pk__in=[crash.pk for crash in leaving], bucket__isnull=False
+    ).exists()
+    assert _stats() == _recompute_stats([bucket])
+    assert _hits() == _expected_hits([bucket])
+
+
+def test_reassign_quality_recompute(cm):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    cm.create_crash(
+        stderr="foo", bucket=bucket, testcase=cm.create_testcase("a.js", quality=5)
+    )
+    cm.create_crash(
+        stderr="bar", bucket=bucket, testcase=cm.create_testcase("b.js", quality=1)
+    )
+    assert _stats() == [(bucket.pk, "testtool", 2, 1)]
+
+    # the entry with the best quality leaves the bucket
+    bucket.reassign(True)
+    assert _stats() == [(bucket.pk, "testtool", 1, 5)]
+
+
+def test_reassign_queries(cm, django_assert_max_num_queries):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    for _ in range(30):
+        cm.create_crash(stderr="foo")
+
+    # independent of the number of entries moved
+    with django_assert_max_num_queries(20):
+        bucket.reassign(True)
+    assert _stats() == [(bucket.pk, "testtool", 30, None)]
+
+
+def test_collect_bulk_delete(cm):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    crashes = _create_crashes(cm, bucket, stderr="foo")
+    _bulk_delete_crashes(
+        CrashEntry.objects.filter(pk__in=[crash.pk for crash in crashes[:3]])
+    )
+    assert _stats() == _recompute_stats([bucket])
+    assert _hits() == _expected_hits([bucket])
+
+    _bulk_delete_crashes(CrashEntry.objects.all())
+    assert not _stats()
+    assert not _hits()
+    assert BucketStatistics.objects.filter(quality__isnull=False).count() == 0
+
+
+def test_collect_nested(cm):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    crash = cm.create_crash(stderr="foo")
+
+    with BucketStatsDelta.collect() as outer:
+        with BucketStatsDelta.collect() as inner:
+            assert inner is outer
+            crash.bucket = bucket
+            crash.save()
+        # nothing is applied before the outermost block ends
+        assert not _stats()
+    assert BucketStatsDelta.current() is None
+    assert _stats() == [(bucket.pk, "testtool", 1, None)]
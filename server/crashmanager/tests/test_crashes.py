@@ -9,12 +9,16 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
+import gzip
 import logging
 
 import pytest
 import requests
+from django.core.files.base import ContentFile
 from django.urls import reverse
 
+from crashmanager.models import TestCase, TestCaseBlob
+
 from . import assert_contains
 
 LOG = logging.getLogger("fm.crashmanager.tests.crashes")
@@ -88,3 +92,79 @@ def test_delete_testcase_crash(cm):
         raise AssertionError(
             f"file should have been deleted with CrashInfo: {test_file!r}"
         )
+
+
+def _stored_testcase(content, ext="txt"):
+    testcase = TestCase(size=len(content))
+    testcase.test = TestCaseBlob.store(ContentFile(content), ext)
+    testcase.save()
+    return testcase
+
+
+def test_testcase_blobs(settings):
+    """Identical testcases share one compressed file, which is removed with the
+    last of them"""
+    settings.TEST_STORAGE_COMPRESSION = "gzip"
+    first = _stored_testcase(b"hello world" * 100)
+    second = _stored_testcase(b"hello world" * 100)
+    other = _stored_testcase(b"hello world" * 100, ext="js")
+    assert first.test.name == second.test.name != other.test.name
+    assert TestCaseBlob.objects.get(name=first.test.name).refcount == 2
+
+    storage = first.test.storage
+    with storage.open(first.test.name, "rb") as fp:
+        assert gzip.decompress(fp.read()) == b"hello world" * 100
+    second.loadTest()
+    assert second.content == b"hello world" * 100
+
+    first.delete()
+    assert storage.exists(second.test.name)
+    assert TestCaseBlob.objects.get(name=second.test.name).refcount == 1
+    second.delete()
+    assert not storage.exists(second.test.name)
+    assert not TestCaseBlob.objects.filter(name=second.test.name).exists()
+    other.delete()
+    assert not TestCaseBlob.objects.exists()
+
+
+@pytest.mark.parametrize("compression", ["", "gzip", "zstd"])
+def test_testcase_blobs_compression(settings, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    settings.TEST_STORAGE_COMPRESSION = compression
+    testcase = _stored_testcase("h\u00e4llo")
+    assert TestCaseBlob.objects.get().compression == compression
+    testcase.loadTest()
+    assert testcase.content == "h\u00e4llo".encode()
+    testcase.delete()
+
+
+def test_testcase_store_shared():
+    """Changing the content of a testcase doesn't change testcases sharing it"""
+    first = _stored_testcase(b"hello")
+    second = _stored_testcase(b"hello")
+    first.content = "bye"
+    first.storeTestAndSave()
+    assert first.test.name.endswith(".txt")
+    assert first.size == 3
+    first.loadTest()
+    second.loadTest()
+    assert (first.content, second.content) == (b"bye", b"hello")
+    assert {blob.refcount for blob in TestCaseBlob.objects.all()} == {1}
+    first.delete()
+    second.delete()
+
+
+def test_testcase_download(client, cm):
+    """Testcases are downloaded decompressed"""
+    client.login(username="test", password="test")
+    crash = cm.create_crash(testcase=_stored_testcase(b"\0\1" * 1000, ext="bin"))
+    response = client.get(
+        reverse("crashmanager:download_test", kwargs={"crashid": crash.pk})
+    )
+    assert response.status_code == requests.codes["ok"]
+    assert b"".join(response.streaming_content) == b"\0\1" * 1000
+    assert response["Content-Disposition"] == (
+        f'attachment; filename="{crash.testcase.test.name.rsplit("/", 1)[1]}"'
+    )
+    crash.delete()
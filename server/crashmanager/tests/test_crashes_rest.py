@@ -9,6 +9,8 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 
+import gzip
+import hashlib
 import json
 import logging
 import os.path
@@ -18,6 +20,8 @@ from unittest.mock import Mock, patch
 
 import pytest
 import requests
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.utils.http import urlencode
 
 from crashmanager.models import BucketStatistics, CrashEntry
@@ -159,6 +163,8 @@ def _compare_rest_result_to_crash(result, crash, raw=True):
         "tool",
         "shortSignature",
         "crashAddress",
+        "framesFingerprint",
+        "crashFingerprint",
         "triagedOnce",
         "created",
     }
@@ -193,9 +199,9 @@ def _compare_created_data_to_crash(
         assert getattr(crash, field) == data[field].strip()
     if "testcase" in data:
         expected_ext = data.get("testcase_ext", "")
-        assert os.path.splitext(crash.testcase.test.path)[1].lstrip(".") == expected_ext
-        with open(crash.testcase.test.path) as fp:
-            assert fp.read() == data["testcase"]
+        assert os.path.splitext(crash.testcase.test.name)[1].lstrip(".") == expected_ext
+        crash.testcase.loadTest()
+        assert crash.testcase.content.decode("utf-8") == data["testcase"]
         assert crash.testcase.isBinary == data["testcase_isbinary"]
         assert crash.testcase.quality == data["testcase_quality"]
     else:
@@ -492,6 +498,11 @@ def test_rest_crashes_report_crash_long(api_client, user_normal):
     assert resp.status_code == requests.codes["created"]
     crash = CrashEntry.objects.get()
     _compare_created_data_to_crash(data, crash, crash_address="0xf7056fff")
+    # fingerprints are computed from the parsed crash
+    assert (crash.framesFingerprint, crash.crashFingerprint) == (
+        CrashEntry.getFingerprints(crash.getCrashInfo())
+    )
+    assert crash.framesFingerprint
 
 
 @patch(
@@ -545,6 +556,315 @@ def test_rest_crashes_report_crash_long_sig(api_client, user_normal):
     _compare_created_data_to_crash(data, crash, short_signature=expected)
 
 
+@pytest.mark.parametrize(
+    "content, isbinary, size",
+    [(b"\xc3\xa4" * 1000, False, 1000), (bytes(range(256)) * 100, True, 25600)],
+    ids=["text", "binary"],
+)
+def test_rest_crashes_report_crash_upload(
+    api_client, user_normal, content, isbinary, size
+):
+    """test that testcases can be uploaded as file"""
+    data = {
+        "rawStdout": "data on\nstdout",
+        "rawStderr": "data on\nstderr",
+        "rawCrashData": "some\tcrash\ndata\n",
+        "testcase": SimpleUploadedFile("test.bin", content),
+        "testcase_isbinary": isbinary,
+        "testcase_ext": "bin",
+        "platform": "x86",
+        "product": "mozilla-central",
+        "os": "linux",
+        "client": "client1",
+        "tool": "tool1",
+    }
+    resp = api_client.post("/crashmanager/rest/crashes/", data=data, format="multipart")
+    LOG.debug(resp)
+    assert resp.status_code == requests.codes["created"]
+    crash = CrashEntry.objects.get()
+    assert crash.testcase.isBinary == isbinary
+    assert crash.testcase.size == size
+    digest = hashlib.sha1(content).hexdigest()
+    assert crash.testcase.test.name == f"testcases/{digest[:2]}/{digest}.bin"
+    crash.testcase.loadTest()
+    assert crash.testcase.content == content
+
+
+def test_rest_crashes_report_crash_upload_invalid(api_client, user_normal):
+    """test that uploaded text testcases which are not valid UTF-8 are binary"""
+    data = {
+        "rawStdout": "",
+        "rawStderr": "",
+        "rawCrashData": "",
+        "testcase": SimpleUploadedFile("test.js", b"a\xff"),
+        "platform": "x86",
+        "product": "mozilla-central",
+        "os": "linux",
+        "client": "client1",
+        "tool": "tool1",
+    }
+    resp = api_client.post("/crashmanager/rest/crashes/", data=data, format="multipart")
+    assert resp.status_code == requests.codes["created"]
+    crash = CrashEntry.objects.get()
+    assert crash.testcase.isBinary
+    assert crash.testcase.size == 2
+    crash.testcase.loadTest()
+    assert crash.testcase.content == b"a\xff"
+
+
+def _bulk_crash(idx, **kwds):
+    crash = {
+        "rawStdout": f"data on\nstdout {idx}",
+        "rawStderr": "data on\nstderr",
+        "rawCrashData": "some\tcrash\ndata\n",
+        "platform": "x86",
+        "product": "mozilla-central",
+        "product_version": "badf00d",
+        "os": "linux",
+        "client": "client1",
+        "tool": "tool1",
+    }
+    crash.update(kwds)
+    return crash
+
+
+@pytest.mark.parametrize("user", ["normal", "restricted", "only_report"], indirect=True)
+def test_rest_crashes_bulk(api_client, user, user_restricted_with_tools):
+    """test that many crashes can be reported at once"""
+    crashes = [
+        # inline testcase, like a single submission
+        _bulk_crash(
+            0,
+            testcase="foo();\ntest();",
+            testcase_isbinary=False,
+            testcase_quality=0,
+            testcase_ext="js",
+        ),
+        # testcases uploaded as file parts
+        _bulk_crash(1, testcase_isbinary=False, testcase_quality=3, testcase_ext="js"),
+        _bulk_crash(2, testcase_isbinary=True, testcase_quality=5),
+        _bulk_crash(3, product_version="", tool="x"),
+    ]
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/",
+        data={
+            "crashes": SimpleUploadedFile("crashes.json", json.dumps(crashes).encode()),
+            "testcase_1": SimpleUploadedFile("test.js", b"bar();"),
+            "testcase_2": SimpleUploadedFile("test.bin", b"\x00\xff"),
+        },
+        format="multipart",
+    )
+    LOG.debug(resp)
+    assert resp.status_code == requests.codes["created"]
+    created = CrashEntry.objects.order_by("id")
+    assert [result["id"] for result in resp.json()] == [crash.pk for crash in created]
+    for result, crash in zip(resp.json()[:3], created[:3]):
+        _compare_rest_result_to_crash(result, crash, raw=False)
+
+    crashes[1]["testcase"] = "bar();"
+    _compare_created_data_to_crash(crashes[0], created[0])
+    _compare_created_data_to_crash(crashes[1], created[1])
+    _compare_created_data_to_crash(crashes[3], created[3])
+    created[2].testcase.loadTest()
+    assert created[2].testcase.content == b"\x00\xff"
+    assert (created[2].testcase.isBinary, created[2].testcase.size) == (True, 2)
+    assert [crash.testcase.quality for crash in created[:3]] == [0, 3, 5]
+
+    # the lookups are shared, the entries are ready for triage
+    assert created[0].product_id == created[1].product_id != created[3].product_id
+    assert created[0].tool_id != created[3].tool_id
+    for crash in created:
+        assert not crash.triagedOnce
+        assert crash.getCrashInfo().rawStderr == ["data on", "stderr"]
+        assert crash.cachedCrashInfoBinary
+
+
+def test_rest_crashes_bulk_json(api_client, user_normal, django_assert_max_num_queries):
+    """test that crashes can be reported as JSON list, with constant queries"""
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/", [_bulk_crash(0)], format="json"
+    )
+    assert resp.status_code == requests.codes["created"]
+
+    crashes = [_bulk_crash(idx, testcase=f"test{idx}();") for idx in range(20)]
+    with django_assert_max_num_queries(20):
+        resp = api_client.post(
+            "/crashmanager/rest/crashes/bulk/", {"crashes": crashes}, format="json"
+        )
+    assert resp.status_code == requests.codes["created"]
+    assert CrashEntry.objects.count() == 21
+    assert cmTestCase.objects.count() == 20
+
+
+def test_rest_crashes_bulk_no_returning(api_client, user_normal, mocker):
+    """test that ids are recovered where bulk inserts return no rows (MySQL)"""
+    mocker.patch.object(
+        type(connection.features), "can_return_rows_from_bulk_insert", False
+    )
+    # committed by someone else, must not be mistaken for the batch
+    api_client.post("/crashmanager/rest/crashes/bulk/", [_bulk_crash(0)], format="json")
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/",
+        [
+            _bulk_crash(1, testcase="foo();", testcase_ext="js"),
+            _bulk_crash(2),
+            _bulk_crash(3, testcase="bar();", testcase_ext="js"),
+        ],
+        format="json",
+    )
+    assert resp.status_code == requests.codes["created"]
+    created = list(CrashEntry.objects.order_by("id"))[1:]
+    assert [result["id"] for result in resp.json()] == [crash.pk for crash in created]
+    testcases = []
+    for crash in created[::2]:
+        crash.testcase.loadTest()
+        testcases.append(crash.testcase.content)
+    assert testcases == [b"foo();", b"bar();"]
+    assert created[1].testcase is None
+
+
+def test_rest_crashes_bulk_triage(api_client, user_normal, mocker, settings):
+    """test that triage of the whole batch is queued at once"""
+    settings.USE_CELERY = True
+    triage = mocker.patch("crashmanager.tasks.triage_crashes.delay")
+    with patch("django.db.transaction.on_commit", new=lambda func: func()):
+        resp = api_client.post(
+            "/crashmanager/rest/crashes/bulk/",
+            [_bulk_crash(0), _bulk_crash(1)],
+            format="json",
+        )
+    assert resp.status_code == requests.codes["created"]
+    triage.assert_called_once_with(
+        list(CrashEntry.objects.order_by("id").values_list("id", flat=True))
+    )
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {},
+        {"crashes": "[{"},
+        {"crashes": "{}"},
+        {"crashes": "[1]"},
+        {"crashes": json.dumps([_bulk_crash(0), _bulk_crash(1, os="")])},
+    ],
+)
+def test_rest_crashes_bulk_invalid(api_client, user_normal, data):
+    """test that invalid batches are rejected as a whole"""
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/", data=data, format="multipart"
+    )
+    LOG.debug(resp)
+    assert resp.status_code == requests.codes["bad_request"]
+    assert not CrashEntry.objects.exists()
+    assert not cmTestCase.objects.exists()
+
+
+def test_rest_crashes_bulk_limit(api_client, user_normal, settings):
+    settings.BULK_CRASHES_LIMIT = 1
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/",
+        [_bulk_crash(0), _bulk_crash(1)],
+        format="json",
+    )
+    assert resp.status_code == requests.codes["bad_request"]
+    assert not CrashEntry.objects.exists()
+
+
+def test_rest_crashes_bulk_restricted(api_client, user_restricted_with_tools):
+    """test that restricted users can only report crashes of their tools"""
+    resp = api_client.post(
+        "/crashmanager/rest/crashes/bulk/",
+        [_bulk_crash(0), _bulk_crash(1, tool="tool2")],
+        format="json",
+    )
+    assert resp.status_code == requests.codes["forbidden"]
+    assert not CrashEntry.objects.exists()
+
+
+def _post_compressed(api_client, body, encoding):
+    return api_client.post(
+        "/crashmanager/rest/crashes/",
+        body,
+        content_type="application/json",
+        HTTP_CONTENT_ENCODING=encoding,
+    )
+
+
+def test_rest_crashes_report_compressed(api_client, user_normal):
+    """test that compressed crash reports are decompressed transparently"""
+    data = _bulk_crash(
+        0, testcase="blah" * 1000, testcase_isbinary=False, testcase_quality=0
+    )
+    resp = _post_compressed(
+        api_client, gzip.compress(json.dumps(data).encode()), "gzip"
+    )
+    LOG.debug(resp)
+    assert resp.status_code == requests.codes["created"]
+    crash = CrashEntry.objects.get()
+    _compare_created_data_to_crash(data, crash)
+
+
+def test_rest_crashes_report_compressed_zstd(api_client, user_normal):
+    zstandard = pytest.importorskip("zstandard")
+    data = _bulk_crash(0)
+    body = zstandard.ZstdCompressor().compress(json.dumps(data).encode())
+    resp = _post_compressed(api_client, body, "zstd")
+    assert resp.status_code == requests.codes["created"]
+    _compare_created_data_to_crash(data, CrashEntry.objects.get())
+
+
+def test_rest_crashes_report_compressed_zstd_frames(api_client, user_normal):
+    """test that zstd bodies of several frames are decompressed completely"""
+    zstandard = pytest.importorskip("zstandard")
+    data = json.dumps(_bulk_crash(0)).encode()
+    compressor = zstandard.ZstdCompressor()
+    body = compressor.compress(data[:100]) + compressor.compress(data[100:])
+    resp = _post_compressed(api_client, body, "zstd")
+    assert resp.status_code == requests.codes["created"]
+    assert CrashEntry.objects.exists()
+
+
+def test_rest_crashes_report_compressed_no_auth(db, api_client):
+    """test that compressed bodies are not decompressed before authentication"""
+    resp = _post_compressed(api_client, b"not compressed", "gzip")
+    assert resp.status_code == requests.codes["unauthorized"]
+
+
+def test_rest_compressed_other_endpoint(api_client, user_normal):
+    """test that compressed bodies are only accepted by the upload endpoints"""
+    resp = api_client.post(
+        "/crashmanager/rest/buckets/",
+        gzip.compress(b"{}"),
+        content_type="application/json",
+        HTTP_CONTENT_ENCODING="gzip",
+    )
+    assert resp.status_code == requests.codes["unsupported_media_type"]
+
+
+@pytest.mark.parametrize(
+    "body, encoding, expected",
+    [
+        (b"not compressed", "gzip", "bad_request"),
+        (
+            gzip.compress(json.dumps(_bulk_crash(0)).encode())[:-10],
+            "gzip",
+            "bad_request",
+        ),
+        (gzip.compress(b"[" + b" " * 2048 + b"]"), "gzip", "request_entity_too_large"),
+        (json.dumps(_bulk_crash(0)).encode(), "br", "unsupported_media_type"),
+    ],
+)
+def test_rest_crashes_report_compressed_invalid(
+    api_client, user_normal, settings, body, encoding, expected
+):
+    """test that invalid compressed request bodies are rejected"""
+    settings.DATA_UPLOAD_MAX_DECOMPRESSED_SIZE = 1024
+    resp = _post_compressed(api_client, body, encoding)
+    assert resp.status_code == requests.codes[expected]
+    assert not CrashEntry.objects.exists()
+
+
 @pytest.mark.parametrize("orig_quality, new_quality", ((0, 5), (5, 0)))
 def test_rest_crash_update(api_client, cm, orig_quality, new_quality, user_normal):
     """test that only allowed fields of CrashEntry can be updated"""
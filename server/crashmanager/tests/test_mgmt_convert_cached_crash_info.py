@@ -0,0 +1,116 @@
+"""Tests for CrashManager convert_cached_crash_info management command"""
+
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from crashmanager.models import CrashEntry, Frame
+from FTB.Signatures.CrashInfo import CrashInfo
+
+pytestmark = pytest.mark.django_db()
+
+ASAN_TRACE = """==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000010
+    #0 0x1 in js::AbstractFramePtr::script() src/a.cpp:1
+    #1 0x2 in EvalInFrame(JSContext*) src/b.cpp:2
+"""
+
+
+@pytest.fixture
+def frame_cache():
+    """Frames cached on a simulated commit are still rolled back after the test"""
+    Frame.clear_cache()
+    yield
+    Frame.clear_cache()
+
+
+@pytest.mark.usefixtures("frame_cache")
+def test_new_entries_binary(
+    cm, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    """new entries store the binary encoding, with the frames interned"""
+    entries = CrashEntry.objects.select_related("product", "platform", "os")
+    with django_capture_on_commit_callbacks(execute=True):
+        crashes = [
+            entries.get(pk=cm.create_crash(stderr=ASAN_TRACE).pk) for _ in range(2)
+        ]
+    assert Frame.objects.count() == 2
+    for crash in crashes:
+        assert crash.cachedCrashInfo == ""
+        assert bytes(crash.cachedCrashInfoBinary)[0] == 0
+        assert not CrashInfo.decodeCacheObject(crash.cachedCrashInfoBinary)["backtrace"]
+        assert Frame.unpack(crash.frameIds) == tuple(
+            Frame.objects.order_by("id").values_list("id", flat=True)
+        )
+        with django_assert_num_queries(0):
+            assert crash.getCrashInfo().backtrace == [
+                "js::AbstractFramePtr::script",
+                "EvalInFrame",
+            ]
+
+    # frames of other processes are loaded from the database
+    Frame.clear_cache()
+    with django_assert_num_queries(1):
+        Frame.prefetch(crashes)
+    backtraces = [crash.getCrashInfo().backtrace for crash in crashes]
+    assert backtraces[0] == ["js::AbstractFramePtr::script", "EvalInFrame"]
+    # all backtraces share the same frame strings
+    assert backtraces[0][0] is backtraces[1][0]
+
+
+def test_convert_cached_crash_info(capsys, cm):
+    crashes = [cm.create_crash(stderr=ASAN_TRACE) for _ in range(4)]
+    expected = crashes[0].getCrashInfo().toCacheObject()
+    # entries cached by previous versions only have the JSON encoding, or the
+    # binary encoding including the backtrace
+    CrashEntry.objects.filter(pk__in=[crash.pk for crash in crashes[:2]]).update(
+        cachedCrashInfo=json.dumps(expected), cachedCrashInfoBinary=None, frameIds=None
+    )
+    CrashEntry.objects.filter(pk__in=[crash.pk for crash in crashes[2:]]).update(
+        cachedCrashInfoBinary=CrashInfo.encodeCacheObject(expected), frameIds=None
+    )
+    invalid = cm.create_crash(stderr=ASAN_TRACE)
+    CrashEntry.objects.filter(pk=invalid.pk).update(
+        cachedCrashInfo="{", cachedCrashInfoBinary=None, frameIds=None
+    )
+    Frame.objects.all().delete()
+    Frame.clear_cache()
+
+    # the previous encodings are still used until converted
+    for crash in CrashEntry.objects.exclude(pk=invalid.pk):
+        assert crash.getCrashInfo().toCacheObject() == expected
+
+    call_command("convert_cached_crash_info", "--batch-size", "2")
+    assert "Successfully converted 5 crash entries" in capsys.readouterr().out
+
+    assert Frame.objects.count() == 2
+    for crash in CrashEntry.objects.all():
+        assert crash.cachedCrashInfo is None
+        assert crash.getCrashInfo().toCacheObject() == expected
+    invalid = CrashEntry.objects.get(pk=invalid.pk)
+    assert (invalid.cachedCrashInfoBinary, invalid.frameIds) == (None, None)
+    assert not CrashEntry.objects.filter(
+        pk__in=[crash.pk for crash in crashes], frameIds__isnull=True
+    ).exists()
+
+    # nothing left to convert
+    call_command("convert_cached_crash_info")
+    assert "Successfully converted 0 crash entries" in capsys.readouterr().out
+
+
+def test_convert_cached_crash_info_args():
+    with pytest.raises(CommandError, match="--batch-size must be at least 1"):
+        call_command("convert_cached_crash_info", "--batch-size", "0")
+
+
+@pytest.mark.usefixtures("frame_cache")
+def test_frames_cached_after_commit(django_capture_on_commit_callbacks):
+    """frames are only cached once their transaction is committed"""
+    with django_capture_on_commit_callbacks() as callbacks:
+        ids = Frame.intern(["foo", "bar"])
+        assert Frame.get_names(ids) == ["foo", "bar"]
+    assert len(callbacks) == 1
+    # not committed yet, the frames would vanish on a rollback
+    assert not Frame._ids and not Frame._names
+    callbacks[0]()
+    assert Frame._names == dict(zip(ids, ["foo", "bar"]))
@@ -0,0 +1,83 @@
+"""Tests for CrashManager dedupe_testcases management command"""
+
+import pytest
+from django.core.management import call_command
+
+from crashmanager.models import TestCase, TestCaseBlob
+
+pytestmark = pytest.mark.usefixtures("crashmanager_test")
+
+
+def test_none(capsys):
+    call_command("dedupe_testcases")
+    assert "Successfully moved 0 testcases into 0 stored files" in (
+        capsys.readouterr().out
+    )
+
+
+def test_dedupe(capsys, cm, django_capture_on_commit_callbacks):
+    # testcases stored before the content-addressed store was introduced
+    testcases = [
+        cm.create_testcase("test.js", "hello world"),
+        cm.create_testcase("test.js", "hello world"),
+        cm.create_testcase("test.bin", "hello world", isBinary=True),
+        cm.create_testcase("test.js", "missing"),
+    ]
+    old_names = [testcase.test.name for testcase in testcases]
+    storage = testcases[0].test.storage
+    storage.delete(old_names[3])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("dedupe_testcases")
+    assert (
+        "Successfully moved 3 testcases into 2 stored files, "
+        "1 testcases with missing files skipped"
+    ) in capsys.readouterr().out
+
+    testcases = [TestCase.objects.get(pk=testcase.pk) for testcase in testcases]
+    assert testcases[0].test.name == testcases[1].test.name
+    assert testcases[2].test.name.endswith(".bin")
+    assert testcases[3].test.name == old_names[3]
+    assert TestCaseBlob.objects.get(name=testcases[0].test.name).refcount == 2
+    for name in old_names:
+        assert not storage.exists(name)
+    for testcase in testcases[:3]:
+        testcase.loadTest()
+        assert testcase.content == b"hello world"
+
+    # already moved testcases are skipped
+    call_command("dedupe_testcases")
+    assert "Successfully moved 0 testcases into 2 stored files" in (
+        capsys.readouterr().out
+    )
+
+    for testcase in testcases:
+        testcase.delete()
+    assert not TestCaseBlob.objects.exists()
+
+
+def test_dedupe_failure(cm, mocker, django_capture_on_commit_callbacks):
+    """Testcases are kept if moving them fails"""
+    testcases = [cm.create_testcase("test.js", f"test{idx}") for idx in range(2)]
+    old_names = [testcase.test.name for testcase in testcases]
+    storage = testcases[0].test.storage
+    store = TestCaseBlob.store
+
+    def failing_store(content, ext=None):
+        if TestCaseBlob.objects.exists():
+            raise OSError("disk full")
+        return store(content, ext)
+
+    mocker.patch.object(TestCaseBlob, "store", side_effect=failing_store)
+
+    with (
+        pytest.raises(OSError, match="disk full"),
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        call_command("dedupe_testcases")
+
+    testcases = [TestCase.objects.get(pk=testcase.pk) for testcase in testcases]
+    assert testcases[0].test.name.startswith("testcases/")
+    assert not storage.exists(old_names[0])
+    assert testcases[1].test.name == old_names[1]
+    assert storage.exists(old_names[1])
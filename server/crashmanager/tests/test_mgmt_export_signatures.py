@@ -18,7 +18,7 @@ import zipfile
 import pytest
 from django.core.management import CommandError, call_command
 
-from crashmanager.models import Bucket
+from crashmanager.models import Bucket, ExportedSignature
 
 pytestmark = pytest.mark.django_db()  # pylint: disable=invalid-name
 
@@ -82,3 +82,78 @@ def test_some():
                         assert contents == "sig2"
     finally:
         os.unlink(tmpf)
+
+
+def test_versions(tmp_path):
+    """the export version only changes if any signature changed"""
+    sig1 = Bucket.objects.create(signature="sig1")
+    sig2 = Bucket.objects.create(signature="sig2")
+
+    def export():
+        call_command("export_signatures", str(tmp_path / "sigs.zip"))
+        with zipfile.ZipFile(tmp_path / "sigs.zip") as zipf:
+            return int(zipf.comment)
+
+    assert export() == 1
+    assert export() == 1
+    assert ExportedSignature.changes_since(1) == (1, {}, [])
+
+    sig1.signature = "sig1 changed"
+    sig1.save()
+    sig2_pk = sig2.pk
+    sig2.delete()
+    assert export() == 2
+    (version, changed, deleted) = ExportedSignature.changes_since(1)
+    assert (version, list(changed), deleted) == (2, [sig1.pk], [sig2_pk])
+    assert changed[sig1.pk][0] == "sig1 changed"
+    assert json.loads(changed[sig1.pk][1])["size"] == 0
+
+
+def test_incremental(cm, tmp_path, django_assert_max_num_queries):
+    """only buckets changed since the last export are exported again"""
+    buckets = [cm.create_bucket(signature=f"sig{idx}") for idx in range(20)]
+    for quality, size in ((5, 1), (3, 20), (3, 10), (3, 10)):
+        testcase = cm.create_testcase("test.txt", testdata="x" * size, quality=quality)
+        cm.create_crash(bucket=buckets[0], testcase=testcase)
+    cm.create_crash(bucket=buckets[1])
+    zip_path = str(tmp_path / "sigs.zip")
+
+    # the number of queries doesn't depend on the number of buckets
+    with django_assert_max_num_queries(16):
+        call_command("export_signatures", zip_path)
+    exported = {
+        row.bucket_id: json.loads(row.metadata)
+        for row in ExportedSignature.objects.all()
+    }
+    assert exported[buckets[0].pk] == {
+        "size": 4,
+        "shortDescription": "",
+        "frequent": False,
+        "testcase__quality": 3,
+        "testcase__size": 10,
+    }
+    assert exported[buckets[1].pk]["size"] == 1
+    assert "testcase__quality" not in exported[buckets[1].pk]
+
+    # nothing changed
+    with django_assert_max_num_queries(8):
+        call_command("export_signatures", zip_path)
+    assert ExportedSignature.current_version() == 1
+
+    cm.create_crash(bucket=buckets[2])
+    buckets[3].frequent = True
+    buckets[3].save()
+    deleted_id = buckets[4].pk
+    buckets[4].delete()
+    call_command("export_signatures", zip_path)
+    assert set(
+        ExportedSignature.objects.filter(version=2).values_list("bucket_id", "deleted")
+    ) == {(buckets[2].pk, False), (buckets[3].pk, False), (deleted_id, True)}
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.comment == b"2"
+        assert len(zipf.namelist()) == 2 * 19
+        assert json.loads(zipf.read(f"{buckets[3].pk}.metadata"))["frequent"]
+
+    # a full export yields the same result
+    call_command("export_signatures", zip_path, "--full")
+    assert ExportedSignature.current_version() == 2
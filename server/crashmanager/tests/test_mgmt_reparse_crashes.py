@@ -0,0 +1,131 @@
+"""Tests for CrashManager reparse_crashes management command"""
+
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from crashmanager.models import BucketStatistics, CrashEntry, CrashReparseRange
+
+pytestmark = pytest.mark.usefixtures("crashmanager_test")
+
+ASAN_TRACE = """==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000010
+    #0 0x1 in js::AbstractFramePtr::script() src/a.cpp:1
+    #1 0x2 in EvalInFrame(JSContext*) src/b.cpp:2
+"""
+
+
+def _output_signature(value):
+    return json.dumps(
+        {"symptoms": [{"src": "stderr", "type": "output", "value": f"/{value}/"}]}
+    )
+
+
+def _make_stale(crashes):
+    # as if the entries were parsed by a previous version
+    CrashEntry.objects.filter(pk__in=[crash.pk for crash in crashes]).update(
+        cachedCrashInfo=None,
+        cachedCrashInfoBinary=None,
+        frameIds=None,
+        crashAddress="",
+        crashAddressNumeric=None,
+        shortSignature="stale",
+        framesFingerprint="",
+        crashFingerprint="",
+    )
+
+
+@pytest.mark.parametrize("arg", ["--workers=0", "--chunk-size=0", "--range-size=0"])
+def test_invalid_options(arg):
+    with pytest.raises(CommandError, match=r"must be at least 1"):
+        call_command("reparse_crashes", arg)
+
+
+def test_none(capsys):
+    call_command("reparse_crashes")
+    assert "Successfully reparsed 0 crash entries" in capsys.readouterr().out
+
+
+def test_reparse(capsys, cm):
+    foo = cm.create_bucket(signature=_output_signature("foo"))
+    match = cm.create_bucket(signature=_output_signature("AddressSanitizer"))
+    crashes = [
+        # still matches its bucket
+        cm.create_crash(stderr=ASAN_TRACE, bucket=match),
+        # dropped out of its bucket and triaged again
+        cm.create_crash(stderr=ASAN_TRACE, bucket=foo),
+        # dropped out of its bucket, no other bucket matches
+        cm.create_crash(stderr="blah", bucket=foo),
+        # unbucketed entries are not triaged again
+        cm.create_crash(stderr=ASAN_TRACE),
+    ]
+    CrashEntry.objects.filter(pk__in=[crash.pk for crash in crashes]).update(
+        triagedOnce=True
+    )
+    _make_stale(crashes)
+    expected = CrashEntry.objects.get(pk=crashes[0].pk)
+    expected.reparseCrashInfo()
+
+    call_command("reparse_crashes", "--chunk-size=2", "--range-size=3")
+    assert (
+        "Successfully reparsed 4 crash entries, 2 removed from their bucket, "
+        "1 of them assigned to a bucket again"
+    ) in capsys.readouterr().out
+
+    crashes = [CrashEntry.objects.get(pk=crash.pk) for crash in crashes]
+    for crash in (crashes[0], crashes[1], crashes[3]):
+        for field in CrashEntry.PARSED_FIELDS:
+            assert getattr(crash, field) == getattr(expected, field), field
+        assert crash.crashAddress == "0x10"
+        assert crash.crashAddressNumeric == 16
+        assert crash.getCrashInfo().backtrace == [
+            "js::AbstractFramePtr::script",
+            "EvalInFrame",
+        ]
+    assert crashes[2].shortSignature == "No crash detected"
+    assert [(crash.bucket_id, crash.triagedOnce) for crash in crashes] == [
+        (match.pk, True),
+        (match.pk, True),
+        (None, True),
+        (None, True),
+    ]
+
+    stats = {stats.bucket_id: stats.size for stats in BucketStatistics.objects.all()}
+    assert stats == {foo.pk: 0, match.pk: 2}
+
+    # the checkpoint is removed once done
+    assert not CrashReparseRange.objects.exists()
+
+
+def test_resume(capsys, cm):
+    crashes = [cm.create_crash(stderr=ASAN_TRACE) for _ in range(3)]
+    _make_stale(crashes)
+    # an interrupted run which already reparsed the first entry
+    CrashReparseRange.objects.create(
+        first_id=crashes[0].pk,
+        last_id=crashes[-1].pk,
+        next_id=crashes[1].pk,
+        reparsed=1,
+    )
+
+    call_command("reparse_crashes")
+    assert "Successfully reparsed 3 crash entries" in capsys.readouterr().out
+    assert [
+        CrashEntry.objects.get(pk=crash.pk).shortSignature for crash in crashes
+    ] == [
+        "stale",
+        "[@ js::AbstractFramePtr::script]",
+        "[@ js::AbstractFramePtr::script]",
+    ]
+
+    # restarting discards the checkpoint
+    _make_stale(crashes)
+    CrashReparseRange.objects.create(
+        first_id=crashes[0].pk,
+        last_id=crashes[-1].pk,
+        next_id=crashes[-1].pk + 1,
+        reparsed=3,
+    )
+    call_command("reparse_crashes", "--restart")
+    assert "Successfully reparsed 3 crash entries" in capsys.readouterr().out
+    assert not CrashEntry.objects.filter(shortSignature="stale").exists()
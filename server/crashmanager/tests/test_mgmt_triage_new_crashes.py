@@ -14,11 +14,19 @@ import json
 import pytest
 from django.contrib.auth.models import User
 from django.core.management import CommandError, call_command
+from django.test import override_settings
 from notifications.models import Notification
 
+from crashmanager.management.commands.triage_new_crashes import (
+    BatchTriage,
+    split_id_range,
+)
 from crashmanager.models import (
     OS,
     Bucket,
+    BucketHit,
+    BucketIndex,
+    BucketStatistics,
     BucketWatch,
     Client,
     CrashEntry,
@@ -27,6 +35,8 @@ from crashmanager.models import (
     Tool,
 )
 from crashmanager.models import User as cmUser
+from FTB.ProgramConfiguration import ProgramConfiguration
+from FTB.Signatures.CrashInfo import CrashInfo
 
 pytestmark = pytest.mark.django_db()  # pylint: disable=invalid-name
 pytestmark = pytest.mark.usefixtures("crashmanager_test")
@@ -41,6 +51,119 @@ def test_none():
     call_command("triage_new_crashes")
 
 
+@pytest.mark.parametrize("arg", ["--workers=0", "--chunk-size=0"])
+def test_invalid_options(arg):
+    with pytest.raises(CommandError, match=r"must be at least 1"):
+        call_command("triage_new_crashes", arg)
+
+
+def test_split_id_range():
+    assert split_id_range(1, 10, 1) == [(1, 10)]
+    assert split_id_range(1, 10, 3) == [(1, 4), (5, 8), (9, 10)]
+    assert split_id_range(5, 6, 4) == [(5, 5), (6, 6)]
+
+
+def test_batch_stats(cm):
+    buckets = [
+        cm.create_bucket(signature=_stack_signature("?", "EvalInFrame")),
+        cm.create_bucket(
+            signature=json.dumps(
+                {"symptoms": [{"src": "stderr", "type": "output", "value": "/blah/"}]}
+            )
+        ),
+    ]
+    crashes = [
+        cm.create_crash(
+            stderr=ASAN_TRACE, testcase=cm.create_testcase("t1.js", quality=5)
+        ),
+        cm.create_crash(
+            stderr=ASAN_TRACE, testcase=cm.create_testcase("t2.js", quality=3)
+        ),
+        cm.create_crash(stderr=ASAN_TRACE, tool="othertool"),
+        cm.create_crash(stderr="blah"),
+        cm.create_crash(stderr="nothing"),
+    ]
+
+    call_command("triage_new_crashes", "--chunk-size=2")
+
+    crashes = [CrashEntry.objects.get(pk=c.pk) for c in crashes]
+    assert [c.bucket_id for c in crashes] == [
+        buckets[0].pk,
+        buckets[0].pk,
+        buckets[0].pk,
+        buckets[1].pk,
+        None,
+    ]
+    assert all(c.triagedOnce for c in crashes)
+
+    stats = BucketStatistics.objects.get(bucket=buckets[0], tool=crashes[0].tool)
+    assert (stats.size, stats.quality) == (2, 3)
+    stats = BucketStatistics.objects.get(bucket=buckets[0], tool=crashes[2].tool)
+    assert (stats.size, stats.quality) == (1, None)
+    stats = BucketStatistics.objects.get(bucket=buckets[1])
+    assert (stats.size, stats.quality) == (1, None)
+    assert (
+        sum(BucketHit.objects.filter(bucket=buckets[0]).values_list("count", flat=True))
+        == 3
+    )
+
+
+def test_batch_ids(cm):
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "/match/"}]}
+        )
+    )
+    crashes = [
+        cm.create_crash(stderr="match"),
+        cm.create_crash(stderr="blah"),
+        # not part of the batch
+        cm.create_crash(stderr="match"),
+    ]
+
+    assert BatchTriage().triage_ids(
+        [crash.pk for crash in crashes[:2]], chunk_size=1
+    ) == (2, 1)
+
+    crashes = [CrashEntry.objects.get(pk=c.pk) for c in crashes]
+    assert [(c.bucket_id, c.triagedOnce) for c in crashes] == [
+        (bucket.pk, True),
+        (None, True),
+        (None, False),
+    ]
+
+
+def test_batch_current(cm):
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "/match/"}]}
+        )
+    )
+    triage = BatchTriage.current()
+    assert BatchTriage.current() is triage
+
+    # a new bucket is picked up by the next batch
+    other = cm.create_bucket(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "/other/"}]}
+        )
+    )
+    triage = BatchTriage.current()
+    assert set(triage.buckets) == {bucket.pk, other.pk}
+    assert BatchTriage.current() is triage
+
+    crash = cm.create_crash(stderr="other")
+    assert triage.triage_ids([crash.pk]) == (1, 1)
+    assert CrashEntry.objects.get(pk=crash.pk).bucket_id == other.pk
+
+    # so is a changed signature
+    other.signature = json.dumps(
+        {"symptoms": [{"src": "stderr", "type": "output", "value": "/changed/"}]}
+    )
+    other.save()
+    assert BatchTriage.current() is not triage
+
+
 def test_some():
     buckets = [
         Bucket.objects.create(
@@ -142,3 +265,142 @@ def test_some_with_notification():
         == f"The bucket {buckets[1].pk} received a new crash entry {crashes[1].pk}"
     )
     assert notification.target == crashes[1]
+
+
+ASAN_TRACE = """==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000000
+    #0 0x1 in js::AbstractFramePtr::script() src/a.cpp:1
+    #1 0x2 in EvalInFrame(JSContext*) src/b.cpp:2
+    #2 0x3 in js::CallJSNative(JSContext*) src/c.cpp:3
+"""
+
+
+def _stack_signature(*frames):
+    return json.dumps(
+        {"symptoms": [{"type": "stackFrames", "functionNames": list(frames)}]}
+    )
+
+
+def test_index_maintained(cm):
+    bucket = cm.create_bucket(signature=_stack_signature("foo", "?", "/bar/", "baz"))
+    index = BucketIndex.objects.get(bucket=bucket)
+    assert json.loads(index.frames) == ["foo", "baz"]
+    assert index.platforms is None
+
+    bucket = Bucket.objects.get(pk=bucket.pk)
+    bucket.signature = json.dumps(
+        {
+            "symptoms": [{"type": "stackFrame", "functionName": "qux"}],
+            "platforms": ["x86"],
+        }
+    )
+    bucket.save()
+    index = BucketIndex.objects.get(bucket=bucket)
+    assert json.loads(index.frames) == ["qux"]
+    assert json.loads(index.platforms) == ["x86"]
+
+    bucket.signature = "invalid"
+    bucket.save()
+    assert not BucketIndex.objects.filter(bucket=bucket).exists()
+
+
+def test_triage_uses_index(cm, monkeypatch):
+    buckets = [
+        cm.create_bucket(signature=_stack_signature("js::CallJSNative")),
+        cm.create_bucket(signature=_stack_signature("?", "EvalInFrame")),
+        cm.create_bucket(signature=_stack_signature("js::Invoke")),
+    ]
+    crash = cm.create_crash(stderr=ASAN_TRACE)
+
+    evaluated = []
+    orig_get_signature = Bucket.getSignature
+
+    def _get_signature(self):
+        evaluated.append(self.pk)
+        return orig_get_signature(self)
+
+    monkeypatch.setattr(Bucket, "getSignature", _get_signature)
+    call_command("triage_new_crash", crash.pk)
+
+    crash = CrashEntry.objects.get(pk=crash.pk)
+    assert crash.bucket_id == buckets[1].pk
+    assert crash.triagedOnce
+    # the bucket requiring a frame not in the trace is never evaluated
+    assert buckets[2].pk not in evaluated
+
+
+def test_triage_unindexed_fallback(cm, django_assert_num_queries):
+    bucket = cm.create_bucket(signature=_stack_signature("?", "EvalInFrame"))
+    BucketIndex.objects.filter(bucket=bucket).delete()
+    crash = cm.create_crash(stderr=ASAN_TRACE)
+
+    call_command("triage_new_crash", crash.pk)
+
+    assert CrashEntry.objects.get(pk=crash.pk).bucket_id == bucket.pk
+
+    # the unindexed buckets are cached along with the index
+    crash_info = crash.getCrashInfo()
+    with django_assert_num_queries(0):
+        assert BucketIndex.get_candidate_ids(crash_info) == [bucket.pk]
+
+
+def _fingerprinted_crash(cm, **kwds):
+    crash = cm.create_crash(**kwds)
+    crash.reparseCrashInfo()
+    return crash
+
+
+def test_fingerprints():
+    config = ProgramConfiguration("test", "x86-64", "linux")
+    crash_info = CrashInfo.fromRawCrashData([], ASAN_TRACE.splitlines(), config)
+    frames, crash = CrashEntry.getFingerprints(crash_info)
+    assert frames and crash and frames != crash
+
+    # only the top frames are part of the frames fingerprint
+    deeper = ASAN_TRACE + "    #3 0x4 in main src/d.cpp:4\n"
+    crash_info = CrashInfo.fromRawCrashData([], deeper.splitlines(), config)
+    assert CrashEntry.getFingerprints(crash_info) != (frames, crash)
+    with override_settings(CRASH_FINGERPRINT_FRAMES=3):
+        assert CrashEntry.getFingerprints(crash_info)[0] == frames
+
+    crash_info = CrashInfo.fromRawCrashData([], [], config)
+    assert CrashEntry.getFingerprints(crash_info)[0] == ""
+
+
+def test_triage_duplicate_fast_path(cm, monkeypatch):
+    bucket = cm.create_bucket(signature=_stack_signature("?", "EvalInFrame"))
+    duplicate = _fingerprinted_crash(cm, stderr=ASAN_TRACE)
+    assert duplicate.bucket_id is None
+    duplicate.bucket = bucket
+    duplicate.save()
+    crash = _fingerprinted_crash(cm, stderr=ASAN_TRACE)
+    assert crash.crashFingerprint == duplicate.crashFingerprint
+
+    def _no_scan(*args, **kwds):
+        raise AssertionError("duplicate was not used")
+
+    monkeypatch.setattr(BucketIndex, "get_candidate_ids", _no_scan)
+    call_command("triage_new_crash", crash.pk)
+    assert CrashEntry.objects.get(pk=crash.pk).bucket_id == bucket.pk
+
+    # batch triage uses the duplicates as well
+    crash = _fingerprinted_crash(cm, stderr=ASAN_TRACE)
+    call_command("triage_new_crashes")
+    assert CrashEntry.objects.get(pk=crash.pk).bucket_id == bucket.pk
+
+
+def test_triage_duplicate_verified(cm):
+    bucket = cm.create_bucket(signature=_stack_signature("?", "EvalInFrame"))
+    other = cm.create_bucket(signature=_stack_signature("???", "js::CallJSNative"))
+    duplicate = _fingerprinted_crash(cm, stderr=ASAN_TRACE)
+    CrashEntry.objects.filter(pk=duplicate.pk).update(bucket=bucket)
+    # the signature of the duplicate's bucket changed since
+    bucket.signature = _stack_signature("missing")
+    bucket.save()
+
+    crash = _fingerprinted_crash(cm, stderr=ASAN_TRACE)
+    call_command("triage_new_crash", crash.pk)
+    assert CrashEntry.objects.get(pk=crash.pk).bucket_id == other.pk
+
+    crash = _fingerprinted_crash(cm, stderr=ASAN_TRACE)
+    call_command("triage_new_crashes")
+    assert CrashEntry.objects.get(pk=crash.pk).bucket_id == other.pk
@@ -0,0 +1,175 @@
+"""Tests for background bucket reassignment
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from crashmanager.cron import resume_reassign_jobs
+from crashmanager.models import (
+    FRAME_MATCH_CACHE,
+    Bucket,
+    BucketReassignJob,
+    BucketReassignRange,
+    BucketStatistics,
+    CrashEntry,
+    Frame,
+)
+from FTB.Signatures.Matchers import StringMatch
+
+pytestmark = pytest.mark.usefixtures("crashmanager_test")  # pylint: disable=invalid-name
+
+
+def _signature(value):
+    return json.dumps({"symptoms": [{"type": "output", "value": value}]})
+
+
+@pytest.fixture
+def frame_caches():
+    """Frames cached on a simulated commit are still rolled back after the test"""
+    Frame.clear_cache()
+    FRAME_MATCH_CACHE.clear()
+    yield
+    Frame.clear_cache()
+    FRAME_MATCH_CACHE.clear()
+
+
+def _ranges(job):
+    return list(job.ranges.order_by("first_id"))
+
+
+def test_reassign_job_ranges(cm, settings):
+    settings.REASSIGN_JOB_RANGE_SIZE = 2
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    matching = [cm.create_crash(stderr="foo") for _ in range(3)]
+    cm.create_crash(stderr="bar")
+    leaving = cm.create_crash(stderr="bar", bucket=bucket)
+    # entries in other buckets are never touched
+    other = cm.create_crash(stderr="foo", bucket=cm.create_bucket())
+
+    job = BucketReassignJob.start(bucket)
+    assert Bucket.objects.get(pk=bucket.pk).reassign_in_progress
+    ranges = _ranges(job)
+    assert [(r.first_id, r.last_id) for r in ranges] == [
+        (matching[0].pk, matching[1].pk),
+        (matching[2].pk, matching[2].pk + 1),
+        (leaving.pk, leaving.pk),
+    ]
+    assert job.get_progress() == {
+        "ranges": 3,
+        "ranges_done": 0,
+        "scanned": 0,
+        "moved_in": 0,
+        "moved_out": 0,
+        "finished": False,
+    }
+
+    # process part of the job, e.g. before a worker restart
+    assert BucketReassignRange.process(ranges[0].pk)
+    assert not BucketReassignRange.process(ranges[0].pk)
+    assert not job.finish()
+    progress = job.get_progress()
+    assert (progress["ranges_done"], progress["scanned"], progress["moved_in"]) == (
+        1,
+        2,
+        2,
+    )
+
+    for job_range in ranges[1:]:
+        BucketReassignRange.process(job_range.pk)
+    assert job.finish()
+
+    assert not Bucket.objects.get(pk=bucket.pk).reassign_in_progress
+    assert job.get_progress() == {
+        "ranges": 3,
+        "ranges_done": 3,
+        "scanned": 5,
+        "moved_in": 3,
+        "moved_out": 1,
+        "finished": True,
+    }
+    assert set(CrashEntry.objects.filter(bucket=bucket)) == set(matching)
+    assert CrashEntry.objects.get(pk=leaving.pk).bucket is None
+    assert CrashEntry.objects.get(pk=other.pk).bucket_id == other.bucket_id
+    assert BucketStatistics.objects.get(bucket=bucket).size == 3
+
+
+def test_reassign_job_dispatch(cm, mocker):
+    chord = mocker.patch("celery.chord")
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    for _ in range(2):
+        cm.create_crash(stderr="foo")
+
+    job = BucketReassignJob.start(bucket)
+    (job_range,) = _ranges(job)
+    job.dispatch()
+    (header, callback), _ = chord.call_args
+    assert [task.args for task in header] == [(job_range.pk,)]
+    assert callback.args == (job.pk,)
+
+    # only ranges that are not done are dispatched again
+    BucketReassignRange.process(job_range.pk)
+    finish = mocker.patch("crashmanager.tasks.reassign_finish.delay")
+    chord.reset_mock()
+    job.dispatch()
+    assert not chord.called
+    finish.assert_called_once_with(job.pk)
+
+
+def test_reassign_job_resume(cm, mocker):
+    dispatch = mocker.patch.object(BucketReassignJob, "dispatch")
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    job = BucketReassignJob.start(bucket)
+
+    resume_reassign_jobs()
+    assert not dispatch.called
+
+    BucketReassignJob.objects.filter(pk=job.pk).update(
+        updated=timezone.now() - timedelta(hours=1)
+    )
+    resume_reassign_jobs()
+    assert dispatch.call_count == 1
+
+    # finished jobs are left alone
+    BucketReassignJob.objects.filter(pk=job.pk).update(
+        updated=timezone.now() - timedelta(hours=1), finished=timezone.now()
+    )
+    resume_reassign_jobs()
+    assert dispatch.call_count == 1
+
+
+@pytest.mark.usefixtures("frame_caches")
+def test_reassign_frame_matches(cm, django_capture_on_commit_callbacks, mocker):
+    """PCRE function names are matched once per frame"""
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {"symptoms": [{"type": "stackFrames", "functionNames": ["???", "/^Eval/"]}]}
+        )
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        crashes = [
+            cm.create_crash(
+                stderr=(
+                    "==1==ERROR: AddressSanitizer: SEGV on unknown address 0x0\n"
+                    "    #0 0x1 in js::AbstractFramePtr::script() src/a.cpp:1\n"
+                    "    #1 0x2 in EvalInFrame(JSContext*) src/b.cpp:2\n"
+                )
+            )
+            for _ in range(3)
+        ]
+    matches = mocker.spy(StringMatch, "matches")
+
+    bucket.reassign(True)
+    assert set(
+        CrashEntry.objects.filter(bucket=bucket).values_list("pk", flat=True)
+    ) == {crash.pk for crash in crashes}
+    # both frames of the first crash, the others reuse the results
+    assert matches.call_count == 2
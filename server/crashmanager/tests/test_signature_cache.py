@@ -0,0 +1,118 @@
+"""Tests for the process-level bucket signature cache
+
+@license:
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import json
+
+import pytest
+
+from crashmanager.models import SIGNATURE_CACHE, Bucket, SignatureCache
+
+pytestmark = pytest.mark.usefixtures("crashmanager_test")  # pylint: disable=invalid-name
+
+
+def _signature(value):
+    return json.dumps({"symptoms": [{"type": "output", "value": value}]})
+
+
+def test_signature_cache_hit(cm):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    sig = bucket.getSignature()
+    assert Bucket.objects.get(pk=bucket.pk).getSignature() is sig
+
+    # unsaved buckets are never cached
+    unsaved = Bucket(signature=_signature("foo"))
+    assert unsaved.getSignature() is not unsaved.getSignature()
+
+
+def test_signature_cache_content_hash(cm):
+    bucket = cm.create_bucket(signature=_signature("foo"))
+    sig = bucket.getSignature()
+
+    # even without any version sync, a changed signature is never served stale
+    other = Bucket.objects.get(pk=bucket.pk)
+    other.signature = _signature("bar")
+    assert other.getSignature() is not sig
+    assert str(other.getSignature()) == other.signature
+
+
+def test_signature_cache_lru():
+    sig_cache = SignatureCache(max_entries=2, sync_interval=0)
+    buckets = [Bucket(pk=pk, signature=_signature(str(pk))) for pk in range(1, 4)]
+    sigs = [sig_cache.get(bucket) for bucket in buckets[:2]]
+    # touch the first entry so the second one is least recently used
+    assert sig_cache.get(buckets[0]) is sigs[0]
+    sig_cache.get(buckets[2])
+    assert list(sig_cache.entries) == [1, 3]
+
+
+def test_signature_cache_unbounded(settings):
+    settings.SIGNATURE_CACHE_ENTRIES = None
+    sig_cache = SignatureCache(sync_interval=0)
+    buckets = [Bucket(pk=pk, signature=_signature(str(pk))) for pk in range(1, 4)]
+    sigs = [sig_cache.get(bucket) for bucket in buckets]
+    # a full scan in the same order hits every entry
+    assert [sig_cache.get(bucket) for bucket in buckets] == sigs
+
+
+def test_signature_cache_not_modified(cm):
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {
+                "symptoms": [
+                    {"type": "stackFrames", "functionNames": ["foo", "bar", "baz"]},
+                    {"type": "output", "value": "/qux/"},
+                ],
+                "platforms": ["x86"],
+            }
+        )
+    )
+    sig = bucket.getSignature()
+
+    def state():
+        return (
+            str(sig),
+            [json.dumps(symptom.jsonobj) for symptom in sig.symptoms],
+            [str(symptom) for symptom in sig.symptoms],
+            sig.platforms,
+        )
+
+    before = state()
+    crash_info = cm.create_crash(
+        stderr=(
+            "==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000000\n"
+            "    #0 0x1 in foo src/a.cpp:1\n"
+            "    #1 0x2 in other src/b.cpp:2\n"
+            "    #2 0x3 in bar src/c.cpp:3\n"
+        )
+    ).getCrashInfo()
+    assert sig.getDistance(crash_info) > 0
+    assert sig.fit(crash_info) is not None
+    sig.getSymptomsDiff(crash_info)
+    sig.getSignatureUnifiedDiffTuples(crash_info)
+    assert Bucket.objects.get(pk=bucket.pk).getSignature() is sig
+    assert state() == before
+
+
+def test_signature_cache_version_sync(cm):
+    sig_cache = SignatureCache(sync_interval=0)
+    buckets = [cm.create_bucket(signature=_signature(v)) for v in ("foo", "bar")]
+    for bucket in buckets:
+        sig_cache.get(bucket)
+    sig_cache.sync(force=True)
+
+    # an edit in another process bumps the version for that bucket only
+    bucket = Bucket.objects.get(pk=buckets[0].pk)
+    bucket.signature = _signature("baz")
+    bucket.save()
+
+    sig_cache.sync(force=True)
+    assert list(sig_cache.entries) == [buckets[1].pk]
+
+    bucket.delete()
+    SIGNATURE_CACHE.clear()
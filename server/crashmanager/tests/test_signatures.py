@@ -17,7 +17,13 @@ import pytest
 import requests
 from django.urls import reverse
 
-from crashmanager.models import Bucket, BucketStatistics, BucketWatch, CrashEntry
+from crashmanager.models import (
+    Bucket,
+    BucketRepresentative,
+    BucketStatistics,
+    BucketWatch,
+    CrashEntry,
+)
 
 from . import assert_contains
 
@@ -142,6 +148,70 @@ def test_find_signature_simple_get(client, cm):  # pylint: disable=invalid-name
     assert response.status_code == requests.codes["ok"]
 
 
+ASAN_TRACE = """==1==ERROR: AddressSanitizer: SEGV on unknown address 0x000000000000
+    #0 0x1 in js::AbstractFramePtr::script() src/a.cpp:1
+    #1 0x2 in EvalInFrame(JSContext*) src/b.cpp:2
+    #2 0x3 in js::CallJSNative(JSContext*) src/c.cpp:3
+"""
+
+
+def test_find_signature_required_outputs(client, cm, mocker):
+    """Representatives are loaded with the outputs the proposals need"""
+    client.login(username="test", password="test")
+    crash = cm.create_crash(stderr=ASAN_TRACE)
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {
+                "symptoms": [
+                    {
+                        "type": "stackFrames",
+                        "functionNames": ["js::AbstractFramePtr::script", "foo"],
+                    }
+                ]
+            }
+        )
+    )
+    other_bucket = cm.create_bucket(
+        signature=json.dumps(
+            {"symptoms": [{"src": "stderr", "type": "output", "value": "bar"}]}
+        )
+    )
+    cm.create_crash(stderr="bar", bucket=other_bucket)
+    get_crash_infos = mocker.spy(BucketRepresentative, "get_crash_infos")
+
+    response = client.get(
+        reverse("crashmanager:findsigs", kwargs={"crashid": crash.pk})
+    )
+    assert response.status_code == requests.codes["ok"]
+    assert [found.pk for found in response.context["buckets"]] == [bucket.pk]
+    assert response.context["buckets"][0].foreignMatchPercentage == 0
+    # the proposed signature only has stack symptoms, so no raw outputs are loaded
+    get_crash_infos.assert_called_once_with(frozenset())
+
+
+def test_find_signature_max_distance(client, cm, settings):
+    """Buckets are proposed up to the configured distance"""
+    client.login(username="test", password="test")
+    crash = cm.create_crash(stderr=ASAN_TRACE)
+    frames = ["js::AbstractFramePtr::script", "x1", "x2", "x3", "x4", "x5"]
+    bucket = cm.create_bucket(
+        signature=json.dumps(
+            {"symptoms": [{"type": "stackFrames", "functionNames": frames}]}
+        )
+    )
+    url = reverse("crashmanager:findsigs", kwargs={"crashid": crash.pk})
+
+    response = client.get(url)
+    assert response.status_code == requests.codes["ok"]
+    assert not response.context["buckets"]
+
+    settings.FIND_SIGNATURES_MAX_DISTANCE = 5
+    response = client.get(url)
+    assert response.status_code == requests.codes["ok"]
+    assert [found.pk for found in response.context["buckets"]] == [bucket.pk]
+    assert response.context["buckets"][0].offCount == 5
+
+
 def test_opt_signature_simple_get(client, cm):  # pylint: disable=invalid-name
     """No errors are thrown in template"""
     client.login(username="test", password="test")
@@ -14,10 +14,19 @@ import logging
 
 import pytest
 import requests
+from django.core.management import call_command
 from django.urls import reverse
 from rest_framework import status
 
-from crashmanager.models import Bucket, BucketHit, BucketStatistics, Bug, CrashEntry
+from crashmanager.models import (
+    Bucket,
+    BucketHit,
+    BucketReassignJob,
+    BucketStatistics,
+    Bug,
+    CrashEntry,
+    ExportedSignature,
+)
 
 from .conftest import _create_user
 
@@ -90,6 +99,7 @@ def _compare_rest_result_to_bucket(
         "id",
         "permanent",
         "reassign_in_progress",
+        "reassign_progress",
         "shortDescription",
         "signature",
         "size",
@@ -116,6 +126,7 @@ def _compare_rest_result_to_bucket(
     assert result["id"] == bucket.pk
     assert result["permanent"] == bucket.permanent
     assert result["reassign_in_progress"] == bucket.reassign_in_progress
+    assert result["reassign_progress"] is None
     assert result["shortDescription"] == bucket.shortDescription
     assert result["signature"] == bucket.signature
     assert result["size"] == size
@@ -143,6 +154,7 @@ def _compare_rest_result_to_bucket(
         "/crashmanager/rest/buckets/",
         "/crashmanager/rest/buckets/1/",
         "/crashmanager/rest/signatures/download/",
+        "/crashmanager/rest/signatures/changes/",
     ],
 )
 def test_rest_signatures_no_auth(db, api_client, method, url):
@@ -160,12 +172,13 @@ def test_rest_signatures_no_auth(db, api_client, method, url):
         "/crashmanager/rest/buckets/",
         "/crashmanager/rest/buckets/1/",
         "/crashmanager/rest/signatures/download/",
+        "/crashmanager/rest/signatures/changes/",
     ],
 )
 @pytest.mark.parametrize("user", ["noperm", "only_sigs", "only_report"], indirect=True)
 def test_rest_signatures_no_perm(user, api_client, method, url):
     """must yield forbidden without permission"""
-    if url.endswith("download/") and user.username == "test-only-sigs":
+    if url.endswith(("download/", "changes/")) and user.username == "test-only-sigs":
         pytest.skip()
     assert (
         getattr(api_client, method)(url, {}).status_code == requests.codes["forbidden"]
@@ -179,6 +192,7 @@ def test_rest_signatures_no_perm(user, api_client, method, url):
         "/crashmanager/rest/buckets/1/",
         "/crashmanager/rest/buckets/",
         "/crashmanager/rest/signatures/download/",
+        "/crashmanager/rest/signatures/changes/",
     ],
 )
 @pytest.mark.parametrize("user", ["normal", "restricted"], indirect=True)
@@ -906,3 +920,91 @@ def test_signatures_download_perms(api_client, user, settings, tmp_path):
         api_client.get("/crashmanager/rest/signatures/download/", {}).status_code
         == requests.codes["ok"]
     )
+
+
+@pytest.mark.parametrize("user", ["normal"], indirect=True)
+def test_edit_signature_reassign_job(api_client, cm, mocker, settings, user):
+    """with celery, saving with reassign starts a background job"""
+    bucket = cm.create_bucket(
+        signature=json.dumps({"symptoms": [{"type": "output", "value": "foo"}]})
+    )
+    cm.create_crash(stderr="bar")
+    settings.USE_CELERY = True
+    start = mocker.patch.object(BucketReassignJob, "start")
+    sig = json.dumps({"symptoms": [{"type": "output", "value": "bar"}]})
+
+    resp = api_client.patch(
+        f"/crashmanager/rest/buckets/{bucket.pk}/?reassign=true&save=true",
+        data={"signature": sig},
+        format="json",
+    )
+    assert resp.status_code == requests.codes["ok"]
+    assert resp.json()["nextOffset"] is None
+    assert resp.json()["inListCount"] == 0
+    (started,), _ = start.call_args
+    assert started.pk == bucket.pk
+
+    # the progress is reported with the bucket
+    mocker.stopall()
+    BucketReassignJob.start(bucket)
+    resp = api_client.get(f"/crashmanager/rest/buckets/{bucket.pk}/")
+    assert resp.json()["reassign_in_progress"]
+    assert resp.json()["reassign_progress"] == {
+        "ranges": 1,
+        "ranges_done": 0,
+        "scanned": 0,
+        "moved_in": 0,
+        "moved_out": 0,
+        "finished": False,
+    }
+
+
+@pytest.mark.parametrize("user", ["normal", "only_sigs"], indirect=True)
+def test_signatures_download_etag(api_client, cm, user, settings, tmp_path):
+    """signatures.zip is only downloaded again if the export version changed"""
+    settings.SIGNATURE_STORAGE = str(tmp_path)
+    cm.create_bucket(signature="sig1")
+    call_command("export_signatures", str(tmp_path / "signatures.zip"))
+
+    url = "/crashmanager/rest/signatures/download/"
+    response = api_client.get(url)
+    assert response.status_code == requests.codes["ok"]
+    assert response["ETag"] == '"1"'
+    response = api_client.get(url, HTTP_IF_NONE_MATCH='"1"')
+    assert response.status_code == requests.codes["not_modified"]
+    assert response["ETag"] == '"1"'
+    response = api_client.get(url, HTTP_IF_NONE_MATCH='"0"')
+    assert response.status_code == requests.codes["ok"]
+
+
+@pytest.mark.parametrize("user", ["normal", "only_sigs"], indirect=True)
+def test_signatures_changes(api_client, user):
+    """only the signatures changed since the given version are served"""
+    url = "/crashmanager/rest/signatures/changes/"
+    assert ExportedSignature.record({1: ("sig1", "{}"), 2: ("sig2", "{}")}) == 1
+    assert ExportedSignature.record({2: None, 3: ("sig3", "{}")}) == 2
+    assert ExportedSignature.record({1: ("sig1", "{}"), 2: None}) == 2
+
+    response = api_client.get(url, {"since": 0})
+    assert response.status_code == requests.codes["ok"]
+    assert response.json() == {
+        "version": 2,
+        "signatures": {
+            "1": {"signature": "sig1", "metadata": "{}"},
+            "3": {"signature": "sig3", "metadata": "{}"},
+        },
+        "deleted": [2],
+    }
+    response = api_client.get(url, {"since": 1})
+    assert response.json() == {
+        "version": 2,
+        "signatures": {"3": {"signature": "sig3", "metadata": "{}"}},
+        "deleted": [2],
+    }
+    assert response["ETag"] == '"2"'
+    response = api_client.get(url, {"since": 2}, HTTP_IF_NONE_MATCH='"2"')
+    assert response.status_code == requests.codes["not_modified"]
+
+    for since in ("", "x", -1, 3):
+        response = api_client.get(url, {"since": since})
+        assert response.status_code == requests.codes["bad_request"]
@@ -3,6 +3,7 @@ import os
 from collections import OrderedDict
 from datetime import datetime, timedelta
 from wsgiref.util import FileWrapper
+from zipfile import BadZipFile, ZipFile
 
 from django.conf import settings as django_settings
 from django.conf import settings as djangosettings
@@ -10,10 +11,11 @@ from django.core.exceptions import FieldError, PermissionDenied, SuspiciousOpera
 from django.db.models import F, OuterRef, Q, Subquery
 from django.db.models.aggregates import Count, Min, Sum
 from django.db.models.functions import Coalesce
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
@@ -39,7 +41,10 @@ from .forms import (
 from .models import (
     Bucket,
     BucketHit,
+    BucketReassignJob,
+    BucketRepresentative,
     BucketStatistics,
+    BucketStatsDelta,
     BucketWatch,
     Bug,
     BugProvider,
@@ -47,6 +52,7 @@ from .models import (
     BugzillaTemplateMode,
     CrashEntry,
     CrashHit,
+    ExportedSignature,
     Tool,
     User,
 )
@@ -396,6 +402,9 @@ def newSignature(request):
             crashEntry.rawStderr,
             configuration,
             crashEntry.rawCrashData,
+            maxDetectionLines=getattr(
+                django_settings, "CRASH_DETECTION_MAX_LINES", None
+            ),
         )
 
         maxStackFrames = 8
@@ -661,22 +670,35 @@ def findSignatures(request, crashid):
     similarBuckets = []
     matchingBucket = None
 
-    # Avoid hitting the database multiple times when looking for the first
-    # entry of a bucket. Keeping these in memory is less expensive.
-    firstEntryPerBucketCache = {}
+    # Sample crashes of all buckets, loaded at once. Raw outputs are only loaded
+    # for the output sources the proposed signatures need.
+    representatives = {}
+
+    def get_representatives(signature):
+        required_outputs = frozenset(signature.getRequiredOutputSources())
+        if required_outputs not in representatives:
+            representatives[required_outputs] = BucketRepresentative.get_crash_infos(
+                required_outputs
+            )
+        return representatives[required_outputs]
+
+    max_distance = getattr(django_settings, "FIND_SIGNATURES_MAX_DISTANCE", 4)
 
     for bucket in buckets:
         signature = bucket.getSignature()
-        distance = signature.getDistance(entry.crashinfo)
+        distance = signature.getDistance(
+            entry.crashinfo, maxFrameDistance=max_distance, maxDistance=max_distance
+        )
 
         # We found a matching bucket, no need to display/calculate similar buckets
         if distance == 0:
             matchingBucket = bucket
             break
 
-        # TODO: This could be made configurable through a GET parameter
-        if distance <= 4:
-            proposedCrashSignature = signature.fit(entry.crashinfo)
+        if distance <= max_distance:
+            proposedCrashSignature = signature.fit(
+                entry.crashinfo, maxFrameDistance=max_distance
+            )
             if proposedCrashSignature:
                 # We now try to determine how this signature will behave in other
                 # buckets. If the signature matches lots of other buckets as well, it is
@@ -686,23 +708,18 @@ def findSignatures(request, crashid):
                 matchesInOtherBucketsLimitExceeded = False
                 nonMatchesInOtherBuckets = 0
                 otherMatchingBucketIds = []
+                otherRepresentatives = get_representatives(proposedCrashSignature)
                 for otherBucket in buckets:
                     if otherBucket.pk == bucket.pk:
                         continue
 
-                    if otherBucket.pk not in firstEntryPerBucketCache:
-                        c = CrashEntry.objects.filter(bucket=otherBucket).first()
-                        firstEntryPerBucketCache[otherBucket.pk] = c
-                        if c:
-                            # Omit testcase for performance reasons for now
-                            firstEntryPerBucketCache[otherBucket.pk] = c.getCrashInfo(
-                                attachTestcase=False
-                            )
-
-                    firstEntryCrashInfo = firstEntryPerBucketCache[otherBucket.pk]
-                    if firstEntryCrashInfo:
+                    otherCrashInfos = otherRepresentatives.get(otherBucket.pk)
+                    if otherCrashInfos:
                         # Omit testcase for performance reasons for now
-                        if proposedCrashSignature.matches(firstEntryCrashInfo):
+                        if any(
+                            proposedCrashSignature.matches(otherCrashInfo)
+                            for otherCrashInfo in otherCrashInfos
+                        ):
                             matchesInOtherBuckets += 1
                             otherMatchingBucketIds.append(otherBucket.pk)
 
@@ -1093,7 +1110,8 @@ class CrashEntryViewSet(
         pks = list(queryset.values_list("id", flat=True))
         while pks:
             chunk, pks = pks[:100], pks[100:]
-            deleteStats = CrashEntry.objects.filter(pk__in=chunk).delete()
+            with BucketStatsDelta.collect():
+                deleteStats = CrashEntry.objects.filter(pk__in=chunk).delete()
             deleted += deleteStats[1]["crashmanager.CrashEntry"]
 
         return Response(
@@ -1157,6 +1175,24 @@ class CrashEntryViewSet(
             obj.testcase.save()
         return Response(CrashEntrySerializer(obj).data)
 
+    @staticmethod
+    def check_tools(request, tool_names):
+        """Check user has access to the tools of the crashes to create"""
+        user = User.get_or_create_restricted(request.user)[0]
+        if user.restricted:
+            allowed_tools = user.defaultToolsFilter.values_list("name", flat=True)
+            if not allowed_tools:
+                raise PermissionDenied({"message": "No tools assigned to user"})
+
+            for tool_name in tool_names:
+                if tool_name not in allowed_tools:
+                    raise PermissionDenied(
+                        {
+                            "message": "You don't have permission to use tool: "
+                            f"{tool_name}"
+                        }
+                    )
+
     def create(self, request, *args, **kwargs):
         """Check user has access to tool before creation"""
         tool_name = request.data.get("tool")
@@ -1166,17 +1202,69 @@ class CrashEntryViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        user = User.get_or_create_restricted(request.user)[0]
-        if user.restricted:
-            allowed_tools = user.defaultToolsFilter.values_list("name", flat=True)
-            if not allowed_tools:
-                raise PermissionDenied({"message": "No tools assigned to user"})
+        self.check_tools(request, [tool_name])
+
+        # The testcase can be uploaded as file instead of a form field, it is
+        # passed on to the serializer without reading it.
+        upload = request.FILES.get("testcase")
+        if upload is None:
+            return super().create(request, *args, **kwargs)
+        data = {key: value for key, value in request.data.items() if key != "testcase"}
+        context = self.get_serializer_context()
+        context["testcase_file"] = upload
+        serializer = self.get_serializer(data=data, context=context)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED, headers=headers
+        )
 
-            if tool_name not in allowed_tools:
-                raise PermissionDenied(
-                    {"message": f"You don't have permission to use tool: {tool_name}"}
-                )
-        return super().create(request, *args, **kwargs)
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Create many crash entries at once. The crashes are given as JSON list,
+        either as request body or as `crashes` field (or file) of a multipart
+        request. Each crash has the fields of a single submission, the testcase
+        of the crash at index N can be uploaded as file `testcase_N`.
+        """
+        if isinstance(request.data, list):
+            crashes = request.data
+        else:
+            crashes = request.FILES.get("crashes", request.data.get("crashes"))
+        if crashes is None:
+            raise InvalidArgumentException({"crashes": ["This field is required."]})
+        if hasattr(crashes, "read"):
+            crashes = crashes.read()
+        if isinstance(crashes, (str, bytes)):
+            try:
+                crashes = json.loads(crashes)
+            except ValueError:
+                raise InvalidArgumentException({"crashes": ["Invalid JSON."]})
+        if not isinstance(crashes, list) or not all(
+            isinstance(crash, dict) for crash in crashes
+        ):
+            raise InvalidArgumentException({"crashes": ["Expected a list of crashes."]})
+
+        limit = getattr(django_settings, "BULK_CRASHES_LIMIT", 1000)
+        if len(crashes) > limit:
+            raise InvalidArgumentException(
+                {"crashes": [f"At most {limit} crashes can be submitted at once."]}
+            )
+
+        self.check_tools(
+            request, {crash["tool"] for crash in crashes if "tool" in crash}
+        )
+
+        context = self.get_serializer_context()
+        context["testcase_files"] = request.FILES
+        serializer = self.get_serializer(data=crashes, many=True, context=context)
+        serializer.is_valid(raise_exception=True)
+        entries = serializer.save()
+        return Response(
+            CrashEntrySerializer(entries, many=True, include_raw=False).data,
+            status=status.HTTP_201_CREATED,
+        )
 
 
 class BucketViewSet(
@@ -1341,7 +1429,12 @@ class BucketViewSet(
         in_list_count, out_list_count = 0, 0
         next_offset = None
         # If the reassign checkbox is checked
-        if reassign:
+        if reassign and submit_save and getattr(django_settings, "USE_CELERY", None):
+            # Reassigning large buckets takes too long for a request, do it in
+            # the background. The progress is reported with the bucket.
+            if not offset:
+                BucketReassignJob.start(bucket)
+        elif reassign:
             in_list, out_list, in_list_count, out_list_count, next_offset = (
                 bucket.reassign(submit_save, limit=limit, offset=offset)
             )
@@ -1604,11 +1697,18 @@ class TestDownloadView(AbstractDownloadView):
         entry = get_object_or_404(CrashEntry, pk=crashid)
         check_authorized_for_crash_entry(request, entry)
 
-        if not entry.testcase:
+        if not entry.testcase or not entry.testcase.test.storage.exists(
+            entry.testcase.test.name
+        ):
             return HttpResponse(status=404)
 
-        file_path = os.path.join(storage_base, entry.testcase.test.name)
-        return self.response(file_path, entry.testcase.test.name)
+        # Testcases are stored compressed, they are decompressed while sending
+        response = StreamingHttpResponse(
+            entry.testcase.iterTest(), content_type="application/octet-stream"
+        )
+        filename = os.path.basename(entry.testcase.test.name)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
 
 
 class SignaturesDownloadView(AbstractDownloadView):
@@ -1623,7 +1723,64 @@ class SignaturesDownloadView(AbstractDownloadView):
         filename = "signatures.zip"
         file_path = os.path.join(storage_base, filename)
 
-        return self.response(file_path, filename)
+        # The export version is stored as zip comment, see export_signatures
+        version = None
+        try:
+            with ZipFile(file_path) as zipFile:
+                version = zipFile.comment.decode("ascii")
+        except (OSError, BadZipFile, UnicodeDecodeError):
+            pass
+        if not version:
+            return self.response(file_path, filename)
+
+        etag = quote_etag(version)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponse(status=304)
+        else:
+            response = self.response(file_path, filename)
+        response["ETag"] = etag
+        return response
+
+
+class SignatureChangesView(APIView):
+    """
+    Serve the signatures changed and deleted since the given export version, so
+    clients can update their signature cache without downloading signatures.zip.
+    """
+
+    authentication_classes = (IPRestrictedTokenAuthentication, SessionAuthentication)
+    permission_classes = (CheckAppPermission,)
+
+    def get(self, request, format=None):
+        deny_restricted_users(request)
+
+        try:
+            since = int(request.query_params["since"])
+        except (KeyError, ValueError):
+            raise ValidationError("Parameter 'since' must be an export version")
+
+        # Clients ahead of the server (e.g. after a database reset) must
+        # download signatures.zip again
+        current = ExportedSignature.current_version()
+        if not 0 <= since <= current:
+            raise ValidationError(f"Unknown export version {since}")
+
+        etag = quote_etag(str(current))
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        (version, changed, deleted) = ExportedSignature.changes_since(since)
+        return Response(
+            {
+                "version": version,
+                "signatures": {
+                    str(bucket_id): {"signature": signature, "metadata": metadata}
+                    for bucket_id, (signature, metadata) in changed.items()
+                },
+                "deleted": deleted,
+            },
+            headers={"ETag": quote_etag(str(version))},
+        )
 
 
 class BugzillaTemplateListView(ListView):
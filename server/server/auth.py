@@ -40,9 +40,10 @@ class CheckAppPermission(permissions.BasePermission):
                     return True
                 view_name = type(view).__name__
                 if app == "crashmanager":
-                    if view_name == "SignaturesDownloadView" and request.user.has_perm(
-                        f"{app}.{app}_download_signatures"
-                    ):
+                    if view_name in (
+                        "SignaturesDownloadView",
+                        "SignatureChangesView",
+                    ) and request.user.has_perm(f"{app}.{app}_download_signatures"):
                         return True
                     if (
                         view_name == "CrashEntryViewSet"
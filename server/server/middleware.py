@@ -1,14 +1,108 @@
+import gzip
+import io
 import re
 import traceback
+import zlib
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.exceptions import APIException, ParseError
 
 from crashmanager.models import User
 
 from .auth import CheckAppPermission
 
+try:
+    import zstandard
+
+    HAVE_ZSTD = True
+    DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error, zstandard.ZstdError)
+except ImportError:
+    HAVE_ZSTD = False
+    DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error)
+
+
+class DecompressedBodyTooLarge(APIException):
+    status_code = 413
+    default_detail = "Decompressed request body too large."
+    default_code = "request_entity_too_large"
+
+
+class DecompressingStream(io.RawIOBase):
+    """
+    Request body stream decompressing the compressed body while it is read. Reading
+    beyond limit decompressed bytes fails with DecompressedBodyTooLarge, corrupt
+    data with a ParseError.
+    """
+
+    def __init__(self, reader, limit):
+        self.reader = reader
+        self.limit = limit
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            # one byte more than allowed, to detect bodies exceeding the limit
+            count = self.reader.readinto(
+                memoryview(buffer)[: self.limit + 1 - self.size]
+            )
+        except DECOMPRESSION_ERRORS:
+            raise ParseError("Invalid compressed request body.")
+        self.size += count
+        if self.size > self.limit:
+            raise DecompressedBodyTooLarge()
+        return count
+
+
+class DecompressRequestMiddleware:
+    """
+    Transparently decompresses request bodies sent to the upload endpoints in
+    COMPRESSED_REQUEST_URLS with a Content-Encoding of gzip (or zstd, if the
+    zstandard package is installed), so clients can compress their uploads.
+
+    The body is decompressed while the view reads it, so requests are
+    authenticated before anything is decompressed. At most
+    DATA_UPLOAD_MAX_DECOMPRESSED_SIZE bytes are decompressed. This must come
+    before any middleware reading the request body.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.urls = re.compile(
+            "(" + "|".join(getattr(settings, "COMPRESSED_REQUEST_URLS", ())) + ")"
+        )
+
+    def __call__(self, request):
+        encoding = request.META.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if encoding in ("", "identity"):
+            return self.get_response(request)
+
+        if not self.urls.fullmatch(request.path):
+            return HttpResponse(
+                "Compressed request bodies are not accepted", status=415
+            )
+        if encoding == "gzip":
+            reader = gzip.GzipFile(fileobj=request._stream, mode="rb")
+        elif encoding == "zstd" and HAVE_ZSTD:
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                request._stream, read_across_frames=True
+            )
+        else:
+            return HttpResponse(f"Unsupported Content-Encoding: {encoding}", status=415)
+
+        limit = getattr(settings, "DATA_UPLOAD_MAX_DECOMPRESSED_SIZE", 64 * 1024**2)
+        # The request is handled as if it was sent uncompressed. Its real length is
+        # only known once it is read, the limit is an upper bound, which also keeps
+        # uploaded files from being buffered in memory.
+        request._stream = io.BufferedReader(DecompressingStream(reader, limit))
+        request.META["CONTENT_LENGTH"] = str(limit)
+        del request.META["HTTP_CONTENT_ENCODING"]
+        return self.get_response(request)
+
 
 class ExceptionLoggingMiddleware:
     """
@@ -27,10 +27,9 @@ try:
 except OSError:
     try:
         with open(SECRET_FILE, "w") as f:
-            import random
+            from django.core.management.utils import get_random_secret_key
 
-            chars = "abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_=+)"
-            SECRET_KEY = "".join([random.choice(chars) for _ in range(64)])
+            SECRET_KEY = get_random_secret_key()
             f.write(SECRET_KEY)
     except OSError:
         raise Exception(f'Cannot open file "{SECRET_FILE}" for writing.')
@@ -67,6 +66,7 @@ INSTALLED_APPS = (
 
 
 MIDDLEWARE = (
+    "server.middleware.DecompressRequestMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -148,6 +148,14 @@ WSGI_APPLICATION = "server.wsgi.application"
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "https://www.mozilla.org/"
+# Upload endpoints accepting compressed request bodies, see
+# server.middleware.DecompressRequestMiddleware
+COMPRESSED_REQUEST_URLS = (
+    r"/crashmanager/rest/crashes/",
+    r"/crashmanager/rest/crashes/bulk/",
+    r"/covmanager/rest/collections/",
+)
+
 LOGIN_REQUIRED_URLS_EXCEPTIONS = (
     r"/login/.*",
     r"/logout/.*",
@@ -348,9 +356,12 @@ GCE_AUTH_CACHE = "/tmp/.google_libcloud_auth.fuzzmanager-cluster"
 # CRASH_MAX_LIFETIME = 365 * 2
 ALLOW_EMAIL_EDITION = True
 
-# This is the base directory where the tests/ subdirectory will
+# This is the base directory where the testcases/ subdirectory will
 # be created for storing submitted test files.
 TEST_STORAGE = os.path.join(BASE_DIR)
+# Test files are stored compressed with zstd if the zstandard package is
+# installed, with gzip otherwise. Use "" to store them uncompressed.
+# TEST_STORAGE_COMPRESSION = "gzip"
 USERDATA_STORAGE = os.path.join(BASE_DIR)
 
 # This is the directory where signatures.zip will be stored
@@ -368,6 +379,42 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_BROKER_URL = "redis:///2"
 CELERY_RESULT_BACKEND = "redis:///1"
 CELERY_TRIAGE_MEMCACHE_ENTRIES = 100
+
+# Number of parsed bucket signatures cached per process (None keeps the signatures
+# of all buckets), and how often (in seconds) each process checks Redis for
+# signatures edited or deleted by other processes.
+SIGNATURE_CACHE_ENTRIES = None
+SIGNATURE_CACHE_SYNC_INTERVAL = 1.0
+
+# Number of sample crash entries kept per bucket to check proposed signatures against
+# other buckets.
+BUCKET_REPRESENTATIVES = 1
+
+# Maximum distance of a bucket signature from a crash entry (the number of wildcard
+# edits and non-matching symptoms) for the bucket to be proposed when searching
+# signatures for that crash entry.
+FIND_SIGNATURES_MAX_DISTANCE = 4
+
+# Number of crash entry ids reassigned per celery task when a bucket is saved, and
+# after how many seconds without progress such a reassignment is resumed.
+REASSIGN_JOB_RANGE_SIZE = 10000
+REASSIGN_JOB_RESUME_AFTER = 15 * 60
+
+# Number of top stack frames hashed into the fingerprint that new crash entries are
+# matched against already bucketed duplicates with, before any other triage.
+CRASH_FINGERPRINT_FRAMES = 8
+
+# Number of backtrace frame names cached per process
+FRAME_CACHE_ENTRIES = 500000
+
+# Number of results of matching PCRE function names of stackFrames symptoms against
+# frames, cached per process for reassigning buckets
+FRAME_MATCH_CACHE_ENTRIES = 262144
+
+# Number of trailing lines of the crash data and stderr of a crash entry that are
+# inspected to detect the crash output format, bounding the work spent on huge logs.
+CRASH_DETECTION_MAX_LINES = 100000
+
 CELERY_TASK_ROUTES = {
     "covmanager.cron.*": {"queue": "cron"},
     "crashmanager.cron.*": {"queue": "cron"},
@@ -391,6 +438,10 @@ CELERY_BEAT_SCHEDULE = {
         "task": "crashmanager.cron.cleanup_old_crashes",
         "schedule": 30 * 60,
     },
+    "Resume stalled bucket reassignments every 5 minutes": {
+        "task": "crashmanager.cron.resume_reassign_jobs",
+        "schedule": 5 * 60,
+    },
     "Create signatures.zip hourly": {
         "task": "crashmanager.cron.export_signatures",
         "schedule": 60 * 60,